@@ -0,0 +1,107 @@
+"""
+Benchmark the gradient aggregation of :class:`tfsnippet.trainer.DataParallel`
+on multiple CPU towers.
+
+Three strategies are compared:
+
+*   ``concat-mean``: ``expand_dims`` + ``concat`` + ``reduce_mean``, which is
+    the legacy implementation of ``average_gradients``.
+*   ``add-n``: ``tf.add_n`` scaled by 1/k.
+*   ``add-n-bucket``: ``tf.add_n`` on fused flat buffers of small gradients.
+
+Usage::
+
+    python scripts/benchmark_average_gradients.py --towers 4 --vars 200
+"""
+import argparse
+import time
+
+import numpy as np
+import tensorflow as tf
+
+from tfsnippet.trainer import DataParallel, average_gradients
+
+
+def concat_mean_gradients(tower_grads):
+    average_grads = []
+    for grad_and_vars in zip(*tower_grads):
+        grads = [tf.expand_dims(g, 0) for g, _ in grad_and_vars]
+        grad = tf.reduce_mean(tf.concat(grads, axis=0), axis=0)
+        average_grads.append((grad, grad_and_vars[0][1]))
+    return average_grads
+
+
+def build_tower_grads(dp, num_vars, large_size, small_size):
+    variables = []
+    for i in range(num_vars):
+        # one out of ten variables is large, while others are small
+        size = large_size if i % 10 == 0 else small_size
+        variables.append(
+            tf.get_variable('v{}'.format(i), shape=[size], dtype=tf.float32))
+
+    tower_grads = []
+    for i, dev in enumerate(dp.work_devices):
+        with tf.device(dev), dp.maybe_name_scope(dev):
+            tower_grads.append(
+                [(tf.tanh(v) * float(i + 1), v) for v in variables])
+    return tower_grads
+
+
+def benchmark(session, grads, iters):
+    op = tf.group(*[g for g, _ in grads])
+    session.run(op)  # warm-up
+    start_time = time.time()
+    for _ in range(iters):
+        session.run(op)
+    return (time.time() - start_time) / iters
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the gradient aggregation on CPU towers.')
+    parser.add_argument('--towers', type=int, default=4,
+                        help='number of CPU towers')
+    parser.add_argument('--vars', type=int, default=200,
+                        help='number of variables')
+    parser.add_argument('--large-size', type=int, default=1000000,
+                        help='size of large variables')
+    parser.add_argument('--small-size', type=int, default=256,
+                        help='size of small variables')
+    parser.add_argument('--bucket-size', type=int, default=65536,
+                        help='maximum size of gradients to be fused')
+    parser.add_argument('--iters', type=int, default=50,
+                        help='number of iterations to time')
+    args = parser.parse_args()
+
+    dp = DataParallel.cpu_towers(args.towers)
+    tower_grads = build_tower_grads(
+        dp, args.vars, args.large_size, args.small_size)
+    with tf.device(dp.main_device):
+        strategies = [
+            ('concat-mean', concat_mean_gradients(tower_grads)),
+            ('add-n', average_gradients(tower_grads)),
+            ('add-n-bucket', average_gradients(
+                tower_grads, bucket_size=args.bucket_size)),
+        ]
+
+    config = tf.ConfigProto(**dp.session_kwargs())
+    with tf.Session(config=config) as session:
+        session.run(tf.global_variables_initializer())
+
+        # check the strategies agree with each other
+        expected = session.run([g for g, _ in strategies[0][1]])
+        for name, grads in strategies[1:]:
+            for a, b in zip(expected, session.run([g for g, _ in grads])):
+                np.testing.assert_allclose(a, b, rtol=1e-5, err_msg=name)
+
+        print('towers={}, vars={}, large_size={}, small_size={}, '
+              'bucket_size={}'.format(args.towers, args.vars,
+                                      args.large_size, args.small_size,
+                                      args.bucket_size))
+        for name, grads in strategies:
+            seconds = benchmark(session, grads, args.iters)
+            print('{:>14s}: {:.3f} ms/iter'.format(name, seconds * 1000.))
+
+
+if __name__ == '__main__':
+    main()
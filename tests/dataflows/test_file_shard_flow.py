@@ -0,0 +1,171 @@
+import os
+import unittest
+
+import numpy as np
+import pytest
+
+from tfsnippet.dataflows import DataFlow
+from tfsnippet.dataflows.file_shard_flow import FileShardFlow
+from tfsnippet.utils import TemporaryDirectory, CacheDir
+
+
+def make_shards(tmpdir):
+    # 3 shards: 4 + 5 + 3 = 12 records, x = arange, y = x * 2
+    lengths = [4, 5, 3]
+    npz_shards, npy_shards = [], []
+    start = 0
+    for i, length in enumerate(lengths):
+        x = np.arange(start, start + length)
+        y = x * 2
+        npz_path = os.path.join(tmpdir, 'shard-{}.npz'.format(i))
+        np.savez(npz_path, x=x, y=y)
+        npz_shards.append(npz_path)
+        npy_path = os.path.join(tmpdir, 'shard-{}.npy'.format(i))
+        np.save(npy_path, x)
+        npy_shards.append(npy_path)
+        start += length
+    return npz_shards, npy_shards
+
+
+class FileShardFlowTestCase(unittest.TestCase):
+
+    def test_property(self):
+        with TemporaryDirectory() as tmpdir:
+            npz_shards, _ = make_shards(tmpdir)
+            df = DataFlow.file_shards(
+                npz_shards, batch_size=5, shuffle=True, skip_incomplete=True,
+                num_workers=2, interleave=3,
+                cache_dir=CacheDir('shards', cache_root=tmpdir)
+            )
+            self.assertIsInstance(df, FileShardFlow)
+            self.assertEqual(tuple(npz_shards), df.shards)
+            self.assertEqual(5, df.batch_size)
+            self.assertTrue(df.is_shuffled)
+            self.assertTrue(df.skip_incomplete)
+            self.assertEqual(2, df.num_workers)
+            self.assertEqual(3, df.prefetch)
+            self.assertEqual(3, df.interleave)
+            self.assertEqual(os.path.join(tmpdir, 'shards'), df.cache_dir.path)
+
+            # test default options
+            df = FileShardFlow(npz_shards, 5)
+            self.assertFalse(df.is_shuffled)
+            self.assertFalse(df.skip_incomplete)
+            self.assertEqual(1, df.num_workers)
+            self.assertEqual(1, df.prefetch)
+            self.assertEqual(1, df.interleave)
+            self.assertEqual('file_shards', df.cache_dir.name)
+
+    def test_errors(self):
+        with pytest.raises(ValueError, match='`shards` must not be empty'):
+            _ = FileShardFlow([], 3)
+        with pytest.raises(ValueError, match='`batch_size` must be at least 1'):
+            _ = FileShardFlow(['a.npz'], 0)
+        with pytest.raises(ValueError,
+                           match='`num_workers` must be at least 1'):
+            _ = FileShardFlow(['a.npz'], 3, num_workers=0)
+        with pytest.raises(ValueError,
+                           match='`interleave` must be at least 1'):
+            _ = FileShardFlow(['a.npz'], 3, interleave=0)
+        with pytest.raises(ValueError, match='`prefetch` must be at least 1'):
+            _ = FileShardFlow(['a.npz'], 3, prefetch=0)
+
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'a.txt')
+            with open(path, 'wb') as f:
+                f.write(b'')
+            with FileShardFlow([path], 3) as df:
+                with pytest.raises(IOError, match='Unsupported shard file'):
+                    _ = list(df)
+
+            npz_shards, npy_shards = make_shards(tmpdir)
+            with FileShardFlow([npz_shards[0], npy_shards[1]], 3) as df:
+                with pytest.raises(ValueError,
+                                   match='The shards do not have the same '
+                                         'number of arrays'):
+                    _ = list(df)
+
+    def test_iterator(self):
+        with TemporaryDirectory() as tmpdir:
+            npz_shards, npy_shards = make_shards(tmpdir)
+
+            # test sequential npz shards
+            with DataFlow.file_shards(npz_shards, batch_size=5,
+                                      num_workers=2) as df:
+                for _ in range(2):
+                    batches = list(df)
+                    self.assertEqual(3, len(batches))
+                    np.testing.assert_equal(
+                        [b[0] for b in batches],
+                        [np.arange(0, 5), np.arange(5, 10), np.arange(10, 12)]
+                    )
+                    for x, y in batches:
+                        np.testing.assert_equal(y, x * 2)
+                        self.assertFalse(x.flags.writeable)
+
+            # test npz shards with selected arrays
+            with DataFlow.file_shards(npz_shards, batch_size=5,
+                                      array_names=['y']) as df:
+                np.testing.assert_equal(
+                    np.concatenate([b[0] for b in df]), np.arange(12) * 2)
+
+            # test npy shards with skip incomplete
+            with DataFlow.file_shards(npy_shards, batch_size=5,
+                                      skip_incomplete=True) as df:
+                np.testing.assert_equal(
+                    [b[0] for b in df], [np.arange(0, 5), np.arange(5, 10)])
+
+            # test shuffled and interleaved shards
+            with DataFlow.file_shards(npz_shards, batch_size=5, shuffle=True,
+                                      num_workers=3, interleave=2) as df:
+                for _ in range(2):
+                    batches = list(df)
+                    self.assertListEqual([5, 5, 2],
+                                         [len(b[0]) for b in batches])
+                    x = np.concatenate([b[0] for b in batches])
+                    y = np.concatenate([b[1] for b in batches])
+                    np.testing.assert_equal(y, x * 2)
+                    np.testing.assert_equal(np.sort(x), np.arange(12))
+
+    def test_directory_and_loader(self):
+        with TemporaryDirectory() as tmpdir:
+            for i in range(5):
+                shard_dir = os.path.join(tmpdir, 'shard-{}'.format(i // 3))
+                if not os.path.isdir(shard_dir):
+                    os.makedirs(shard_dir)
+                with open(os.path.join(shard_dir, '{}.bin'.format(i)),
+                          'wb') as f:
+                    f.write(np.asarray([i, i + 1], dtype=np.int32).tobytes())
+
+            def file_decoder(path):
+                with open(path, 'rb') as f:
+                    x = np.frombuffer(f.read(), dtype=np.int32)
+                return x, x[0]
+
+            shards = [os.path.join(tmpdir, 'shard-0'),
+                      'file://' + os.path.join(tmpdir, 'shard-1')]
+            with DataFlow.file_shards(shards, batch_size=2,
+                                      file_decoder=file_decoder) as df:
+                batches = list(df)
+                np.testing.assert_equal(
+                    np.concatenate([b[0] for b in batches]),
+                    [[0, 1], [1, 2], [2, 3], [3, 4], [4, 5]]
+                )
+                np.testing.assert_equal(
+                    np.concatenate([b[1] for b in batches]), np.arange(5))
+
+            # test decoding the files with multiple workers, where the
+            # order of the files should be kept
+            with DataFlow.file_shards(shards, batch_size=5, num_workers=2,
+                                      file_decoder=file_decoder) as df:
+                np.testing.assert_equal(
+                    [b[1] for b in df], [np.arange(5)])
+
+            # test custom loader
+            def loader(path):
+                return (np.arange(3) + int(path[-1]) * 3,)
+
+            with DataFlow.file_shards(shards, batch_size=4,
+                                      loader=loader) as df:
+                np.testing.assert_equal(
+                    [b[0] for b in df], [np.arange(4), np.arange(4, 6)])
@@ -1,14 +1,67 @@
+import os
+import pickle
 import unittest
 
 import numpy as np
 import pytest
+import six
 
 from tests.datasets.helper import skipUnlessRunDatasetsTests
 from tfsnippet.datasets import *
+from tfsnippet.datasets.cifar import _load_batches
+from tfsnippet.utils import TemporaryDirectory
 
 
 class CifarTestCase(unittest.TestCase):
 
+    def test_load_batches(self):
+        def make_batch(path, label, data, labels):
+            with open(path, 'wb') as f:
+                pickle.dump({b'batch_label': label.encode('utf-8'),
+                             b'data': data, b'fine_labels': labels}, f,
+                            protocol=2)
+
+        if six.PY2:  # pragma: no cover
+            return  # the test batch files are written in Python 3 format
+
+        data = np.random.randint(0, 256, size=[6, 3072]).astype(np.uint8)
+        labels = list(range(6))
+        with TemporaryDirectory() as tmpdir:
+            paths = [os.path.join(tmpdir, 'batch_{}'.format(i))
+                     for i in range(2)]
+            for i in range(2):
+                make_batch(paths[i], 'batch {}'.format(i),
+                           data[i * 3: (i + 1) * 3], labels[i * 3: (i + 1) * 3])
+
+            for channels_last, x_shape in [(True, (32, 32, 3)),
+                                           (False, (3, 32, 32)),
+                                           (True, (1024, 3))]:
+                for normalize_x in (False, True):
+                    x = np.empty((6,) + x_shape, dtype=np.float32)
+                    y = np.empty((6,), dtype=np.int32)
+                    _load_batches(
+                        [(paths[i], x[i * 3: (i + 1) * 3],
+                          y[i * 3: (i + 1) * 3], 'batch {}'.format(i))
+                         for i in range(2)],
+                        channels_last=channels_last, normalize_x=normalize_x,
+                        labels_key='fine_labels'
+                    )
+                    expected = data.reshape([6, 3, 32, 32]).astype(np.float32)
+                    if channels_last:
+                        expected = np.transpose(expected, [0, 2, 3, 1])
+                    if normalize_x:
+                        expected /= 255.
+                    np.testing.assert_allclose(
+                        x, expected.reshape((6,) + x_shape))
+                    np.testing.assert_equal(y, labels)
+
+            with pytest.raises(AssertionError):
+                _load_batches(
+                    [(paths[0], np.empty([3, 3072]), np.empty([3]), 'batch 1')],
+                    channels_last=True, normalize_x=False,
+                    labels_key='fine_labels'
+                )
+
     @skipUnlessRunDatasetsTests()
     def test_fetch_cifar10(self):
         # test channels_last = True, normalize_x = False
@@ -0,0 +1,155 @@
+import hashlib
+import os
+import tarfile
+import unittest
+
+import pytest
+from io import StringIO
+
+from tfsnippet.datasets import DatasetRegistry
+from tfsnippet.utils import TemporaryDirectory
+
+# nothing is listening on this port, thus the connection is refused at once
+BAD_MIRROR = 'http://127.0.0.1:1/datasets'
+PAYLOAD = b'hello, dataset'
+PAYLOAD_MD5 = hashlib.md5(PAYLOAD).hexdigest()
+
+
+def write_file(path, content):
+    parent_dir = os.path.split(path)[0]
+    if not os.path.isdir(parent_dir):
+        os.makedirs(parent_dir)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class DatasetRegistryTestCase(unittest.TestCase):
+
+    def test_mirrors_and_resolve(self):
+        with TemporaryDirectory() as tmpdir:
+            mirror_dir = os.path.join(tmpdir, 'mirror')
+            write_file(os.path.join(mirror_dir, 'mnist', 'a.gz'), PAYLOAD)
+
+            r = DatasetRegistry.from_env({
+                'TFSNIPPET_DATASET_MIRRORS': '{}; {}'.format(
+                    BAD_MIRROR + '/', 'file://' + mirror_dir),
+            })
+            self.assertFalse(r.offline)
+            self.assertEqual([BAD_MIRROR + '/', 'file://' + mirror_dir],
+                             r.get_mirrors('mnist'))
+            r.add_mirror(os.path.join(tmpdir, 'other'), name='mnist')
+            self.assertEqual(os.path.join(tmpdir, 'other'),
+                             r.get_mirrors('mnist')[0])
+            self.assertEqual(2, len(r.get_mirrors('cifar')))
+
+            # local mirrors without the file are skipped
+            candidates = r.resolve('mnist', 'http://example.com/x/a.gz')
+            self.assertEqual(3, len(candidates))
+            self.assertEqual(BAD_MIRROR + '/mnist/a.gz', candidates[0])
+            self.assertTrue(candidates[1].startswith('file://'))
+            self.assertEqual('http://example.com/x/a.gz', candidates[2])
+            self.assertEqual(
+                [BAD_MIRROR + '/cifar/b.gz', 'http://example.com/x/a.gz'],
+                r.resolve('cifar', 'http://example.com/x/a.gz', 'b.gz')
+            )
+
+            r.offline = True
+            self.assertEqual([BAD_MIRROR + '/mnist/b.gz'],
+                             r.resolve('mnist', 'http://example.com/x/b.gz'))
+            self.assertTrue(DatasetRegistry.from_env(
+                {'TFSNIPPET_DATASET_OFFLINE': '1'}).offline)
+
+            with pytest.raises(ValueError, match='`mirror` must not be empty'):
+                r.add_mirror('')
+
+    def test_download(self):
+        with TemporaryDirectory() as tmpdir:
+            mirror_dir = os.path.join(tmpdir, 'mirror')
+            write_file(os.path.join(mirror_dir, 'mnist', 'a.gz'), PAYLOAD)
+            write_file(os.path.join(mirror_dir, 'mnist', 'bad.gz'), b'bad')
+            cache_root = os.path.join(tmpdir, 'cache')
+            r = DatasetRegistry([BAD_MIRROR, mirror_dir], offline=True,
+                                cache_root=cache_root)
+
+            # fail over to the local mirror
+            log_file = StringIO()
+            path = r.download(
+                'mnist', 'http://example.com/a.gz', hasher=hashlib.md5(),
+                expected_hash=PAYLOAD_MD5, progress_file=log_file
+            )
+            self.assertEqual(os.path.join(cache_root, 'mnist', 'a.gz'), path)
+            self.assertEqual(PAYLOAD, read_file(path))
+            self.assertIn('Downloading {}/mnist/a.gz ... error'.
+                          format(BAD_MIRROR), log_file.getvalue())
+
+            # cached file should be used without consulting the mirrors
+            os.remove(os.path.join(mirror_dir, 'mnist', 'a.gz'))
+            log_file = StringIO()
+            self.assertEqual(path, r.download(
+                'mnist', 'http://example.com/a.gz', hasher=hashlib.md5(),
+                expected_hash=PAYLOAD_MD5, progress_file=log_file
+            ))
+            self.assertEqual('', log_file.getvalue())
+
+            # hash mismatch or missing file
+            with pytest.raises(IOError, match='Hash not match'):
+                _ = r.download(
+                    'mnist', 'http://example.com/bad.gz',
+                    hasher=hashlib.md5(), expected_hash=PAYLOAD_MD5,
+                    progress_file=StringIO()
+                )
+            self.assertFalse(os.path.exists(
+                os.path.join(cache_root, 'mnist', 'bad.gz')))
+            r = DatasetRegistry(offline=True, cache_root=cache_root)
+            with pytest.raises(IOError, match='the registry is offline'):
+                _ = r.download('mnist', 'http://example.com/c.gz')
+
+    def test_download_and_extract_and_seed_cache(self):
+        with TemporaryDirectory() as tmpdir:
+            # make the seed archive
+            seed_dir = os.path.join(tmpdir, 'seed')
+            write_file(os.path.join(seed_dir, 'cifar', 'data', 'x.txt'),
+                       b'x')
+            write_file(os.path.join(seed_dir, 'cifar', 'data', 'y.txt'),
+                       b'y')
+            seed_file = os.path.join(tmpdir, 'seed.tar.gz')
+            with tarfile.open(seed_file, 'w:gz') as tar:
+                tar.add(os.path.join(seed_dir, 'cifar'), arcname='cifar')
+
+            # seed the cache, and the existing files should not be touched
+            cache_root = os.path.join(tmpdir, 'cache')
+            write_file(os.path.join(cache_root, 'cifar', 'data', 'y.txt'),
+                       b'old')
+            r = DatasetRegistry(offline=True, cache_root=cache_root)
+            self.assertEqual(1, r.seed_cache(seed_file))
+            self.assertEqual(b'x', read_file(
+                os.path.join(cache_root, 'cifar', 'data', 'x.txt')))
+            self.assertEqual(b'old', read_file(
+                os.path.join(cache_root, 'cifar', 'data', 'y.txt')))
+
+            # the seeded directory should be used without any mirror
+            self.assertEqual(
+                os.path.join(cache_root, 'cifar', 'data'),
+                r.download_and_extract('cifar', 'http://example.com/data.tgz')
+            )
+
+            # extract from the mirror
+            mirror_dir = os.path.join(tmpdir, 'mirror')
+            os.makedirs(os.path.join(mirror_dir, 'cifar'))
+            os.rename(seed_file,
+                      os.path.join(mirror_dir, 'cifar', 'other.tar.gz'))
+            r.add_mirror(mirror_dir)
+            path = r.download_and_extract(
+                'cifar', 'http://example.com/other.tar.gz',
+                progress_file=StringIO()
+            )
+            self.assertEqual(os.path.join(cache_root, 'cifar', 'other'), path)
+            self.assertEqual(
+                b'y', read_file(os.path.join(path, 'cifar', 'data', 'y.txt')))
+            self.assertFalse(os.path.exists(
+                os.path.join(cache_root, 'cifar', 'other.tar.gz')))
@@ -1,9 +1,10 @@
 import numpy as np
 import pytest
 import tensorflow as tf
+from mock import Mock
 
 from tfsnippet import DataFlow
-from tfsnippet.evaluation import collect_outputs
+from tfsnippet.evaluation import *
 
 
 class CollectOutputsTestCase(tf.test.TestCase):
@@ -129,3 +130,58 @@ class CollectOutputsTestCase(tf.test.TestCase):
                                match='`mode` is "average", but the 0-th '
                                      'output is not a scalar'):
                 _ = collect_outputs([ph1], [ph1], df, mode='average')
+
+    def test_collect_outputs_sinks(self):
+        with self.test_session() as sess:
+            ph1 = tf.placeholder(dtype=tf.float32, shape=[None, 2])
+            arr1 = np.random.normal(size=[10, 2]).astype(np.float32)
+
+            # the data length of an ExtraInfoDataFlow is passed to sinks
+            df = DataFlow.arrays([arr1], batch_size=3)
+            sink = ConcatSink()
+            outputs = collect_outputs([ph1 * 2.], [ph1], df, sinks=[sink])
+            self.assertEqual((10, 2), sink._array.shape)
+            np.testing.assert_allclose(outputs[0], arr1 * 2.)
+
+            # mix the sinks with `mode`
+            outputs = collect_outputs(
+                {'sum': ph1, 'concat': ph1, 'mean': tf.reduce_mean(ph1)},
+                [ph1], df, mode='average',
+                sinks={'sum': ReduceSink(np.add), 'concat': ConcatSink()}
+            )
+            np.testing.assert_allclose(outputs['sum'], np.sum(arr1, axis=0),
+                                       rtol=1e-5)
+            np.testing.assert_allclose(outputs['concat'], arr1)
+            np.testing.assert_allclose(outputs['mean'], np.mean(arr1),
+                                       rtol=1e-5)
+
+            with pytest.raises(ValueError,
+                               match='The number of sinks does not match '
+                                     'the number of outputs: 2 vs 1'):
+                _ = collect_outputs([ph1], [ph1], df, sinks=[None, None])
+            with pytest.raises(TypeError, match='Not an output sink'):
+                _ = collect_outputs([ph1], [ph1], df, sinks=[123])
+
+    def test_collect_outputs_prefetch(self):
+        with self.test_session() as sess:
+            ph1 = tf.placeholder(dtype=tf.float32, shape=[None, 2])
+            arr1 = np.random.normal(size=[100, 2]).astype(np.float32)
+            df = DataFlow.arrays([arr1], batch_size=3)
+
+            outputs = collect_outputs([ph1 * 2.], [ph1], df, prefetch=2)
+            np.testing.assert_allclose(outputs[0], arr1 * 2.)
+
+            # the error in the sinks should stop the background thread
+            callback = Mock(side_effect=RuntimeError('sink error'))
+            with pytest.raises(RuntimeError, match='sink error'):
+                _ = collect_outputs([ph1], [ph1], df, prefetch=2,
+                                    sinks=[CallbackSink(callback)])
+            self.assertEqual(1, callback.call_count)
+
+            # the error in the background thread should be re-raised
+            with pytest.raises(ValueError, match='data flow error'):
+                _ = collect_outputs(
+                    [ph1], [ph1],
+                    df.map(Mock(side_effect=ValueError('data flow error'))),
+                    prefetch=2
+                )
@@ -0,0 +1,188 @@
+import os
+import unittest
+
+import numpy as np
+import pytest
+from mock import Mock
+
+from tfsnippet.evaluation import *
+from tfsnippet.utils import StatisticsCollector, TemporaryDirectory
+
+
+def feed_sink(sink, batches, data_length=None):
+    sink.reset(data_length)
+    for b in batches:
+        sink.add(b, len(b))
+    return sink.get_result()
+
+
+class ConcatSinkTestCase(unittest.TestCase):
+
+    def test_concat(self):
+        arr = np.random.normal(size=[10, 3])
+        batches = [arr[:4], arr[4:8], arr[8:]]
+
+        # without length hint
+        sink = ConcatSink()
+        self.assertEqual(0, sink.axis)
+        np.testing.assert_equal(feed_sink(sink, batches), arr)
+
+        # with exact, small and large length hints
+        for data_length in (10, 3, 100):
+            result = feed_sink(sink, batches, data_length=data_length)
+            self.assertEqual(result.dtype, arr.dtype)
+            np.testing.assert_equal(result, arr)
+
+        # the size overrides the hint
+        sink = ConcatSink(size=10)
+        result = feed_sink(sink, batches, data_length=3)
+        self.assertEqual((10, 3), sink._array.shape)
+        np.testing.assert_equal(result, arr)
+
+        # concat along axis 1
+        sink = ConcatSink(axis=-1)
+        result = feed_sink(sink, [b.T for b in batches], data_length=10)
+        np.testing.assert_equal(result, arr.T)
+
+    def test_errors(self):
+        sink = ConcatSink()
+        sink.reset(10)
+        with pytest.raises(ValueError,
+                           match='Cannot concatenate a scalar output'):
+            sink.add(np.asarray(1.), 1)
+        with pytest.raises(ValueError, match='No output has been collected'):
+            sink.get_result()
+
+        sink = ConcatSink(axis=1)
+        sink.reset()
+        with pytest.raises(ValueError, match='`axis` out of range'):
+            sink.add(np.arange(3), 3)
+
+
+class MemmapSinkTestCase(unittest.TestCase):
+
+    def test_memmap(self):
+        arr = np.random.normal(size=[10, 3]).astype(np.float32)
+        batches = [arr[:4], arr[4:8], arr[8:]]
+
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'outputs.npy')
+            sink = MemmapSink(path)
+            self.assertEqual(path, sink.path)
+            result = feed_sink(sink, batches, data_length=10)
+            self.assertIsInstance(result, np.memmap)
+            np.testing.assert_equal(result, arr)
+            del result
+            np.testing.assert_equal(np.load(path), arr)
+
+            # the file is truncated to the collected length
+            result = feed_sink(MemmapSink(path, size=12), batches)
+            np.testing.assert_equal(result, arr)
+            del result
+            np.testing.assert_equal(np.load(path), arr)
+
+            # the file is truncated along the concatenation axis
+            arr3 = np.random.normal(size=[2, 10, 3]).astype(np.float64)
+            result = feed_sink(
+                MemmapSink(path, axis=1, size=17),
+                [arr3[:, :4], arr3[:, 4:8], arr3[:, 8:]]
+            )
+            np.testing.assert_equal(result, arr3)
+            del result
+            np.testing.assert_equal(np.load(path), arr3)
+            expected_path = os.path.join(tmpdir, 'expected.npy')
+            np.save(expected_path, arr3)
+            self.assertEqual(os.path.getsize(expected_path),
+                             os.path.getsize(path))
+
+            with pytest.raises(ValueError,
+                               match='The size of the memmap file is '
+                                     'unknown'):
+                MemmapSink(path).reset()
+            with pytest.raises(ValueError,
+                               match='The outputs exceed the size of the '
+                                     'memmap file: 8 > 6'):
+                feed_sink(MemmapSink(path), batches, data_length=6)
+
+
+class ReducingSinksTestCase(unittest.TestCase):
+
+    def test_average(self):
+        arr = np.random.normal(size=[10])
+        sink = AverageSink()
+        sink.reset()
+        for i in range(0, 10, 4):
+            sink.add(np.mean(arr[i: i + 4]), len(arr[i: i + 4]))
+        np.testing.assert_allclose(sink.get_result(), np.mean(arr))
+
+        with pytest.raises(ValueError,
+                           match='Cannot average a non-scalar output'):
+            sink.add(arr, 10)
+        sink.reset()
+        with pytest.raises(ValueError, match='No output has been collected'):
+            sink.get_result()
+
+    def test_reduce(self):
+        arr = np.random.normal(size=[10, 3])
+        batches = [arr[:4], arr[4:8], arr[8:]]
+        np.testing.assert_allclose(
+            feed_sink(ReduceSink(np.add), batches), np.sum(arr, axis=0))
+        np.testing.assert_equal(
+            feed_sink(ReduceSink(np.minimum), batches), np.min(arr, axis=0))
+        np.testing.assert_equal(
+            feed_sink(ReduceSink(np.maximum, axis=1),
+                      [arr[:, :2], arr[:, 2:]]),
+            np.max(arr, axis=1)
+        )
+        with pytest.raises(ValueError, match='No output has been collected'):
+            feed_sink(ReduceSink(np.add), [])
+
+    def test_statistics(self):
+        arr = np.random.normal(size=[10, 3])
+        batches = [arr[:4], arr[4:8], arr[8:]]
+        result = feed_sink(StatisticsSink(), batches)
+        self.assertIsInstance(result, StatisticsCollector)
+        self.assertEqual((3,), result.shape)
+        np.testing.assert_allclose(result.mean, np.mean(arr, axis=0))
+        np.testing.assert_allclose(result.var, np.var(arr, axis=0))
+
+        result = feed_sink(StatisticsSink(axis=1),
+                           [b.T for b in batches])
+        np.testing.assert_allclose(result.mean, np.mean(arr, axis=0))
+
+        result = feed_sink(StatisticsSink(quantiles=True),
+                           [arr[:5, 0], arr[5:, 0]])
+        np.testing.assert_allclose(result.quantile(.5),
+                                   np.median(arr[:, 0]))
+        with pytest.raises(ValueError, match='No output has been collected'):
+            feed_sink(StatisticsSink(), [])
+
+    def test_histogram(self):
+        arr = np.random.normal(size=[10, 3])
+        batches = [arr[:4], arr[4:8], arr[8:]]
+
+        sink = HistogramSink(5, range=(-1., 1.))
+        counts, edges = feed_sink(sink, batches)
+        np.testing.assert_allclose(edges, np.linspace(-1., 1., 6))
+        np.testing.assert_equal(
+            counts, np.histogram(arr, bins=5, range=(-1., 1.))[0])
+
+        # the counts should be reset
+        counts, edges = feed_sink(sink, batches)
+        np.testing.assert_equal(
+            counts, np.histogram(arr, bins=5, range=(-1., 1.))[0])
+
+        edges = np.asarray([-3., 0., .5, 3.])
+        counts, _ = feed_sink(HistogramSink(edges), batches)
+        np.testing.assert_equal(counts, np.histogram(arr, bins=edges)[0])
+
+        with pytest.raises(ValueError, match='`range` must be specified'):
+            _ = HistogramSink(5)
+
+    def test_callback(self):
+        callback = Mock()
+        arr = np.arange(10)
+        self.assertIsNone(feed_sink(CallbackSink(callback), [arr[:4]]))
+        self.assertEqual(1, callback.call_count)
+        np.testing.assert_equal(arr[:4], callback.call_args[0][0])
+        self.assertEqual(4, callback.call_args[0][1])
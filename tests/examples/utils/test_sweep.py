@@ -0,0 +1,107 @@
+import json
+import multiprocessing
+import os
+import unittest
+
+import pytest
+
+from tfsnippet.examples.utils import *
+from tfsnippet.utils import Config, TemporaryDirectory
+
+
+class _SweepConfig(Config):
+    learning_rate = 0.001
+    z_dim = 40
+
+
+def _trial_fn(trial):
+    if trial.config.z_dim < 0:
+        raise ValueError('negative z_dim')
+    return {'loss': trial.config.learning_rate * trial.config.z_dim,
+            'intra_op': trial.session_config().intra_op_parallelism_threads,
+            'cpus': len(trial.cpus)}
+
+
+class SearchTestCase(unittest.TestCase):
+
+    def test_grid_search(self):
+        self.assertEqual(
+            [{'a': 1, 'b': 'x'}, {'a': 1, 'b': 'y'},
+             {'a': 2, 'b': 'x'}, {'a': 2, 'b': 'y'}],
+            grid_search({'b': ['x', 'y'], 'a': [1, 2]})
+        )
+        self.assertEqual([{}], grid_search({}))
+
+    def test_random_search(self):
+        space = {'a': [1, 2, 3], 'b': lambda rs: rs.uniform(0., 1.)}
+        trials = random_search(space, 10, seed=1234)
+        self.assertEqual(10, len(trials))
+        for t in trials:
+            self.assertIn(t['a'], [1, 2, 3])
+            self.assertTrue(0. <= t['b'] < 1.)
+        self.assertEqual(trials, random_search(space, 10, seed=1234))
+
+
+class RunSweepTestCase(unittest.TestCase):
+
+    def test_run_sweep(self):
+        trials = grid_search({'learning_rate': [0.1, 0.2], 'z_dim': [10, -1]})
+        with TemporaryDirectory() as tmpdir:
+            rows = run_sweep(_trial_fn, _SweepConfig, trials, tmpdir,
+                             num_workers=2, cpus_per_trial=1)
+
+            self.assertEqual([0, 1, 2, 3], [r['index'] for r in rows])
+            self.assertEqual(['ok', 'failed', 'ok', 'failed'],
+                             [r['status'] for r in rows])
+            self.assertAlmostEqual(1., rows[0]['loss'])
+            self.assertAlmostEqual(2., rows[2]['loss'])
+            self.assertEqual(1, rows[0]['intra_op'])
+            self.assertEqual(1, rows[0]['cpus'])
+            self.assertIn('ValueError: negative z_dim', rows[1]['error'])
+
+            # check the result directory of each trial
+            trial_dir = os.path.join(tmpdir, 'trial_0002')
+            with open(os.path.join(trial_dir, 'config.json'), 'rb') as f:
+                self.assertEqual({'learning_rate': 0.2, 'z_dim': 10},
+                                 json.loads(f.read().decode('utf-8')))
+            with open(os.path.join(trial_dir, 'result.json'), 'rb') as f:
+                self.assertAlmostEqual(
+                    2., json.loads(f.read().decode('utf-8'))['loss'])
+            with open(os.path.join(tmpdir, 'sweep.json'), 'rb') as f:
+                self.assertEqual(rows, json.loads(f.read().decode('utf-8')))
+
+            # check the aggregated table
+            table = format_sweep_table(rows)
+            lines = table.split('\n')
+            self.assertEqual(6, len(lines))
+            self.assertEqual(['index', 'status', 'cpus', 'intra_op',
+                              'learning_rate', 'loss', 'z_dim'],
+                             lines[0].split())
+            self.assertEqual(['3', 'failed', '0.2', '-1'], lines[5].split())
+
+    @pytest.mark.skipif(
+        not hasattr(multiprocessing, 'get_all_start_methods') or
+        'fork' not in multiprocessing.get_all_start_methods(),
+        reason='The platform does not support fork'
+    )
+    def test_fork_non_picklable_trial_fn(self):
+        scale = 10.
+        with TemporaryDirectory() as tmpdir:
+            rows = run_sweep(
+                lambda trial: {'loss': trial.config.learning_rate * scale},
+                _SweepConfig, [{'learning_rate': .5}], tmpdir
+            )
+            self.assertEqual('ok', rows[0]['status'])
+            self.assertAlmostEqual(5., rows[0]['loss'])
+
+    def test_errors(self):
+        with pytest.raises(TypeError, match='`config_cls` must be a subclass '
+                                            'of `Config`'):
+            _ = run_sweep(_trial_fn, object, [], '.')
+        with pytest.raises(ValueError, match='`num_workers` must be at '
+                                             'least 1'):
+            _ = run_sweep(_trial_fn, _SweepConfig, [], '.', num_workers=0)
+        with pytest.raises(ValueError, match='`cpus_per_trial` must be at '
+                                             'least 1'):
+            _ = run_sweep(_trial_fn, _SweepConfig, [], '.', num_workers=1,
+                          cpus_per_trial=0)
@@ -0,0 +1,116 @@
+import threading
+import unittest
+
+import pytest
+from mock import Mock
+
+from tfsnippet.scaffold import AsyncSummaryWriter
+
+
+def summary_values(summary):
+    return [(v.tag, v.simple_value) for v in summary.value]
+
+
+class AsyncSummaryWriterTestCase(unittest.TestCase):
+
+    def test_props(self):
+        sw = Mock()
+        writer = AsyncSummaryWriter(sw, flush_interval=2., queue_size=10,
+                                    drop_when_full=True)
+        self.assertIs(writer.summary_writer, sw)
+        self.assertEqual(writer.flush_interval, 2.)
+        self.assertEqual(writer.queue_size, 10)
+        self.assertTrue(writer.drop_when_full)
+        self.assertEqual(writer.dropped_count, 0)
+
+        with pytest.raises(ValueError, match='`queue_size` must be at least '
+                                             '1'):
+            _ = AsyncSummaryWriter(sw, queue_size=0)
+        with pytest.raises(ValueError, match='`flush_interval` must be '
+                                             'positive'):
+            _ = AsyncSummaryWriter(sw, flush_interval=0.)
+
+    def test_write(self):
+        sw = Mock()
+        with AsyncSummaryWriter(sw, flush_interval=60.) as writer:
+            writer.add_metrics({'loss': 1.}, global_step=1)
+            writer.add_metrics([('acc', 0.5)], global_step=1)
+            writer.add_metrics({}, global_step=1)
+            writer.add_metrics({'loss': 2.}, global_step=2)
+            writer.add_summary(b'summary', global_step=3)
+            writer.flush()
+
+            # the metrics of the same step are written in one summary
+            calls = sw.add_summary.call_args_list
+            self.assertEqual(3, len(calls))
+            self.assertEqual((b'summary',), calls[0][0])
+            self.assertEqual({'global_step': 3}, calls[0][1])
+            self.assertEqual([('loss', 1.), ('acc', 0.5)],
+                             summary_values(calls[1][0][0]))
+            self.assertEqual({'global_step': 1}, calls[1][1])
+            self.assertEqual([('loss', 2.)], summary_values(calls[2][0][0]))
+            self.assertEqual({'global_step': 2}, calls[2][1])
+            self.assertEqual(1, sw.flush.call_count)
+
+            writer.add_metrics({'loss': 3.}, global_step=4)
+
+        # close should write the pending metrics, but not close `sw`
+        self.assertEqual(4, sw.add_summary.call_count)
+        self.assertEqual(2, sw.flush.call_count)
+        self.assertFalse(sw.close.called)
+
+    def test_delegated_methods(self):
+        sw = Mock()
+        sw.get_logdir = Mock(return_value='/logdir')
+        with AsyncSummaryWriter(sw) as writer:
+            self.assertEqual('/logdir', writer.get_logdir())
+            writer.add_summary(b'summary', global_step=1)
+            writer.add_graph('graph', global_step=2)
+            writer.add_meta_graph('meta_graph')
+            writer.add_run_metadata('run_metadata', 'step_3', global_step=3)
+            writer.add_session_log('session_log', global_step=4)
+            writer.add_event('event')
+            writer.flush()
+
+            # the calls are delegated in order
+            self.assertEqual(
+                ['add_summary', 'add_graph', 'add_meta_graph',
+                 'add_run_metadata', 'add_session_log', 'add_event',
+                 'flush'],
+                [c[0] for c in sw.method_calls if c[0] != 'get_logdir']
+            )
+            sw.add_graph.assert_called_once_with('graph', global_step=2)
+            sw.add_meta_graph.assert_called_once_with(
+                'meta_graph', global_step=None)
+            sw.add_run_metadata.assert_called_once_with(
+                'run_metadata', 'step_3', global_step=3)
+            sw.add_session_log.assert_called_once_with(
+                'session_log', global_step=4)
+            sw.add_event.assert_called_once_with('event')
+
+    def test_drop_when_full(self):
+        blocker = threading.Event()
+        sw = Mock()
+        sw.add_summary = Mock(side_effect=lambda *args, **kwargs:
+                              blocker.wait())
+        writer = AsyncSummaryWriter(sw, queue_size=1, drop_when_full=True)
+        try:
+            # the worker is blocked by the first summary, and the second
+            # one occupies the queue, thus the rest are dropped
+            for i in range(5):
+                writer.add_summary(b'summary', global_step=i)
+            self.assertGreaterEqual(writer.dropped_count, 3)
+        finally:
+            blocker.set()
+            writer.close()
+
+    def test_worker_error(self):
+        sw = Mock()
+        sw.add_summary = Mock(side_effect=IOError('disk full'))
+        writer = AsyncSummaryWriter(sw)
+        writer.add_summary(b'summary')
+        with pytest.raises(RuntimeError, match='AsyncSummaryWriter failed to '
+                                               'write the summaries: disk '
+                                               'full'):
+            writer.flush()
+        writer.close()
@@ -1,5 +1,6 @@
 import os
 
+import numpy as np
 import pytest
 import tensorflow as tf
 from mock import Mock
@@ -165,3 +166,200 @@ class CheckpointSaverTestCase(tf.test.TestCase):
             with pytest.raises(KeyError, match='Object `obj3` not found in the '
                                                'checkpoint'):
                 saver.restore_latest()
+
+    def test_async_save(self):
+        class MyObject(CheckpointSavableObject):
+            def __init__(self, value):
+                self.value = value
+
+            def get_state(self):
+                return {'value': self.value}
+
+            def set_state(self, state):
+                self.value = state['value']
+
+        with TemporaryDirectory() as tmpdir, \
+                self.test_session() as sess:
+            save_dir = os.path.join(tmpdir, 'saves')
+            v = tf.get_variable('v', dtype=tf.int32, initializer=12)
+            w = tf.get_variable('w', dtype=tf.float32, shape=[2, 3],
+                                initializer=tf.zeros_initializer())
+            step = tf.get_variable('step', dtype=tf.int64, initializer=10)
+            obj = MyObject(56)
+            ensure_variables_initialized()
+
+            saver = CheckpointSaver([v, w], save_dir, objects={'obj': obj},
+                                    max_to_keep=2, save_meta=False,
+                                    async_save=True)
+            self.assertTrue(saver.async_save)
+
+            # the snapshot should be taken at the time of calling `save`
+            ckpt_0 = saver.save(step)
+            self.assertEqual(
+                os.path.join(save_dir, 'checkpoint.dat-10'), ckpt_0)
+            sess.run([tf.assign(v, 1212), tf.assign(w, tf.ones([2, 3]))])
+            obj.value = 5656
+            self.assertEqual([(ckpt_0, None)],
+                             saver.collect_async_results(wait=True))
+            self.assertEqual([], saver.collect_async_results(wait=True))
+            self.assertEqual(saver.latest_checkpoint(), ckpt_0)
+            saver.restore(ckpt_0)
+            self.assertEqual(12, sess.run(v))
+            np.testing.assert_equal(sess.run(w), np.zeros([2, 3]))
+            self.assertEqual(56, obj.value)
+
+            # test max_to_keep
+            sess.run([tf.assign(v, 1212), tf.assign(w, tf.ones([2, 3]))])
+            obj.value = 5656
+            ckpt_1 = saver.save(11)
+            ckpt_2 = saver.save(12)
+            self.assertEqual(saver.latest_checkpoint(), ckpt_2)
+            self.assertEqual([(ckpt_1, None), (ckpt_2, None)],
+                             saver.collect_async_results())
+            self.assertFalse(os.path.exists(ckpt_0 + '.index'))
+            self.assertTrue(os.path.exists(ckpt_1 + '.index'))
+
+            # the checkpoint files should be restored by a sync saver
+            sess.run(tf.assign(v, 0))
+            obj.value = 0
+            saver = CheckpointSaver([v, w], save_dir, objects={'obj': obj})
+            self.assertEqual(saver.latest_checkpoint(), ckpt_2)
+            saver.restore_latest()
+            self.assertEqual(1212, sess.run(v))
+            np.testing.assert_equal(sess.run(w), np.ones([2, 3]))
+            self.assertEqual(5656, obj.value)
+
+    def test_save_values(self):
+        with TemporaryDirectory() as tmpdir, \
+                self.test_session() as sess:
+            save_dir = os.path.join(tmpdir, 'saves')
+            v = tf.get_variable('v', dtype=tf.int32, initializer=12)
+            w = tf.get_variable('w', dtype=tf.float32, shape=[2, 3],
+                                initializer=tf.zeros_initializer())
+            ensure_variables_initialized()
+
+            saver = CheckpointSaver([v, w], save_dir, save_meta=False)
+            ckpt_0 = saver.save_values({v: 34, w: np.ones([2, 3])},
+                                       global_step=5)
+            self.assertEqual(
+                os.path.join(save_dir, 'checkpoint.dat-5'), ckpt_0)
+            self.assertEqual(saver.latest_checkpoint(), ckpt_0)
+            self.assertEqual(12, sess.run(v))
+
+            saver.restore_latest()
+            self.assertEqual(34, sess.run(v))
+            np.testing.assert_equal(sess.run(w), np.ones([2, 3]))
+
+            # savable objects are not supported
+            saver = CheckpointSaver([v], save_dir,
+                                    objects={'obj': Mock(
+                                        spec=CheckpointSavableObject)})
+            with pytest.raises(RuntimeError,
+                               match='`save_values` is not supported'):
+                saver.save_values({v: 1})
+
+    def test_dedup_save(self):
+        class MyObject(CheckpointSavableObject):
+            def __init__(self, value):
+                self.value = value
+
+            def get_state(self):
+                return {'value': self.value}
+
+            def set_state(self, state):
+                self.value = state['value']
+
+        def count_blobs(save_dir):
+            return sum(len(names) for _, _, names in
+                       os.walk(os.path.join(save_dir, 'blobs')))
+
+        with TemporaryDirectory() as tmpdir, \
+                self.test_session() as sess:
+            save_dir = os.path.join(tmpdir, 'saves')
+            v = tf.get_variable('v', dtype=tf.int32, initializer=12)
+            w = tf.get_variable('w', dtype=tf.float32, shape=[2, 3],
+                                initializer=tf.zeros_initializer())
+            sv = ScheduledVariable('sv', dtype=tf.float32, initial_value=34)
+            obj = MyObject(56)
+            ensure_variables_initialized()
+
+            saver = CheckpointSaver([v, w, sv], save_dir,
+                                    objects={'obj': obj}, max_to_keep=2,
+                                    dedup=True)
+            self.assertTrue(saver.dedup)
+
+            # the first checkpoint writes all the blobs
+            ckpt_0 = saver.save(0)
+            self.assertEqual(
+                os.path.join(save_dir, 'checkpoint.dat-0'), ckpt_0)
+            self.assertEqual(saver.latest_checkpoint(), ckpt_0)
+            self.assertTrue(os.path.isfile(ckpt_0 + '.meta'))
+            self.assertEqual(4, count_blobs(save_dir))
+
+            # only the changed values are written
+            sess.run(tf.assign(v, 1212))
+            obj.value = 5656
+            ckpt_1 = saver.save(1)
+            self.assertEqual(6, count_blobs(save_dir))
+            sess.run(tf.assign(v, 121212))
+            ckpt_2 = saver.save(2)
+            self.assertEqual(saver.latest_checkpoint(), ckpt_2)
+
+            # the evicted checkpoint and its unique blobs are removed
+            self.assertFalse(os.path.exists(ckpt_0))
+            self.assertFalse(os.path.exists(ckpt_0 + '.meta'))
+            self.assertEqual(5, count_blobs(save_dir))
+
+            # re-saving a checkpoint replaces its manifest, without leaving
+            # any temporary file
+            self.assertEqual(ckpt_2, saver.save(2))
+            self.assertEqual(5, count_blobs(save_dir))
+            self.assertFalse(
+                [n for n in os.listdir(save_dir) if n.endswith('.tmp')])
+
+            # restore a checkpoint
+            sess.run([tf.assign(v, 0), tf.assign(w, tf.ones([2, 3]))])
+            sv.set(0)
+            obj.value = 0
+            saver.restore(ckpt_1)
+            self.assertListEqual(sess.run([v, sv]), [1212, 34])
+            np.testing.assert_equal(sess.run(w), np.zeros([2, 3]))
+            self.assertEqual(5656, obj.value)
+
+            # the checkpoints can be recovered and restored by a saver
+            # without dedup
+            saver = CheckpointSaver([v, w], save_dir, objects={'obj': obj})
+            self.assertEqual(saver.latest_checkpoint(), ckpt_2)
+            self.assertEqual([ckpt_1, ckpt_2], saver.saver.last_checkpoints)
+            obj.value = 0
+            saver.restore_latest()
+            self.assertEqual(121212, sess.run(v))
+            self.assertEqual(5656, obj.value)
+
+            # test errors
+            saver = CheckpointSaver([v], save_dir, objects={'obj3': obj})
+            with pytest.raises(KeyError, match='Object `obj3` not found in the '
+                                               'checkpoint'):
+                saver.restore_latest()
+            u = tf.get_variable('u', dtype=tf.int32, initializer=0)
+            saver = CheckpointSaver([u], save_dir)
+            with pytest.raises(KeyError, match='Variable `u` not found in the '
+                                               'checkpoint'):
+                saver.restore_latest()
+
+            # test async dedup save, and save values
+            save_dir = os.path.join(tmpdir, 'saves2')
+            saver = CheckpointSaver([v, w], save_dir, save_meta=False,
+                                    async_save=True, dedup=True)
+            ckpt_0 = saver.save(0)
+            sess.run(tf.assign(v, 0))
+            self.assertEqual([(ckpt_0, None)],
+                             saver.collect_async_results(wait=True))
+            ckpt_1 = saver.save_values({v: 34, w: np.ones([2, 3])},
+                                       global_step=1)
+            self.assertEqual(saver.latest_checkpoint(), ckpt_1)
+            saver.restore(ckpt_0)
+            self.assertEqual(121212, sess.run(v))
+            saver.restore(ckpt_1)
+            self.assertEqual(34, sess.run(v))
+            np.testing.assert_equal(sess.run(w), np.ones([2, 3]))
@@ -0,0 +1,79 @@
+import os
+
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from tfsnippet.scaffold import *
+from tfsnippet.utils import ensure_variables_initialized, TemporaryDirectory
+
+
+class EarlyStoppingSnapshotTestCase(tf.test.TestCase):
+
+    def _test_snapshot(self, make_snapshot, description):
+        a = tf.get_variable('a', dtype=tf.int32, initializer=1)
+        b = tf.get_variable('b', dtype=tf.float32, shape=[2, 3],
+                            initializer=tf.zeros_initializer())
+        sv = ScheduledVariable('sv', dtype=tf.float32, initial_value=2.)
+
+        with self.test_session() as sess:
+            ensure_variables_initialized()
+            snapshot = make_snapshot({'a': a, 'b': b, 'sv': sv})
+            self.assertEqual([a, b, sv.variable], snapshot.variables)
+            self.assertIsNone(snapshot.latest_snapshot())
+            with pytest.raises(IOError):
+                snapshot.restore_latest()
+
+            snapshot.save(global_step=10)
+            sess.run([tf.assign(a, 2), tf.assign(b, tf.ones([2, 3]))])
+            sv.set(3.)
+            snapshot.save(global_step=20, session=sess)
+            sess.run([tf.assign(a, 3), tf.assign(b, 2 * tf.ones([2, 3]))])
+            sv.set(4.)
+
+            self.assertIn(description, snapshot.latest_snapshot())
+            snapshot.restore_latest()
+            self.assertEqual(2, sess.run(a))
+            np.testing.assert_equal(np.ones([2, 3]), sess.run(b))
+            self.assertEqual(3., sv.get())
+
+            # save the values taken earlier
+            snapshot.save_values(
+                {a: 5, b: 5 * np.ones([2, 3]), sv.variable: 6.},
+                global_step=30
+            )
+            self.assertEqual(2, sess.run(a))
+            snapshot.restore_latest()
+            self.assertEqual(5, sess.run(a))
+            np.testing.assert_equal(5 * np.ones([2, 3]), sess.run(b))
+            self.assertEqual(6., sv.get())
+            snapshot.close()
+
+    def test_host_memory_snapshot(self):
+        self._test_snapshot(HostMemorySnapshot,
+                            'snapshot in host memory at step 20')
+
+    def test_shadow_variable_snapshot(self):
+        def make_snapshot(variables):
+            snapshot = ShadowVariableSnapshot(variables)
+            self.assertEqual(3, len(snapshot.shadow_variables))
+            for v in snapshot.shadow_variables:
+                self.assertNotIn(v, tf.global_variables())
+                self.assertNotIn(v, tf.local_variables())
+            return snapshot
+
+        self._test_snapshot(make_snapshot,
+                            'snapshot in shadow variables at step 20')
+
+    def test_checkpoint_snapshot(self):
+        with TemporaryDirectory() as tmpdir:
+            save_dir = os.path.join(tmpdir, 'early_stopping')
+            self._test_snapshot(
+                lambda variables: CheckpointSnapshot(variables, save_dir),
+                'checkpoint {}'.format(
+                    os.path.join(save_dir, 'checkpoint.dat-20'))
+            )
+
+    def test_errors(self):
+        with pytest.raises(TypeError, match='Not a variable'):
+            _ = HostMemorySnapshot([tf.constant(1)])
@@ -4,10 +4,12 @@ import os
 from collections import OrderedDict
 
 import numpy as np
+import pytest
 import tensorflow as tf
+from mock import Mock
 
 from tfsnippet.scaffold import (summarize_variables, MetricLogger,
-                                ScheduledVariable)
+                                ScheduledVariable, AsyncSummaryWriter)
 from tfsnippet.utils import TemporaryDirectory, ensure_variables_initialized
 
 
@@ -207,3 +209,19 @@ class MetricLoggerTestCase(tf.test.TestCase):
                 valid_loss_values,
                 [-1, -2]
             )
+
+    def test_async_summary_writer(self):
+        sw = Mock()
+        with AsyncSummaryWriter(sw) as writer:
+            logger = MetricLogger(writer)
+            logger.collect_metrics({'loss': 1.}, global_step=3)
+            writer.flush()
+            self.assertEqual({'global_step': 3},
+                             sw.add_summary.call_args_list[0][1])
+
+            # a tensor global step is not read by the async writer, since
+            # it would synchronize the training thread with the session
+            with pytest.raises(TypeError,
+                               match='`global_step` must be an int rather '
+                                     'than a tensor'):
+                logger.collect_metrics({'loss': 2.}, tf.constant(4))
@@ -0,0 +1,94 @@
+import json
+import os
+import time
+import unittest
+
+import numpy as np
+from mock import Mock, mock
+
+from tfsnippet.scaffold import StepProfiler
+from tfsnippet.utils import TemporaryDirectory
+
+
+class StepProfilerTestCase(unittest.TestCase):
+
+    def test_record_and_stats(self):
+        profiler = StepProfiler(percentiles=(50, 99.5))
+        self.assertEqual((50, 99.5), profiler.percentiles)
+        self.assertFalse(profiler.has_records)
+        self.assertEqual({}, profiler.get_stats())
+
+        for i in range(1, 11):
+            profiler.record('session_run', .1 * i)
+        with profiler.timeit('feed_dict'):
+            time.sleep(.01)
+
+        class Hook(object):
+            def __call__(self):
+                pass
+
+        def my_handler():
+            pass
+
+        profiler.record_handler('after_step', my_handler, .5)
+        profiler.record_handler('after_step', Hook(), .25)
+        profiler.record_handler('after_epoch', Mock(callback=my_handler), 1.)
+        self.assertTrue(profiler.has_records)
+
+        stats = profiler.get_stats()
+        self.assertEqual(
+            ['session_run', 'feed_dict', 'hook:after_step:my_handler',
+             'hook:after_step:Hook', 'hook:after_epoch:my_handler'],
+            list(stats)
+        )
+        self.assertEqual(['count', 'total', 'p50', 'p99.5'],
+                         list(stats['session_run']))
+        self.assertEqual(10, stats['session_run']['count'])
+        np.testing.assert_almost_equal(5.5, stats['session_run']['total'])
+        np.testing.assert_almost_equal(
+            np.percentile(np.arange(1, 11) * .1, [50, 99.5]),
+            [stats['session_run']['p50'], stats['session_run']['p99.5']]
+        )
+        self.assertGreaterEqual(stats['feed_dict']['total'], .01)
+
+        lines = profiler.format_stats()
+        self.assertEqual(5, len(lines))
+        self.assertEqual('hook:after_step:my_handler: total 0.5s p50 0.5s '
+                         'p99.5 0.5s (x1)', lines[2])
+
+        profiler.clear()
+        self.assertFalse(profiler.has_records)
+
+    def test_bounded_memory(self):
+        profiler = StepProfiler(percentiles=(50, 90))
+        durations = np.random.RandomState(1234).uniform(size=10000)
+        with mock.patch('tfsnippet.scaffold.profiler.MAX_EXACT_DURATIONS',
+                        100):
+            for d in durations:
+                profiler.record('session_run', d)
+                self.assertLess(
+                    len(profiler._sections['session_run'].durations), 100)
+
+        stats = profiler.get_stats()['session_run']
+        self.assertEqual(10000, stats['count'])
+        np.testing.assert_almost_equal(np.sum(durations), stats['total'])
+        np.testing.assert_allclose(
+            np.percentile(durations, [50, 90]), [stats['p50'], stats['p90']],
+            atol=.01
+        )
+
+    def test_dump_json(self):
+        profiler = StepProfiler()
+        with TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, 'profile.json')
+            profiler.record('data_wait', 1.)
+            profiler.dump_json(path, step=1)
+            profiler.dump_json(path, profiler.get_stats(), step=2)
+            with open(path, 'r') as f:
+                objs = [json.loads(l) for l in f.read().strip().split('\n')]
+        self.assertEqual(2, len(objs))
+        self.assertEqual([1, 2], [o['step'] for o in objs])
+        self.assertEqual(
+            {'count': 1, 'total': 1., 'p50': 1., 'p90': 1., 'p99': 1.},
+            objs[0]['stats']['data_wait']
+        )
@@ -1,4 +1,6 @@
 import os
+
+import pytest
 import tensorflow as tf
 
 from tests.helper import assert_variables
@@ -63,3 +65,87 @@ class ScheduledVariableTestCase(tf.test.TestCase):
             self.assertEqual(v.get(), .5)
             self.assertEqual(v.anneal(), .5)
             self.assertEqual(v.get(), .5)
+
+    def test_host_cache(self):
+        v = ScheduledVariable('v', 1., host_cache=True)
+        self.assertTrue(v.host_cache)
+
+        with self.test_session() as sess:
+            ensure_variables_initialized()
+            self.assertIsNone(v.get_cached())
+            self.assertEqual(v.get(), 1.)
+            self.assertIsNone(v.get_cached())
+
+            # the value assigned by `set()` is kept in host memory
+            self.assertEqual(v.set(2.), 2.)
+            self.assertEqual(v.get_cached(), 2.)
+            self.assertEqual(v.get_cached(sess), 2.)
+            self.assertEqual(v.get(), 2.)
+
+            # obtaining `assign_op` should not invalidate the cache, while
+            # running it directly requires invalidating the cache manually
+            assign_op, assign_ph = v.assign_op, v.assign_ph
+            self.assertEqual(v.get_cached(), 2.)
+            sess.run(assign_op, feed_dict={assign_ph: 3.})
+            v.invalidate_cache()
+            self.assertIsNone(v.get_cached())
+            self.assertEqual(v.get(), 3.)
+
+            # the cache should be invalidated after assigned by other means
+            v.set(3.5)
+            sess.run(tf.assign(v.variable, 4.))
+            v.invalidate_cache()
+            self.assertEqual(v.get(), 4.)
+
+            v.set(4.)
+            ScheduledVariable.invalidate_all_caches()
+            self.assertIsNone(v.get_cached())
+            self.assertEqual(v.get(), 4.)
+
+            # the value assigned by `anneal()` is kept in host memory
+            a = AnnealingVariable('a', 1., .5, host_cache=True)
+            ensure_variables_initialized()
+            self.assertEqual(a.anneal(), .5)
+            self.assertEqual(a.get_cached(), .5)
+
+            # the host cache is disabled by default
+            w = ScheduledVariable('w', 1.)
+            self.assertFalse(w.host_cache)
+            ensure_variables_initialized()
+            self.assertEqual(w.set(2.), 2.)
+            self.assertIsNone(w.get_cached())
+            sess.run(tf.assign(w.variable, 3.))
+            self.assertEqual(w.get(), 3.)
+
+    def test_schedule_by_global_step(self):
+        global_step = tf.get_variable(
+            'global_step', dtype=tf.int64,
+            initializer=tf.constant(0, dtype=tf.int64)
+        )
+        step_ph = tf.placeholder(dtype=tf.int64, shape=())
+        assign_step = tf.assign(global_step, step_ph)
+        v = AnnealingVariable('v', 1., .5, .25)
+        self.assertIsNone(v.schedule_op)
+        op = v.anneal_by_global_step(global_step, steps=2)
+        self.assertIs(op, v.schedule_op)
+
+        with pytest.raises(RuntimeError, match='The value of this variable '
+                                               'has already been scheduled'):
+            _ = v.schedule_by_global_step(lambda s: s, global_step)
+        with pytest.raises(ValueError, match='`steps` must be at least 1'):
+            _ = AnnealingVariable('v2', 1., .5).anneal_by_global_step(
+                global_step, steps=0)
+
+        with self.test_session() as sess:
+            ensure_variables_initialized()
+            for step, value in [(0, 1.), (1, 1.), (2, .5), (3, .5), (4, .25),
+                                (6, .25)]:
+                sess.run(assign_step, feed_dict={step_ph: step})
+                sess.run(op)
+                self.assertEqual(v.get(), value)
+
+            # no host-side value is kept for in-graph scheduled variables
+            self.assertEqual(v.set(2.), 2.)
+            self.assertIsNone(v.get_cached())
+            sess.run(op)
+            self.assertEqual(v.get(), .25)
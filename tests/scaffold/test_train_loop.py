@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
+import json
 import os
 import re
 import time
@@ -11,7 +12,10 @@ from mock import Mock
 
 from tfsnippet.dataflows import DataFlow
 from tfsnippet.scaffold import (TrainLoop, CheckpointSavableObject,
-                                ScheduledVariable)
+                                ScheduledVariable, AsyncSummaryWriter,
+                                EventKeys, HostMemorySnapshot,
+                                ShadowVariableSnapshot, CheckpointSnapshot,
+                                StepProfiler)
 from tfsnippet.scaffold.train_loop_ import (TRAIN_LOOP_STATES_CKPT_NAME,
                                             EARLY_STOPPING_STATES_CKPT_NAME)
 from tfsnippet.utils import (TemporaryDirectory,
@@ -141,6 +145,47 @@ class TrainLoopTestCase(tf.test.TestCase):
             self.assertEqual(epoch_counter, 3)
             self.assertEqual(step_counter, 10)
 
+    def test_multi_step_counters(self):
+        # test loop with configured `max_epoch`
+        with TrainLoop([], max_epoch=2) as loop:
+            runs = []
+            for epoch in loop.iter_epochs():
+                df = DataFlow.arrays([np.arange(5)], 1)
+                for step, batches in loop.iter_multi_steps(2, df):
+                    self.assertEqual(step, loop.step)
+                    self.assertEqual(len(batches), loop.steps_in_run)
+                    self.assertIs(batches, loop.step_data)
+                    runs.append((step, [b[0][0] for b in batches]))
+                self.assertEqual(1, loop.steps_in_run)
+            self.assertEqual(
+                [(2, [0, 1]), (4, [2, 3]), (5, [4]),
+                 (7, [0, 1]), (9, [2, 3]), (10, [4])],
+                runs
+            )
+
+        # test loop with configured `max_step`
+        with TrainLoop([], max_step=10) as loop:
+            runs = []
+            for epoch in loop.iter_epochs():
+                for step, num_steps in loop.iter_multi_steps(4):
+                    runs.append((step, num_steps))
+            self.assertEqual([(4, 4), (8, 4), (10, 2)], runs)
+
+        # test loop with configured `max_step` with payload
+        with TrainLoop([], max_step=5) as loop:
+            runs = []
+            for epoch in loop.iter_epochs():
+                for step, batches in loop.iter_multi_steps(3, np.arange(4)):
+                    runs.append((epoch, step, list(batches)))
+            self.assertEqual(
+                [(1, 3, [0, 1, 2]), (1, 4, [3]), (2, 5, [0])], runs)
+
+        with pytest.raises(ValueError,
+                           match='`steps_per_run` must be at least 1'):
+            with TrainLoop([], max_step=5) as loop:
+                for _ in loop.iter_epochs():
+                    _ = list(loop.iter_multi_steps(0))
+
     def test_get_progress(self):
         null_print = lambda x: None
 
@@ -380,6 +425,20 @@ class TrainLoopTestCase(tf.test.TestCase):
             r'$'
         ))
 
+    def test_collect_weighted_metrics(self):
+        logs = []
+        with TrainLoop([], max_epoch=1, print_func=logs.append,
+                       show_eta=False) as loop:
+            for _ in loop.iter_epochs():
+                loop.collect_weighted_metrics({'x': 2.}, 1)
+                loop.collect_weighted_metrics({'x': 3.}, 3)
+                loop.print_logs()
+        self.assertMatches('\n'.join(logs), re.compile(
+            r'^'
+            r'\[Step 0\] epoch time: [^ ]+s; x: 2\.75 \(±0\.433013\)'
+            r'$'
+        ))
+
     def test_summary_writer(self):
         def read_summary(summary_dir):
             # read the metric summary
@@ -469,6 +528,92 @@ class TrainLoopTestCase(tf.test.TestCase):
                 ['metrics/loss', 'metrics/valid_loss']
             )
 
+        # test write summary asynchronously
+        with TemporaryDirectory() as tempdir:
+            with TrainLoop([], max_epoch=2, summary_dir=tempdir,
+                           summary_async=True) as loop:
+                self.assertIsInstance(loop.summary_writer,
+                                      AsyncSummaryWriter)
+                self.assertIs(loop.summary_writer.summary_writer,
+                              loop._summary_writer)
+                for epoch in loop.iter_epochs():
+                    for _, loss in loop.iter_steps([0.7, 0.6, 0.8]):
+                        loop.collect_metrics(loss=epoch + loss)
+                    loop.collect_metrics(valid_loss=epoch)
+
+                with self.test_session():
+                    summary_op = tf.summary.scalar('x', tf.constant(1.23))
+                    loop.add_summary(summary_op.eval())
+            self.assertIsNone(loop._async_summary_writer)
+
+            obj = read_summary(tempdir)
+            self.assertEqual(
+                ['metrics/loss', 'metrics/valid_loss', 'x'],
+                sorted(obj[0])
+            )
+            np.testing.assert_equal(obj[1], [1, 2, 3, 4, 5, 6])
+            np.testing.assert_almost_equal(
+                obj[2],
+                [1.7, 1.6, 1.8, 2.7, 2.6, 2.8]
+            )
+            np.testing.assert_equal(obj[3], [3, 6])
+            np.testing.assert_almost_equal(obj[4], [1, 2])
+            np.testing.assert_equal(obj[5], [6])
+            np.testing.assert_almost_equal(obj[6], [1.23])
+
+    def test_profile(self):
+        logs = []
+        with TemporaryDirectory() as tempdir:
+            json_file = os.path.join(tempdir, 'profile.json')
+            with TrainLoop([], max_epoch=1, profile=True,
+                           profile_json_file=json_file,
+                           print_func=logs.append) as loop:
+                self.assertIsInstance(loop.profiler, StepProfiler)
+                loop.events.on(EventKeys.AFTER_STEP, lambda l: None)
+                for _ in loop.iter_epochs():
+                    for _ in loop.iter_steps([1, 2]):
+                        with loop.profile('session_run'):
+                            pass
+                    loop.print_logs()
+                    self.assertFalse(loop.profiler.has_records)
+                    loop.print_logs()
+
+            with open(json_file, 'r') as f:
+                objs = [json.loads(l) for l in f.read().strip().split('\n')]
+            self.assertEqual(1, len(objs))
+            self.assertEqual(1, objs[0]['epoch'])
+            self.assertEqual(2, objs[0]['step'])
+            self.assertEqual(
+                ['data_wait', 'hook:after_step:<lambda>', 'session_run'],
+                sorted(objs[0]['stats'])
+            )
+            self.assertEqual(3, objs[0]['stats']['data_wait']['count'])
+            self.assertEqual(2, objs[0]['stats']['session_run']['count'])
+
+        profile_logs = [l for l in logs if 'Profile: ' in l]
+        self.assertEqual(3, len(profile_logs))
+        self.assertTrue(any('Profile: data_wait: total ' in l
+                            for l in profile_logs))
+
+        # profiling is disabled by default
+        with TrainLoop([], max_epoch=1) as loop:
+            self.assertIsNone(loop.profiler)
+            for _ in loop.iter_epochs():
+                with loop.profile('session_run'):
+                    pass
+
+        profiler = StepProfiler(percentiles=[50])
+        with TrainLoop([], profile=profiler) as loop:
+            self.assertIs(profiler, loop.profiler)
+
+        with pytest.raises(TypeError, match='`profile` must be a bool or a '
+                                            'StepProfiler'):
+            _ = TrainLoop([], profile=1)
+        with pytest.raises(ValueError, match='`profile_json_file` is '
+                                             'specified, but `profile` is not '
+                                             'enabled'):
+            _ = TrainLoop([], profile_json_file='profile.json')
+
     def test_early_stopping(self):
         with self.test_session():
             a = tf.get_variable('a', shape=(), dtype=tf.int32)
@@ -508,6 +653,45 @@ class TrainLoopTestCase(tf.test.TestCase):
             self.assertAlmostEqual(loop.best_valid_metric, 0.8)
             self.assertEqual(get_variable_values([a, b]), [13, 23])
 
+    def test_early_stopping_backends(self):
+        with self.test_session(), TemporaryDirectory() as tempdir:
+            a = tf.get_variable('a', shape=(), dtype=tf.int32)
+            b = tf.get_variable('b', shape=(), dtype=tf.int32)
+
+            for backend, snapshot_class in [
+                    (None, HostMemorySnapshot),
+                    ('memory', HostMemorySnapshot),
+                    ('variable', ShadowVariableSnapshot),
+                    ('disk', CheckpointSnapshot)]:
+                set_variable_values([a, b], [1, 2])
+                with TrainLoop([a], max_epoch=1, early_stopping=True,
+                               early_stopping_backend=backend) as loop:
+                    self.assertIsInstance(loop._early_stopping_snapshot,
+                                          snapshot_class)
+                    for _ in loop.iter_epochs():
+                        for step, valid_loss in \
+                                loop.iter_steps([0.7, 0.6, 0.8]):
+                            set_variable_values([a, b],
+                                                [10 + step, 20 + step])
+                            loop.collect_metrics(valid_loss=valid_loss)
+                self.assertAlmostEqual(loop.best_valid_metric, 0.6)
+                self.assertEqual(get_variable_values([a, b]), [12, 23])
+
+            # the disk backend is the default if `checkpoint_dir` is specified
+            with TrainLoop([a], checkpoint_dir=tempdir,
+                           early_stopping=True) as loop:
+                self.assertIsInstance(loop._early_stopping_snapshot,
+                                      CheckpointSnapshot)
+            with TrainLoop([a], checkpoint_dir=tempdir, early_stopping=True,
+                           early_stopping_backend='variable') as loop:
+                self.assertIsInstance(loop._early_stopping_snapshot,
+                                      ShadowVariableSnapshot)
+
+            with pytest.raises(ValueError, match='Unsupported '
+                                                 '`early_stopping_backend`'):
+                _ = TrainLoop([a], early_stopping=True,
+                              early_stopping_backend='gpu')
+
     def test_checkpoint(self):
         class MyObject(CheckpointSavableObject):
             def __init__(self):
@@ -590,6 +774,52 @@ class TrainLoopTestCase(tf.test.TestCase):
                     self.assertEqual(o.value, 9120 + epoch)
                     self.assertEqual(var.get(), 9450 + epoch)
 
+    def test_async_checkpoint(self):
+        var = ScheduledVariable('var', initial_value=456, dtype=tf.int32)
+
+        with self.test_session() as sess, \
+                TemporaryDirectory() as tempdir:
+            ensure_variables_initialized()
+            saved = []
+            failed = []
+
+            with TrainLoop([var.variable],
+                           checkpoint_dir=tempdir,
+                           checkpoint_epoch_freq=2,
+                           checkpoint_async=True,
+                           max_epoch=4) as loop:
+                self.assertTrue(loop._checkpoint_saver.async_save)
+                loop.events.on(EventKeys.CHECKPOINT_SAVED,
+                               lambda l, path: saved.append(path))
+                loop.events.on(EventKeys.CHECKPOINT_FAILED,
+                               lambda l, path, err: failed.append(path))
+                for epoch in loop.iter_epochs():
+                    for _ in loop.iter_steps([1, 1]):
+                        pass
+                    var.set(9450 + epoch)
+
+            self.assertEqual(
+                [os.path.join(tempdir, 'checkpoint/checkpoint.dat-{}'.
+                              format(i)) for i in (4, 8)],
+                saved
+            )
+            self.assertEqual([], failed)
+
+            # restore from latest
+            with TrainLoop([var.variable], checkpoint_dir=tempdir) as loop:
+                self.assertEqual(loop.epoch, 4)
+                self.assertEqual(loop.step, 8)
+                self.assertEqual(var.get(), 9454)
+
+            # sync checkpoint should also fire the event
+            saved = []
+            with TrainLoop([var.variable], checkpoint_dir=tempdir) as loop:
+                loop.events.on(EventKeys.CHECKPOINT_SAVED,
+                               lambda l, path: saved.append(path))
+                loop.make_checkpoint()
+            self.assertEqual(
+                [os.path.join(tempdir, 'checkpoint/checkpoint.dat-8')], saved)
+
     def test_checkpoint_and_early_stopping(self):
         with self.test_session(), TemporaryDirectory() as tempdir:
             a = tf.get_variable('a', shape=(), dtype=tf.int32)
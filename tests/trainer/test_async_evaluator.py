@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+from mock import Mock
+
+from tfsnippet.dataflows import DataFlow
+from tfsnippet.scaffold import TrainLoop, EventKeys
+from tfsnippet.trainer import *
+from tfsnippet.utils import ensure_variables_initialized
+
+
+class AsyncEvaluatorTestCase(tf.test.TestCase):
+
+    def test_props(self):
+        loop = Mock(valid_metric_name='valid_loss')
+        ph = tf.placeholder(tf.float32, shape=[None])
+        df = DataFlow.arrays([np.arange(4, dtype=np.float32)], batch_size=2)
+
+        v = AsyncEvaluator(loop, tf.reduce_mean(ph), [ph], df, max_pending=2)
+        self.assertIsInstance(v, Evaluator)
+        self.assertEqual(2, v.max_pending)
+        self.assertEqual(0, v.pending_count)
+        loop.events.on.assert_any_call(EventKeys.AFTER_STEP,
+                                       v._on_loop_event)
+        loop.events.on.assert_any_call(EventKeys.AFTER_EPOCH,
+                                       v._on_loop_event)
+
+        # nothing to collect and nothing to close
+        v.collect_results(wait=True)
+        v.close()
+
+        with pytest.raises(ValueError,
+                           match='`max_pending` must be at least 1'):
+            _ = AsyncEvaluator(loop, tf.reduce_mean(ph), [ph], df,
+                               max_pending=0)
+
+    def test_model_variables(self):
+        w = tf.get_variable('w', dtype=tf.float32, initializer=1.)
+        m = tf.get_variable('m', dtype=tf.float32, initializer=0.,
+                            trainable=False,
+                            collections=[tf.GraphKeys.GLOBAL_VARIABLES,
+                                         tf.GraphKeys.MODEL_VARIABLES])
+        s = tf.get_variable('s', dtype=tf.float32, initializer=0.,
+                            trainable=False)
+        _ = tf.get_variable('other', dtype=tf.float32, initializer=0.,
+                            trainable=False)
+        _ = tf.train.AdamOptimizer().minimize(w * w)
+        ph = tf.placeholder(tf.float32, shape=[None])
+        df = DataFlow.arrays([np.arange(4, dtype=np.float32)], batch_size=2)
+
+        # the optimizer slots and the other non-trainable variables should
+        # not be taken snapshot of by default
+        loop = Mock(valid_metric_name='valid_loss', param_vars={'s': s})
+        v = AsyncEvaluator(loop, tf.reduce_mean(ph), [ph], df)
+        self.assertEqual([w, m, s],
+                         v._model_variables(tf.get_default_graph()))
+
+    def test_run(self):
+        w = tf.get_variable('w', dtype=tf.float32, initializer=1.)
+        ph = tf.placeholder(tf.float32, shape=[None])
+        scale = tf.placeholder(tf.float32, shape=())
+        loss = tf.reduce_mean(ph) * w * scale
+        df = DataFlow.arrays([np.arange(1, 5, dtype=np.float32)],
+                             batch_size=2)
+        w_values = [2., .5, 3.]
+        assign_ph = tf.placeholder(tf.float32, shape=())
+        assign_op = tf.assign(w, assign_ph)
+
+        logs = []
+        results = []
+        with self.test_session() as sess:
+            ensure_variables_initialized()
+            with TrainLoop([w], max_epoch=3, early_stopping=True,
+                           print_func=logs.append) as loop:
+                v = AsyncEvaluator(loop, loss, [ph], df,
+                                   feed_dict={scale: lambda: 2.})
+                v.events.on(EventKeys.AFTER_EXECUTION,
+                            lambda e: results.append(
+                                (loop.step, dict(e.last_metrics_dict))))
+
+                for epoch in loop.iter_epochs():
+                    for _ in loop.iter_steps([0]):
+                        # evaluate on the snapshot, while `w` is changed
+                        v.run()
+                        self.assertEqual(1, v.pending_count)
+                        sess.run(assign_op,
+                                 feed_dict={assign_ph: w_values[epoch - 1]})
+                        if epoch < 3:
+                            v.collect_results(wait=True)
+                            self.assertEqual(0, v.pending_count)
+
+                # the last evaluation is delivered outside the epoch loop
+                self.assertEqual(1, v.pending_count)
+                v.collect_results(wait=True)
+                self.assertEqual(0, v.pending_count)
+                v.close()
+
+            # the early-stopping should restore the snapshot of the best
+            # evaluation, rather than the values when it is delivered
+            self.assertEqual(.5, sess.run(w))
+
+        self.assertEqual([1, 2, 3], [r[0] for r in results])
+        np.testing.assert_allclose(
+            [5., 10., 2.5], [r[1]['valid_loss'] for r in results])
+        for _, r in results:
+            self.assertIn('eval_time', r)
+        self.assertEqual(2.5, loop.best_valid_metric)
+        self.assertTrue(any(
+            l.startswith('[Step 3] ') and l.endswith(' (*)') and
+            'valid_loss: 2.5' in l
+            for l in logs
+        ))
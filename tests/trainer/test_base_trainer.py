@@ -8,9 +8,15 @@ from mock import Mock
 from tfsnippet.dataflows import DataFlow
 from tfsnippet.scaffold import TrainLoop, AnnealingVariable, EventKeys
 from tfsnippet.trainer import *
+from tfsnippet.trainer.base_trainer import OnEveryFewCalls
 from tfsnippet.utils import EventSource
 
 
+def hooks_repr(trainer, event_key):
+    return repr([hook for key, hook in trainer.hook_schedule
+                 if key == event_key])
+
+
 class BaseTrainerTestCase(tf.test.TestCase):
 
     def test_props(self):
@@ -66,39 +72,44 @@ class BaseTrainerTestCase(tf.test.TestCase):
         )
 
         self.assertEqual(
-            repr(t.events._event_handlers_map[EventKeys.STEP_EVALUATION]),
+            hooks_repr(t, EventKeys.STEP_EVALUATION),
             '[eval:step:5, {!r}:step:9, eval2:step:15]'.format(eval1.run)
         )
         self.assertEqual(
-            repr(t.events._event_handlers_map[EventKeys.STEP_ANNEALING]),
+            hooks_repr(t, EventKeys.STEP_ANNEALING),
             '[anneal:step:7, {!r}:step:11, anneal2:step:17]'.
             format(anneal1.anneal)
         )
         self.assertEqual(
-            repr(t.events._event_handlers_map[EventKeys.STEP_LOGGING]),
+            hooks_repr(t, EventKeys.STEP_LOGGING),
             '[print_logs:step:3, print_logs:step:13]'
         )
 
         self.assertEqual(
-            repr(t.events._event_handlers_map[EventKeys.EPOCH_EVALUATION]),
+            hooks_repr(t, EventKeys.EPOCH_EVALUATION),
             '[eval:epoch:6, {!r}:epoch:10, eval2:epoch:16]'.format(eval2.run)
         )
         self.assertEqual(
-            repr(t.events._event_handlers_map[EventKeys.EPOCH_ANNEALING]),
+            hooks_repr(t, EventKeys.EPOCH_ANNEALING),
             '[anneal:epoch:8, {!r}:epoch:12, anneal2:epoch:18]'.
             format(anneal2.anneal)
         )
         self.assertEqual(
-            repr(t.events._event_handlers_map[EventKeys.EPOCH_LOGGING]),
+            hooks_repr(t, EventKeys.EPOCH_LOGGING),
             '[print_logs:epoch:4, print_logs:epoch:14]'
         )
 
+        # only one dispatcher is registered for each event
+        self.assertEqual(
+            1, len(t.events._event_handlers_map[EventKeys.STEP_EVALUATION]))
+
         # test remove
         t.remove_log_hooks()
         self.assertNotIn(
             EventKeys.STEP_LOGGING, t.events._event_handlers_map)
         self.assertNotIn(
             EventKeys.EPOCH_LOGGING, t.events._event_handlers_map)
+        self.assertEqual('[]', hooks_repr(t, EventKeys.STEP_LOGGING))
 
         t.remove_validation_hooks()
         self.assertNotIn(
@@ -148,6 +159,121 @@ class BaseTrainerTestCase(tf.test.TestCase):
 
         self.assertEqual(f.call_count, 2)
 
+        # test multiple steps in a run
+        f.reset_mock()
+        t._steps_in_run = 3
+        for i in range(3, 22, 3):
+            t.loop.step = i
+            t.events.fire(EventKeys.STEP_EVALUATION, t)
+        self.assertEqual(f.call_count, 4)  # at 6, 12, 15 and 21
+
+    def test_hook_call(self):
+        # the hook can still run as a plain event handler
+        t = BaseTrainer(Mock(valid_metric_name='valid_loss'))
+        f = Mock(return_value=123)
+        hook = OnEveryFewCalls('step', 5, f)
+        results = []
+        for i in range(1, 11):
+            t.loop.step = i
+            results.append(hook(t))
+        self.assertEqual([None] * 4 + [123] + [None] * 4 + [123], results)
+
+        # test multiple steps in a run
+        f.reset_mock()
+        t._steps_in_run = 3
+        for i in range(3, 22, 3):
+            t.loop.step = i
+            hook(t)
+        self.assertEqual(f.call_count, 4)  # at 6, 12, 15 and 21
+
+        # the epoch hook ignores the steps in a run
+        f.reset_mock()
+        hook = OnEveryFewCalls('epoch', 2, f)
+        for i in range(1, 5):
+            t.loop.epoch = i
+            hook(t)
+        self.assertEqual(f.call_count, 2)
+
+    def test_hook_schedule(self):
+        loop = Mock(valid_metric_name='valid_loss')
+        t = BaseTrainer(loop)
+        calls = []
+        f = Mock(side_effect=lambda: calls.append('f'),
+                 __repr__=lambda o: 'f')
+        g = Mock(side_effect=lambda: calls.append('g'),
+                 __repr__=lambda o: 'g')
+        t.anneal_after(g, steps=3)
+        t.anneal_after(f, steps=2)
+        [(key, hook_g), (_, hook_f)] = t.hook_schedule
+        self.assertEqual(EventKeys.STEP_ANNEALING, key)
+        self.assertEqual(('step', 3, None), (hook_g.key, hook_g.freq,
+                                             hook_g.next_due))
+
+        # the due hooks run in the order of registration
+        for i in range(1, 7):
+            t.loop.step = i
+            t.events.fire(EventKeys.STEP_ANNEALING, t)
+        self.assertEqual(['f', 'g', 'f', 'g', 'f'], calls)
+        self.assertEqual((9, 8), (hook_g.next_due, hook_f.next_due))
+
+        # hooks added later are scheduled by the same dispatcher
+        t.anneal_after(f, steps=5)
+        t.loop.step = 8
+        t.events.fire(EventKeys.STEP_ANNEALING, t)
+        self.assertEqual(['f', 'g', 'f', 'g', 'f', 'f'], calls)
+        self.assertEqual([9, 10, 10],
+                         [h.next_due for _, h in t.hook_schedule])
+
+        # the hooks are re-registered after removed
+        t.remove_annealing_hooks()
+        self.assertEqual([], t.hook_schedule)
+        t.anneal_after(g, steps=1)
+        t.events.fire(EventKeys.STEP_ANNEALING, t)
+        self.assertEqual('g', calls[-1])
+
+        # the time of each hook is reported to the handler timer
+        timer = Mock()
+        t.events.set_handler_timer(timer)
+        t.loop.step = 9
+        t.events.fire(EventKeys.STEP_ANNEALING, t)
+        self.assertEqual(1, timer.call_count)
+        self.assertEqual(EventKeys.STEP_ANNEALING, timer.call_args[0][0])
+        self.assertIs(g, timer.call_args[0][1].callback)
+
+    def test_hook_order_with_event_handlers(self):
+        loop = Mock(valid_metric_name='valid_loss')
+        t = BaseTrainer(loop)
+        calls = []
+
+        def hook(name):
+            return Mock(side_effect=lambda: calls.append(name),
+                        __repr__=lambda o: name)
+
+        t.anneal_after(hook('f'), steps=1)
+        t.anneal_after(hook('g'), steps=1)
+        t.events.on(EventKeys.STEP_ANNEALING,
+                    lambda trainer: calls.append('handler'))
+        t.anneal_after(hook('h'), steps=2)
+        t.anneal_after(hook('k'), steps=1)
+
+        # the consecutive hooks share one dispatcher, while the plain
+        # handler keeps its position among the hooks
+        self.assertEqual(
+            3, len(t.events.get_event_handlers(EventKeys.STEP_ANNEALING)))
+        for i in range(1, 3):
+            t.loop.step = i
+            t.events.fire(EventKeys.STEP_ANNEALING, t)
+        self.assertEqual(['f', 'g', 'handler', 'k',
+                          'f', 'g', 'handler', 'h', 'k'], calls)
+        self.assertEqual('[f:step:1, g:step:1, h:step:2, k:step:1]',
+                         hooks_repr(t, EventKeys.STEP_ANNEALING))
+
+        # the hooks of all the dispatchers are removed
+        t.remove_annealing_hooks()
+        self.assertEqual([], t.hook_schedule)
+        self.assertEqual(
+            [], t.events.get_event_handlers(EventKeys.STEP_ANNEALING))
+
     def test_run(self):
         with self.test_session() as session:
             df = DataFlow.arrays([np.arange(6, dtype=np.float32)], batch_size=4)
@@ -0,0 +1,204 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+from mock import patch
+
+from tfsnippet.trainer import *
+
+
+class AverageGradientsTestCase(tf.test.TestCase):
+
+    def test_average_gradients(self):
+        v = tf.get_variable('v', shape=[2], dtype=tf.float32)
+        w = tf.get_variable('w', shape=[], dtype=tf.float32)
+        tower_grads = [
+            [(tf.constant([1., 2.]), v), (tf.constant(3.), w)],
+            [(tf.constant([3., 4.]), v), (tf.constant(5.), w)],
+            [(tf.constant([5., 9.]), v), (tf.constant(7.), w)],
+        ]
+        self.assertIs(tower_grads[0], average_gradients(tower_grads[:1]))
+
+        grads = average_gradients(tower_grads)
+        self.assertEqual([v, w], [x for _, x in grads])
+        with self.test_session() as sess:
+            g_v, g_w = sess.run([g for g, _ in grads])
+            np.testing.assert_allclose(g_v, [3., 5.])
+            np.testing.assert_allclose(g_w, 5.)
+
+    def test_sparse_gradients(self):
+        emb = tf.get_variable('emb', shape=[4, 2], dtype=tf.float32)
+        tower_grads = [
+            [(tf.IndexedSlices(tf.constant([[1., 2.]]), tf.constant([0]),
+                               tf.constant([4, 2])), emb)],
+            [(tf.IndexedSlices(tf.constant([[3., 4.], [5., 6.]]),
+                               tf.constant([0, 3]),
+                               tf.constant([4, 2])), emb)],
+        ]
+        [(grad, var)] = average_gradients(tower_grads)
+        self.assertIs(emb, var)
+        self.assertIsInstance(grad, tf.IndexedSlices)
+
+        with self.test_session() as sess:
+            np.testing.assert_allclose(
+                sess.run(tf.convert_to_tensor(grad)),
+                [[2., 3.], [0., 0.], [0., 0.], [2.5, 3.]]
+            )
+
+        # mixed dense and sparse gradients are densified
+        tower_grads[1][0] = (tf.ones([4, 2]), emb)
+        [(grad, var)] = average_gradients(tower_grads)
+        self.assertNotIsInstance(grad, tf.IndexedSlices)
+        with self.test_session() as sess:
+            np.testing.assert_allclose(
+                sess.run(grad),
+                [[1., 1.5], [.5, .5], [.5, .5], [.5, .5]]
+            )
+
+    def test_none_gradients(self):
+        v = tf.get_variable('v', shape=[], dtype=tf.float32)
+        self.assertEqual([(None, v)],
+                         average_gradients([[(None, v)], [(None, v)]]))
+        with pytest.raises(ValueError, match='The gradients of variable .* '
+                                             'are None in some of the '
+                                             'towers'):
+            _ = average_gradients([[(None, v)], [(tf.constant(1.), v)]])
+
+    def test_bucketing(self):
+        np.random.seed(1234)
+        shapes = [[2, 3], [], [5], [100], [4], [3, 1]]
+        variables = [tf.get_variable('v{}'.format(i), shape=s)
+                     for i, s in enumerate(shapes)]
+        values = [[np.random.normal(size=s).astype(np.float32)
+                   for s in shapes] for _ in range(3)]
+        tower_grads = [[(tf.constant(g), v) for g, v in zip(t, variables)]
+                       for t in values]
+
+        grads = average_gradients(tower_grads, bucket_size=10)
+        self.assertEqual(variables, [v for _, v in grads])
+        for (g, _), shape in zip(grads, shapes):
+            self.assertEqual(shape, g.get_shape().as_list())
+
+        with self.test_session() as sess:
+            outputs = sess.run([g for g, _ in grads])
+            for i, out in enumerate(outputs):
+                np.testing.assert_allclose(
+                    out, np.mean([t[i] for t in values], axis=0),
+                    rtol=1e-5
+                )
+
+
+class DataParallelTestCase(tf.test.TestCase):
+
+    def test_detect_devices(self):
+        path = 'tfsnippet.trainer.data_parallel.detect_gpus'
+
+        with patch(path, return_value=[]):
+            dp = DataParallel()
+            self.assertEqual(('/device:CPU:0',), dp.work_devices)
+            self.assertEqual('/device:CPU:0', dp.main_device)
+            self.assertEqual((), dp.gpu_devices)
+            self.assertEqual({'device_count': {'CPU': 1}},
+                             dp.session_kwargs())
+
+        with patch(path, return_value=[['/device:GPU:0', '/device:GPU:1']]):
+            dp = DataParallel()
+            self.assertEqual(('/device:GPU:0', '/device:GPU:1'),
+                             dp.work_devices)
+            self.assertEqual(dp.work_devices, dp.gpu_devices)
+            self.assertEqual('/device:GPU:0', dp.main_device)
+            self.assertTrue(dp.is_gpu_device('/device:GPU:1'))
+            self.assertFalse(dp.channels_last('/device:GPU:1'))
+            self.assertEqual({}, dp.session_kwargs())
+
+        with patch(path, return_value=[['/device:GPU:0'], ['/device:GPU:1']]):
+            dp = DataParallel()
+            self.assertEqual('/device:CPU:0', dp.main_device)
+            dp = DataParallel(disable_prebuild=True)
+            self.assertTrue(dp.disable_prebuild)
+            self.assertEqual('/device:GPU:0', dp.main_device)
+
+    def test_cpu_towers(self):
+        dp = DataParallel.cpu_towers(3)
+        self.assertEqual(3, dp.num_towers)
+        self.assertEqual(
+            ('/device:CPU:0', '/device:CPU:1', '/device:CPU:2'),
+            dp.work_devices
+        )
+        self.assertEqual('/device:CPU:0', dp.main_device)
+        self.assertEqual((), dp.gpu_devices)
+        self.assertTrue(dp.channels_last('/device:CPU:1'))
+        self.assertEqual(
+            {'device_count': {'CPU': 3}, 'intra_op_parallelism_threads': 2,
+             'inter_op_parallelism_threads': 3},
+            dp.session_kwargs(cpu_threads=7)
+        )
+
+        with pytest.raises(ValueError, match='`num_towers` must be at least 1'):
+            _ = DataParallel.cpu_towers(0)
+        with pytest.raises(ValueError, match='`devices` must not be empty'):
+            _ = DataParallel(devices=[])
+
+    def test_data_parallel(self):
+        dp = DataParallel.cpu_towers(3)
+        input_x = tf.placeholder(tf.float32, shape=[None])
+        batch_size = tf.shape(input_x)[0]
+
+        towers = list(dp.data_parallel(batch_size, [input_x]))
+        self.assertEqual(list(dp.work_devices), [t[0] for t in towers])
+        self.assertEqual([False] * 3, [t[1] for t in towers])
+
+        outputs = []
+        for dev, _, [dev_x] in towers:
+            with tf.device(dev), dp.maybe_name_scope(dev):
+                outputs.append(dev_x * 2.)
+        [mean] = dp.average([[tf.reduce_mean(o) for o in outputs]],
+                            batch_size)
+        [concat] = dp.concat([outputs])
+        [simple_mean] = dp.average([[tf.reduce_mean(o) for o in outputs]])
+
+        x = np.arange(7, dtype=np.float32)
+        with tf.Session(config=tf.ConfigProto(**dp.session_kwargs())) as sess:
+            # the batch should be split into nearly equal slices
+            slices = sess.run([t[2][0] for t in towers],
+                              feed_dict={input_x: x})
+            self.assertEqual([2, 2, 3], [len(s) for s in slices])
+            np.testing.assert_equal(np.concatenate(slices), x)
+
+            m, c, sm = sess.run([mean, concat, simple_mean],
+                                feed_dict={input_x: x})
+            np.testing.assert_allclose(m, np.mean(x * 2.), rtol=1e-5)
+            np.testing.assert_allclose(c, x * 2.)
+            np.testing.assert_allclose(
+                sm, np.mean([np.mean(s * 2.) for s in slices]), rtol=1e-5)
+
+    def test_single_device(self):
+        dp = DataParallel(devices=['/device:CPU:0'])
+        self.assertEqual('/device:CPU:0', dp.main_device)
+        input_x = tf.placeholder(tf.float32, shape=[None])
+        self.assertEqual(
+            [('/device:CPU:0', False, (input_x,))],
+            list(dp.data_parallel(tf.shape(input_x)[0], [input_x]))
+        )
+        self.assertEqual([input_x], dp.concat([[input_x]]))
+        self.assertEqual([input_x], dp.average([[input_x]]))
+        self.assertEqual([], dp.average([]))
+
+    def test_prebuild(self):
+        dp = DataParallel(devices=['/device:GPU:0', '/device:GPU:1'])
+        self.assertEqual('/device:CPU:0', dp.main_device)
+        input_x = tf.placeholder(tf.float32, shape=[None])
+        towers = list(dp.data_parallel(4, [input_x]))
+        self.assertEqual(('/device:CPU:0', True, (input_x,)), towers[0])
+        self.assertEqual(['/device:GPU:0', '/device:GPU:1'],
+                         [t[0] for t in towers[1:]])
+
+        dp = DataParallel(devices=['/device:GPU:0', '/device:GPU:1'],
+                          disable_prebuild=True)
+        towers = list(dp.data_parallel(4, [input_x]))
+        self.assertEqual(['/device:GPU:0', '/device:GPU:1'],
+                         [t[0] for t in towers])
+
+        with pytest.raises(ValueError, match='`tensors` must be list of '
+                                             'Tensor lists of the same '
+                                             'length'):
+            _ = dp.average([[input_x, input_x], [input_x]])
@@ -103,3 +103,54 @@ class EvaluatorTestCase(tf.test.TestCase):
                     call_session, call_feed_dict = call_args[0]
                     self.assertEqual(56, call_feed_dict[ph2])
                     self.assertNotIn(ph3, call_feed_dict)
+
+    def test_run_streaming_metrics(self):
+        with self.test_session():
+            df = DataFlow.arrays([np.arange(6, dtype=np.float32)], batch_size=4)
+            ph = tf.placeholder(tf.float32, shape=[None])
+
+            # test default loss weight
+            with TrainLoop([], max_epoch=1) as loop:
+                v = Evaluator(loop, tf.reduce_mean(ph), [ph], df,
+                              streaming_metrics=True)
+                self.assertIsInstance(v.streaming_metrics, StreamingMetrics)
+                v._run_batch = Mock(wraps=v._run_batch)
+                loop.collect_weighted_metrics = \
+                    Mock(wraps=loop.collect_weighted_metrics)
+
+                for epoch in loop.iter_epochs():
+                    for _ in range(2):  # the sums should be reset every run
+                        v.run()
+                        np.testing.assert_almost_equal(
+                            2.5, v.last_metrics_dict['valid_loss'])
+                    np.testing.assert_almost_equal(
+                        2.5, loop._epoch_metrics._metrics['valid_loss'].mean)
+
+                # the mini-batches are run by `_run_batch`, with the batch
+                # weights fed, and the metrics are collected with the sum
+                # of the batch weights
+                self.assertEqual(4, len(v._run_batch.call_args_list))
+                self.assertEqual(
+                    [4, 2, 4, 2],
+                    [c[0][1][v._batch_weight_ph]
+                     for c in v._run_batch.call_args_list]
+                )
+                self.assertEqual(
+                    [6, 6],
+                    [c[0][1] for c in
+                     loop.collect_weighted_metrics.call_args_list]
+                )
+
+            # test None loss weight
+            with TrainLoop([], max_epoch=1) as loop:
+                v = Evaluator(loop, {'valid_loss_x': tf.reduce_mean(ph)},
+                              [ph], df, batch_weight_func=None,
+                              streaming_metrics=True)
+                for epoch in loop.iter_epochs():
+                    v.run()
+                    np.testing.assert_almost_equal(
+                        3.0, v.last_metrics_dict['valid_loss_x'])
+
+        # test the streaming metrics are not created by default
+        self.assertIsNone(Evaluator(Mock(), {'x': 1}, [], Mock())
+                          .streaming_metrics)
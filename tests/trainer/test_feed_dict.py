@@ -1,6 +1,7 @@
 import unittest
 
 import six
+from mock import mock
 import tensorflow as tf
 
 from tfsnippet.trainer import *
@@ -60,3 +61,62 @@ class MergeFeedDictTestCase(unittest.TestCase):
                 six.iteritems({'b': 200, 'c': 300})
             )
         )
+
+
+class FeedDictPlanTestCase(tf.test.TestCase):
+
+    def test_resolve(self):
+        with self.test_session() as sess:
+            c = MyDynamicValue(56)
+            d = {
+                'a': 12,
+                'b': ScheduledVariable('b', 34),
+                'c': c,
+                'd': lambda: 78,
+            }
+            ensure_variables_initialized()
+
+            plan = FeedDictPlan(d, {'e': 90})
+            self.assertEqual(['a', 'e'], sorted(plan.static_keys))
+            self.assertEqual(['c', 'd'], sorted(plan.dynamic_keys))
+            self.assertEqual(['b'], plan.scheduled_keys)
+
+            d2 = plan.resolve()
+            self.assertDictEqual(
+                {'a': 12, 'b': 34, 'c': 56, 'd': 78, 'e': 90}, d2)
+
+            # the dynamic values are resolved each time
+            c.value = 65
+            d['b'].set(43)
+            d3 = plan.resolve([('a', 21), ('f', 100)], session=sess)
+            self.assertIsNot(d2, d3)
+            self.assertDictEqual(
+                {'a': 21, 'b': 43, 'c': 65, 'd': 78, 'e': 90, 'f': 100}, d3)
+
+            # the plan does not track the source feed dicts
+            d['g'] = 1
+            self.assertNotIn('g', plan.resolve())
+
+    def test_scheduled_variable_fetch(self):
+        with self.test_session() as sess:
+            a = ScheduledVariable('a', 1)
+            b = ScheduledVariable('b', 2, host_cache=True)
+            ensure_variables_initialized()
+
+            # the values assigned by other means are read from the session
+            plan = FeedDictPlan({'a': a, 'b': b})
+            sess.run(tf.assign(a.variable, 10))
+            self.assertDictEqual({'a': 10, 'b': 2}, plan.resolve())
+
+            # no fetch is required if all values are kept in host memory
+            b.set(20)
+            plan = FeedDictPlan({'b': b})
+            with mock.patch.object(sess, 'run', wraps=sess.run) as m:
+                self.assertDictEqual({'b': 20}, plan.resolve(session=sess))
+                self.assertFalse(m.called)
+
+    def test_no_scheduled_variable(self):
+        # no session is required if there is no scheduled variable
+        plan = FeedDictPlan({'a': 1, 'b': MyDynamicValue(2)})
+        self.assertDictEqual({'a': 1, 'b': 2, 'c': 3},
+                             plan.resolve({'c': 3}))
@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from tfsnippet.trainer import *
+from tfsnippet.utils import ensure_variables_initialized
+
+
+class GradientAccumulatorTestCase(tf.test.TestCase):
+
+    def test_accumulate_and_apply(self):
+        ph = tf.placeholder(tf.float32, [None])
+        idx = tf.placeholder(tf.int32, [None])
+        w = tf.get_variable('w', shape=[], dtype=tf.float32,
+                            initializer=tf.zeros_initializer())
+        emb = tf.get_variable('emb', shape=[4, 2], dtype=tf.float32,
+                              initializer=tf.zeros_initializer())
+        # the gradient of `emb` is an IndexedSlices
+        loss = -tf.reduce_mean(ph) * w - \
+            tf.reduce_sum(tf.gather(emb, idx))
+        optimizer = tf.train.GradientDescentOptimizer(1.)
+        accumulator = GradientAccumulator(optimizer, loss)
+        self.assertIs(optimizer, accumulator.optimizer)
+        self.assertEqual([w, emb],
+                         [v for _, v in accumulator.grads_and_vars])
+        self.assertEqual(3, len(accumulator.variables))
+        for v in accumulator.variables:
+            self.assertNotIn(v, tf.trainable_variables())
+            self.assertNotIn(v, tf.global_variables())
+
+        with self.test_session() as sess:
+            ensure_variables_initialized()
+            accumulator.reset()
+
+            # the variables should not be changed by accumulating
+            sess.run(accumulator.accumulate_op,
+                     feed_dict={ph: [1., 3.], idx: [0, 0]})
+            sess.run(accumulator.accumulate_op,
+                     feed_dict={ph: [4.], idx: [1]})
+            self.assertEqual(2, accumulator.get_accumulated_count())
+            self.assertEqual(0., sess.run(w))
+
+            # apply the average of the gradients of three micro-batches
+            sess.run(accumulator.apply_op,
+                     feed_dict={ph: [6.], idx: [3]})
+            self.assertEqual(0, accumulator.get_accumulated_count())
+            np.testing.assert_allclose(sess.run(w), (2. + 4. + 6.) / 3)
+            np.testing.assert_allclose(
+                sess.run(emb),
+                np.asarray([[2., 2.], [1., 1.], [0., 0.], [1., 1.]]) / 3.
+            )
+
+            # the accumulators should be reset after apply
+            sess.run(accumulator.apply_op,
+                     feed_dict={ph: [3.], idx: [2]})
+            np.testing.assert_allclose(sess.run(w), 7.)
+
+            # reset should discard the accumulated gradients
+            sess.run(accumulator.accumulate_op,
+                     feed_dict={ph: [100.], idx: [2]})
+            accumulator.reset()
+            sess.run(accumulator.apply_op,
+                     feed_dict={ph: [1.], idx: [2]})
+            np.testing.assert_allclose(sess.run(w), 8.)
+
+    def test_grads_and_vars(self):
+        w = tf.get_variable('w', shape=[], dtype=tf.float32,
+                            initializer=tf.zeros_initializer())
+        v = tf.get_variable('v', shape=[], dtype=tf.float32,
+                            initializer=tf.zeros_initializer())
+        optimizer = tf.train.GradientDescentOptimizer(.5)
+        accumulator = GradientAccumulator(
+            optimizer, grads_and_vars=[(tf.constant(-2.), w), (None, v)])
+        self.assertEqual([w], [x for _, x in accumulator.grads_and_vars])
+
+        with self.test_session() as sess:
+            ensure_variables_initialized()
+            accumulator.reset()
+            sess.run(accumulator.apply_op)
+            np.testing.assert_allclose(sess.run(w), 1.)
+
+        with pytest.raises(ValueError, match='Either `loss` or '
+                                             '`grads_and_vars` should be '
+                                             'specified'):
+            _ = GradientAccumulator(optimizer)
+        with pytest.raises(ValueError, match='No gradient to accumulate'):
+            _ = GradientAccumulator(optimizer, grads_and_vars=[(None, v)])
@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import tensorflow as tf
+
+from tfsnippet.trainer import StreamingMetrics
+
+
+class StreamingMetricsTestCase(tf.test.TestCase):
+
+    def test_streaming_metrics(self):
+        x = tf.placeholder(tf.float32, shape=[])
+        w = tf.placeholder(tf.float32, shape=[])
+        streaming = StreamingMetrics({'x': x, 'x2': x * x}, weight=w)
+        self.assertEqual(['x', 'x2'], sorted(streaming.metrics))
+        self.assertEqual(3, len(streaming.variables))
+        for v in streaming.variables:
+            self.assertIn(v, tf.local_variables())
+            self.assertNotIn(v, tf.global_variables())
+
+        with self.test_session() as sess:
+            streaming.reset()
+            self.assertEqual({}, streaming.fetch())
+
+            for value, weight in [(1., 1.), (2., 3.), (4., 0.)]:
+                sess.run(streaming.update_op, feed_dict={x: value, w: weight})
+            metrics = streaming.fetch(reset=False)
+            np.testing.assert_allclose(7. / 4, metrics['x'])
+            np.testing.assert_allclose(13. / 4, metrics['x2'])
+            metrics = streaming.fetch()
+            np.testing.assert_allclose(7. / 4, metrics['x'])
+
+            # the sums should have been reset by the last fetch
+            self.assertEqual({}, streaming.fetch())
+            sess.run(streaming.update_op, feed_dict={x: 5., w: 2.})
+            np.testing.assert_allclose(5., streaming.fetch(sess)['x'])
+
+    def test_fetch_and_reset(self):
+        x = tf.placeholder(tf.float32, shape=[])
+        streaming = StreamingMetrics({'x': x, 'y': 2. * x})
+        with self.test_session() as sess:
+            streaming.reset()
+            for _ in range(3):
+                for value in [1., 2., 6.]:
+                    sess.run(streaming.update_op, feed_dict={x: value})
+                # the sums should be read before being reset in the same run
+                metrics = streaming.fetch()
+                self.assertEqual(['x', 'y'], list(metrics))
+                np.testing.assert_allclose(3., metrics['x'])
+                np.testing.assert_allclose(6., metrics['y'])
+                np.testing.assert_equal(
+                    [0., 0., 0.], sess.run(streaming.variables))
+
+    def test_default_weight(self):
+        x = tf.placeholder(tf.int32, shape=[])
+        streaming = StreamingMetrics({'x': x})
+        with self.test_session() as sess:
+            streaming.reset(sess)
+            for value in [1, 2, 6]:
+                sess.run(streaming.update_op, feed_dict={x: value})
+            np.testing.assert_allclose(3., streaming.fetch()['x'])
+
+    def test_errors(self):
+        with pytest.raises(ValueError, match='Metric is not a scalar tensor'):
+            _ = StreamingMetrics({'x': tf.constant([1., 2.])})
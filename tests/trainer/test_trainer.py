@@ -1,3 +1,6 @@
+import json
+import os
+
 import numpy as np
 import pytest
 import tensorflow as tf
@@ -85,6 +88,229 @@ class TrainerTestCase(tf.test.TestCase):
             )
             self.assertFalse(loop.add_summary.called)
 
+    def test_trace_after(self):
+        ph = tf.placeholder(tf.int32, [5])
+        var = tf.get_variable('var', shape=[5], dtype=tf.int32,
+                              initializer=tf.zeros_initializer())
+        train_op = tf.assign(var, ph)
+        df = DataFlow.arrays([np.arange(10, 30, dtype=np.int32)], batch_size=5)
+
+        with TemporaryDirectory() as tmpdir:
+            with self.test_session(), \
+                    TrainLoop([var], max_epoch=1, summary_dir=tmpdir) as loop:
+                sw = loop.summary_writer
+                sw.add_run_metadata = Mock(wraps=sw.add_run_metadata)
+                t = Trainer(loop, train_op, [ph], df)
+                t.trace_after(steps=2)
+                ensure_variables_initialized()
+                t.run()
+
+                self.assertEqual(
+                    ['step_2', 'step_4'],
+                    [c[0][1] for c in sw.add_run_metadata.call_args_list]
+                )
+            for step in (2, 4):
+                trace_file = os.path.join(
+                    tmpdir, 'timeline_step_{}.json'.format(step))
+                with open(trace_file, 'r') as f:
+                    self.assertIn('traceEvents', json.load(f))
+            self.assertFalse(os.path.exists(
+                os.path.join(tmpdir, 'timeline_step_1.json')))
+
+        # test trace into the specified directory, with `count`
+        with TemporaryDirectory() as tmpdir:
+            with self.test_session(), \
+                    TrainLoop([var], max_epoch=1) as loop:
+                t = Trainer(loop, train_op, [ph], df)
+                t.trace_after(steps=1, count=2, trace_dir=tmpdir)
+                ensure_variables_initialized()
+                t.run()
+            self.assertEqual(
+                ['timeline_step_1.json', 'timeline_step_2.json'],
+                sorted(os.listdir(tmpdir))
+            )
+
+        with TrainLoop([var], max_epoch=1) as loop:
+            t = Trainer(loop, train_op, [ph], df)
+            with pytest.raises(ValueError, match='`trace_dir` is required'):
+                t.trace_after(steps=1)
+
+    def test_run_multi_steps(self):
+        ph = tf.placeholder(tf.int32, [None, None])
+        var = tf.get_variable('var', shape=[], dtype=tf.int32,
+                              initializer=tf.zeros_initializer())
+
+        def train_step(x):
+            return tf.assign_add(var, tf.reduce_sum(x)), {'x': x[0]}
+
+        train_op, metrics = multi_step_train_op(
+            train_step, [ph], metric_names=['x'])
+        df = DataFlow.arrays([np.arange(7, dtype=np.int32)], batch_size=2)
+
+        with self.test_session() as session, \
+                TrainLoop([var], max_epoch=1, early_stopping=False) as loop:
+            loop.collect_metrics = Mock(wraps=loop.collect_metrics)
+            hook = Mock(return_value=None)
+            t = Trainer(loop, train_op, [ph], df, metrics=metrics,
+                        steps_per_run=3)
+            t.evaluate_after_steps(hook, freq=2)
+            self.assertEqual(3, t.steps_per_run)
+            ensure_variables_initialized()
+            t.run()
+
+            # steps [0, 1], [2, 3], [4, 5] in the first run, and the
+            # incomplete step [6] in the second run
+            self.assertEqual(4, loop.step)
+            self.assertEqual(21, session.run(var))
+            metric_values = [c[0][0]['x'] for c in
+                             loop.collect_metrics.call_args_list
+                             if 'x' in c[0][0]]
+            np.testing.assert_allclose([2., 6.], metric_values)
+            self.assertEqual(2, hook.call_count)  # at step 3 and 4
+
+        with pytest.raises(ValueError,
+                           match='`steps_per_run` must be at least 1'):
+            _ = Trainer(Mock(max_epoch=1), train_op, [ph], df,
+                        steps_per_run=0)
+        with pytest.raises(ValueError,
+                           match='`steps_input` is required for running '
+                                 'multiple steps without `data_flow`'):
+            _ = Trainer(Mock(max_epoch=1), train_op, [], None,
+                        steps_per_run=2)
+
+    def test_run_multi_steps_without_data_flow(self):
+        num_steps = tf.placeholder(tf.int32, [])
+        var = tf.get_variable('var', shape=[], dtype=tf.int32,
+                              initializer=tf.zeros_initializer())
+        train_op, _ = multi_step_train_op(
+            lambda: tf.assign_add(var, 1), num_steps=num_steps)
+
+        with self.test_session() as session, \
+                TrainLoop([var], max_step=5, early_stopping=False) as loop:
+            t = Trainer(loop, train_op, [], None, steps_per_run=2,
+                        steps_input=num_steps)
+            self.assertIs(num_steps, t.steps_input)
+            ensure_variables_initialized()
+            t.run()
+            self.assertEqual(5, loop.step)
+            self.assertEqual(5, session.run(var))
+
+    def test_run_multi_steps_with_optimizer(self):
+        ph = tf.placeholder(tf.float32, [None, None])
+        step_ph = tf.placeholder(tf.float32, [None])
+        var = tf.get_variable('var', shape=[], dtype=tf.float32,
+                              initializer=tf.zeros_initializer())
+        optimizer = tf.train.AdamOptimizer(learning_rate=.1)
+
+        def build_loss(x):
+            return tf.reduce_mean(tf.square(var - x))
+
+        # the slot variables of the optimizer are created outside the loop,
+        # and reused by the train step inside the loop
+        single_step_op = optimizer.minimize(build_loss(step_ph))
+        train_op, metrics = multi_step_train_op(
+            lambda x: (optimizer.minimize(build_loss(x)),
+                       {'loss': build_loss(x)}),
+            [ph], metric_names=['loss']
+        )
+        x = np.arange(8, dtype=np.float32).reshape([4, 2])
+
+        with self.test_session() as session:
+            # run the four steps one by one, as the reference
+            session.run(tf.global_variables_initializer())
+            for batch_x in x:
+                session.run(single_step_op, feed_dict={step_ph: batch_x})
+            expected = session.run(var)
+            self.assertNotEqual(0., expected)
+
+            # run the four steps by the multi-step op
+            session.run(tf.global_variables_initializer())
+            _, loss = session.run([train_op, metrics['loss']],
+                                  feed_dict={ph: x})
+            np.testing.assert_allclose(expected, session.run(var),
+                                       rtol=1e-5)
+            self.assertGreater(loss, 0.)
+
+    def test_run_streaming_metrics(self):
+        ph = tf.placeholder(tf.int32, [None])
+        var = tf.get_variable('var', shape=[], dtype=tf.int32,
+                              initializer=tf.zeros_initializer())
+        train_op = tf.assign_add(var, tf.reduce_sum(ph))
+        df = DataFlow.arrays([np.arange(6, dtype=np.int32)], batch_size=1)
+
+        with self.test_session() as session, \
+                TrainLoop([var], max_epoch=2, early_stopping=False) as loop:
+            loop.collect_weighted_metrics = \
+                Mock(wraps=loop.collect_weighted_metrics)
+            t = Trainer(loop, train_op, [ph], df,
+                        metrics={'x': tf.reduce_mean(ph)},
+                        streaming_metrics=True)
+            self.assertIsInstance(t.streaming_metrics, StreamingMetrics)
+            t.log_after_steps(4)
+            ensure_variables_initialized()
+            t.run()
+
+            # the metrics should be collected only before printing the logs,
+            # and at the end of every epoch, weighted by the number of runs
+            call_args = [c[0] for c in
+                         loop.collect_weighted_metrics.call_args_list]
+            np.testing.assert_allclose([1.5, 4.5, 0.5, 3.5],
+                                       [a[0]['x'] for a in call_args])
+            self.assertEqual([4, 2, 2, 4], [a[1] for a in call_args])
+            self.assertEqual(30, session.run(var))
+
+        self.assertIsNone(
+            Trainer(Mock(max_epoch=1), train_op, [ph], df).streaming_metrics)
+
+    def test_run_accumulate_steps(self):
+        ph = tf.placeholder(tf.float32, [None])
+        var = tf.get_variable('var', shape=[], dtype=tf.float32,
+                              initializer=tf.zeros_initializer())
+        global_step = tf.get_variable('global_step', dtype=tf.int64,
+                                      initializer=0, trainable=False)
+        loss = -tf.reduce_mean(ph) * var
+        accumulator = GradientAccumulator(
+            tf.train.GradientDescentOptimizer(1.), loss,
+            global_step=global_step
+        )
+        df = DataFlow.arrays([np.arange(7, dtype=np.float32)], batch_size=1)
+
+        with self.test_session() as session, \
+                TrainLoop([var], max_epoch=1, early_stopping=False) as loop:
+            loop.collect_metrics = Mock(wraps=loop.collect_metrics)
+            t = Trainer(loop, accumulator, [ph], df,
+                        metrics={'x': tf.reduce_mean(ph)},
+                        accumulate_steps=3)
+            self.assertEqual(3, t.accumulate_steps)
+            self.assertIs(accumulator, t.train_op)
+            ensure_variables_initialized()
+            t.run()
+
+            # optimizer steps [0, 1, 2], [3, 4, 5], and the incomplete
+            # step [6] at the end of the epoch
+            self.assertEqual(3, loop.step)
+            self.assertEqual(3, session.run(global_step))
+            np.testing.assert_allclose(11., session.run(var))
+            self.assertEqual(0, accumulator.get_accumulated_count())
+            metric_values = [c[0][0]['x'] for c in
+                             loop.collect_metrics.call_args_list
+                             if 'x' in c[0][0]]
+            np.testing.assert_allclose([1., 4., 6.], metric_values)
+
+        with pytest.raises(ValueError,
+                           match='`accumulate_steps` must be at least 1'):
+            _ = Trainer(Mock(max_epoch=1), accumulator, [ph], df,
+                        accumulate_steps=0)
+        with pytest.raises(ValueError,
+                           match='`accumulate_steps` and `steps_per_run` '
+                                 'cannot be both larger than 1'):
+            _ = Trainer(Mock(max_epoch=1), accumulator, [ph], df,
+                        accumulate_steps=2, steps_per_run=2)
+        with pytest.raises(TypeError,
+                           match='`train_op` must be a GradientAccumulator'):
+            _ = Trainer(Mock(max_epoch=1), tf.no_op(), [ph], df,
+                        accumulate_steps=2)
+
 
 class LossTrainerTestCase(tf.test.TestCase):
 
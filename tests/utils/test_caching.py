@@ -3,10 +3,12 @@ import mimetypes
 import os
 import shutil
 import socket
+import time
 import unittest
 from contextlib import contextmanager
 from threading import Thread
 
+import numpy as np
 import six
 import pytest
 from mock import mock
@@ -119,6 +121,15 @@ def assets_server():
         server.server_close()
 
 
+def get_server_counter(server, expected, timeout=1.):
+    # the counter is increased after the response has been sent, thus we
+    # wait for a while until it reaches the expected value
+    stop_time = time.time() + timeout
+    while server.counter[0] < expected and time.time() < stop_time:
+        time.sleep(.01)
+    return server.counter[0]
+
+
 # patch the extractor for tests
 class PatchedExtractor(Extractor):
     call_count = 0
@@ -278,6 +289,12 @@ class CacheDirTestCase(unittest.TestCase):
                                               hasher=hashlib.sha1(),
                                               expected_hash=payload_tar_sha1)
 
+                    # the expected hash is case-insensitive
+                    self.assertEqual(path, cache_dir.download(
+                        url + 'payload.tar', hasher=hashlib.sha1(),
+                        expected_hash=payload_tar_sha1.upper()
+                    ))
+
                     with open(path, 'wb') as f:
                         f.write(b'12345')
 
@@ -356,6 +373,51 @@ class CacheDirTestCase(unittest.TestCase):
                 log_file.getvalue()
             )
 
+    def test_extract_file_with_decoder(self):
+        def decoder(name, content):
+            return {'x': np.frombuffer(content[-5:], dtype=np.uint8),
+                    'name': name}
+
+        with TemporaryDirectory() as tmpdir:
+            cache_dir = CacheDir('sub-dir', cache_root=tmpdir)
+            log_file = LogIO()
+            path = cache_dir.extract_file(get_asset_path('payload.zip'),
+                                          progress_file=log_file,
+                                          decoder=decoder, num_workers=2)
+            self.assertEqual(os.path.join(cache_dir.path, 'payload'), path)
+            self.assertListEqual(['.decoded_arrays', 'name.npy', 'x.npy'],
+                                 sorted(iter_files(path)))
+            np.testing.assert_equal(
+                np.load(os.path.join(path, 'name.npy')),
+                ['a/1.txt', 'b/2.txt', 'c.txt']
+            )
+            np.testing.assert_equal(
+                np.load(os.path.join(path, 'x.npy')),
+                np.frombuffer(b'1.txt2.txtc.txt', dtype=np.uint8).
+                reshape([3, 5])
+            )
+            self.assertFalse(os.path.isdir(path + '._extracting_'))
+            self.assertEqual(
+                'Extracting {} ... ok\n'.format(get_asset_path('payload.zip')),
+                log_file.getvalue()
+            )
+
+            # test the existing directory is reused only if it matches
+            # whether or not `decoder` is specified
+            self.assertEqual(path, cache_dir.extract_file(
+                get_asset_path('payload.zip'), decoder=decoder))
+            with pytest.raises(IOError, match='is extracted with `decoder`, '
+                                              'which does not match'):
+                _ = cache_dir.extract_file(get_asset_path('payload.zip'))
+            path = cache_dir.extract_file(get_asset_path('payload.tar'),
+                                          extract_dir='payload2')
+            with pytest.raises(IOError, match='is extracted without '
+                                              '`decoder`, which does not '
+                                              'match'):
+                _ = cache_dir.extract_file(get_asset_path('payload.tar'),
+                                           extract_dir='payload2',
+                                           decoder=decoder)
+
     def test_download_and_extract_and_purge_all(self):
         with TemporaryDirectory() as tmpdir:
             cache_dir = CacheDir('sub-dir', cache_root=tmpdir)
@@ -374,3 +436,74 @@ class CacheDirTestCase(unittest.TestCase):
                 self.assertTrue(os.path.isdir(cache_dir.path))
                 cache_dir.purge_all()
                 self.assertFalse(os.path.isdir(cache_dir.path))
+
+    def test_content_addressed_store(self):
+        def compute_hash(hasher, path):
+            with open(path, 'rb') as f:
+                hasher.update(f.read())
+            return hasher.hexdigest()
+
+        payload_zip_md5 = compute_hash(
+            hashlib.md5(), get_asset_path('payload.zip'))
+        store_path = lambda root: os.path.join(
+            root, '_content_store', 'md5', payload_zip_md5)
+
+        with TemporaryDirectory() as tmpdir, \
+                scoped_set_config(settings, file_cache_content_addressed=True):
+            cache_a = CacheDir('a', cache_root=tmpdir)
+            cache_b = CacheDir('b', cache_root=tmpdir)
+
+            with assets_server() as (server, url):
+                # download the same content into two cache dirs
+                path_a = cache_a.download(url + 'payload.zip',
+                                          hasher=hashlib.md5(),
+                                          expected_hash=payload_zip_md5)
+                path_b = cache_b.download(url + 'payload.zip',
+                                          filename='payload2.zip',
+                                          hasher=hashlib.md5(),
+                                          expected_hash=payload_zip_md5)
+                self.assertEqual(1, get_server_counter(server, 1))
+                self.assertEqual(os.path.join(cache_a.path, 'payload.zip'),
+                                 path_a)
+                self.assertEqual(os.path.join(cache_b.path, 'payload2.zip'),
+                                 path_b)
+                self.assertTrue(os.path.isfile(store_path(tmpdir)))
+                self.assertTrue(os.path.samefile(path_a, store_path(tmpdir)))
+                self.assertTrue(os.path.samefile(path_b, store_path(tmpdir)))
+
+                # download without hash should not use the store
+                _ = cache_a.download(url + 'payload.zip',
+                                     filename='payload3.zip')
+                self.assertEqual(2, get_server_counter(server, 2))
+                self.assertFalse(os.path.samefile(
+                    cache_a.resolve('payload3.zip'), store_path(tmpdir)))
+
+                # download and extract the same content into two cache dirs
+                extract_a = cache_a.download_and_extract(
+                    url + 'payload.zip', filename='payload4.zip',
+                    extract_dir='payload4', hasher=hashlib.md5(),
+                    expected_hash=payload_zip_md5
+                )
+                extract_b = cache_b.download_and_extract(
+                    url + 'payload.zip', filename='payload5.zip',
+                    extract_dir='payload5', hasher=hashlib.md5(),
+                    expected_hash=payload_zip_md5
+                )
+                self.assertEqual(2, get_server_counter(server, 2))
+                self.assertEqual(cache_a.resolve('payload4'), extract_a)
+                self.assertEqual(cache_b.resolve('payload5'), extract_b)
+                for path in (extract_a, extract_b):
+                    self.assertListEqual(PAYLOAD_CONTENT, summarize_dir(path))
+                    self.assertTrue(os.path.samefile(
+                        path, store_path(tmpdir) + '._extracted_'))
+                self.assertFalse(os.path.exists(
+                    cache_a.resolve('payload4.zip')))
+                self.assertTrue(os.path.isfile(store_path(tmpdir)))
+
+                # purge a cache dir should not affect the store
+                cache_a.purge_all()
+                self.assertListEqual(
+                    PAYLOAD_CONTENT,
+                    summarize_dir(store_path(tmpdir) + '._extracted_')
+                )
+                self.assertListEqual(PAYLOAD_CONTENT, summarize_dir(extract_b))
@@ -44,6 +44,33 @@ class EventSourceTestCase(unittest.TestCase):
         events.fire('ev1', 123, value=456)
         self.assertEqual(f1.call_args, ((123,), {'value': 456}))
 
+    def test_handler_timer(self):
+        f1 = Mock()
+        f2 = Mock(side_effect=ValueError('error in f2'))
+        timer = Mock()
+
+        events = EventSource()
+        events.on('ev', f1)
+        events.on('ev', f2)
+        events.set_handler_timer(timer)
+        with pytest.raises(ValueError, match='error in f2'):
+            events.reverse_fire('ev', 123)
+        self.assertFalse(f1.called)
+        self.assertEqual(1, timer.call_count)
+        self.assertEqual(('ev', f2), timer.call_args[0][:2])
+        self.assertGreaterEqual(timer.call_args[0][2], 0.)
+
+        timer.reset_mock()
+        events.off('ev', f2)
+        events.fire('ev', 123)
+        self.assertEqual(f1.call_args, ((123,), {}))
+        self.assertEqual(('ev', f1), timer.call_args[0][:2])
+
+        timer.reset_mock()
+        events.set_handler_timer(None)
+        events.fire('ev', 123)
+        self.assertFalse(timer.called)
+
     def test_order(self):
         dest = []
 
@@ -54,6 +81,8 @@ class EventSourceTestCase(unittest.TestCase):
         events.on('ev', lambda: f(1))
         events.on('ev', lambda: f(2))
         events.on('ev', lambda: f(3))
+        self.assertEqual(3, len(events.get_event_handlers('ev')))
+        self.assertEqual([], events.get_event_handlers('other'))
 
         events.fire('ev')
         self.assertListEqual(dest, [1, 2, 3])
@@ -3,7 +3,9 @@ import shutil
 import sys
 import unittest
 
+import numpy as np
 import pytest
+from mock import mock
 
 from tfsnippet.utils import *
 
@@ -63,6 +65,93 @@ class ExtractorTestCase(unittest.TestCase):
         self.check_archive_file(TarExtractor, self.get_asset('payload.tar.bz2'),
                                 'payload.tb2')
 
+    def test_extract_all(self):
+        for name in ('payload.zip', 'payload.tar.gz', 'payload.rar'):
+            for num_workers in (None, 1, 4):
+                with TemporaryDirectory() as tmpdir, \
+                        Extractor.open(self.get_asset(name)) as e:
+                    path = os.path.join(tmpdir, 'extracted')
+                    e.extract_all(path, buffer_size=4,
+                                  num_workers=num_workers)
+                    files = []
+                    for n in sorted(iter_files(path)):
+                        with open(os.path.join(path, n), 'rb') as f:
+                            files.append((n, f.read()))
+                    self.assertListEqual(
+                        [
+                            ('a/1.txt', b'a/1.txt'),
+                            ('b/2.txt', b'b/2.txt'),
+                            ('c.txt', b'c.txt'),
+                        ],
+                        files
+                    )
+
+    def test_map_entries_and_extract_arrays(self):
+        def decoder(name, content):
+            if name != 'c.txt':
+                return {'x': np.frombuffer(content, dtype=np.uint8),
+                        'y': int(name[0] == 'b')}
+
+        for name in ('payload.zip', 'payload.tar.gz'):
+            for num_workers in (None, 4):
+                with Extractor.open(self.get_asset(name)) as e:
+                    self.assertListEqual(
+                        [
+                            ('a/1.txt', b'a/1.txt'),
+                            ('b/2.txt', b'b/2.txt'),
+                            ('c.txt', b'c.txt'),
+                        ],
+                        e.map_entries(lambda n, c: (n, c),
+                                      num_workers=num_workers)
+                    )
+
+                with Extractor.open(self.get_asset(name)) as e:
+                    arrays = e.extract_arrays(decoder,
+                                              num_workers=num_workers)
+                    self.assertListEqual(['x', 'y'], sorted(arrays))
+                    np.testing.assert_equal(
+                        arrays['x'],
+                        np.frombuffer(b'a/1.txtb/2.txt', dtype=np.uint8).
+                        reshape([2, 7])
+                    )
+                    np.testing.assert_equal(arrays['y'], [0, 1])
+
+        # test growing the buffers, and up-casting the dtype
+        def decoder2(name, content):
+            return {'x': np.frombuffer(content[:3], dtype=np.uint8),
+                    'y': 0.5 if name == 'c.txt' else 1}
+
+        with mock.patch('tfsnippet.utils.archive_file.'
+                        'DEFAULT_ARRAYS_CAPACITY', 1):
+            with Extractor.open(self.get_asset('payload.tar.gz')) as e:
+                arrays = e.extract_arrays(decoder2)
+                np.testing.assert_equal(
+                    arrays['x'],
+                    np.frombuffer(b'a/1b/2c.t', dtype=np.uint8).
+                    reshape([3, 3])
+                )
+                self.assertEqual(np.float64, arrays['y'].dtype)
+                np.testing.assert_equal(arrays['y'], [1., 1., .5])
+
+        with Extractor.open(self.get_asset('payload.zip')) as e:
+            with pytest.raises(ValueError,
+                               match='The decoded records do not have the '
+                                     'same shape for field \'x\''):
+                _ = e.extract_arrays(
+                    lambda n, c: {'x': np.frombuffer(c, dtype=np.uint8)})
+
+        with Extractor.open(self.get_asset('payload.zip')) as e:
+            with pytest.raises(ValueError,
+                               match='No file in the archive has been '
+                                     'decoded'):
+                _ = e.extract_arrays(lambda n, c: None)
+
+        with Extractor.open(self.get_asset('payload.zip')) as e:
+            with pytest.raises(ValueError,
+                               match='The decoded records do not have the '
+                                     'same fields'):
+                _ = e.extract_arrays(lambda n, c: {n: c})
+
     def test_errors(self):
         with TemporaryDirectory() as tmpdir:
             archive_file = os.path.join(tmpdir, 'payload.txt')
@@ -1,5 +1,8 @@
+import os
+
 import pytest
 import tensorflow as tf
+from mock import Mock, patch
 
 from tfsnippet.shortcuts import global_reuse
 from tfsnippet.utils import (get_default_session_or_error,
@@ -7,7 +10,10 @@ from tfsnippet.utils import (get_default_session_or_error,
                              get_uninitialized_variables,
                              ensure_variables_initialized,
                              create_session,
-                             get_variable_ddi)
+                             autotune_session_threads,
+                             get_variable_ddi,
+                             TemporaryDirectory)
+from tfsnippet.utils.session import _parse_cpu_list
 
 
 class CreateSessionTestCase(tf.test.TestCase):
@@ -35,6 +41,138 @@ class CreateSessionTestCase(tf.test.TestCase):
         session = create_session(lock_memory=False)
         self.assertTrue(session._config.gpu_options.allow_growth)
 
+    def test_thread_options(self):
+        # test the default thread options
+        config = create_session()._config
+        self.assertEqual(0, config.intra_op_parallelism_threads)
+        self.assertEqual(0, config.inter_op_parallelism_threads)
+        self.assertFalse(config.use_per_session_threads)
+
+        # test with cpu_threads
+        config = create_session(cpu_threads=4)._config
+        self.assertEqual(4, config.intra_op_parallelism_threads)
+        self.assertEqual(2, config.inter_op_parallelism_threads)
+        config = create_session(cpu_threads=1,
+                                use_per_session_threads=True)._config
+        self.assertEqual(1, config.intra_op_parallelism_threads)
+        self.assertEqual(1, config.inter_op_parallelism_threads)
+        self.assertTrue(config.use_per_session_threads)
+        config = create_session(inter_op=3)._config
+        self.assertEqual(0, config.intra_op_parallelism_threads)
+        self.assertEqual(3, config.inter_op_parallelism_threads)
+
+        # test with numa_node
+        with patch('tfsnippet.utils.session._numa_node_cpus',
+                   Mock(return_value=[4, 5, 6])) as m, \
+                patch('os.sched_setaffinity', Mock(), create=True) as a:
+            config = create_session(numa_node=1)._config
+            self.assertEqual(((1,), {}), m.call_args)
+            self.assertEqual(((0, [4, 5, 6]), {}), a.call_args)
+            self.assertEqual(3, config.intra_op_parallelism_threads)
+            self.assertEqual(2, config.inter_op_parallelism_threads)
+
+        # test errors
+        with pytest.raises(ValueError, match='`cpu_threads` must be at '
+                                             'least 1'):
+            _ = create_session(cpu_threads=0)
+        with pytest.raises(ValueError, match='`inter_op` must be at least 1'):
+            _ = create_session(inter_op=0)
+        with pytest.raises(ValueError, match='`cpu_threads` and `numa_node` '
+                                             'cannot be specified along with '
+                                             '`intra_op_parallelism_threads`'):
+            _ = create_session(cpu_threads=1, intra_op_parallelism_threads=1)
+        with pytest.raises(ValueError, match='`inter_op` cannot be specified '
+                                             'along with '
+                                             '`inter_op_parallelism_threads`'):
+            _ = create_session(inter_op=1, inter_op_parallelism_threads=1)
+
+    def test_parse_cpu_list(self):
+        self.assertEqual([0, 1, 2, 3, 8, 10, 11],
+                         _parse_cpu_list('0-3,8,10-11\n'))
+        self.assertEqual([], _parse_cpu_list(''))
+
+
+class AutotuneSessionThreadsTestCase(tf.test.TestCase):
+
+    def test_autotune(self):
+        a = tf.get_variable('a', initializer=0, dtype=tf.int32)
+        assign_op = tf.assign_add(a, 1)
+        step_fn = Mock(wraps=lambda session: session.run(assign_op))
+
+        with TemporaryDirectory() as tmpdir:
+            ret = autotune_session_threads(
+                step_fn, candidates=[(1, 1), (2, 1)], n_steps=3,
+                warmup_steps=1, name='test', cache_root=tmpdir
+            )
+            self.assertIn(ret, [
+                {'cpu_threads': 1, 'inter_op': 1,
+                 'use_per_session_threads': True},
+                {'cpu_threads': 2, 'inter_op': 1,
+                 'use_per_session_threads': True},
+            ])
+            self.assertEqual(8, step_fn.call_count)
+            cache_dir = os.path.join(tmpdir, 'session_threads')
+            self.assertEqual(1, len(os.listdir(cache_dir)))
+
+            # the cached result should be used
+            step_fn.reset_mock()
+            self.assertEqual(
+                ret, autotune_session_threads(step_fn, name='test',
+                                              cache_root=tmpdir))
+            self.assertEqual(0, step_fn.call_count)
+
+            # a different workload name should not hit the cache
+            ret = autotune_session_threads(
+                step_fn, candidates=[(1, 2)], n_steps=1, warmup_steps=0,
+                name='other', cache_root=tmpdir
+            )
+            self.assertEqual({'cpu_threads': 1, 'inter_op': 2,
+                              'use_per_session_threads': True}, ret)
+            self.assertEqual(1, step_fn.call_count)
+            self.assertEqual(2, len(os.listdir(cache_dir)))
+
+            # test disabling the cache
+            step_fn.reset_mock()
+            _ = autotune_session_threads(
+                step_fn, candidates=[(1, 1)], n_steps=1, warmup_steps=0,
+                name='test', cache=False, cache_root=tmpdir
+            )
+            self.assertEqual(1, step_fn.call_count)
+
+            with pytest.raises(ValueError,
+                               match='`candidates` must not be empty'):
+                _ = autotune_session_threads(
+                    step_fn, candidates=[], name='empty', cache_root=tmpdir)
+
+    def test_autotune_restores_variables(self):
+        a = tf.get_variable('a', initializer=0, dtype=tf.int32)
+        b = tf.get_variable('b', initializer=0, dtype=tf.int32)
+        inc_a = tf.assign_add(a, 1)
+        assign_op = tf.group(inc_a, tf.assign_add(b, 1))
+
+        with TemporaryDirectory() as tmpdir, \
+                self.test_session() as outer_session:
+            outer_session.run(a.initializer)
+
+            # `step_fn` runs on the default session, rather than the
+            # benchmark session, which should not change the variables
+            _ = autotune_session_threads(
+                lambda session: outer_session.run(inc_a),
+                candidates=[(1, 1)], n_steps=2, warmup_steps=1,
+                cache=False, cache_root=tmpdir
+            )
+            self.assertEqual(0, outer_session.run(a))
+            self.assertEqual([b], get_uninitialized_variables())
+
+            # the benchmark sessions have their own variables
+            _ = autotune_session_threads(
+                lambda session: session.run(assign_op),
+                candidates=[(1, 1), (2, 1)], n_steps=2, warmup_steps=1,
+                cache=False, cache_root=tmpdir
+            )
+            self.assertEqual(0, outer_session.run(a))
+            self.assertEqual([b], get_uninitialized_variables())
+
 
 class GetDefaultSessionOrErrorTestCase(tf.test.TestCase):
 
@@ -191,6 +329,48 @@ class EnsureVariablesInitializedTestCase(tf.test.TestCase):
                 [b]
             )
 
+    def test_ops_are_cached(self):
+        a = tf.get_variable('a', dtype=tf.int32, initializer=1)
+        b = tf.get_variable('b', dtype=tf.int32, initializer=2)
+        graph = tf.get_default_graph()
+
+        with self.test_session() as sess:
+            self.assertEqual([], get_uninitialized_variables([]))
+            self.assertEqual([a, b], get_uninitialized_variables())
+            ensure_variables_initialized()
+            ensure_variables_initialized()
+            self.assertEqual([], get_uninitialized_variables())
+
+            # calling again should not build new operations
+            op_count = len(graph.get_operations())
+            for _ in range(3):
+                ensure_variables_initialized()
+                self.assertEqual([], get_uninitialized_variables([a, b]))
+            self.assertEqual(op_count, len(graph.get_operations()))
+
+            # a new variable should be checked and initialized
+            c = tf.get_variable('c', dtype=tf.int32, initializer=3)
+            self.assertEqual([c], get_uninitialized_variables())
+            ensure_variables_initialized()
+            self.assertEqual([], get_uninitialized_variables([a, b, c]))
+            self.assertEqual(3, sess.run(c))
+
+            # the cached operations should not inherit the context of the
+            # first call
+            d = tf.get_variable('d', dtype=tf.int32, initializer=4)
+            cache = graph._tfsnippet_variables_ops_cache
+            dep_op = tf.no_op()
+            with tf.control_dependencies([dep_op]), \
+                    tf.device('/cpu:0'), tf.name_scope('outer'):
+                ensure_variables_initialized([d])
+            for op in (cache['is_initialized'][(d,)].op,
+                       cache['initializer'][(d,)]):
+                self.assertNotIn(dep_op, op.control_inputs)
+                self.assertEqual('', op.device)
+                self.assertTrue(
+                    op.name.startswith('ensure_variables_initialized'))
+            self.assertEqual(4, sess.run(d))
+
 
 class GetVariableDDITestCase(tf.test.TestCase):
 
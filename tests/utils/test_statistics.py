@@ -177,3 +177,89 @@ class StatisticsCollectorTestCase(unittest.TestCase):
                 ValueError,
                 match=r'Shape mismatch: \(3,\) not ending with \(3, 2\)'):
             collector.collect([1, 2, 3])
+
+    def test_large_mean(self):
+        np.random.seed(1234)
+        x = np.random.normal(loc=1e6, size=10000)
+        collector = StatisticsCollector()
+        for batch in np.split(x, 100):
+            collector.collect(batch)
+        np.testing.assert_allclose(collector.mean, np.mean(x), rtol=1e-12)
+        np.testing.assert_allclose(collector.var, np.var(x), rtol=1e-9)
+
+    def test_zero_weight(self):
+        collector = StatisticsCollector()
+        collector.collect([1, 2], weight=0.)
+        self.assertEqual(collector.counter, 2)
+        self.assertEqual(collector.weight_sum, 0.)
+        self.assertAlmostEqual(collector.mean, 0.)
+        self.assertAlmostEqual(collector.var, 0.)
+
+    def test_merge(self):
+        arr = np.arange(24).reshape([4, 3, 2])
+        weight = [1, 2, 3, 4]
+        expected = StatisticsCollector(shape=(3, 2))
+        expected.collect(arr, weight=weight)
+
+        c1 = StatisticsCollector(shape=(3, 2))
+        c1.collect(arr[:1], weight=weight[:1])
+        c2 = StatisticsCollector(shape=(3, 2))
+        c2.collect(arr[1:], weight=weight[1:])
+        c1.merge(c2)
+        c1.merge(StatisticsCollector(shape=(3, 2)))
+        self.assertEqual(c1.counter, 4)
+        self.assertAlmostEqual(c1.weight_sum, 10.)
+        np.testing.assert_almost_equal(c1.mean, expected.mean)
+        np.testing.assert_almost_equal(c1.var, expected.var)
+        self.assertEqual(c2.counter, 3)
+
+        # merge into an empty collector
+        c3 = StatisticsCollector(shape=(3, 2))
+        c3.merge(c1)
+        np.testing.assert_almost_equal(c3.mean, expected.mean)
+        np.testing.assert_almost_equal(c3.square, expected.square)
+
+        with pytest.raises(ValueError, match=r'Shape mismatch: \(\) vs '
+                                             r'\(3, 2\)'):
+            c1.merge(StatisticsCollector())
+        with pytest.raises(ValueError, match='Cannot merge a collector '
+                                             'estimating the quantiles'):
+            StatisticsCollector().merge(StatisticsCollector(quantiles=True))
+
+    def test_quantiles(self):
+        np.random.seed(1234)
+        x = np.random.exponential(size=20000)
+        c1 = StatisticsCollector(quantiles=True)
+        c2 = StatisticsCollector(quantiles=True)
+        np.testing.assert_equal(c1.quantile([.5]), [np.nan])
+        for i, batch in enumerate(np.split(x, 20)):
+            (c1 if i % 2 else c2).collect(batch)
+        c1.merge(c2)
+
+        q = [0., .01, .5, .9, .99, 1.]
+        np.testing.assert_allclose(
+            c1.quantile(q), np.percentile(x, np.asarray(q) * 100),
+            rtol=5e-2, atol=1e-3
+        )
+        self.assertEqual(c1.quantile(0.), np.min(x))
+        self.assertEqual(c1.quantile(1.), np.max(x))
+
+        c1.reset()
+        self.assertTrue(np.isnan(c1.quantile(.5)))
+
+        # test collecting a large batch at once, with weights
+        x = np.random.normal(size=100000)
+        w = np.random.uniform(.5, 2., size=x.shape)
+        c1.collect(x, w)
+        np.testing.assert_allclose(
+            c1.quantile([.01, .5, .99]), np.percentile(x, [1, 50, 99]),
+            atol=5e-2
+        )
+        self.assertLessEqual(c1._digest._means.size, 100)
+        np.testing.assert_almost_equal(np.sum(c1._digest._weights), np.sum(w))
+
+        with pytest.raises(ValueError, match='`quantiles` is only supported '
+                                             'for scalar values'):
+            _ = StatisticsCollector(shape=(2,), quantiles=True)
+        with pytest.raises(RuntimeError, match='`quantiles` is not enabled'):
+            _ = StatisticsCollector().quantile(.5)
@@ -1,6 +1,7 @@
 from .array_flow import *
 from .base import *
 from .data_mappers import *
+from .file_shard_flow import *
 from .gather_flow import *
 from .iterator_flow import *
 from .mapper_flow import *
@@ -8,7 +9,7 @@ from .seq_flow import *
 from .threading_flow import *
 
 __all__ = [
-    'ArrayFlow', 'DataFlow', 'DataMapper', 'ExtraInfoDataFlow', 'GatherFlow',
-    'IteratorFactoryFlow', 'MapperFlow', 'SeqFlow', 'SlidingWindow',
-    'ThreadingFlow',
+    'ArrayFlow', 'DataFlow', 'DataMapper', 'ExtraInfoDataFlow',
+    'FileShardFlow', 'GatherFlow', 'IteratorFactoryFlow', 'MapperFlow',
+    'SeqFlow', 'SlidingWindow', 'ThreadingFlow',
 ]
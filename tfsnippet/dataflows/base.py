@@ -289,6 +289,55 @@ class DataFlow(object):
             skip_incomplete=skip_incomplete, random_state=random_state
         )
 
+    @staticmethod
+    def file_shards(shards, batch_size, shuffle=False, skip_incomplete=False,
+                    array_names=None, file_decoder=None, loader=None,
+                    num_workers=1, prefetch=None, interleave=1,
+                    cache_dir='file_shards', random_state=None):
+        """
+        Construct a :class:`~tfsnippet.dataflows.FileShardFlow`.
+
+        Args:
+            shards (Iterable[str]): The paths or URIs of the shard files.
+            batch_size (int): Size of each mini-batch.
+            shuffle (bool): Whether or not to shuffle data before iterating?
+                (default :obj:`False`)
+            skip_incomplete (bool): Whether or not to exclude the last
+                mini-batch if it is incomplete? (default :obj:`False`)
+            array_names (Iterable[str]): The names of the arrays to load from
+                ".npz" shards.  If not specified, load all the arrays in the
+                order of their storage.
+            file_decoder ((str) -> tuple[np.ndarray]): The function to decode
+                each file of a directory shard.  If not specified, decode
+                each file as an image by :func:`imageio.imread`.
+            loader ((str) -> tuple[np.ndarray]): If specified, use this
+                function to load each (local) shard, instead of the default
+                loader.
+            num_workers (int): Number of background threads for loading
+                the shards. (default 1)
+            prefetch (int): Number of shards to load ahead of consumption.
+                (default ``max(num_workers, interleave)``)
+            interleave (int): Number of shards whose records are mixed
+                together for shuffling. (default 1)
+            cache_dir (CacheDir or str): The :class:`CacheDir`, or the name
+                of the :class:`CacheDir`, for staging remote shards.
+                (default "file_shards")
+            random_state (RandomState): Optional numpy RandomState for
+                shuffling data before each epoch.  (default :obj:`None`,
+                construct a new :class:`RandomState`).
+
+        Returns:
+            tfsnippet.dataflow.FileShardFlow: The data flow from shard files.
+        """
+        from .file_shard_flow import FileShardFlow
+        return FileShardFlow(
+            shards=shards, batch_size=batch_size, shuffle=shuffle,
+            skip_incomplete=skip_incomplete, array_names=array_names,
+            file_decoder=file_decoder, loader=loader, num_workers=num_workers,
+            prefetch=prefetch, interleave=interleave, cache_dir=cache_dir,
+            random_state=random_state
+        )
+
     @staticmethod
     def iterator_factory(factory):
         """
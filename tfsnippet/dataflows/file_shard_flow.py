@@ -0,0 +1,327 @@
+import os
+from collections import deque
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import six
+
+from tfsnippet.utils import (AutoInitAndCloseable, CacheDir, iter_files,
+                             generate_random_seed)
+from tfsnippet.utils.archive_file import TAR_FILE_EXTENSIONS
+from .base import DataFlow
+
+if six.PY2:
+    from urlparse import urlparse
+else:
+    from urllib.parse import urlparse
+
+try:
+    import imageio
+except ImportError:  # pragma: no cover
+    imageio = None
+
+__all__ = ['FileShardFlow']
+
+ARCHIVE_FILE_EXTENSIONS = TAR_FILE_EXTENSIONS + ('.zip', '.rar')
+
+
+def _make_readonly(arr):
+    arr = np.asarray(arr)
+    arr.setflags(write=False)
+    return arr
+
+
+def _decode_image_file(file_path):
+    if imageio is None:  # pragma: no cover
+        raise RuntimeError('Required package not installed: imageio.')
+    return (imageio.imread(file_path),)
+
+
+class FileShardFlow(DataFlow, AutoInitAndCloseable):
+    """
+    Using a list of shard files as data source flow.
+
+    Each shard should be small enough to be loaded into memory, while the
+    whole dataset might not.  The supported shard formats are:
+
+    1.  ".npy" files: each file contains one array, which is memory-mapped
+        instead of being loaded.
+    2.  ".npz" files: each file contains several arrays, selected and
+        ordered by `array_names`.
+    3.  directories (e.g., image folders): each file within the directory
+        is decoded by `file_decoder` into a tuple of arrays, which are then
+        stacked to form the shard.
+
+    A shard might also be specified as a remote URI, in which case it will
+    be downloaded into `cache_dir` (and extracted, if it is an archive)
+    before being loaded.  The shards are loaded by a pool of background
+    threads, at most `prefetch` shards ahead of consumption.  If `shuffle`
+    is :obj:`True`, the records of every `interleave` consecutive shards
+    (in shuffled order) are mixed together before being shuffled.
+
+    Usage::
+
+        shard_flow = DataFlow.file_shards(
+            ['data/train-00.npz', 'data/train-01.npz', ...],
+            batch_size=256, array_names=['x', 'y'], shuffle=True,
+            num_workers=4, interleave=4
+        )
+        with shard_flow:
+            for batch_x, batch_y in shard_flow:
+                ...
+    """
+
+    def __init__(self, shards, batch_size, shuffle=False,
+                 skip_incomplete=False, array_names=None, file_decoder=None,
+                 loader=None, num_workers=1, prefetch=None, interleave=1,
+                 cache_dir='file_shards', random_state=None):
+        """
+        Construct a :class:`FileShardFlow`.
+
+        Args:
+            shards (Iterable[str]): The paths or URIs of the shard files.
+            batch_size (int): Size of each mini-batch.
+            shuffle (bool): Whether or not to shuffle data before iterating?
+                (default :obj:`False`)
+            skip_incomplete (bool): Whether or not to exclude the last
+                mini-batch if it is incomplete? (default :obj:`False`)
+            array_names (Iterable[str]): The names of the arrays to load from
+                ".npz" shards.  If not specified, load all the arrays in the
+                order of their storage.
+            file_decoder ((str) -> tuple[np.ndarray]): The function to decode
+                each file of a directory shard.  If not specified, decode
+                each file as an image by :func:`imageio.imread`.
+            loader ((str) -> tuple[np.ndarray]): If specified, use this
+                function to load each (local) shard, instead of the default
+                loader.
+            num_workers (int): Number of background threads for loading
+                the shards, as well as for decoding the files of each
+                directory shard. (default 1)
+            prefetch (int): Number of shards to load ahead of consumption.
+                (default ``max(num_workers, interleave)``)
+            interleave (int): Number of shards whose records are mixed
+                together for shuffling. (default 1)
+            cache_dir (CacheDir or str): The :class:`CacheDir`, or the name
+                of the :class:`CacheDir`, for staging remote shards.
+                (default "file_shards")
+            random_state (RandomState): Optional numpy RandomState for
+                shuffling data before each epoch.  (default :obj:`None`,
+                construct a new :class:`RandomState`).
+        """
+        # validate the parameters
+        shards = tuple(shards)
+        if not shards:
+            raise ValueError('`shards` must not be empty.')
+        batch_size = int(batch_size)
+        if batch_size < 1:
+            raise ValueError('`batch_size` must be at least 1.')
+        num_workers = int(num_workers)
+        if num_workers < 1:
+            raise ValueError('`num_workers` must be at least 1.')
+        interleave = int(interleave)
+        if interleave < 1:
+            raise ValueError('`interleave` must be at least 1.')
+        if prefetch is None:
+            prefetch = max(num_workers, interleave)
+        prefetch = int(prefetch)
+        if prefetch < 1:
+            raise ValueError('`prefetch` must be at least 1.')
+        if not isinstance(cache_dir, CacheDir):
+            cache_dir = CacheDir(cache_dir)
+
+        # memorize the parameters
+        self._shards = shards
+        self._batch_size = batch_size
+        self._is_shuffled = bool(shuffle)
+        self._skip_incomplete = bool(skip_incomplete)
+        self._array_names = \
+            tuple(array_names) if array_names is not None else None
+        self._file_decoder = file_decoder or _decode_image_file
+        self._loader = loader
+        self._num_workers = num_workers
+        self._prefetch = prefetch
+        self._interleave = interleave
+        self._cache_dir = cache_dir
+        self._random_state = \
+            random_state or np.random.RandomState(generate_random_seed())
+
+        # internal states
+        self._pool = None  # type: ThreadPool
+        self._decode_pool = None  # type: ThreadPool
+        self._array_count = None
+
+    @property
+    def shards(self):
+        """Get the paths or URIs of the shard files."""
+        return self._shards
+
+    @property
+    def batch_size(self):
+        """Get the size of each mini-batch."""
+        return self._batch_size
+
+    @property
+    def is_shuffled(self):
+        """Whether or not the data are shuffled before iterating?"""
+        return self._is_shuffled
+
+    @property
+    def skip_incomplete(self):
+        """Whether or not to exclude the last mini-batch if incomplete?"""
+        return self._skip_incomplete
+
+    @property
+    def num_workers(self):
+        """Get the number of background threads for loading the shards."""
+        return self._num_workers
+
+    @property
+    def prefetch(self):
+        """Get the number of shards to load ahead of consumption."""
+        return self._prefetch
+
+    @property
+    def interleave(self):
+        """Get the number of shards mixed together for shuffling."""
+        return self._interleave
+
+    @property
+    def cache_dir(self):
+        """Get the :class:`CacheDir` for staging remote shards."""
+        return self._cache_dir
+
+    def _init(self):
+        self._pool = ThreadPool(self._num_workers)
+        # the files of a directory shard are decoded by a separated pool,
+        # since waiting for them within the shard pool would deadlock once
+        # all the shard workers are waiting
+        self._decode_pool = ThreadPool(self._num_workers)
+
+    def _close(self):
+        try:
+            for pool in (self._pool, self._decode_pool):
+                pool.terminate()
+                pool.join()
+        finally:
+            self._pool = None
+            self._decode_pool = None
+
+    def _stage_shard(self, shard):
+        """Get the local path of `shard`, downloading it if required."""
+        parsed = urlparse(shard)
+        if parsed.scheme in ('', 'file') or len(parsed.scheme) == 1:
+            # plain path, file URI, or Windows path with drive letter
+            return parsed.path if parsed.scheme == 'file' else shard
+        if any(parsed.path.endswith(ext) for ext in ARCHIVE_FILE_EXTENSIONS):
+            return self._cache_dir.download_and_extract(shard)
+        return self._cache_dir.download(shard)
+
+    def _load_shard(self, shard):
+        path = self._stage_shard(shard)
+        if self._loader is not None:
+            arrays = tuple(self._loader(path))
+        elif os.path.isdir(path):
+            records = self._decode_pool.map(
+                lambda name: tuple(self._file_decoder(
+                    os.path.join(path, name))),
+                sorted(iter_files(path, sep=os.sep))
+            )
+            if not records:
+                raise ValueError('Shard directory is empty: {!r}'.
+                                 format(path))
+            arrays = tuple(np.stack(a, axis=0) for a in zip(*records))
+        elif path.endswith('.npy'):
+            arrays = (np.load(path, mmap_mode='r'),)
+        elif path.endswith('.npz'):
+            with np.load(path) as npz:
+                names = self._array_names
+                if names is None:
+                    names = npz.files
+                arrays = tuple(npz[n] for n in names)
+        else:
+            raise IOError('Unsupported shard file: {!r}'.format(path))
+
+        # validate the loaded arrays
+        if not arrays:
+            raise ValueError('No array is loaded from shard: {!r}'.
+                             format(shard))
+        for a in arrays[1:]:
+            if len(a) != len(arrays[0]):
+                raise ValueError('The arrays loaded from shard {!r} do not '
+                                 'have the same data length.'.format(shard))
+        return arrays
+
+    def _iter_loaded_shards(self, shards):
+        # keep at most `prefetch` shards being loaded ahead, so as to bound
+        # the memory used by the loaded but not yet consumed shards
+        pending = deque()
+        shards_it = iter(shards)
+
+        def fill_pending():
+            for shard in shards_it:
+                pending.append(
+                    self._pool.apply_async(self._load_shard, (shard,)))
+                if len(pending) >= self._prefetch:
+                    break
+
+        fill_pending()
+        while pending:
+            arrays = pending.popleft().get()
+            fill_pending()
+            if self._array_count is None:
+                self._array_count = len(arrays)
+            elif len(arrays) != self._array_count:
+                raise ValueError('The shards do not have the same number of '
+                                 'arrays: {} vs {}'.
+                                 format(len(arrays), self._array_count))
+            yield arrays
+
+    def _iter_shard_groups(self):
+        shards = list(self._shards)
+        if self._is_shuffled:
+            self._random_state.shuffle(shards)
+        group = []
+        for arrays in self._iter_loaded_shards(shards):
+            group.append(arrays)
+            if len(group) >= self._interleave:
+                yield group
+                group = []
+        if group:
+            yield group
+
+    def _minibatch_iterator(self):
+        self.init()
+        batch_size = self._batch_size
+        leftover = None
+
+        for group in self._iter_shard_groups():
+            if leftover is not None:
+                group = [leftover] + group
+            if len(group) == 1:
+                arrays = group[0]
+            else:
+                arrays = tuple(np.concatenate(a, axis=0) for a in zip(*group))
+            del group
+
+            length = len(arrays[0])
+            stop = length - length % batch_size
+            if self._is_shuffled:
+                t = np.int32 if length < (1 << 31) else np.int64
+                indices = np.arange(length, dtype=t)
+                self._random_state.shuffle(indices)
+
+                for start in range(0, stop, batch_size):
+                    s = indices[start: start + batch_size]
+                    yield tuple(_make_readonly(a[s]) for a in arrays)
+                leftover = tuple(a[indices[stop:]] for a in arrays)
+            else:
+                for start in range(0, stop, batch_size):
+                    s = slice(start, start + batch_size)
+                    yield tuple(_make_readonly(a[s]) for a in arrays)
+                leftover = tuple(a[stop:] for a in arrays)
+
+            if not len(leftover[0]):
+                leftover = None
+
+        if leftover is not None and not self._skip_incomplete:
+            yield tuple(_make_readonly(a) for a in leftover)
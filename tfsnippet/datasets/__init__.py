@@ -1,7 +1,9 @@
 from .cifar import *
 from .fashion_mnist import *
 from .mnist import *
+from .registry import *
 
 __all__ = [
-    'load_cifar10', 'load_cifar100', 'load_fashion_mnist', 'load_mnist',
+    'DatasetRegistry', 'dataset_registry', 'load_cifar10', 'load_cifar100',
+    'load_fashion_mnist', 'load_mnist',
 ]
@@ -1,10 +1,12 @@
 import hashlib
 import os
+from multiprocessing.pool import ThreadPool
 
 import six
 import numpy as np
 
-from tfsnippet.utils import CacheDir, validate_enum_arg
+from tfsnippet.utils import validate_enum_arg
+from .registry import dataset_registry
 
 if six.PY2:
     import cPickle as pickle
@@ -21,7 +23,7 @@ CIFAR_100_MD5 = 'eb9058c3a382ffc7106e4002c42a8d85'
 CIFAR_100_CONTENT_DIR = 'cifar-100-python'
 
 
-def _load_batch(path, channels_last, x_shape, x_dtype, y_dtype, normalize_x,
+def _load_batch(path, out_x, out_y, channels_last, normalize_x,
                 expected_batch_label, labels_key='labels'):
     # load from file
     with open(path, 'rb') as f:
@@ -35,21 +37,45 @@ def _load_batch(path, channels_last, x_shape, x_dtype, y_dtype, normalize_x,
             d['batch_label'] = d['batch_label'].decode('utf-8')
     assert(d['batch_label'] == expected_batch_label)
 
-    data = np.asarray(d['data'], dtype=x_dtype)
-    labels = np.asarray(d[labels_key], dtype=y_dtype)
+    data = np.asarray(d['data'])
+    labels = d[labels_key]
+    assert(len(data) == len(labels) == len(out_x) == len(out_y))
 
-    # change shape
+    # decode the data directly into the output array, changing the layout
+    # and the dtype in a single copy
     data = data.reshape((data.shape[0], 3, 32, 32))
     if channels_last:
         data = np.transpose(data, (0, 2, 3, 1))
-    if x_shape:
-        data = data.reshape([data.shape[0]] + list(x_shape))
+    out_view = out_x.reshape(data.shape)
+    np.copyto(out_view, data, casting='unsafe')
+    out_y[...] = labels
 
     # normalize x
     if normalize_x:
-        data /= np.asarray(255., dtype=data.dtype)
+        out_view /= np.asarray(255., dtype=out_view.dtype)
 
-    return data, labels
+
+def _load_batches(batches, channels_last, normalize_x, labels_key='labels'):
+    """
+    Load batch files in parallel.
+
+    Args:
+        batches: List of ``(path, out_x, out_y, expected_batch_label)``.
+    """
+    def load(batch):
+        path, out_x, out_y, expected_batch_label = batch
+        _load_batch(
+            path, out_x=out_x, out_y=out_y, channels_last=channels_last,
+            normalize_x=normalize_x, expected_batch_label=expected_batch_label,
+            labels_key=labels_key
+        )
+
+    pool = ThreadPool(len(batches))
+    try:
+        pool.map(load, batches)
+    finally:
+        pool.close()
+        pool.join()
 
 
 def _validate_x_shape(x_shape, channels_last):
@@ -89,32 +115,28 @@ def load_cifar10(channels_last=True, x_shape=None, x_dtype=np.float32,
     x_shape = _validate_x_shape(x_shape, channels_last)
 
     # fetch data
-    path = CacheDir('cifar').download_and_extract(
-        CIFAR_10_URI, hasher=hashlib.md5(), expected_hash=CIFAR_10_MD5)
+    path = dataset_registry.download_and_extract(
+        'cifar', CIFAR_10_URI, hasher=hashlib.md5(),
+        expected_hash=CIFAR_10_MD5)
     data_dir = os.path.join(path, CIFAR_10_CONTENT_DIR)
 
     # load the data
-    train_num = 50000
-    train_x = np.zeros((train_num,) + x_shape, dtype=x_dtype)
-    train_y = np.zeros((train_num,), dtype=y_dtype)
-
-    for i in range(1, 6):
-        path = os.path.join(data_dir, 'data_batch_{}'.format(i))
-        x, y = _load_batch(
-            path, channels_last=channels_last, x_shape=x_shape,
-            x_dtype=x_dtype, y_dtype=y_dtype, normalize_x=normalize_x,
-            expected_batch_label='training batch {} of 5'.format(i)
-        )
-        (train_x[(i - 1) * 10000: i * 10000, ...],
-         train_y[(i - 1) * 10000: i * 10000]) = x, y
-
-    path = os.path.join(data_dir, 'test_batch')
-    test_x, test_y = _load_batch(
-        path, channels_last=channels_last, x_shape=x_shape,
-        x_dtype=x_dtype, y_dtype=y_dtype, normalize_x=normalize_x,
-        expected_batch_label='testing batch 1 of 1'
-    )
-    assert(len(test_x) == len(test_y) == 10000)
+    train_x = np.empty((50000,) + x_shape, dtype=x_dtype)
+    train_y = np.empty((50000,), dtype=y_dtype)
+    test_x = np.empty((10000,) + x_shape, dtype=x_dtype)
+    test_y = np.empty((10000,), dtype=y_dtype)
+
+    batches = [
+        (os.path.join(data_dir, 'data_batch_{}'.format(i)),
+         train_x[(i - 1) * 10000: i * 10000, ...],
+         train_y[(i - 1) * 10000: i * 10000],
+         'training batch {} of 5'.format(i))
+        for i in range(1, 6)
+    ]
+    batches.append((os.path.join(data_dir, 'test_batch'), test_x, test_y,
+                    'testing batch 1 of 1'))
+    _load_batches(batches, channels_last=channels_last,
+                  normalize_x=normalize_x)
 
     return (train_x, train_y), (test_x, test_y)
 
@@ -145,27 +167,24 @@ def load_cifar100(label_mode='fine', channels_last=True, x_shape=None,
     x_shape = _validate_x_shape(x_shape, channels_last)
 
     # fetch data
-    path = CacheDir('cifar').download_and_extract(
-        CIFAR_100_URI, hasher=hashlib.md5(), expected_hash=CIFAR_100_MD5)
+    path = dataset_registry.download_and_extract(
+        'cifar', CIFAR_100_URI, hasher=hashlib.md5(),
+        expected_hash=CIFAR_100_MD5)
     data_dir = os.path.join(path, CIFAR_100_CONTENT_DIR)
 
     # load the data
-    path = os.path.join(data_dir, 'train')
-    train_x, train_y = _load_batch(
-        path, channels_last=channels_last, x_shape=x_shape,
-        x_dtype=x_dtype, y_dtype=y_dtype, normalize_x=normalize_x,
-        expected_batch_label='training batch 1 of 1',
-        labels_key='{}_labels'.format(label_mode)
-    )
-    assert(len(train_x) == len(train_y) == 50000)
-
-    path = os.path.join(data_dir, 'test')
-    test_x, test_y = _load_batch(
-        path, channels_last=channels_last, x_shape=x_shape,
-        x_dtype=x_dtype, y_dtype=y_dtype, normalize_x=normalize_x,
-        expected_batch_label='testing batch 1 of 1',
+    train_x = np.empty((50000,) + x_shape, dtype=x_dtype)
+    train_y = np.empty((50000,), dtype=y_dtype)
+    test_x = np.empty((10000,) + x_shape, dtype=x_dtype)
+    test_y = np.empty((10000,), dtype=y_dtype)
+
+    _load_batches(
+        [(os.path.join(data_dir, 'train'), train_x, train_y,
+          'training batch 1 of 1'),
+         (os.path.join(data_dir, 'test'), test_x, test_y,
+          'testing batch 1 of 1')],
+        channels_last=channels_last, normalize_x=normalize_x,
         labels_key='{}_labels'.format(label_mode)
     )
-    assert(len(test_x) == len(test_y) == 10000)
 
     return (train_x, train_y), (test_x, test_y)
@@ -4,7 +4,7 @@ import hashlib
 import numpy as np
 import idx2numpy
 
-from tfsnippet.utils import CacheDir
+from .registry import dataset_registry
 
 __all__ = ['load_fashion_mnist']
 
@@ -21,8 +21,8 @@ TEST_Y_MD5 = 'bb300cfdad3c16e7a12a480ee83cd310'
 
 def _fetch_array(uri, md5):
     """Fetch an MNIST array from the `uri` with cache."""
-    path = CacheDir('fashion_mnist').download(
-        uri, hasher=hashlib.md5(), expected_hash=md5)
+    path = dataset_registry.download(
+        'fashion_mnist', uri, hasher=hashlib.md5(), expected_hash=md5)
     with gzip.open(path, 'rb') as f:
         return idx2numpy.convert_from_file(f)
 
@@ -4,7 +4,7 @@ import hashlib
 import numpy as np
 import idx2numpy
 
-from tfsnippet.utils import CacheDir
+from .registry import dataset_registry
 
 __all__ = ['load_mnist']
 
@@ -21,8 +21,8 @@ TEST_Y_MD5 = 'ec29112dd5afa0611ce80d1b7f02629c'
 
 def _fetch_array(uri, md5):
     """Fetch an MNIST array from the `uri` with cache."""
-    path = CacheDir('mnist').download(
-        uri, hasher=hashlib.md5(), expected_hash=md5)
+    path = dataset_registry.download(
+        'mnist', uri, hasher=hashlib.md5(), expected_hash=md5)
     with gzip.open(path, 'rb') as f:
         return idx2numpy.convert_from_file(f)
 
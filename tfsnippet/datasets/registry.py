@@ -0,0 +1,324 @@
+import os
+import shutil
+import sys
+
+import six
+
+from tfsnippet.utils import CacheDir, Extractor, get_cache_root, makedirs
+from tfsnippet.utils.caching import (guess_filename_from_uri,
+                                     guess_extract_dir_from_filename)
+
+if six.PY2:
+    from urllib import pathname2url
+    from urlparse import urlparse
+else:
+    from urllib.parse import urlparse
+    from urllib.request import pathname2url
+
+__all__ = ['DatasetRegistry', 'dataset_registry']
+
+DEFAULT_MIRROR_TIMEOUT = (5., 60.)
+"""Default (connect, read) timeout in seconds of the HTTP requests."""
+
+
+def _is_local_mirror(mirror):
+    scheme = urlparse(mirror).scheme
+    # plain path, file URI, or Windows path with drive letter
+    return scheme in ('', 'file') or len(scheme) == 1
+
+
+def _local_mirror_path(mirror):
+    parsed = urlparse(mirror)
+    if parsed.scheme == 'file':
+        return parsed.path
+    return mirror
+
+
+class DatasetRegistry(object):
+    """
+    Registry of the mirrors, where the dataset files are fetched from.
+
+    A mirror is either a local directory (plain path or "file://" URI), or
+    the base URI of an HTTP server, which has the same layout as the cache
+    root, i.e., the file `filename` of the dataset `name` is located at
+    ``<mirror>/<name>/<filename>``.  Note that a cache root usually cannot
+    serve as a mirror, since the downloaded archives are deleted once they
+    have been extracted; use :meth:`seed_cache` to share the extracted
+    files among hosts instead.
+
+    The mirrors are tried in order before the original URI of the dataset
+    files.  Local mirrors which do not contain the file are skipped without
+    any I/O other than the existence check, and HTTP requests are sent with
+    a short connect timeout, such that a broken mirror fails fast.  If
+    `offline` is :obj:`True`, the original URIs will never be requested.
+
+    The dataset files already in the cache are used without consulting the
+    mirrors at all.  A whole cache root can be archived and pre-seeded by
+    :meth:`seed_cache` on other hosts, such that no network round-trip is
+    required for loading the datasets.
+
+    The global registry :obj:`dataset_registry` is used by the dataset
+    loaders of :mod:`tfsnippet.datasets`.  Its mirrors are initialized
+    from the environment variable ``TFSNIPPET_DATASET_MIRRORS`` (separated
+    by ";"), and it is offline if ``TFSNIPPET_DATASET_OFFLINE`` is "1".
+    """
+
+    def __init__(self, mirrors=(), offline=False, cache_root=None,
+                 timeout=DEFAULT_MIRROR_TIMEOUT):
+        """
+        Construct a new :class:`DatasetRegistry`.
+
+        Args:
+            mirrors (Iterable[str]): The mirrors for all datasets.
+            offline (bool): If :obj:`True`, never request the original
+                URIs of the dataset files.  (default :obj:`False`)
+            cache_root (str or None): The cache root directory.  If not
+                specified, use ``get_cache_root()``.
+            timeout (float or (float, float)): The (connect, read) timeout
+                in seconds of the HTTP requests.
+        """
+        self._mirrors = []
+        self._dataset_mirrors = {}
+        self.offline = bool(offline)
+        self.cache_root = cache_root
+        self.timeout = timeout
+        for mirror in mirrors:
+            self.add_mirror(mirror)
+
+    @classmethod
+    def from_env(cls, environ=None):
+        """
+        Construct a new :class:`DatasetRegistry` from environment variables.
+
+        Args:
+            environ (dict[str, str]): The environment variables.
+                (default :obj:`os.environ`)
+
+        Returns:
+            DatasetRegistry: The constructed registry.
+        """
+        if environ is None:
+            environ = os.environ
+        mirrors = [m.strip() for m in
+                   environ.get('TFSNIPPET_DATASET_MIRRORS', '').split(';')]
+        return cls(
+            mirrors=[m for m in mirrors if m],
+            offline=environ.get('TFSNIPPET_DATASET_OFFLINE') == '1'
+        )
+
+    def add_mirror(self, mirror, name=None):
+        """
+        Add a mirror to the registry.
+
+        Args:
+            mirror (str): The local directory, or the base URI of the mirror.
+            name (str or None): If specified, add the mirror only for this
+                dataset.  Otherwise add the mirror for all datasets.
+        """
+        if not mirror:
+            raise ValueError('`mirror` must not be empty.')
+        if name is None:
+            self._mirrors.append(mirror)
+        else:
+            self._dataset_mirrors.setdefault(name, []).append(mirror)
+
+    def get_mirrors(self, name):
+        """
+        Get the mirrors of a dataset.
+
+        Args:
+            name (str): The name of the dataset.
+
+        Returns:
+            list[str]: The mirrors specific to this dataset, followed by
+                the mirrors for all datasets.
+        """
+        return self._dataset_mirrors.get(name, []) + self._mirrors
+
+    def resolve(self, name, uri, filename=None):
+        """
+        Resolve the candidate URIs of a dataset file, in order of preference.
+
+        Args:
+            name (str): The name of the dataset.
+            uri (str): The original URI of the dataset file.
+            filename (str): The filename of the dataset file.  Default
+                :obj:`None`, will automatically infer `filename` according
+                to `uri`.
+
+        Returns:
+            list[str]: The candidate URIs.
+        """
+        if filename is None:
+            filename = guess_filename_from_uri(uri)
+        ret = []
+        for mirror in self.get_mirrors(name):
+            if _is_local_mirror(mirror):
+                path = os.path.abspath(os.path.join(
+                    _local_mirror_path(mirror), name, filename))
+                if os.path.isfile(path):
+                    ret.append('file://' + pathname2url(path))
+            else:
+                ret.append('/'.join([mirror.rstrip('/'), name, filename]))
+        if not self.offline:
+            ret.append(uri)
+        return ret
+
+    def _fetch(self, name, uri, filename, cached_path, fetch_fn, hasher):
+        if os.path.exists(cached_path):
+            return fetch_fn(uri, hasher=hasher)
+
+        candidates = self.resolve(name, uri, filename)
+        errors = []
+        for candidate in candidates:
+            try:
+                return fetch_fn(
+                    candidate,
+                    hasher=hasher.copy() if hasher is not None else None
+                )
+            except IOError as ex:
+                errors.append('{}: {}'.format(candidate, ex))
+
+        if not errors:
+            raise IOError('No mirror has the file {!r} of dataset {!r}, and '
+                          'the registry is offline.'.format(filename, name))
+        raise IOError('Failed to fetch the file {!r} of dataset {!r} from '
+                      'any of the candidate URIs:\n  {}'.
+                      format(filename, name, '\n  '.join(errors)))
+
+    def download(self, name, uri, filename=None, show_progress=None,
+                 progress_file=sys.stderr, hasher=None, expected_hash=None):
+        """
+        Download a dataset file into the :class:`CacheDir` named `name`,
+        from the first available candidate URI.
+
+        Args:
+            name (str): The name of the dataset, also the name of the
+                :class:`CacheDir`.
+            uri (str): The original URI of the dataset file.
+            filename (str): The filename to use as the downloaded file.
+                Default :obj:`None`, will automatically infer `filename`
+                according to `uri`.
+            show_progress (bool): Whether or not to show interactive
+                progress bar?  See :meth:`CacheDir.download`.
+            progress_file: The file object where to write the progress.
+                (default :obj:`sys.stderr`)
+            hasher: A hasher algorithm instance from `hashlib`.
+                If specified, will compute the hash of downloaded content,
+                and validate against `expected_hash`.
+            expected_hash (str): The expected hash of downloaded content.
+
+        Returns:
+            str: The absolute path of the downloaded file.
+
+        Raises:
+            IOError: If the file cannot be fetched from any candidate URI.
+        """
+        if filename is None:
+            filename = guess_filename_from_uri(uri)
+        cache_dir = CacheDir(name, cache_root=self.cache_root)
+
+        def fetch_fn(candidate, hasher):
+            return cache_dir.download(
+                candidate, filename=filename, show_progress=show_progress,
+                progress_file=progress_file, hasher=hasher,
+                expected_hash=expected_hash, timeout=self.timeout
+            )
+
+        return self._fetch(name, uri, filename, cache_dir.resolve(filename),
+                           fetch_fn, hasher)
+
+    def download_and_extract(self, name, uri, filename=None, extract_dir=None,
+                             show_progress=None, progress_file=sys.stderr,
+                             hasher=None, expected_hash=None):
+        """
+        Download a dataset archive into the :class:`CacheDir` named `name`,
+        from the first available candidate URI, and extract it.
+
+        Args:
+            name (str): The name of the dataset, also the name of the
+                :class:`CacheDir`.
+            uri (str): The original URI of the dataset archive.
+            filename (str): The filename to use as the downloaded file.
+                Default :obj:`None`, will automatically infer `filename`
+                according to `uri`.
+            extract_dir (str): The name to use as the extracted directory.
+                Default :obj:`None`, will automatically infer `extract_dir`
+                according to `filename`.
+            show_progress (bool): Whether or not to show interactive
+                progress bar?  See :meth:`CacheDir.download`.
+            progress_file: The file object where to write the progress.
+                (default :obj:`sys.stderr`)
+            hasher: A hasher algorithm instance from `hashlib`.
+                If specified, will compute the hash of downloaded content,
+                and validate against `expected_hash`.
+            expected_hash (str): The expected hash of downloaded content.
+
+        Returns:
+            str: The absolute path of the extracted directory.
+
+        Raises:
+            IOError: If the archive cannot be fetched from any candidate URI.
+        """
+        if filename is None:
+            filename = guess_filename_from_uri(uri)
+        if extract_dir is None:
+            extract_dir = guess_extract_dir_from_filename(filename)
+        cache_dir = CacheDir(name, cache_root=self.cache_root)
+
+        def fetch_fn(candidate, hasher):
+            return cache_dir.download_and_extract(
+                candidate, filename=filename, extract_dir=extract_dir,
+                show_progress=show_progress, progress_file=progress_file,
+                hasher=hasher, expected_hash=expected_hash,
+                timeout=self.timeout
+            )
+
+        return self._fetch(name, uri, filename,
+                           cache_dir.resolve(extract_dir), fetch_fn, hasher)
+
+    def seed_cache(self, archive_file):
+        """
+        Pre-seed the cache root with the files in an archive.
+
+        The archive should have the same layout as the cache root, e.g.,
+        made by ``tar -czf seed.tar.gz -C ~/.tfsnippet/cache mnist cifar``.
+        The files already in the cache root will not be overwritten.
+
+        Args:
+            archive_file (str): The path of the archive file.
+
+        Returns:
+            int: The number of files added to the cache root.
+
+        Raises:
+            IOError: If any file in the archive is outside the cache root.
+        """
+        cache_root = self.cache_root
+        if cache_root is None:
+            cache_root = get_cache_root()
+        cache_root = os.path.abspath(cache_root)
+
+        count = 0
+        with Extractor.open(archive_file) as extractor:
+            for name, file_obj in extractor:
+                file_path = os.path.abspath(
+                    os.path.join(cache_root, *name.split('/')))
+                if not file_path.startswith(cache_root + os.sep):
+                    raise IOError('File {!r} in the archive is outside the '
+                                  'cache root.'.format(name))
+                if os.path.exists(file_path):
+                    continue
+                parent_dir = os.path.split(file_path)[0]
+                if not os.path.isdir(parent_dir):
+                    makedirs(parent_dir, exist_ok=True)
+                temp_file = file_path + '._seeding_'
+                with open(temp_file, 'wb') as f:
+                    shutil.copyfileobj(file_obj, f)
+                os.rename(temp_file, file_path)
+                count += 1
+        return count
+
+
+dataset_registry = DatasetRegistry.from_env()
+"""The global :class:`DatasetRegistry` used by the dataset loaders."""
@@ -1,5 +1,8 @@
 from .collect_outputs_ import *
+from .sinks import *
 
 __all__ = [
+    'AverageSink', 'CallbackSink', 'ConcatSink', 'HistogramSink',
+    'MemmapSink', 'OutputSink', 'ReduceSink', 'StatisticsSink',
     'collect_outputs',
 ]
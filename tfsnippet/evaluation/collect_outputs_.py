@@ -1,19 +1,96 @@
+import sys
 from collections import OrderedDict
+from contextlib import closing
+from threading import Thread, Event
 
-import numpy as np
+import six
 import tensorflow as tf
 
-from tfsnippet.trainer import resolve_feed_dict, merge_feed_dict
+from tfsnippet.dataflows import ExtraInfoDataFlow
+from tfsnippet.trainer import FeedDictPlan
 from tfsnippet.utils import validate_enum_arg, get_default_session_or_error
+from .sinks import OutputSink, ConcatSink, AverageSink
+
+if six.PY2:
+    from Queue import Queue, Full
+else:
+    from queue import Queue, Full
 
 __all__ = ['collect_outputs']
 
+_END_OF_OUTPUTS = object()
+
+
+def _iter_outputs(outputs, inputs, data_flow, feed_dict, session):
+    plan = FeedDictPlan(feed_dict)
+    for batch in data_flow:
+        batch_feed_dict = plan.resolve(zip(inputs, batch), session=session)
+        yield len(batch[0]), session.run(outputs, feed_dict=batch_feed_dict)
+
+
+def _prefetch_outputs(iterator, prefetch):
+    # run `iterator` in a background thread, such that the ``session.run``
+    # of the next mini-batches overlap with consuming the current one
+    queue = Queue(maxsize=prefetch)
+    stopped = Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                queue.put(item, timeout=.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def worker():
+        try:
+            for item in iterator:
+                if not put((item, None)):
+                    return
+            put((_END_OF_OUTPUTS, None))
+        except Exception:
+            put((None, sys.exc_info()))
+
+    thread = Thread(target=worker)
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            item, exc_info = queue.get()
+            if exc_info is not None:
+                six.reraise(*exc_info)
+            if item is _END_OF_OUTPUTS:
+                break
+            yield item
+    finally:
+        stopped.set()
+        thread.join()
+
 
 def collect_outputs(outputs, inputs, data_flow, mode='concat', axis=0,
-                    feed_dict=None, session=None):
+                    feed_dict=None, session=None, sinks=None, prefetch=0):
     """
     Run TensorFlow nodes by mini-batch and collect outputs from each batch.
 
+    The outputs from each batch are consumed by an :class:`OutputSink` for
+    each output tensor, either specified by `sinks`, or selected by `mode`.
+    A sink may reduce the outputs, or write them to a file as they come,
+    such that the collected outputs need not fit into the host memory,
+    for example::
+
+        latent, err = collect_outputs(
+            [z, recons_err], [input_x], data_flow,
+            sinks=[MemmapSink('latent.npy'),
+                   StatisticsSink(quantiles=True)],
+            prefetch=2
+        )
+
+    If `data_flow` is an :class:`~tfsnippet.dataflows.ExtraInfoDataFlow`,
+    its data length is passed to the sinks, thus "concat" mode fills a
+    preallocated array instead of concatenating the outputs of each batch
+    at last, which would double the memory usage.
+
     Args:
         outputs (Iterable[tf.Tensor] or dict[str, tf.Tensor]): The output
             tensors to be computed.
@@ -27,10 +104,18 @@ def collect_outputs(outputs, inputs, data_flow, mode='concat', axis=0,
         feed_dict: Optional, additional feed dict.
         session: The TensorFlow session.  If not specified, use the
             default session.
+        sinks (Iterable[OutputSink] or dict[str, OutputSink]): The sink
+            for each output tensor, a list if `outputs` is a list, or a dict
+            if `outputs` is a dict.  The outputs without a sink (or with
+            :obj:`None` as the sink) are collected according to `mode`.
+        prefetch (int): If positive, run the data flow and ``session.run``
+            in a background thread, which computes at most this number of
+            mini-batches ahead of the sinks.  (default 0)
 
     Returns:
-        tuple[np.ndarray] or dict[str, tf.Tensor]: The collected outputs.
-            Returns a dict if `outputs` is a dict, or a tuple otherwise.
+        tuple or dict[str, any]: The collected outputs, i.e., the results of
+            the sinks.  Returns a dict if `outputs` is a dict, or a tuple
+            otherwise.
     """
     mode = validate_enum_arg('mode', mode, ['concat', 'average'])
     session = session or get_default_session_or_error()
@@ -38,45 +123,52 @@ def collect_outputs(outputs, inputs, data_flow, mode='concat', axis=0,
     if isinstance(outputs, (dict, OrderedDict)):
         output_keys = list(outputs)
         outputs = [tf.convert_to_tensor(outputs[k]) for k in output_keys]
+        sinks = sinks or {}
+        sinks = [sinks.get(k) for k in output_keys]
     else:
         output_keys = None
         outputs = [tf.convert_to_tensor(o) for o in outputs]
+        sinks = list(sinks) if sinks is not None else [None] * len(outputs)
+        if len(sinks) != len(outputs):
+            raise ValueError('The number of sinks does not match the number '
+                             'of outputs: {} vs {}'.
+                             format(len(sinks), len(outputs)))
     inputs = [tf.convert_to_tensor(i) for i in inputs]
 
-    # check the shape of output tensors
-    for i, o in enumerate(outputs):
+    # check the shape of output tensors, and select the sinks by `mode`
+    for i, (o, sink) in enumerate(zip(outputs, sinks)):
+        if sink is not None:
+            if not isinstance(sink, OutputSink):
+                raise TypeError('Not an output sink: {!r}'.format(sink))
+            continue
         o_shape = o.get_shape()
         if mode == 'concat':
             if o_shape.ndims is not None and o_shape.ndims < 1:
                 raise ValueError('`mode` is "concat", but the {}-th output '
                                  'is a scalar: {!r}'.format(i, o))
+            sinks[i] = ConcatSink(axis=axis)
         else:
             if o_shape.ndims is not None and o_shape.ndims > 0:
                 raise ValueError('`mode` is "average", but the {}-th output '
                                  'is not a scalar: {!r}'.format(i, o))
+            sinks[i] = AverageSink()
 
-    collected = [[] for _ in range(len(outputs))]
-    weights = []
+    data_length = None
+    if isinstance(data_flow, ExtraInfoDataFlow):
+        data_length = data_flow.data_length
+    for sink in sinks:
+        sink.reset(data_length)
 
-    for batch in data_flow:
-        weights.append(len(batch[0]))
-        batch_feed_dict = merge_feed_dict(
-            feed_dict,
-            {k: v for (k, v) in zip(inputs, batch)}
-        )
-        batch_feed_dict = resolve_feed_dict(batch_feed_dict)
-        for i, o in enumerate(session.run(outputs, feed_dict=batch_feed_dict)):
-            collected[i].append(o)
-
-    weights = np.asarray(weights, dtype=np.float32)
-    for i, batches in enumerate(collected):
-        if mode == 'average':
-            stacked = np.stack(batches, axis=0)
-            assert(len(stacked.shape) == 1)
-            collected[i] = np.average(stacked, axis=0, weights=weights)
-        else:
-            collected[i] = np.concatenate(batches, axis=axis)
+    batch_outputs = _iter_outputs(
+        outputs, inputs, data_flow, feed_dict, session)
+    if prefetch > 0:
+        batch_outputs = _prefetch_outputs(batch_outputs, prefetch)
+    with closing(batch_outputs):
+        for weight, values in batch_outputs:
+            for sink, value in zip(sinks, values):
+                sink.add(value, weight)
 
+    collected = [sink.get_result() for sink in sinks]
     if output_keys is not None:
         collected = dict(zip(output_keys, collected))
     else:
@@ -0,0 +1,455 @@
+import struct
+
+import numpy as np
+
+from tfsnippet.utils import StatisticsCollector
+
+__all__ = [
+    'OutputSink', 'ConcatSink', 'AverageSink', 'MemmapSink', 'ReduceSink',
+    'StatisticsSink', 'HistogramSink', 'CallbackSink',
+]
+
+
+class OutputSink(object):
+    """
+    Base class for consuming the outputs of :func:`collect_outputs`.
+
+    A sink receives the output of one tensor from each mini-batch by
+    :meth:`add`, and produces the collected result by :meth:`get_result`,
+    such that the outputs can be reduced or written somewhere else as they
+    come, instead of being kept in memory until all mini-batches are done.
+    :meth:`reset` is called by :func:`collect_outputs` before the first
+    mini-batch, thus a sink can be reused by many calls.
+    """
+
+    def reset(self, data_length=None):
+        """
+        Prepare for a new collection.
+
+        Args:
+            data_length (int or None): The total length of the data, if it
+                is known before iterating through the data flow, e.g., the
+                data flow is an
+                :class:`~tfsnippet.dataflows.ExtraInfoDataFlow`.
+        """
+
+    def add(self, value, weight):
+        """
+        Consume the output of a mini-batch.
+
+        Args:
+            value (np.ndarray): The output of the mini-batch.
+            weight (float): The weight of the mini-batch, i.e., the size of
+                the mini-batch.
+        """
+        raise NotImplementedError()
+
+    def get_result(self):
+        """
+        Get the collected result.
+
+        Returns:
+            The collected result, whose type depends on the sink.
+        """
+        raise NotImplementedError()
+
+
+class ConcatSink(OutputSink):
+    """
+    Concatenate the outputs from each mini-batch along `axis`.
+
+    If the total length along `axis` is known, either specified by `size`,
+    or hinted by the data length of the data flow, the result array is
+    allocated at the first mini-batch and filled in place, which avoids
+    keeping the outputs of each mini-batch and the concatenated array in
+    memory at the same time.  The array is enlarged if the hint turns out
+    to be too small, and is trimmed if it is too large.  Otherwise, the
+    outputs of each mini-batch are concatenated by :func:`np.concatenate`
+    in :meth:`get_result`.
+    """
+
+    def __init__(self, axis=0, size=None):
+        """
+        Construct a new :class:`ConcatSink`.
+
+        Args:
+            axis (int): The axis for concatenation.  (default 0)
+            size (int): The total length along `axis`.  If not specified,
+                use the data length of the data flow, if known.
+        """
+        self._axis = int(axis)
+        self._size = int(size) if size is not None else None
+        self._init_state(self._size)
+
+    @property
+    def axis(self):
+        """Get the axis for concatenation."""
+        return self._axis
+
+    def _init_state(self, capacity):
+        self._capacity = capacity
+        self._array = None
+        self._batches = []
+        self._length = 0
+
+    def reset(self, data_length=None):
+        if self._size is not None:
+            data_length = self._size
+        self._init_state(data_length)
+
+    def _check_value(self, value):
+        value = np.asarray(value)
+        if not value.shape:
+            raise ValueError('Cannot concatenate a scalar output.')
+        axis = self._axis
+        if axis < 0:
+            axis += len(value.shape)
+        if axis < 0 or axis >= len(value.shape):
+            raise ValueError('`axis` out of range for the output of shape '
+                             '{}: {}'.format(value.shape, self._axis))
+        return value, axis
+
+    def _allocate(self, value, axis, capacity):
+        shape = list(value.shape)
+        shape[axis] = capacity
+        return np.empty(shape, dtype=value.dtype)
+
+    def _grow(self, value, axis, capacity):
+        array = self._allocate(value, axis, capacity)
+        self._slice(array, axis, 0, self._length)[...] = \
+            self._slice(self._array, axis, 0, self._length)
+        return array
+
+    @staticmethod
+    def _slice(array, axis, start, stop):
+        idx = [slice(None)] * len(array.shape)
+        idx[axis] = slice(start, stop)
+        return array[tuple(idx)]
+
+    def add(self, value, weight):
+        value, axis = self._check_value(value)
+        if self._capacity is None:
+            self._batches.append(value)
+            return
+
+        length = self._length + value.shape[axis]
+        if self._array is None:
+            self._array = self._allocate(
+                value, axis, max(self._capacity, length))
+        elif length > self._array.shape[axis]:
+            self._array = self._grow(
+                value, axis, max(length, 2 * self._array.shape[axis]))
+        self._slice(self._array, axis, self._length, length)[...] = value
+        self._length = length
+
+    def get_result(self):
+        if self._capacity is None:
+            return np.concatenate(self._batches, axis=self._axis)
+        if self._array is None:
+            raise ValueError('No output has been collected.')
+        if self._length < self._array.shape[self._axis]:
+            return self._slice(self._array, self._axis, 0, self._length)
+        return self._array
+
+
+def _truncate_npy_file(path, shape):
+    """
+    Rewrite the header of the ``.npy`` file at `path` with a smaller
+    `shape`, and truncate the data accordingly.  The data must have been
+    arranged for the new shape in C order.
+    """
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            _, _, dtype = np.lib.format.read_array_header_1_0(f)
+            len_format = '<H'
+        else:
+            _, _, dtype = np.lib.format.read_array_header_2_0(f)
+            len_format = '<I'
+        offset = f.tell()
+
+        # the new header is padded to the length of the original one,
+        # such that the data need not to be moved
+        header = "{{'descr': {!r}, 'fortran_order': False, 'shape': {!r}, }}".\
+            format(np.lib.format.dtype_to_descr(dtype),
+                   tuple(int(n) for n in shape))
+        header_len = offset - np.lib.format.MAGIC_LEN - \
+            struct.calcsize(len_format)
+        header = (header.ljust(header_len - 1) + '\n').encode('latin1')
+        assert len(header) == header_len
+
+        f.seek(np.lib.format.MAGIC_LEN)
+        f.write(struct.pack(len_format, header_len))
+        f.write(header)
+        f.truncate(offset + int(np.prod(shape)) * dtype.itemsize)
+
+
+class MemmapSink(ConcatSink):
+    """
+    Concatenate the outputs from each mini-batch into a ``.npy`` file.
+
+    The file is opened by :func:`np.lib.format.open_memmap` at the first
+    mini-batch, thus the outputs can be much larger than the host memory.
+    The total length along `axis` must be known, either specified by `size`,
+    or hinted by the data length of the data flow.  If fewer outputs are
+    collected, the file is truncated to the collected length by
+    :meth:`get_result`.
+    """
+
+    def __init__(self, path, axis=0, size=None):
+        """
+        Construct a new :class:`MemmapSink`.
+
+        Args:
+            path (str): The path of the ``.npy`` file.
+            axis (int): The axis for concatenation.  (default 0)
+            size (int): The total length along `axis`.  If not specified,
+                use the data length of the data flow.
+        """
+        self._path = path
+        super(MemmapSink, self).__init__(axis=axis, size=size)
+
+    @property
+    def path(self):
+        """Get the path of the ``.npy`` file."""
+        return self._path
+
+    def reset(self, data_length=None):
+        super(MemmapSink, self).reset(data_length)
+        if self._capacity is None:
+            raise ValueError('The size of the memmap file is unknown: '
+                             '`size` must be specified if the data length '
+                             'of the data flow is unknown.')
+
+    def _check_capacity(self, length):
+        if length > self._capacity:
+            raise ValueError('The outputs exceed the size of the memmap '
+                             'file: {} > {}'.format(length, self._capacity))
+
+    def _allocate(self, value, axis, capacity):
+        self._check_capacity(capacity)
+        shape = list(value.shape)
+        shape[axis] = capacity
+        return np.lib.format.open_memmap(
+            self._path, mode='w+', dtype=value.dtype, shape=tuple(shape))
+
+    def _grow(self, value, axis, capacity):
+        self._check_capacity(self._length + value.shape[axis])
+
+    def _truncate(self):
+        array = self._array
+        axis = self._axis if self._axis >= 0 else self._axis + len(array.shape)
+        shape = list(array.shape)
+        capacity, length = shape[axis], self._length
+        shape[axis] = length
+
+        # move the collected outputs to the front of the file, in C order
+        outer = int(np.prod(shape[:axis], dtype=np.int64))
+        inner = int(np.prod(shape[axis + 1:], dtype=np.int64))
+        src = array.reshape([outer, capacity * inner])
+        dst = array.reshape([-1])[: outer * length * inner].\
+            reshape([outer, length * inner])
+        for i in range(1, outer):
+            dst[i] = src[i, : length * inner]
+        array.flush()
+
+        # the file must not be mapped when it is truncated
+        del array, src, dst
+        self._array = None
+        _truncate_npy_file(self._path, shape)
+        self._array = np.lib.format.open_memmap(self._path, mode='r+')
+
+    def get_result(self):
+        """
+        Get the memmap array.
+
+        The ``.npy`` file is truncated to the collected length, if it is
+        shorter than the size of the file.
+
+        Returns:
+            np.memmap: The memmap array of the collected outputs.
+        """
+        if self._array is not None and \
+                self._length < self._array.shape[self._axis]:
+            self._truncate()
+        result = super(MemmapSink, self).get_result()
+        self._array.flush()
+        return result
+
+
+class AverageSink(OutputSink):
+    """
+    Average the scalar outputs from each mini-batch, weighted by the size
+    of each mini-batch.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, data_length=None):
+        self._total = 0.
+        self._weight_sum = 0.
+
+    def add(self, value, weight):
+        value = np.asarray(value)
+        if value.shape:
+            raise ValueError('Cannot average a non-scalar output.')
+        self._total += float(value) * weight
+        self._weight_sum += weight
+
+    def get_result(self):
+        if self._weight_sum <= 0:
+            raise ValueError('No output has been collected.')
+        return self._total / self._weight_sum
+
+
+class ReduceSink(OutputSink):
+    """
+    Reduce the outputs from each mini-batch along `axis` by a NumPy ufunc.
+
+    For example, ``ReduceSink(np.add)`` computes the sum of the outputs,
+    while ``ReduceSink(np.minimum)`` and ``ReduceSink(np.maximum)`` compute
+    the minimum and the maximum.
+    """
+
+    def __init__(self, ufunc, axis=0):
+        """
+        Construct a new :class:`ReduceSink`.
+
+        Args:
+            ufunc (np.ufunc): The binary NumPy ufunc, e.g., :obj:`np.add`.
+            axis (int): The axis to reduce.  (default 0)
+        """
+        self._ufunc = ufunc
+        self._axis = int(axis)
+        self.reset()
+
+    def reset(self, data_length=None):
+        self._result = None
+
+    def add(self, value, weight):
+        value = self._ufunc.reduce(np.asarray(value), axis=self._axis)
+        if self._result is None:
+            self._result = value
+        else:
+            self._result = self._ufunc(self._result, value)
+
+    def get_result(self):
+        if self._result is None:
+            raise ValueError('No output has been collected.')
+        return self._result
+
+
+class StatisticsSink(OutputSink):
+    """
+    Collect the mean and variance (and optionally the quantiles) of the
+    outputs along `axis`, by a :class:`~tfsnippet.utils.StatisticsCollector`.
+    """
+
+    def __init__(self, axis=0, quantiles=False):
+        """
+        Construct a new :class:`StatisticsSink`.
+
+        Args:
+            axis (int): The axis of the samples.  (default 0)
+            quantiles (bool): Whether or not to estimate the quantiles?
+                Only supported for outputs with one dimension.
+                (default :obj:`False`)
+        """
+        self._axis = int(axis)
+        self._quantiles = quantiles
+        self._collector = None  # type: StatisticsCollector
+
+    def reset(self, data_length=None):
+        self._collector = None
+
+    def add(self, value, weight):
+        value = np.moveaxis(np.asarray(value), self._axis, 0)
+        if self._collector is None:
+            self._collector = StatisticsCollector(
+                shape=value.shape[1:], quantiles=self._quantiles)
+        self._collector.collect(value)
+
+    def get_result(self):
+        """
+        Get the statistics collector.
+
+        Returns:
+            StatisticsCollector: The collector of the outputs.
+        """
+        if self._collector is None:
+            raise ValueError('No output has been collected.')
+        return self._collector
+
+
+class HistogramSink(OutputSink):
+    """
+    Count the histogram of all elements of the outputs.
+
+    The bin edges must be determined before the first mini-batch, thus
+    `bins` must be the bin edges, or `bins` must be the number of bins
+    along with `range` specified.
+    """
+
+    def __init__(self, bins, range=None):
+        """
+        Construct a new :class:`HistogramSink`.
+
+        Args:
+            bins (int or np.ndarray): The number of bins, or the bin edges.
+            range ((float, float)): The lower and upper range of the bins.
+                Required if `bins` is an integer.
+
+        Raises:
+            ValueError: If `bins` is an integer but `range` is not specified.
+        """
+        if np.ndim(bins) == 0:
+            if range is None:
+                raise ValueError('`range` must be specified if `bins` is '
+                                 'the number of bins.')
+            bins = np.linspace(range[0], range[1], int(bins) + 1)
+        self._edges = np.asarray(bins)
+        self.reset()
+
+    @property
+    def edges(self):
+        """Get the bin edges."""
+        return self._edges
+
+    def reset(self, data_length=None):
+        self._counts = np.zeros([len(self._edges) - 1], dtype=np.int64)
+
+    def add(self, value, weight):
+        self._counts += np.histogram(value, bins=self._edges)[0]
+
+    def get_result(self):
+        """
+        Get the histogram.
+
+        Returns:
+            (np.ndarray, np.ndarray): The counts and the bin edges.
+        """
+        return self._counts, self._edges
+
+
+class CallbackSink(OutputSink):
+    """Pass the outputs from each mini-batch to a callback."""
+
+    def __init__(self, callback):
+        """
+        Construct a new :class:`CallbackSink`.
+
+        Args:
+            callback ((value, weight) -> any): The callback function.
+        """
+        self._callback = callback
+
+    def add(self, value, weight):
+        self._callback(value, weight)
+
+    def get_result(self):
+        """
+        Returns:
+            None: Nothing is collected by this sink.
+        """
+        return None
@@ -6,3 +6,4 @@ from .misc import *
 from .mlconfig import *
 from .mlresults import *
 from .multi_gpu import *
+from .sweep import *
@@ -0,0 +1,365 @@
+import itertools
+import json
+import multiprocessing as mp
+import os
+import traceback
+from collections import deque
+
+import numpy as np
+import six
+import tensorflow as tf
+
+from tfsnippet.utils import Config, ConsoleTable, makedirs
+from .jsonutils import JsonEncoder
+from .mlresults import MLResults
+
+if six.PY2:
+    from Queue import Empty
+else:
+    from queue import Empty
+
+__all__ = [
+    'grid_search', 'random_search', 'SweepTrial', 'run_sweep',
+    'format_sweep_table',
+]
+
+
+def grid_search(space):
+    """
+    Generate the trials of a grid search.
+
+    Args:
+        space (dict[str, list]): The candidate values of each config field.
+
+    Returns:
+        list[dict[str, any]]: The config values of each trial, i.e., the
+            Cartesian product of the candidate values.  The config fields
+            are iterated in the sorted order of their names.
+    """
+    keys = sorted(space)
+    return [dict(zip(keys, values))
+            for values in itertools.product(*[list(space[k]) for k in keys])]
+
+
+def random_search(space, n_trials, seed=None):
+    """
+    Generate the trials of a random search.
+
+    Args:
+        space (dict[str, list or (np.random.RandomState) -> any]): The
+            candidate values of each config field, or a function which
+            samples a value from the given random state, e.g.,
+            ``lambda rs: 10 ** rs.uniform(-4, -2)``.
+        n_trials (int): The number of trials to generate.
+        seed (int): The random seed.
+
+    Returns:
+        list[dict[str, any]]: The config values of each trial.
+    """
+    random_state = np.random.RandomState(seed)
+    keys = sorted(space)
+    ret = []
+    for _ in range(n_trials):
+        trial = {}
+        for k in keys:
+            candidates = space[k]
+            if callable(candidates):
+                trial[k] = candidates(random_state)
+            else:
+                candidates = list(candidates)
+                trial[k] = candidates[random_state.randint(len(candidates))]
+        ret.append(trial)
+    return ret
+
+
+class SweepTrial(object):
+    """
+    A trial of a hyper-parameter sweep, passed to the trial function
+    within the trial process by :func:`run_sweep`.
+    """
+
+    def __init__(self, index, params, config, result_dir, cpus,
+                 intra_op_threads, inter_op_threads):
+        self.index = index
+        """int: The index of this trial."""
+        self.params = params
+        """dict[str, any]: The config values of this trial."""
+        self.config = config
+        """Config: The config object, with `params` assigned."""
+        self.result_dir = result_dir
+        """str: The result directory of this trial."""
+        self.cpus = cpus
+        """tuple[int]: The CPUs assigned to this trial."""
+        self.intra_op_threads = intra_op_threads
+        """int: The thread budget of TensorFlow intra-op thread pool."""
+        self.inter_op_threads = inter_op_threads
+        """int: The thread budget of TensorFlow inter-op thread pool."""
+        self.results = None
+        """MLResults: The results object of this trial."""
+
+    def session_config(self):
+        """
+        Get the session config under the thread budgets of this trial.
+
+        Returns:
+            tf.ConfigProto: The session config.
+        """
+        return tf.ConfigProto(
+            intra_op_parallelism_threads=self.intra_op_threads,
+            inter_op_parallelism_threads=self.inter_op_threads,
+        )
+
+
+def _available_cpus():
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(mp.cpu_count()))
+
+
+def _get_mp_context():
+    # use fork if possible, even if the default start method is not
+    # (e.g., "spawn" on macOS with Python 3.8+)
+    if hasattr(mp, 'get_context'):
+        try:
+            return mp.get_context('fork')
+        except ValueError:  # pragma: no cover
+            pass
+    return mp
+
+
+def _trial_process(trial_fn, trial, pin_cpus, queue):
+    try:
+        if pin_cpus and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, trial.cpus)
+        os.environ['OMP_NUM_THREADS'] = str(trial.intra_op_threads)
+
+        trial.results = MLResults(trial.result_dir)
+        trial.results.save_config(trial.config)
+        with tf.Graph().as_default():
+            metrics = trial_fn(trial)
+        if metrics:
+            trial.results.update_metrics(metrics)
+        metrics = json.loads(json.dumps(trial.results.metrics_dict,
+                                        cls=JsonEncoder))
+        queue.put((trial.index, True, metrics))
+    except Exception:
+        queue.put((trial.index, False, traceback.format_exc()))
+
+
+def run_sweep(trial_fn, config_cls, trials, result_dir, num_workers=None,
+              cpus_per_trial=None, inter_op_threads=None, pin_cpus=True):
+    """
+    Run a hyper-parameter sweep with concurrent trial processes.
+
+    Each trial runs in a new process, pinned to a disjoint set of CPUs
+    (if supported by the platform), with its own :class:`MLResults` at
+    ``result_dir/trial_<index>``.  The trial function is called with a
+    :class:`SweepTrial`, within a new default graph::
+
+        class ExpConfig(spt.Config):
+            learning_rate = 0.001
+            z_dim = 40
+
+        def train(trial):
+            config = trial.config
+            ...  # build the model
+            with tf.Session(config=trial.session_config()) as session:
+                ...  # train the model
+            return {'test_nll': test_nll}
+
+        rows = run_sweep(
+            train, ExpConfig,
+            grid_search({'learning_rate': [1e-3, 1e-4], 'z_dim': [20, 40]}),
+            result_dir='./results/sweep', num_workers=4
+        )
+        print(format_sweep_table(rows))
+
+    The processes are forked on platforms supporting "fork" (e.g., Linux
+    and macOS), thus `trial_fn` needs not to be picklable, but no session
+    should have been created in the main process.  On other platforms
+    (e.g., Windows), the processes are spawned, thus `trial_fn` must be
+    picklable (e.g., a module-level function), and the main module must
+    be importable without running the sweep again.
+
+    The rows of all trials are also saved to ``result_dir/sweep.json``.
+
+    Args:
+        trial_fn ((SweepTrial) -> dict[str, any]): The trial function.
+            The returned dict (if not :obj:`None`) will be saved as the
+            metrics of the trial.
+        config_cls (type): The config class, a subclass of
+            :class:`~tfsnippet.utils.Config`.
+        trials (list[dict[str, any]]): The config values of each trial,
+            e.g., generated by :func:`grid_search` or :func:`random_search`.
+        result_dir (str): The root result directory of the sweep.
+        num_workers (int): The number of concurrent trials.  If not
+            specified, use ``available_cpus // cpus_per_trial`` if
+            `cpus_per_trial` is specified, or 1 otherwise.
+        cpus_per_trial (int): The number of CPUs assigned to each trial,
+            which is also the intra-op thread budget of each trial.
+            If not specified, divide the available CPUs evenly among the
+            workers.
+        inter_op_threads (int): The inter-op thread budget of each trial.
+            If not specified, use ``min(2, cpus_per_trial)``.
+        pin_cpus (bool): Whether or not to pin the CPU affinity of each
+            trial process? (default :obj:`True`)
+
+    Returns:
+        list[dict[str, any]]: The rows of the trials, in the order of
+            `trials`.  Each row contains "index", "status" ("ok" or
+            "failed"), the config values, the metrics of the trial, and
+            "error" (the traceback) for failed trials.
+    """
+    if not isinstance(config_cls, six.class_types) or \
+            not issubclass(config_cls, Config):
+        raise TypeError('`config_cls` must be a subclass of `Config`: '
+                        'got {!r}.'.format(config_cls))
+    trials = [dict(t) for t in trials]
+    cpus = _available_cpus()
+    if num_workers is None:
+        if cpus_per_trial is not None:
+            num_workers = max(1, len(cpus) // int(cpus_per_trial))
+        else:
+            num_workers = 1
+    num_workers = int(num_workers)
+    if num_workers < 1:
+        raise ValueError('`num_workers` must be at least 1: got {!r}.'.
+                         format(num_workers))
+    if cpus_per_trial is None:
+        cpus_per_trial = max(1, len(cpus) // num_workers)
+    cpus_per_trial = int(cpus_per_trial)
+    if cpus_per_trial < 1:
+        raise ValueError('`cpus_per_trial` must be at least 1: got {!r}.'.
+                         format(cpus_per_trial))
+    if inter_op_threads is None:
+        inter_op_threads = min(2, cpus_per_trial)
+
+    # assign the CPUs to each worker slot, wrapping around if the CPUs
+    # are not enough for all the slots
+    slot_cpus = [
+        tuple(cpus[(i * cpus_per_trial + j) % len(cpus)]
+              for j in range(cpus_per_trial))
+        for i in range(num_workers)
+    ]
+
+    # construct the trial objects, which also validates the config values
+    trial_objects = []
+    for i, params in enumerate(trials):
+        config = config_cls()
+        config.update(params)
+        trial_objects.append(SweepTrial(
+            index=i,
+            params=params,
+            config=config,
+            result_dir=os.path.join(result_dir, 'trial_{:04d}'.format(i)),
+            cpus=(),
+            intra_op_threads=cpus_per_trial,
+            inter_op_threads=inter_op_threads,
+        ))
+
+    # run the trials
+    ctx = _get_mp_context()
+    queue = ctx.Queue()
+    pending = deque(trial_objects)
+    running = {}  # slot -> (process, trial)
+    outcomes = {}  # index -> (succeeded, metrics or traceback)
+
+    def receive(timeout):
+        try:
+            index, ok, payload = queue.get(timeout=timeout)
+        except Empty:
+            return False
+        else:
+            outcomes[index] = (ok, payload)
+            return True
+
+    try:
+        while pending or running:
+            for slot in range(num_workers):
+                if slot not in running and pending:
+                    trial = pending.popleft()
+                    trial.cpus = slot_cpus[slot]
+                    p = ctx.Process(target=_trial_process,
+                                   args=(trial_fn, trial, pin_cpus, queue))
+                    p.daemon = True
+                    p.start()
+                    running[slot] = (p, trial)
+
+            receive(timeout=.1)
+            for slot, (p, trial) in list(six.iteritems(running)):
+                if trial.index in outcomes:
+                    p.join()
+                    del running[slot]
+                elif not p.is_alive():
+                    # drain the queue before concluding the process
+                    # has exited without reporting its outcome
+                    while receive(timeout=.1):
+                        pass
+                    if trial.index not in outcomes:
+                        outcomes[trial.index] = (
+                            False,
+                            'The trial process exited with code {}.'.
+                            format(p.exitcode)
+                        )
+                    p.join()
+                    del running[slot]
+    finally:
+        for p, _ in six.itervalues(running):
+            p.terminate()
+            p.join()
+
+    # aggregate the outcomes
+    rows = []
+    for trial in trial_objects:
+        ok, payload = outcomes[trial.index]
+        row = {'index': trial.index, 'status': 'ok' if ok else 'failed'}
+        row.update(trial.params)
+        if ok:
+            row.update(payload)
+        else:
+            row['error'] = payload
+        rows.append(row)
+
+    makedirs(result_dir, exist_ok=True)
+    with open(os.path.join(result_dir, 'sweep.json'), 'wb') as f:
+        s = json.dumps(rows, sort_keys=True, cls=JsonEncoder)
+        if not isinstance(s, six.binary_type):
+            s = s.encode('utf-8')
+        f.write(s)
+
+    return rows
+
+
+def format_sweep_table(rows, columns=None):
+    """
+    Format the rows returned by :func:`run_sweep` as a console table.
+
+    Args:
+        rows (list[dict[str, any]]): The rows of the trials.
+        columns (list[str]): The columns to show.  If not specified, show
+            "index", "status", followed by all the other columns (except
+            "error") in sorted order.
+
+    Returns:
+        str: The formatted table.
+    """
+    if columns is None:
+        keys = set()
+        for row in rows:
+            keys.update(row)
+        keys.difference_update(('index', 'status', 'error'))
+        columns = ['index', 'status'] + sorted(keys)
+
+    def format_value(v):
+        if v is None:
+            return ''
+        if isinstance(v, float):
+            return '{:.6g}'.format(v)
+        return str(v)
+
+    table = ConsoleTable(len(columns), col_align=['>'] * len(columns))
+    table.add_row(columns)
+    table.add_hr('-')
+    for row in rows:
+        table.add_row([format_value(row.get(c)) for c in columns])
+    return table.format()
@@ -1,11 +1,17 @@
+from .async_summary_writer import *
 from .checkpoint import *
+from .early_stopping import *
 from .event_keys import *
 from .logging_ import *
+from .profiler import *
 from .scheduled_var import *
 from .train_loop_ import *
 
 __all__ = [
-    'AnnealingVariable', 'CheckpointSavableObject', 'CheckpointSaver',
-    'DefaultMetricFormatter', 'EventKeys', 'MetricFormatter', 'MetricLogger',
-    'ScheduledVariable', 'TrainLoop', 'summarize_variables',
+    'AnnealingVariable', 'AsyncSummaryWriter', 'CheckpointSavableObject',
+    'CheckpointSaver', 'CheckpointSnapshot', 'DefaultMetricFormatter',
+    'EarlyStoppingSnapshot', 'EventKeys', 'HostMemorySnapshot',
+    'MetricFormatter', 'MetricLogger', 'ScheduledVariable',
+    'ShadowVariableSnapshot', 'StepProfiler', 'TrainLoop',
+    'summarize_variables',
 ]
@@ -0,0 +1,313 @@
+import time
+from collections import OrderedDict
+from logging import getLogger
+from threading import Thread, Event
+
+import six
+import tensorflow as tf
+
+from tfsnippet.utils import AutoInitAndCloseable
+
+if six.PY2:
+    from Queue import Queue, Empty, Full
+else:
+    from queue import Queue, Empty, Full
+
+__all__ = ['AsyncSummaryWriter']
+
+_METRICS = 'metrics'
+_SUMMARY = 'summary'
+_CALL = 'call'
+_FLUSH = 'flush'
+_STOP = 'stop'
+
+
+class AsyncSummaryWriter(AutoInitAndCloseable):
+    """
+    Write the metrics and summaries in a background thread.
+
+    The metrics are put into a bounded queue as raw ``(tag, value)`` pairs,
+    and the background thread builds one :class:`tf.summary.Summary` per
+    global step out of the metrics received within every `flush_interval`
+    seconds, and writes it via the wrapped `summary_writer`.  This takes
+    the protobuf building and the file I/O off the training thread.
+
+    When the queue is full, :meth:`add_metrics` and :meth:`add_summary`
+    block until there is free space, or drop the data if `drop_when_full`
+    is :obj:`True` (counted by :attr:`dropped_count`).
+
+    Usage::
+
+        with AsyncSummaryWriter(tf.summary.FileWriter(log_dir)) as writer:
+            writer.add_metrics({'loss': 0.1}, global_step=1)
+            ...
+
+    The other writing methods of :class:`tf.summary.FileWriter`
+    (:meth:`add_graph`, :meth:`add_meta_graph`, :meth:`add_run_metadata`,
+    :meth:`add_session_log` and :meth:`add_event`) are delegated to the
+    wrapped `summary_writer` by the background thread as well, in the order
+    of calls, and are never dropped.
+
+    The wrapped `summary_writer` is flushed, but not closed, when this
+    writer is closed.
+    """
+
+    def __init__(self, summary_writer, flush_interval=1., queue_size=1000,
+                 drop_when_full=False):
+        """
+        Construct a new :class:`AsyncSummaryWriter`.
+
+        Args:
+            summary_writer: The TensorFlow summary writer to be wrapped.
+            flush_interval (float): Number of seconds between two writes
+                of the received metrics. (default 1.)
+            queue_size (int): Maximum number of pending calls to
+                :meth:`add_metrics` and :meth:`add_summary`.  (default 1000)
+            drop_when_full (bool): Whether or not to drop the metrics and
+                summaries when the queue is full, instead of waiting?
+                (default :obj:`False`)
+        """
+        queue_size = int(queue_size)
+        if queue_size < 1:
+            raise ValueError('`queue_size` must be at least 1.')
+        flush_interval = float(flush_interval)
+        if flush_interval <= 0:
+            raise ValueError('`flush_interval` must be positive.')
+
+        self._summary_writer = summary_writer
+        self._flush_interval = flush_interval
+        self._queue_size = queue_size
+        self._drop_when_full = bool(drop_when_full)
+        self._dropped_count = 0
+
+        # internal states for background worker
+        self._worker = None  # type: Thread
+        self._queue = None  # type: Queue
+        self._worker_error = None
+
+    @property
+    def summary_writer(self):
+        """Get the wrapped TensorFlow summary writer."""
+        return self._summary_writer
+
+    @property
+    def flush_interval(self):
+        """Get the number of seconds between two writes of the metrics."""
+        return self._flush_interval
+
+    @property
+    def queue_size(self):
+        """Get the maximum number of pending calls."""
+        return self._queue_size
+
+    @property
+    def drop_when_full(self):
+        """Whether or not to drop the data when the queue is full?"""
+        return self._drop_when_full
+
+    @property
+    def dropped_count(self):
+        """Get the number of dropped calls because the queue was full."""
+        return self._dropped_count
+
+    def _write_metrics(self, pending_metrics):
+        for global_step, values in six.iteritems(pending_metrics):
+            summary = tf.summary.Summary(value=[
+                tf.summary.Summary.Value(tag=tag, simple_value=value)
+                for tag, value in values
+            ])
+            self._summary_writer.add_summary(summary, global_step=global_step)
+        pending_metrics.clear()
+
+    def _worker_func(self):
+        pending_metrics = OrderedDict()  # {global_step: [(tag, value)]}
+        next_write_time = time.time() + self._flush_interval
+
+        try:
+            while True:
+                try:
+                    item = self._queue.get(
+                        timeout=max(next_write_time - time.time(), 0.))
+                except Empty:
+                    item = None
+
+                if item is not None:
+                    kind, payload, global_step = item
+                    if kind == _METRICS:
+                        pending_metrics.setdefault(global_step, []). \
+                            extend(payload)
+                    elif kind == _SUMMARY:
+                        self._summary_writer.add_summary(
+                            payload, global_step=global_step)
+                    elif kind == _CALL:
+                        method, args, kwargs = payload
+                        getattr(self._summary_writer, method)(
+                            *args, **kwargs)
+                    else:
+                        self._write_metrics(pending_metrics)
+                        self._summary_writer.flush()
+                        payload.set()
+                        if kind == _STOP:
+                            break
+
+                if time.time() >= next_write_time:
+                    self._write_metrics(pending_metrics)
+                    next_write_time = time.time() + self._flush_interval
+        except Exception as ex:
+            getLogger(__name__).warning(
+                '{} exited because of error.'.format(self.__class__.__name__),
+                exc_info=True
+            )
+            self._worker_error = ex
+            # release the callers blocked on the queue or on flushing
+            while True:
+                try:
+                    kind, payload, _ = self._queue.get_nowait()
+                except Empty:
+                    break
+                if kind in (_FLUSH, _STOP):
+                    payload.set()
+
+    def _init(self):
+        self._queue = Queue(self._queue_size)
+        self._worker_error = None
+        self._worker = Thread(target=self._worker_func)
+        self._worker.daemon = True
+        self._worker.start()
+
+    def _send(self, item):
+        # the worker may exit because of error at any time, thus never wait
+        # for it without checking whether or not it is still alive
+        while self._worker.is_alive():
+            try:
+                self._queue.put(item, timeout=.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def _send_and_wait(self, kind):
+        done = Event()
+        if self._send((kind, done, None)):
+            while not done.wait(.1) and self._worker.is_alive():
+                pass
+
+    def _close(self):
+        try:
+            self._send_and_wait(_STOP)
+            self._worker.join()
+        finally:
+            self._worker = None
+            self._queue = None
+        self._check_worker_error()
+
+    def _check_worker_error(self):
+        if self._worker_error is not None:
+            error, self._worker_error = self._worker_error, None
+            raise RuntimeError('{} failed to write the summaries: {}'.
+                               format(self.__class__.__name__, error))
+
+    def _put(self, item):
+        self.init()
+        self._check_worker_error()
+        if self._drop_when_full:
+            try:
+                self._queue.put(item, block=False)
+            except Full:
+                self._dropped_count += 1
+        else:
+            self._send(item)
+
+    def add_metrics(self, metrics, global_step=None):
+        """
+        Add metric values.
+
+        Args:
+            metrics (dict[str, float] or Iterable[(str, float)]): The metric
+                values, or the ``(tag, value)`` pairs.
+            global_step (int): The global step counter.
+        """
+        if hasattr(metrics, 'items'):
+            metrics = six.iteritems(metrics)
+        values = [(str(k), float(v)) for k, v in metrics]
+        if values:
+            self._put((_METRICS, values, global_step))
+
+    def add_summary(self, summary, global_step=None):
+        """
+        Add a summary object.
+
+        Args:
+            summary (tf.summary.Summary or bytes): TensorFlow summary object,
+                or serialized summary.
+            global_step (int): The global step counter.
+        """
+        self._put((_SUMMARY, summary, global_step))
+
+    def _call(self, method, *args, **kwargs):
+        self.init()
+        self._check_worker_error()
+        self._send((_CALL, (method, args, kwargs), None))
+
+    def add_graph(self, graph, global_step=None, **kwargs):
+        """
+        Add a graph, see :meth:`tf.summary.FileWriter.add_graph`.
+
+        Args:
+            graph (tf.Graph or tf.GraphDef): The graph.
+            global_step (int): The global step counter.
+            \\**kwargs: Other named arguments of the wrapped method.
+        """
+        self._call('add_graph', graph, global_step=global_step, **kwargs)
+
+    def add_meta_graph(self, meta_graph_def, global_step=None):
+        """
+        Add a meta graph, see :meth:`tf.summary.FileWriter.add_meta_graph`.
+
+        Args:
+            meta_graph_def (tf.MetaGraphDef): The meta graph.
+            global_step (int): The global step counter.
+        """
+        self._call('add_meta_graph', meta_graph_def, global_step=global_step)
+
+    def add_run_metadata(self, run_metadata, tag, global_step=None):
+        """
+        Add the metadata of a session run, see
+        :meth:`tf.summary.FileWriter.add_run_metadata`.
+
+        Args:
+            run_metadata (tf.RunMetadata): The run metadata.
+            tag (str): The tag of the run metadata.
+            global_step (int): The global step counter.
+        """
+        self._call('add_run_metadata', run_metadata, tag,
+                   global_step=global_step)
+
+    def add_session_log(self, session_log, global_step=None):
+        """
+        Add a session log, see :meth:`tf.summary.FileWriter.add_session_log`.
+
+        Args:
+            session_log (tf.SessionLog): The session log.
+            global_step (int): The global step counter.
+        """
+        self._call('add_session_log', session_log, global_step=global_step)
+
+    def add_event(self, event):
+        """
+        Add an event, see :meth:`tf.summary.FileWriter.add_event`.
+
+        Args:
+            event (tf.Event): The event.
+        """
+        self._call('add_event', event)
+
+    def get_logdir(self):
+        """Get the log directory of the wrapped summary writer."""
+        return self._summary_writer.get_logdir()
+
+    def flush(self):
+        """Wait for all the pending data to be written and flushed."""
+        self.init()
+        self._send_and_wait(_FLUSH)
+        self._check_worker_error()
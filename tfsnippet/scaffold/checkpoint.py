@@ -1,7 +1,14 @@
+import codecs
 import copy
+import hashlib
+import json
 import os
+import time
 from collections import OrderedDict
+from logging import getLogger
+from threading import Thread
 
+import numpy as np
 import six
 import tensorflow as tf
 
@@ -20,6 +27,12 @@ __all__ = ['CheckpointSavableObject', 'CheckpointSaver']
 CHECKPOINT_VAR_NAME = 'tfsnippet_checkpoint_pickle_variable_' \
                       'd2a4b5a2c0ca48b9855bce2953bc11d5'
 
+MANIFEST_FORMAT = 'tfsnippet.dedup_checkpoint'
+"""Format name of the manifest files of deduplicated checkpoints."""
+
+BLOBS_DIR = 'blobs'
+"""Name of the content-addressed blob store under the checkpoint directory."""
+
 
 class CheckpointSavableObject(object):
     """
@@ -71,16 +84,184 @@ class CheckpointSerialVar(object):
         session.run(self._assign_op, feed_dict={self._assign_ph: value})
 
 
+class _BackgroundCheckpointWriter(object):
+    """
+    Write the snapshot of variable values as a checkpoint file, with a
+    :class:`tf.train.Saver` in a private graph.
+
+    The variables in the private graph have the same names in checkpoint
+    files as the saved variables, thus the written checkpoint files can be
+    restored by the saver of the original graph.
+    """
+
+    def __init__(self, names, dtypes, shapes, max_to_keep):
+        self._names = list(names)
+        self._graph = tf.Graph()
+        with self._graph.as_default():
+            self._placeholders = []
+            var_dict = {}
+            for i, (name, dtype, shape) in enumerate(
+                    zip(self._names, dtypes, shapes)):
+                ph = tf.placeholder(dtype=dtype, shape=shape)
+                var_dict[name] = tf.Variable(
+                    ph, name='var_{}'.format(i), trainable=False,
+                    collections=[]
+                )
+                self._placeholders.append(ph)
+            self._init_op = tf.variables_initializer(list(var_dict.values()))
+            self._saver = tf.train.Saver(var_list=var_dict,
+                                         max_to_keep=max_to_keep)
+
+    def write(self, values, save_path, global_step, last_checkpoints):
+        self._saver.set_last_checkpoints_with_time(last_checkpoints)
+        # never occupy the GPU memory for writing checkpoints
+        config = tf.ConfigProto(device_count={'GPU': 0})
+        with tf.Session(graph=self._graph, config=config) as session:
+            session.run(self._init_op, feed_dict={
+                ph: values[name]
+                for name, ph in zip(self._names, self._placeholders)
+            })
+            self._saver.save(session, save_path, global_step=global_step,
+                             write_meta_graph=False)
+        return self._saver.last_checkpoints_with_time
+
+
+class _DedupCheckpointWriter(object):
+    """
+    Write the snapshot of variable values as a deduplicated checkpoint.
+
+    Each value is serialized (by ``np.save``) into a blob, which is stored
+    at ``save_dir/blobs/<hash[:2]>/<hash>``, named by the SHA-1 hash of its
+    content.  A blob is only written if it does not exist, thus the values
+    that never change (e.g., frozen parameters) are only written once.
+    The checkpoint file itself is a JSON manifest, referencing the blobs.
+    """
+
+    def __init__(self, save_dir):
+        self._save_dir = save_dir
+        self._blobs_dir = os.path.join(save_dir, BLOBS_DIR)
+
+    def blob_path(self, blob_hash):
+        return os.path.join(self._blobs_dir, blob_hash[:2], blob_hash)
+
+    def _put_blob(self, content):
+        blob_hash = hashlib.sha1(content).hexdigest()
+        path = self.blob_path(blob_hash)
+        if not os.path.isfile(path):
+            makedirs(os.path.dirname(path), exist_ok=True)
+            _write_file_atomic(path, content)
+        return blob_hash
+
+    def write(self, values, serialized_states, save_path, last_checkpoints,
+              max_to_keep):
+        manifest = {'format': MANIFEST_FORMAT, 'variables': {},
+                    'objects': None}
+        for name, value in six.iteritems(values):
+            buf = six.BytesIO()
+            np.save(buf, np.asarray(value), allow_pickle=False)
+            manifest['variables'][name] = self._put_blob(buf.getvalue())
+        if serialized_states is not None:
+            manifest['objects'] = self._put_blob(serialized_states)
+
+        _write_file_atomic(
+            save_path, json.dumps(manifest, sort_keys=True).encode('utf-8'))
+
+        # update the checkpoint state, and evict the old checkpoints
+        last_checkpoints = [(p, t) for p, t in last_checkpoints
+                            if p != save_path]
+        last_checkpoints.append((save_path, time.time()))
+        evicted = []
+        if max_to_keep:
+            evicted = last_checkpoints[:-max_to_keep]
+            last_checkpoints = last_checkpoints[-max_to_keep:]
+        tf.train.update_checkpoint_state(
+            self._save_dir, save_path,
+            all_model_checkpoint_paths=[p for p, _ in last_checkpoints]
+        )
+        if evicted:
+            for p, _ in evicted:
+                for path in (p, p + '.meta'):
+                    if os.path.isfile(path):
+                        os.remove(path)
+            self._collect_garbage([p for p, _ in last_checkpoints])
+        return last_checkpoints
+
+    def _collect_garbage(self, checkpoints):
+        referenced = set()
+        for path in checkpoints:
+            manifest = _load_manifest(path)
+            referenced.update(six.itervalues(manifest['variables']))
+            if manifest['objects'] is not None:
+                referenced.add(manifest['objects'])
+        for parent, _, names in os.walk(self._blobs_dir):
+            for name in names:
+                if name not in referenced:
+                    os.remove(os.path.join(parent, name))
+
+
+def _write_file_atomic(path, content):
+    """
+    Write `content` into `path` via a temporary file, such that a partially
+    written file would never be seen at `path`.
+    """
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        # `os.rename` cannot replace an existing file on Windows
+        getattr(os, 'replace', os.rename)(tmp_path, path)
+    except BaseException:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _is_manifest(save_path):
+    """Check whether or not `save_path` is a deduplicated checkpoint."""
+    if not os.path.isfile(save_path) or os.path.exists(save_path + '.index'):
+        return False
+    with open(save_path, 'rb') as f:
+        return f.read(1) == b'{'
+
+
+def _load_manifest(save_path):
+    """Load the manifest of a deduplicated checkpoint."""
+    with codecs.open(save_path, 'rb', 'utf-8') as f:
+        manifest = json.load(f)
+    if not isinstance(manifest, dict) or \
+            manifest.get('format') != MANIFEST_FORMAT:
+        raise IOError('Not a deduplicated checkpoint file: {}'.
+                      format(save_path))
+    return manifest
+
+
 class CheckpointSaver(VarScopeObject):
     """
     Save and restore :class:`tf.Variable`, :class:`ScheduledVariable` and
     :class:`CheckpointSavableObject` with :class:`tf.train.Saver`.
+
+    If `async_save` is :obj:`True`, :meth:`save` only takes a snapshot of
+    the variable values into host memory, by a single ``session.run``,
+    and the checkpoint files are written by a background thread.  At most
+    one background save can be in flight, thus :meth:`save` waits for the
+    previous one to finish.  The results of the background saves should be
+    collected by :meth:`collect_async_results`.
+
+    If `dedup` is :obj:`True`, the checkpoints are written in a deduplicated
+    format: the value of each variable is stored as a blob named by the hash
+    of its content under ``save_dir/blobs``, and each checkpoint file is a
+    manifest referencing the blobs.  Thus the variables which have not
+    changed since the last checkpoint (e.g., frozen encoders, permutation
+    matrices and :class:`ScheduledVariable`) are not written again.  The
+    blobs not referenced by any kept checkpoint are removed when an old
+    checkpoint is evicted due to `max_to_keep`.  :meth:`restore` accepts
+    checkpoints of both formats, regardless of `dedup`.
     """
 
     @add_name_and_scope_arg_doc
     def __init__(self, variables, save_dir, objects=None,
                  filename='checkpoint.dat', max_to_keep=None, save_meta=True,
-                 name=None, scope=None):
+                 async_save=False, dedup=False, name=None, scope=None):
         """
         Construct a new :class:`CheckpointSaver`.
 
@@ -97,6 +278,10 @@ class CheckpointSaver(VarScopeObject):
                 If :obj:`None` or `0`, keep all versions.
             save_meta (bool): Whether or not to save the graph meta in
                  checkpoint files?
+            async_save (bool): Whether or not to write the checkpoint files
+                in a background thread?  (default :obj:`False`)
+            dedup (bool): Whether or not to write deduplicated checkpoints?
+                (default :obj:`False`)
         """
         # check the argument `variables`
         def check_var(var):
@@ -142,6 +327,15 @@ class CheckpointSaver(VarScopeObject):
         self._save_dir = os.path.abspath(save_dir)
         self._filename = str(filename)
         self._save_meta = bool(save_meta)
+        self._async_save = bool(async_save)
+        self._dedup = bool(dedup)
+        self._max_to_keep = max_to_keep
+        self._dedup_writer = _DedupCheckpointWriter(self._save_dir)
+
+        # states of the background saves
+        self._async_writer = None  # type: _BackgroundCheckpointWriter
+        self._async_thread = None  # type: Thread
+        self._async_results = []
 
         super(CheckpointSaver, self).__init__(name=name, scope=scope)
 
@@ -181,6 +375,16 @@ class CheckpointSaver(VarScopeObject):
         """Whether or not to save graph meta?"""
         return self._save_meta
 
+    @property
+    def async_save(self):
+        """Whether or not to write the checkpoint files in background?"""
+        return self._async_save
+
+    @property
+    def dedup(self):
+        """Whether or not to write deduplicated checkpoints?"""
+        return self._dedup
+
     @property
     def saver(self):
         """
@@ -206,6 +410,7 @@ class CheckpointSaver(VarScopeObject):
             str or None: The path of the latest checkpoint file, or
                 :obj:`None` if no checkpoint file is found.
         """
+        self._wait_async()
         return tf.train.latest_checkpoint(self._save_dir)
 
     def restore_latest(self, ignore_non_exist=False, session=None):
@@ -237,13 +442,21 @@ class CheckpointSaver(VarScopeObject):
                 If not specified, restore into the default session.
         """
         session = session or get_default_session_or_error()
+        self._wait_async()
 
         # restore the variables
-        self._saver.restore(session, save_path)
+        if _is_manifest(save_path):
+            serialized_states = self._restore_manifest(save_path, session)
+        else:
+            self._saver.restore(session, save_path)
+            serialized_states = None
+            if self._objects:
+                serialized_states = self._serial_var.get(session)
+        ScheduledVariable.invalidate_all_caches()
 
         # restore the states of savable objects
         if self._objects:
-            object_states = pkl.loads(self._serial_var.get(session))
+            object_states = pkl.loads(serialized_states)
             assert(isinstance(object_states, dict))
 
             for key, obj in six.iteritems(self._objects):
@@ -252,6 +465,31 @@ class CheckpointSaver(VarScopeObject):
                                    '{}'.format(key, save_path))
                 obj.set_state(object_states[key])
 
+    def _restore_manifest(self, save_path, session):
+        manifest = _load_manifest(save_path)
+        feed_dict = {}
+        init_ops = []
+        for name, var in six.iteritems(self._variables):
+            if name not in manifest['variables']:
+                raise KeyError('Variable `{}` not found in the checkpoint: '
+                               '{}'.format(name, save_path))
+            blob_path = self._dedup_writer.blob_path(
+                manifest['variables'][name])
+            # feed the value to the initial value of the variable, which
+            # does not need to build new assignment operations
+            init_ops.append(var.initializer)
+            feed_dict[var.initializer.inputs[1]] = \
+                np.load(blob_path, allow_pickle=False)
+        session.run(init_ops, feed_dict=feed_dict)
+
+        if self._objects:
+            if manifest['objects'] is None:
+                raise KeyError('Object states not found in the checkpoint: '
+                               '{}'.format(save_path))
+            blob_path = self._dedup_writer.blob_path(manifest['objects'])
+            with open(blob_path, 'rb') as f:
+                return f.read()
+
     def save(self, global_step=None, session=None):
         """
         Save the session to a checkpoint file.
@@ -262,11 +500,13 @@ class CheckpointSaver(VarScopeObject):
                 If not specified, select the default session.
 
         Returns:
-            str: The path of the saved checkpoint file.
+            str: The path of the saved checkpoint file.  If `async_save` is
+                :obj:`True`, the file might not have been written yet.
         """
         session = session or get_default_session_or_error()
 
         # save the states of savable objects into serial var
+        serialized_states = None
         if self._objects:
             object_states = {}
             for key, obj in six.iteritems(self._objects):
@@ -274,7 +514,11 @@ class CheckpointSaver(VarScopeObject):
 
             serialized_states = pkl.dumps(
                 object_states, protocol=pkl.HIGHEST_PROTOCOL)
-            self._serial_var.set(serialized_states)
+            if not self._async_save and not self._dedup:
+                self._serial_var.set(serialized_states)
+
+        if self._async_save or self._dedup:
+            return self._save_snapshot(global_step, serialized_states, session)
 
         # now save the variables to checkpoint file
         if not os.path.isdir(self.save_dir):
@@ -285,3 +529,157 @@ class CheckpointSaver(VarScopeObject):
             global_step=global_step,
             write_meta_graph=self.save_meta
         )
+
+    def _save_snapshot(self, global_step, serialized_states, session):
+        self._wait_async()
+
+        # take the snapshot of the variable values in one session run
+        names = sorted(self._variables)
+        fetches = [self._variables[n] for n in names]
+        if isinstance(global_step, (tf.Variable, tf.Tensor)):
+            fetches.append(global_step)
+        values = session.run(fetches)
+        if isinstance(global_step, (tf.Variable, tf.Tensor)):
+            global_step = values.pop()
+        values = dict(zip(names, values))
+
+        save_path = os.path.join(self.save_dir, self.filename)
+        if global_step is not None:
+            global_step = int(global_step)
+            save_path = '{}-{}'.format(save_path, global_step)
+        meta_graph = session.graph if self._save_meta else None
+
+        last_checkpoints = self._saver.last_checkpoints_with_time
+        if self._dedup:
+            def write_values():
+                return self._dedup_writer.write(
+                    values, serialized_states, save_path, last_checkpoints,
+                    self._max_to_keep
+                )
+        else:
+            if serialized_states is not None:
+                values[CHECKPOINT_VAR_NAME] = serialized_states
+            self._ensure_values_writer(values)
+
+            def write_values():
+                return self._async_writer.write(
+                    values, os.path.join(self.save_dir, self.filename),
+                    global_step, last_checkpoints
+                )
+
+        def write_checkpoint():
+            if not os.path.isdir(self.save_dir):
+                makedirs(self.save_dir, exist_ok=True)
+            self._saver.set_last_checkpoints_with_time(write_values())
+            if meta_graph is not None:
+                tf.train.export_meta_graph(
+                    save_path + '.meta', graph=meta_graph,
+                    saver_def=self._saver.saver_def
+                )
+
+        if not self._async_save:
+            write_checkpoint()
+            return save_path
+
+        def write():
+            try:
+                write_checkpoint()
+                error = None
+            except Exception as ex:
+                getLogger(__name__).warning(
+                    'Failed to save checkpoint: %s', save_path, exc_info=True)
+                error = ex
+            self._async_results.append((save_path, error))
+
+        self._async_thread = Thread(target=write)
+        self._async_thread.daemon = True
+        self._async_thread.start()
+        return save_path
+
+    def _ensure_values_writer(self, values):
+        if self._async_writer is None:
+            var_names = sorted(values)
+            self._async_writer = _BackgroundCheckpointWriter(
+                names=var_names,
+                dtypes=[self._var_dict[n].dtype.base_dtype
+                        for n in var_names],
+                shapes=[np.shape(values[n]) for n in var_names],
+                max_to_keep=self._max_to_keep
+            )
+
+    def save_values(self, values, global_step=None):
+        """
+        Save the specified variable values to a checkpoint file.
+
+        This method saves the values taken earlier (e.g., a snapshot of
+        the parameters being evaluated in background), instead of the
+        current values in a session.  The checkpoint file can be restored
+        by :meth:`restore` as usual.
+
+        Args:
+            values (dict[tf.Variable, np.ndarray]): The values of the
+                variables.  It must contain all the saved variables.
+            global_step (int): The global step counter.
+
+        Returns:
+            str: The path of the saved checkpoint file.
+
+        Raises:
+            RuntimeError: If this saver has savable objects, whose states
+                cannot be taken along with the values.
+        """
+        if self._objects:
+            raise RuntimeError('`save_values` is not supported for a saver '
+                               'with savable objects.')
+        self._wait_async()
+        values = {n: values[v] for n, v in six.iteritems(self._variables)}
+
+        save_path = os.path.join(self.save_dir, self.filename)
+        if global_step is not None:
+            global_step = int(global_step)
+            save_path = '{}-{}'.format(save_path, global_step)
+        if not os.path.isdir(self.save_dir):
+            makedirs(self.save_dir, exist_ok=True)
+        if self._dedup:
+            self._saver.set_last_checkpoints_with_time(
+                self._dedup_writer.write(
+                    values, None, save_path,
+                    self._saver.last_checkpoints_with_time, self._max_to_keep
+                )
+            )
+        else:
+            self._ensure_values_writer(values)
+            self._saver.set_last_checkpoints_with_time(
+                self._async_writer.write(
+                    values, os.path.join(self.save_dir, self.filename),
+                    global_step, self._saver.last_checkpoints_with_time
+                )
+            )
+        return save_path
+
+    def _wait_async(self):
+        if self._async_thread is not None:
+            self._async_thread.join()
+            self._async_thread = None
+
+    def collect_async_results(self, wait=False):
+        """
+        Collect the results of the finished background saves.
+
+        Args:
+            wait (bool): Whether or not to wait for the in-flight background
+                save to finish?  (default :obj:`False`)
+
+        Returns:
+            list[(str, Exception or None)]: The path of each checkpoint file,
+                and the error if failed to save it.
+        """
+        if wait:
+            self._wait_async()
+        elif self._async_thread is not None and \
+                not self._async_thread.is_alive():
+            self._async_thread = None
+        # the background thread only appends to this list
+        ret = self._async_results[:]
+        del self._async_results[:len(ret)]
+        return ret
@@ -0,0 +1,332 @@
+import tensorflow as tf
+
+from tfsnippet.utils import get_default_session_or_error
+from .checkpoint import CheckpointSaver
+from .scheduled_var import ScheduledVariable
+
+__all__ = [
+    'EarlyStoppingSnapshot', 'HostMemorySnapshot', 'ShadowVariableSnapshot',
+    'CheckpointSnapshot',
+]
+
+
+class EarlyStoppingSnapshot(object):
+    """
+    Base class for the snapshot of the best parameters for early-stopping.
+
+    :meth:`save` is called each time a new best validation metric is met,
+    thus it is on the critical path of the training loop, while
+    :meth:`restore_latest` is called only once, when the training loop
+    exits normally.
+    """
+
+    def __init__(self, variables):
+        """
+        Construct a new :class:`EarlyStoppingSnapshot`.
+
+        Args:
+            variables: A list of variables, or a dict `(name -> variable)`.
+                A variable might be a :class:`tf.Variable` or a
+                :class:`ScheduledVariable`.
+        """
+        if isinstance(variables, dict):
+            variables = [variables[k] for k in sorted(variables)]
+
+        def check_var(var):
+            if isinstance(var, ScheduledVariable):
+                var = var.variable
+            if not isinstance(var, tf.Variable):
+                raise TypeError('Not a variable: {!r}'.format(var))
+            return var
+
+        self._variables = [check_var(v) for v in variables]
+
+    @property
+    def variables(self):
+        """
+        Get the variables to take snapshot of.
+
+        Returns:
+            list[tf.Variable]: The variables.
+        """
+        return list(self._variables)
+
+    def save(self, global_step=None, session=None):
+        """
+        Take a snapshot of the variables, replacing the previous one.
+
+        Args:
+            global_step (int): The global step counter.
+            session (tf.Session): The session to use.  If not specified,
+                use the default session.
+        """
+        raise NotImplementedError()
+
+    def save_values(self, values, global_step=None, session=None):
+        """
+        Take a snapshot of the specified values, replacing the previous one.
+
+        This is used when the validation metric has been computed on the
+        values taken earlier, e.g., by
+        :class:`~tfsnippet.trainer.AsyncEvaluator`.
+
+        Args:
+            values (dict[tf.Variable, np.ndarray]): The values of the
+                variables.  It must contain all the variables of this
+                snapshot.
+            global_step (int): The global step counter.
+            session (tf.Session): The session to use.  If not specified,
+                use the default session.
+        """
+        raise NotImplementedError()
+
+    def latest_snapshot(self):
+        """
+        Get the description of the latest snapshot.
+
+        Returns:
+            str or None: The description of the latest snapshot, or
+                :obj:`None` if no snapshot has been taken.
+        """
+        raise NotImplementedError()
+
+    def restore_latest(self, session=None):
+        """
+        Restore the variables from the latest snapshot.
+
+        Args:
+            session (tf.Session): The session to use.  If not specified,
+                use the default session.
+
+        Raises:
+            IOError: If no snapshot has been taken.
+        """
+        raise NotImplementedError()
+
+    def close(self):
+        """Release the resources held by the snapshot."""
+
+
+class _InProcessSnapshot(EarlyStoppingSnapshot):
+
+    def __init__(self, variables):
+        super(_InProcessSnapshot, self).__init__(variables)
+        self._global_step = None
+        self._has_snapshot = False
+
+    def _save(self, session):
+        raise NotImplementedError()
+
+    def _restore(self, session):
+        raise NotImplementedError()
+
+    def _save_values(self, values, session):
+        raise NotImplementedError()
+
+    def save(self, global_step=None, session=None):
+        session = session or get_default_session_or_error()
+        self._save(session)
+        self._global_step = global_step
+        self._has_snapshot = True
+
+    def save_values(self, values, global_step=None, session=None):
+        values = [values[v] for v in self._variables]
+        self._save_values(values, session)
+        self._global_step = global_step
+        self._has_snapshot = True
+
+    def latest_snapshot(self):
+        if not self._has_snapshot:
+            return None
+        if self._global_step is None:
+            return 'snapshot in {}'.format(self._location)
+        return 'snapshot in {} at step {}'.format(
+            self._location, self._global_step)
+
+    def restore_latest(self, session=None):
+        if not self._has_snapshot:
+            raise IOError('No snapshot has been taken.')
+        session = session or get_default_session_or_error()
+        self._restore(session)
+        ScheduledVariable.invalidate_all_caches()
+
+
+class HostMemorySnapshot(_InProcessSnapshot):
+    """
+    Keep the snapshot of the variables as NumPy arrays in host memory.
+
+    The variable values are fetched by a single ``session.run``, and are
+    restored by a single grouped assign operation.  This avoids writing
+    checkpoint files at each new best validation metric.
+    """
+
+    _location = 'host memory'
+
+    def __init__(self, variables, name=None):
+        """
+        Construct a new :class:`HostMemorySnapshot`.
+
+        Args:
+            variables: A list of variables, or a dict `(name -> variable)`.
+                A variable might be a :class:`tf.Variable` or a
+                :class:`ScheduledVariable`.
+            name (str): Default name of the name scope.
+                If not specified, generate one according to the class name.
+        """
+        super(HostMemorySnapshot, self).__init__(variables)
+        self._values = None
+
+        with tf.name_scope(name, default_name='HostMemorySnapshot'):
+            self._placeholders = [
+                tf.placeholder(dtype=v.dtype.base_dtype, shape=v.get_shape())
+                for v in self._variables
+            ]
+            self._restore_op = tf.group(*[
+                tf.assign(v, ph)
+                for v, ph in zip(self._variables, self._placeholders)
+            ])
+
+    def _save(self, session):
+        self._values = session.run(self._variables)
+
+    def _save_values(self, values, session):
+        self._values = values
+
+    def _restore(self, session):
+        session.run(self._restore_op, feed_dict={
+            ph: value for ph, value in zip(self._placeholders, self._values)
+        })
+
+    def close(self):
+        self._values = None
+
+
+class ShadowVariableSnapshot(_InProcessSnapshot):
+    """
+    Keep the snapshot of the variables in shadow TensorFlow variables.
+
+    The variable values are copied to the shadow variables, on the same
+    devices, by a single grouped assign operation, which involves no
+    device-to-host transfer.  However, the shadow variables double the
+    device memory occupied by the variables.
+
+    The shadow variables are not added to any collection, thus they are
+    neither saved by checkpoints, nor initialized by
+    :func:`~tfsnippet.utils.ensure_variables_initialized`.  They are
+    initialized by the first assignment in :meth:`save`.
+    """
+
+    _location = 'shadow variables'
+
+    def __init__(self, variables, name=None):
+        """
+        Construct a new :class:`ShadowVariableSnapshot`.
+
+        Args:
+            variables: A list of variables, or a dict `(name -> variable)`.
+                A variable might be a :class:`tf.Variable` or a
+                :class:`ScheduledVariable`.
+            name (str): Default name of the name scope.
+                If not specified, generate one according to the class name.
+        """
+        super(ShadowVariableSnapshot, self).__init__(variables)
+
+        with tf.name_scope(name, default_name='ShadowVariableSnapshot'):
+            shadows = []
+            for i, v in enumerate(self._variables):
+                with tf.device(v.device):
+                    shadows.append(tf.Variable(
+                        tf.zeros(v.get_shape(), dtype=v.dtype.base_dtype),
+                        name='shadow_{}'.format(i), trainable=False,
+                        collections=[]
+                    ))
+            self._shadows = shadows
+            self._save_op = tf.group(*[
+                tf.assign(s, v) for s, v in zip(shadows, self._variables)])
+            self._restore_op = tf.group(*[
+                tf.assign(v, s) for s, v in zip(shadows, self._variables)])
+            self._placeholders = [
+                tf.placeholder(dtype=v.dtype.base_dtype, shape=v.get_shape())
+                for v in self._variables
+            ]
+            self._load_op = tf.group(*[
+                tf.assign(s, ph)
+                for s, ph in zip(shadows, self._placeholders)
+            ])
+
+    @property
+    def shadow_variables(self):
+        """
+        Get the shadow variables.
+
+        Returns:
+            list[tf.Variable]: The shadow variables.
+        """
+        return list(self._shadows)
+
+    def _save(self, session):
+        session.run(self._save_op)
+
+    def _save_values(self, values, session):
+        session = session or get_default_session_or_error()
+        session.run(self._load_op, feed_dict={
+            ph: value for ph, value in zip(self._placeholders, values)
+        })
+
+    def _restore(self, session):
+        session.run(self._restore_op)
+
+
+class CheckpointSnapshot(EarlyStoppingSnapshot):
+    """
+    Keep the snapshot of the variables as checkpoint files on disk.
+
+    This is suitable for very large models, whose parameters do not fit
+    into the host or device memory twice.  The checkpoint files also
+    survive the process, such that the early-stopping can be resumed
+    along with the training.
+    """
+
+    def __init__(self, variables, save_dir):
+        """
+        Construct a new :class:`CheckpointSnapshot`.
+
+        Args:
+            variables: A list of variables, or a dict `(name -> variable)`.
+                A variable might be a :class:`tf.Variable` or a
+                :class:`ScheduledVariable`.
+            save_dir (str): The directory, where to place the checkpoint
+                files.  This directory must be solely owned by this snapshot.
+        """
+        super(CheckpointSnapshot, self).__init__(variables)
+        self._saver = CheckpointSaver(
+            variables,
+            save_dir=save_dir,
+            max_to_keep=2,
+            save_meta=False
+        )
+
+    @property
+    def saver(self):
+        """
+        Get the checkpoint saver.
+
+        Returns:
+            CheckpointSaver: The checkpoint saver.
+        """
+        return self._saver
+
+    def save(self, global_step=None, session=None):
+        self._saver.save(global_step=global_step, session=session)
+
+    def save_values(self, values, global_step=None, session=None):
+        self._saver.save_values(values, global_step=global_step)
+
+    def latest_snapshot(self):
+        latest = self._saver.latest_checkpoint()
+        if latest is not None:
+            latest = 'checkpoint {}'.format(latest)
+        return latest
+
+    def restore_latest(self, session=None):
+        self._saver.restore_latest(session=session)
@@ -15,6 +15,9 @@ class EventKeys(object):
     # (TrainLoop) When time metrics have been collected.
     TIME_METRICS_COLLECTED = 'time_metrics_collected'
 
+    # (TrainLoop) Before printing the logs.
+    BEFORE_PRINT_LOGS = 'before_print_logs'
+
     # (TrainLoop) When metric statistics have been printed.
     METRIC_STATS_PRINTED = 'metric_stats_printed'
 
@@ -24,6 +27,12 @@ class EventKeys(object):
     # (TrainLoop) When TensorFlow summary has been added.
     SUMMARY_ADDED = 'summary_added'
 
+    # (TrainLoop) When a checkpoint has been saved.
+    CHECKPOINT_SAVED = 'checkpoint_saved'
+
+    # (TrainLoop) When failed to save a checkpoint in background.
+    CHECKPOINT_FAILED = 'checkpoint_failed'
+
     # (TrainLoop, Trainer) Before executing an epoch.
     BEFORE_EPOCH = 'before_epoch'
 
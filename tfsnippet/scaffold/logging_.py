@@ -13,6 +13,7 @@ from tfsnippet.utils import (humanize_duration,
                              StatisticsCollector,
                              get_default_session_or_error,
                              DocInherit)
+from .async_summary_writer import AsyncSummaryWriter
 from .scheduled_var import ScheduledVariable
 
 __all__ = [
@@ -174,7 +175,7 @@ class MetricLogger(object):
         for k, v in six.iteritems(self._summary_commit_freqs):
             self._metrics_skip_counter[k] = v - 1
 
-    def collect_metrics(self, metrics, global_step=None):
+    def collect_metrics(self, metrics, global_step=None, weight=1.):
         """
         Collect the statistics of metrics.
 
@@ -189,14 +190,33 @@ class MetricLogger(object):
                 the metric values would be recorded, if calling
                 :meth:`collect_metrics` with an array.
             global_step (int or tf.Variable or tf.Tensor): The global step
-                counter. (optional)
+                counter. (optional)  It must be an int if `summary_writer`
+                is an :class:`AsyncSummaryWriter`, e.g., the host step
+                counter tracked by :class:`~tfsnippet.scaffold.TrainLoop`,
+                since reading a tensor would synchronize the training thread
+                with the session at every call.
+            weight (float): The weight of the metric values, e.g., the number
+                of mini-batches or samples that the values are averaged over.
+                This affects only the statistics for :meth:`format_logs`.
+                (default 1.)
+
+        Raises:
+            TypeError: If `global_step` is a tensor, while `summary_writer`
+                is an :class:`AsyncSummaryWriter`.
         """
+        is_async = isinstance(self._summary_writer, AsyncSummaryWriter)
+        if is_async and isinstance(global_step, (tf.Variable, tf.Tensor)):
+            raise TypeError('`global_step` must be an int rather than a '
+                            'tensor, when writing summaries by '
+                            '`AsyncSummaryWriter`: got {!r}.'.
+                            format(global_step))
+
         tf_summary_values = []
         for k, v in six.iteritems(metrics):
             if isinstance(v, ScheduledVariable):
                 v = v.get()
             v = np.asarray(v)
-            self._metrics[k].collect(v)
+            self._metrics[k].collect(v, weight)
 
             if self._summary_writer is not None and \
                     (self._summary_skip_pattern is None or
@@ -206,20 +226,26 @@ class MetricLogger(object):
                 if skip_count + 1 >= freq_limit:
                     self._metrics_skip_counter[k] = 0
                     tag = self._summary_metric_prefix + k
-                    tf_summary_values.append(
-                        tf.summary.Summary.Value(
-                            tag=tag, simple_value=v.mean()
-                        )
-                    )
+                    tf_summary_values.append((tag, v.mean()))
                 else:
                     self._metrics_skip_counter[k] = skip_count + 1
 
         if tf_summary_values:
-            summary = tf.summary.Summary(value=tf_summary_values)
-            if global_step is not None and \
-                    isinstance(global_step, (tf.Variable, tf.Tensor)):
-                global_step = get_default_session_or_error().run(global_step)
-            self._summary_writer.add_summary(summary, global_step=global_step)
+            if is_async:
+                # the summary is built in the background thread
+                self._summary_writer.add_metrics(
+                    tf_summary_values, global_step=global_step)
+            else:
+                if global_step is not None and \
+                        isinstance(global_step, (tf.Variable, tf.Tensor)):
+                    global_step = \
+                        get_default_session_or_error().run(global_step)
+                summary = tf.summary.Summary(value=[
+                    tf.summary.Summary.Value(tag=tag, simple_value=value)
+                    for tag, value in tf_summary_values
+                ])
+                self._summary_writer.add_summary(
+                    summary, global_step=global_step)
 
     def format_logs(self):
         """
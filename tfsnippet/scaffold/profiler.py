@@ -0,0 +1,232 @@
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
+import six
+
+from tfsnippet.utils import humanize_duration, StatisticsCollector
+
+__all__ = ['StepProfiler']
+
+DATA_WAIT = 'data_wait'
+FEED_DICT = 'feed_dict'
+SESSION_RUN = 'session_run'
+COLLECT_METRICS = 'collect_metrics'
+HOOK_PREFIX = 'hook:'
+
+MAX_EXACT_DURATIONS = 1024
+"""
+Maximum number of durations kept in memory for each section.  Once more
+durations have been recorded since last clear, the percentiles are
+estimated by a t-digest instead.
+"""
+
+
+class _NullContext(object):
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+
+NULL_CONTEXT = _NullContext()
+"""The context manager doing nothing, used when profiling is disabled."""
+
+
+class _SectionStats(object):
+    """The running statistics of a section."""
+
+    __slots__ = ('count', 'total', 'durations', 'collector')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.durations = []  # not yet collected by `collector`
+        self.collector = None  # type: StatisticsCollector
+
+    def flush(self):
+        if self.collector is None:
+            self.collector = StatisticsCollector(quantiles=True)
+        self.collector.collect(np.asarray(self.durations))
+        self.durations = []
+
+
+def _handler_name(handler):
+    # unwrap the hooks registered by ``BaseTrainer.*_after_*()``
+    handler = getattr(handler, 'callback', handler)
+    name = getattr(handler, '__name__', None)
+    if name is None:
+        name = handler.__class__.__name__
+    return name
+
+
+class StepProfiler(object):
+    """
+    Collect the time spent in different sections of the training steps.
+
+    The :class:`TrainLoop` and the trainers record the following sections,
+    if the profiler is enabled by ``TrainLoop(profile=True)``:
+
+    *   ``data_wait``: time blocked in the data flow of ``iter_steps``.
+    *   ``feed_dict``: time of resolving the feed dict by
+        :meth:`~tfsnippet.trainer.FeedDictPlan.resolve`.
+    *   ``session_run``: time of the training ``session.run``.
+    *   ``collect_metrics``: time of collecting the metrics and summaries.
+    *   ``hook:<event_key>:<handler>``: time of each event handler.
+
+    The statistics are kept until :meth:`clear` is called, which is done by
+    :meth:`TrainLoop.print_logs` after the percentiles have been reported.
+    The count and the total duration of each section are kept as running
+    sums, while the percentiles are computed exactly from the durations
+    only if no more than :data:`MAX_EXACT_DURATIONS` durations have been
+    recorded, or estimated by a t-digest otherwise, such that the memory
+    usage is bounded no matter how long the logs are not printed.
+    """
+
+    def __init__(self, percentiles=(50, 90, 99)):
+        """
+        Construct a new :class:`StepProfiler`.
+
+        Args:
+            percentiles (Iterable[float]): The percentiles to report.
+                (default ``(50, 90, 99)``)
+        """
+        self._percentiles = tuple(percentiles)
+        self._sections = OrderedDict()  # type: dict[str, _SectionStats]
+
+    @property
+    def percentiles(self):
+        """Get the percentiles to report."""
+        return self._percentiles
+
+    @property
+    def has_records(self):
+        """Whether or not any duration has been recorded since last clear?"""
+        return bool(self._sections)
+
+    def record(self, section, duration):
+        """
+        Record the duration of a section.
+
+        Args:
+            section (str): Name of the section.
+            duration (float): The duration in seconds.
+        """
+        stats = self._sections.get(section)
+        if stats is None:
+            stats = self._sections[section] = _SectionStats()
+        stats.count += 1
+        stats.total += duration
+        if self._percentiles:
+            stats.durations.append(duration)
+            if len(stats.durations) >= MAX_EXACT_DURATIONS:
+                stats.flush()
+
+    @contextmanager
+    def timeit(self, section):
+        """
+        Open a context for timing a section.
+
+        Args:
+            section (str): Name of the section.
+        """
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.record(section, time.time() - start_time)
+
+    def record_handler(self, event_key, handler, duration):
+        """
+        Record the duration of an event handler.
+
+        This method can be used as the handler timer of
+        :meth:`~tfsnippet.utils.EventSource.set_handler_timer`.
+
+        Args:
+            event_key (str): The event key.
+            handler: The event handler.
+            duration (float): The duration in seconds.
+        """
+        self.record('{}{}:{}'.format(HOOK_PREFIX, event_key,
+                                     _handler_name(handler)),
+                    duration)
+
+    def clear(self):
+        """Clear the recorded durations."""
+        self._sections.clear()
+
+    def get_stats(self):
+        """
+        Get the statistics of the recorded durations.
+
+        Returns:
+            OrderedDict[str, OrderedDict[str, float]]: For each section,
+                the ``count`` and ``total`` of the durations, as well as
+                each percentile (e.g., ``p50``).
+        """
+        ret = OrderedDict()
+        for section, s in six.iteritems(self._sections):
+            stats = OrderedDict([
+                ('count', s.count),
+                ('total', float(s.total)),
+            ])
+            if self._percentiles:
+                if s.collector is None:
+                    values = np.percentile(s.durations, self._percentiles)
+                else:
+                    s.flush()
+                    values = s.collector.quantile(
+                        np.asarray(self._percentiles) / 100.)
+                for p, v in zip(self._percentiles, values):
+                    stats['p{:g}'.format(p)] = float(v)
+            ret[section] = stats
+        return ret
+
+    def format_stats(self, stats=None):
+        """
+        Format the statistics of the recorded durations as log lines.
+
+        Args:
+            stats: The statistics returned by :meth:`get_stats`.
+                If not specified, use the current statistics.
+
+        Returns:
+            list[str]: One line for each section.
+        """
+        if stats is None:
+            stats = self.get_stats()
+        lines = []
+        for section, s in six.iteritems(stats):
+            buf = ['{}: total {}'.format(
+                section, humanize_duration(s['total']))]
+            for p in self._percentiles:
+                key = 'p{:g}'.format(p)
+                if key in s:
+                    buf.append('{} {}'.format(
+                        key, humanize_duration(s[key])))
+            buf.append('(x{})'.format(s['count']))
+            lines.append(' '.join(buf))
+        return lines
+
+    def dump_json(self, path, stats=None, **extra):
+        """
+        Append the statistics as one JSON object per line to a file.
+
+        Args:
+            path (str): The path of the file.
+            stats: The statistics returned by :meth:`get_stats`.
+                If not specified, use the current statistics.
+            \\**extra: Extra fields of the JSON object, e.g., the epoch
+                and step counters.
+        """
+        if stats is None:
+            stats = self.get_stats()
+        obj = OrderedDict(extra)
+        obj['stats'] = stats
+        with open(path, 'a') as f:
+            f.write(json.dumps(obj) + '\n')
@@ -1,3 +1,6 @@
+import weakref
+
+import numpy as np
 import tensorflow as tf
 
 from tfsnippet.ops import convert_to_tensor_and_cast
@@ -14,10 +17,29 @@ class ScheduledVariable(TensorWrapper):
     """
     A non-trainable :class:`tf.Variable`, whose value might need to be changed
     as training goes by.
+
+    If `host_cache` is :obj:`True`, the value assigned by :meth:`set` (or
+    :meth:`AnnealingVariable.anneal`) is kept in host memory, along with
+    the session it is assigned in, such that :meth:`get` needs no session
+    round-trip until the variable is assigned by other means.  All the
+    host-side values are invalidated when :meth:`invalidate_all_caches` is
+    called, which is done by :meth:`CheckpointSaver.restore` and the
+    early-stopping snapshots.  However, the host-side value cannot track
+    any other assignment (e.g., running :attr:`assign_op` directly, running
+    the variable initializer, or restoring the variable by a plain
+    :class:`tf.train.Saver`), thus :meth:`invalidate_cache` must be called
+    afterwards.  The host cache is disabled by default, where :meth:`get`
+    always reads the value from the session.
+
+    Alternatively, the value can be scheduled as an in-graph function of
+    the global step, by :meth:`schedule_by_global_step`, such that no host
+    interaction is needed at all.
     """
 
+    _cache_generation = 0  # increased by `invalidate_all_caches()`
+
     def __init__(self, name, initial_value, dtype=tf.float32, model_var=False,
-                 collections=None):
+                 collections=None, host_cache=False):
         """
         Construct a new :class:`ScheduledVariable`.
 
@@ -30,7 +52,10 @@ class ScheduledVariable(TensorWrapper):
             collections (Iterable[str]): Add the variable to these graph
                 collections, in addition to the `MODEL_VARIABLES` and
                 `GLOBAL_VARIABLES` collections.
+            host_cache (bool): Whether or not to keep the assigned value
+                in host memory?  (default :obj:`False`)
         """
+        self._self_host_cache = bool(host_cache)
         with tf.name_scope('ScheduledVariable.init'):
             dtype = tf.as_dtype(dtype)
 
@@ -65,6 +90,8 @@ class ScheduledVariable(TensorWrapper):
         self._self_assign_ph = tf.placeholder(
             dtype=dtype, shape=self._self_var.get_shape())
         self._self_assign_op = self._self_var.assign(self._self_assign_ph)
+        self._self_cache = None  # (weakref(session), generation, value)
+        self._self_schedule_op = None
 
     @property
     def tensor(self):
@@ -85,6 +112,10 @@ class ScheduledVariable(TensorWrapper):
         """
         Get the assignment operation.
 
+        Prefer :meth:`set` to running this operation directly, which also
+        keeps the assigned value in host memory.  Otherwise, call
+        :meth:`invalidate_cache` after running this operation.
+
         Returns:
             tf.Operation: The assignment operation.
         """
@@ -93,16 +124,74 @@ class ScheduledVariable(TensorWrapper):
     @property
     def assign_ph(self):
         """
-        Get the assignment placeholder.
+        Get the assignment placeholder of :attr:`assign_op`.
 
         Returns:
             tf.Tensor: The assignment placeholder.
         """
         return self._self_assign_ph
 
+    @property
+    def host_cache(self):
+        """Whether or not the assigned value is kept in host memory?"""
+        return self._self_host_cache
+
+    @property
+    def schedule_op(self):
+        """
+        Get the operation built by :meth:`schedule_by_global_step`.
+
+        Returns:
+            tf.Operation or None: The operation, or :obj:`None` if the
+                value is not scheduled in the graph.
+        """
+        return self._self_schedule_op
+
+    def get_cached(self, session=None):
+        """
+        Get the host-side value of the variable, without session round-trip.
+
+        Args:
+            session (tf.Session): The session, where the value has been
+                assigned.  If not specified, use the default session.
+
+        Returns:
+            The host-side value, or :obj:`None` if `host_cache` is not
+            enabled, if the value has not been assigned in `session` by
+            :meth:`set`, or if the value has been invalidated.
+        """
+        cache = self._self_cache
+        if cache is not None:
+            session = session or get_default_session_or_error()
+            if cache[0]() is session and \
+                    cache[1] == ScheduledVariable._cache_generation:
+                value = cache[2]
+                if isinstance(value, np.ndarray):
+                    value = value.copy()
+                return value
+
+    def _update_cache(self, session, value):
+        if self._self_host_cache and self._self_schedule_op is None:
+            self._self_cache = (weakref.ref(session),
+                                ScheduledVariable._cache_generation, value)
+        return value
+
+    def invalidate_cache(self):
+        """Invalidate the host-side value of this variable."""
+        self._self_cache = None
+
+    @staticmethod
+    def invalidate_all_caches():
+        """Invalidate the host-side values of all the scheduled variables."""
+        ScheduledVariable._cache_generation += 1
+
     def get(self):
         """Get the current value of the variable."""
-        return get_default_session_or_error().run(self._self_read_op)
+        session = get_default_session_or_error()
+        value = self.get_cached(session)
+        if value is None:
+            value = session.run(self._self_read_op)
+        return value
 
     def set(self, value):
         """
@@ -114,8 +203,44 @@ class ScheduledVariable(TensorWrapper):
         Returns:
             The new value assigned to the variable.
         """
-        return get_default_session_or_error().run(
-            self._self_assign_op, feed_dict={self._self_assign_ph: value})
+        session = get_default_session_or_error()
+        return self._update_cache(session, session.run(
+            self._self_assign_op, feed_dict={self._self_assign_ph: value}))
+
+    def schedule_by_global_step(self, schedule_fn, global_step, name=None):
+        """
+        Schedule the value as an in-graph function of the global step.
+
+        The returned operation assigns ``schedule_fn(global_step)`` to the
+        variable, and should be run along with the training operation,
+        e.g., ``train_op = tf.group(train_op, var.schedule_op)``.
+        The host-side value is disabled for this variable afterwards,
+        since the value is changed inside the graph.
+
+        Args:
+            schedule_fn ((tf.Tensor) -> tf.Tensor): The function, which
+                computes the value of the variable from the global step.
+            global_step (tf.Tensor or tf.Variable): The global step counter.
+            name (str): Default name of the name scope.
+                If not specified, generate one according to the method name.
+
+        Returns:
+            tf.Operation: The operation to assign the scheduled value.
+
+        Raises:
+            RuntimeError: If the value has already been scheduled.
+        """
+        if self._self_schedule_op is not None:
+            raise RuntimeError('The value of this variable has already been '
+                               'scheduled in the graph.')
+        with tf.name_scope(name, default_name='schedule_by_global_step',
+                           values=[global_step]):
+            global_step = tf.convert_to_tensor(global_step)
+            value = convert_to_tensor_and_cast(
+                schedule_fn(global_step), self._self_var.dtype.base_dtype)
+            self._self_schedule_op = tf.group(self._self_var.assign(value))
+        self.invalidate_cache()
+        return self._self_schedule_op
 
 
 class AnnealingVariable(ScheduledVariable):
@@ -125,7 +250,8 @@ class AnnealingVariable(ScheduledVariable):
     """
 
     def __init__(self, name, initial_value, ratio, min_value=None,
-                 dtype=tf.float32, model_var=False, collections=None):
+                 dtype=tf.float32, model_var=False, collections=None,
+                 host_cache=False):
         """
         Construct a new :class:`AnnealingVariable`.
 
@@ -140,13 +266,16 @@ class AnnealingVariable(ScheduledVariable):
             collections (Iterable[str]): Add the variable to these graph
                 collections, in addition to the `MODEL_VARIABLES` and
                 `GLOBAL_VARIABLES` collections.
+            host_cache (bool): Whether or not to keep the assigned value
+                in host memory?  (default :obj:`False`)
         """
         self._self_ratio = ratio
         self._self_min_value = min_value
 
         super(AnnealingVariable, self).__init__(
             name=name, initial_value=initial_value, dtype=dtype,
-            model_var=model_var, collections=collections
+            model_var=model_var, collections=collections,
+            host_cache=host_cache
         )
 
     def _init(self, name, initial_value, dtype, collections):
@@ -158,6 +287,7 @@ class AnnealingVariable(ScheduledVariable):
             min_value = convert_to_tensor_and_cast(min_value, dtype)
             initial_value = tf.maximum(initial_value, min_value)
         self._self_min_value = min_value
+        self._self_initial_value = initial_value
 
         super(AnnealingVariable, self)._init(
             name, initial_value, dtype, collections)
@@ -177,7 +307,45 @@ class AnnealingVariable(ScheduledVariable):
         Returns:
             The new value of the variable.
         """
-        return get_default_session_or_error().run(self._self_anneal_op)
+        session = get_default_session_or_error()
+        return self._update_cache(session, session.run(self._self_anneal_op))
+
+    def anneal_by_global_step(self, global_step, steps, name=None):
+        """
+        Schedule the annealing as an in-graph function of the global step.
+
+        The scheduled value is ``initial_value * ratio ** (global_step //
+        steps)``, clipped by `min_value`, which equals to calling
+        :meth:`anneal` once every `steps` steps, without host interaction.
+        See :meth:`schedule_by_global_step` for how to use the returned
+        operation.  Values assigned by :meth:`set` are overridden the next
+        time the operation runs.
+
+        Args:
+            global_step (tf.Tensor or tf.Variable): The global step counter.
+            steps (int): Number of steps between two annealing.
+            name (str): Default name of the name scope.
+                If not specified, generate one according to the method name.
+
+        Returns:
+            tf.Operation: The operation to assign the annealed value.
+        """
+        steps = int(steps)
+        if steps < 1:
+            raise ValueError('`steps` must be at least 1.')
+
+        def schedule_fn(step):
+            dtype = self._self_var.dtype.base_dtype
+            times = tf.cast(step // tf.cast(steps, step.dtype), dtype)
+            value = self._self_initial_value * self._self_ratio ** times
+            if self._self_min_value is not None:
+                value = tf.maximum(self._self_min_value, value)
+            return value
+
+        return self.schedule_by_global_step(
+            schedule_fn, global_step,
+            name=name or 'anneal_by_global_step'
+        )
 
 
 register_tensor_wrapper_class(ScheduledVariable)
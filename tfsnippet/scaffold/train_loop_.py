@@ -16,9 +16,13 @@ from tfsnippet.dataflows import DataFlow
 from tfsnippet.utils import (StatisticsCollector, DisposableContext,
                              humanize_duration, ETA, EventSource,
                              TemporaryDirectory)
+from .async_summary_writer import AsyncSummaryWriter
 from .checkpoint import CheckpointSavableObject, CheckpointSaver
+from .early_stopping import (EarlyStoppingSnapshot, HostMemorySnapshot,
+                             ShadowVariableSnapshot, CheckpointSnapshot)
 from .event_keys import EventKeys
 from .logging_ import summarize_variables, DefaultMetricFormatter, MetricLogger
+from .profiler import StepProfiler, DATA_WAIT, NULL_CONTEXT
 
 __all__ = ['TrainLoop']
 
@@ -107,12 +111,18 @@ class TrainLoop(DisposableContext):
             metrics_dict = merge(metrics_dict, kwargs)
             events.fire(EventKeys.METRICS_COLLECTED, self, metrics_dict)
 
+        # when a checkpoint has been saved (or failed to be saved in
+        # background) by :meth:`make_checkpoint`
+        events.fire(EventKeys.CHECKPOINT_SAVED, self, checkpoint_path)
+        events.fire(EventKeys.CHECKPOINT_FAILED, self, checkpoint_path, error)
+
         # when summaries are fed into the loop by :meth:`add_summary`
         def add_summary(self, summary):
             events.fire(EventKeys.SUMMARY_ADDED, self, summary)
 
         # when metric statistics have been printed as log
         def print_logs(self):
+            events.fire(EventKeys.BEFORE_PRINT_LOGS, self)
             ...
             events.fire(EventKeys.METRIC_STATS_PRINTED, self, metric_stats)
             events.fire(EventKeys.TIME_METRIC_STATS_PRINTED, self,
@@ -144,6 +154,7 @@ class TrainLoop(DisposableContext):
                  checkpoint_epoch_freq=None,
                  checkpoint_max_to_keep=None,
                  checkpoint_save_objects=None,
+                 checkpoint_async=False,
                  restore_checkpoint=True,
 
                  # summary related arguments
@@ -153,11 +164,17 @@ class TrainLoop(DisposableContext):
                  summary_metric_prefix='metrics/',
                  summary_skip_pattern=re.compile(r'.*(time|timer)$'),
                  summary_commit_freqs=None,
+                 summary_async=False,
 
                  # validation and early-stopping related arguments
                  valid_metric_name='valid_loss',
                  valid_metric_smaller_is_better=None,
-                 early_stopping=False):
+                 early_stopping=False,
+                 early_stopping_backend=None,
+
+                 # profiling related arguments
+                 profile=False,
+                 profile_json_file=None):
         """
         Construct the :class:`TrainLoop`.
 
@@ -192,6 +209,12 @@ class TrainLoop(DisposableContext):
                 versions to keep. If :obj:`None` or `0`, keep all versions.
             checkpoint_save_objects (dict[str, CheckpointSavableObject]): If
                 specified, will save and restore the states of these objects.
+            checkpoint_async (bool): Whether or not to write the checkpoint
+                files in a background thread?  If :obj:`True`, the training
+                will only be blocked by taking a snapshot of the variables,
+                and :obj:`EventKeys.CHECKPOINT_SAVED` (or
+                :obj:`EventKeys.CHECKPOINT_FAILED`) will be fired after the
+                files are written.  (default :obj:`False`)
             restore_checkpoint (bool or str): If :obj:`True`, will restore
                 the latest checkpoint.  If a str, it should be the path of
                 a checkpoint file, and will restore from this checkpoint.
@@ -212,6 +235,11 @@ class TrainLoop(DisposableContext):
             summary_commit_freqs (dict[str, int] or None): If specified,
                 a metric will be committed to `summary_writer` no more frequent
                 than ``summary_commit_freqs[metric]``. (default :obj:`None`)
+            summary_async (bool): Whether or not to write the metrics and
+                summaries in a background thread, via an
+                :class:`AsyncSummaryWriter` with the default options?
+                Specify an :class:`AsyncSummaryWriter` as `summary_writer`
+                for customized options.  (default :obj:`False`)
 
             valid_metric_name (str): Name of the validation metric.
             valid_metric_smaller_is_better (bool): Whether or not the smaller
@@ -226,6 +254,26 @@ class TrainLoop(DisposableContext):
                 The variables will only be restored if the training loop
                 is exited without any error or interruption, including
                 the Ctrl+C KeyboardInterrupt.
+            early_stopping_backend (str or None): Where to keep the best
+                parameters for early-stopping.  One of: "memory", keep
+                the values in host memory (:class:`HostMemorySnapshot`);
+                "variable", keep the values in shadow variables on the
+                same devices (:class:`ShadowVariableSnapshot`); "disk",
+                keep the values as checkpoint files, which is suitable for
+                very large models (:class:`CheckpointSnapshot`).
+                If not specified, use "disk" if `checkpoint_dir` is specified,
+                such that the early-stopping can be resumed along with the
+                training, otherwise use "memory".
+
+            profile (bool or StepProfiler): Whether or not to profile the
+                time spent in different sections of the steps (see
+                :class:`StepProfiler`)?  If :obj:`True`, the percentiles of
+                the durations will be printed by :meth:`print_logs`.
+                A :class:`StepProfiler` can also be specified, so as to
+                customize the percentiles.  (default :obj:`False`)
+            profile_json_file (str or None): If specified, the statistics of
+                the profiler will also be appended to this file, one JSON
+                object per call to :meth:`print_logs`.
         """
         # regularize the parameters
         if not isinstance(param_vars, (dict, OrderedDict)):
@@ -251,6 +299,12 @@ class TrainLoop(DisposableContext):
                     'a file path is specified for `restore_checkpoint`.'
                 )
             restore_checkpoint = os.path.abspath(restore_checkpoint)
+        if early_stopping_backend is None:
+            early_stopping_backend = \
+                'disk' if checkpoint_dir is not None else 'memory'
+        if early_stopping_backend not in ('memory', 'variable', 'disk'):
+            raise ValueError('Unsupported `early_stopping_backend`: {!r}'.
+                             format(early_stopping_backend))
         save_objects = dict(checkpoint_save_objects or ())
         for key in (TRAIN_LOOP_STATES_CKPT_NAME,
                     EARLY_STOPPING_STATES_CKPT_NAME):
@@ -290,11 +344,29 @@ class TrainLoop(DisposableContext):
         self._summary_skip_pattern = summary_skip_pattern
         self._summary_commit_freqs = dict(summary_commit_freqs or ())
         self._own_summary_writer = own_summary_writer
+        self._summary_async = summary_async
+        self._async_summary_writer = None  # type: AsyncSummaryWriter
 
         self._use_early_stopping = early_stopping
         self._valid_metric_name = valid_metric_name
         self._valid_metric_smaller_is_better = smaller_is_better
 
+        # the step profiler
+        if profile is True:
+            profile = StepProfiler()
+        elif profile is False:
+            profile = None
+        elif profile is not None and not isinstance(profile, StepProfiler):
+            raise TypeError('`profile` must be a bool or a StepProfiler: '
+                            'got {!r}'.format(profile))
+        if profile_json_file is not None:
+            if profile is None:
+                raise ValueError('`profile_json_file` is specified, but '
+                                 '`profile` is not enabled.')
+            profile_json_file = os.path.abspath(profile_json_file)
+        self._profiler = profile  # type: StepProfiler
+        self._profile_json_file = profile_json_file
+
         # the event source
         self._events = EventSource([
             EventKeys.ENTER_LOOP,
@@ -305,10 +377,15 @@ class TrainLoop(DisposableContext):
             EventKeys.AFTER_STEP,
             EventKeys.METRICS_COLLECTED,
             EventKeys.TIME_METRICS_COLLECTED,
+            EventKeys.BEFORE_PRINT_LOGS,
             EventKeys.METRIC_STATS_PRINTED,
             EventKeys.TIME_METRIC_STATS_PRINTED,
             EventKeys.SUMMARY_ADDED,
+            EventKeys.CHECKPOINT_SAVED,
+            EventKeys.CHECKPOINT_FAILED,
         ])
+        if self._profiler is not None:
+            self._events.set_handler_timer(self._profiler.record_handler)
 
         # the restorable train loop states
         self._states = TrainLoopStates()
@@ -330,22 +407,29 @@ class TrainLoop(DisposableContext):
                 objects=save_objects,
                 save_dir=os.path.join(checkpoint_dir, 'checkpoint'),
                 max_to_keep=checkpoint_max_to_keep,
-                save_meta=False
+                save_meta=False,
+                async_save=checkpoint_async
             )
 
-        # the checkpoint saver for early stopping
-        # if checkpoint_dir is None, we postpone the initialization until
-        # enter the loop.
-        self._early_stopping_saver = None
+        # the snapshot of the best parameters for early stopping
+        # if checkpoint_dir is None, we postpone the initialization of the
+        # disk backend until enter the loop.
+        self._early_stopping_backend = early_stopping_backend
+        self._early_stopping_snapshot = None  # type: EarlyStoppingSnapshot
         self._early_stopping_temp_dir = None  # type: TemporaryDirectory
 
-        if checkpoint_dir is not None and self._use_early_stopping:
-            self._early_stopping_saver = CheckpointSaver(
-                self._param_vars,
-                save_dir=os.path.join(checkpoint_dir, 'early_stopping'),
-                max_to_keep=2,
-                save_meta=False
-            )
+        if self._use_early_stopping:
+            if early_stopping_backend == 'memory':
+                self._early_stopping_snapshot = \
+                    HostMemorySnapshot(self._param_vars)
+            elif early_stopping_backend == 'variable':
+                self._early_stopping_snapshot = \
+                    ShadowVariableSnapshot(self._param_vars)
+            elif checkpoint_dir is not None:
+                self._early_stopping_snapshot = CheckpointSnapshot(
+                    self._param_vars,
+                    save_dir=os.path.join(checkpoint_dir, 'early_stopping')
+                )
 
         # euphemeral train loop states
         self._eta = None
@@ -357,6 +441,7 @@ class TrainLoop(DisposableContext):
         self._is_best_valid_metric = False
         self._epoch_start_time = None
         self._step_start_time = None
+        self._steps_in_run = 1  # number of steps in the current run
 
         # the active data flow of current epoch
         self._data_flow = None  # type: DataFlow
@@ -367,28 +452,28 @@ class TrainLoop(DisposableContext):
         if self._summary_dir is not None:
             self._summary_writer = tf.summary.FileWriter(
                 self._summary_dir, graph=self._summary_graph)
+        if self._summary_async and self._summary_writer is not None and \
+                not isinstance(self._summary_writer, AsyncSummaryWriter):
+            self._async_summary_writer = \
+                AsyncSummaryWriter(self._summary_writer)
 
         # create the metric accumulators
         self._step_metrics = MetricLogger(formatter=self._metric_formatter)
         self._epoch_metrics = MetricLogger(
-            summary_writer=self._summary_writer,
+            summary_writer=self.summary_writer,
             summary_metric_prefix=self._summary_metric_prefix,
             summary_skip_pattern=self._summary_skip_pattern,
             summary_commit_freqs=self._summary_commit_freqs,
             formatter=self._metric_formatter
         )
 
-        # create the early-stopping saver if required
+        # create the early-stopping disk backend if required
         if self._use_early_stopping:
-            if self._early_stopping_saver is None:
+            if self._early_stopping_snapshot is None:
                 self._early_stopping_temp_dir = TemporaryDirectory()
                 dir_path = self._early_stopping_temp_dir.__enter__()
-                self._early_stopping_saver = CheckpointSaver(
-                    self._param_vars,
-                    save_dir=dir_path,
-                    max_to_keep=2,
-                    save_meta=False,
-                )
+                self._early_stopping_snapshot = CheckpointSnapshot(
+                    self._param_vars, save_dir=dir_path)
 
         # restore the checkpoint
         if self._checkpoint_saver is not None:
@@ -418,16 +503,25 @@ class TrainLoop(DisposableContext):
 
     def _exit(self, exc_type, exc_val, exc_tb):
         try:
+            # wait for the background checkpoint to be saved
+            if self._checkpoint_saver is not None:
+                self._report_checkpoints(wait=True)
+
             # close the summary writer
+            if self._async_summary_writer is not None:
+                try:
+                    self._async_summary_writer.close()
+                finally:
+                    self._async_summary_writer = None
             if self._own_summary_writer:
                 self._summary_writer.close()
                 self._summary_writer = None
                 self._own_summary_writer = False
 
             # restore the early-stopping variables if no error
-            if self._early_stopping_saver is not None:
+            if self._early_stopping_snapshot is not None:
                 if exc_type is None:
-                    es_latest = self._early_stopping_saver.latest_checkpoint()
+                    es_latest = self._early_stopping_snapshot.latest_snapshot()
                     if es_latest is None:  # pragma: no cover
                         warnings.warn(
                             'Early-stopping has never been triggered! '
@@ -435,10 +529,11 @@ class TrainLoop(DisposableContext):
                             'Did you forget to add corresponding metric?'
                         )
                     else:
-                        self._early_stopping_saver.restore(es_latest)
+                        self._early_stopping_snapshot.restore_latest()
                         self.println('Restore early-stopping parameters: '
-                                     'from checkpoint {}'.format(es_latest))
-                    self._early_stopping_saver = None
+                                     'from {}'.format(es_latest))
+                    self._early_stopping_snapshot.close()
+                    self._early_stopping_snapshot = None
                 else:  # pragma: no cover
                     warnings.warn(
                         'Early-stopping variables are not restored, because '
@@ -473,7 +568,8 @@ class TrainLoop(DisposableContext):
 
     def _commit_step_stop_time(self):
         if self._step_start_time is not None:
-            duration = time.time() - self._step_start_time
+            duration = (time.time() - self._step_start_time) / \
+                self._steps_in_run
             self.collect_metrics(metrics={STEP_TIME_METRIC: duration})
             self._step_start_time = None
 
@@ -531,9 +627,53 @@ class TrainLoop(DisposableContext):
     def max_step(self, value):
         self._max_step = int(value)
 
+    @property
+    def profiler(self):
+        """
+        Get the step profiler.
+
+        Returns:
+            StepProfiler or None: The step profiler, or :obj:`None` if
+                profiling is not enabled.
+        """
+        return self._profiler
+
+    def profile(self, section):
+        """
+        Open a context for timing a section of the step, if profiling is
+        enabled.  The durations are reported by :meth:`print_logs`.
+
+        Args:
+            section (str): Name of the section.
+
+        Returns:
+            A context manager.
+        """
+        if self._profiler is None:
+            return NULL_CONTEXT
+        return self._profiler.timeit(section)
+
+    @property
+    def summary_dir(self):
+        """
+        Get the directory for writing TensorFlow summaries.
+
+        Returns:
+            str or None: The summary directory, or :obj:`None` if
+                `summary_dir` is not specified.
+        """
+        return self._summary_dir
+
     @property
     def summary_writer(self):
-        """Get the summary writer instance."""
+        """
+        Get the summary writer instance.
+
+        This is the :class:`AsyncSummaryWriter` wrapping the summary writer
+        within the loop context, if `summary_async` is :obj:`True`.
+        """
+        if self._async_summary_writer is not None:
+            return self._async_summary_writer
         return self._summary_writer
 
     @property
@@ -561,6 +701,15 @@ class TrainLoop(DisposableContext):
         """Get the data of current step."""
         return self._step_data
 
+    @property
+    def steps_in_run(self):
+        """
+        Get the number of steps in the current run.
+
+        This is always 1, unless iterating through :meth:`iter_multi_steps`.
+        """
+        return self._steps_in_run
+
     @property
     def use_early_stopping(self):
         """Whether or not to adopt early-stopping?"""
@@ -607,7 +756,26 @@ class TrainLoop(DisposableContext):
         """
         if not self._checkpoint_saver:
             raise RuntimeError('Checkpoint directory is not configured.')
-        self._checkpoint_saver.save(self._states.step)
+        if self._checkpoint_saver.async_save:
+            # only one background save is in flight, thus wait for the
+            # previous one and report it
+            self._report_checkpoints(wait=True)
+            self._checkpoint_saver.save(self._states.step)
+        else:
+            checkpoint_path = self._checkpoint_saver.save(self._states.step)
+            self.events.fire(EventKeys.CHECKPOINT_SAVED, self,
+                             checkpoint_path)
+
+    def _report_checkpoints(self, wait=False):
+        if self._checkpoint_saver.async_save:
+            results = self._checkpoint_saver.collect_async_results(wait=wait)
+            for checkpoint_path, error in results:
+                if error is None:
+                    self.events.fire(EventKeys.CHECKPOINT_SAVED, self,
+                                     checkpoint_path)
+                else:
+                    self.events.fire(EventKeys.CHECKPOINT_FAILED, self,
+                                     checkpoint_path, error)
 
     def iter_epochs(self):
         """
@@ -648,6 +816,8 @@ class TrainLoop(DisposableContext):
                 if self._checkpoint_epoch_freq is not None and \
                         self.epoch % self._checkpoint_epoch_freq == 0:
                     self.make_checkpoint()
+                elif self._checkpoint_saver is not None:
+                    self._report_checkpoints()
         finally:
             self._within_epoch = False
             self._epoch_start_time = None
@@ -672,6 +842,43 @@ class TrainLoop(DisposableContext):
                 the tuple of ``(step counter, batch data)`` if `data_generator`
                 is specified.
         """
+        return self._iter_steps(data_generator, steps_per_run=None)
+
+    def iter_multi_steps(self, steps_per_run, data_generator=None):
+        """
+        Iterate through the steps, at most `steps_per_run` steps at a time.
+
+        This is useful for running multiple training steps within one
+        ``session.run``.  The step counter is advanced in bulk by the number
+        of steps of each run, and the step events of this loop, as well as
+        the step time metric (averaged among the steps), are fired and
+        collected once per run.  The number of steps of a run might be
+        less than `steps_per_run`, at the end of an epoch (when
+        `data_generator` is exhausted) or when `max_step` is reached.
+
+        This method can only be called when there's no other step loop
+        is being iterated, and an epoch loop is active.
+
+        Args:
+            steps_per_run (int): Maximum number of steps to run at a time.
+            data_generator: Optional iterable data, whose mini-batches are
+                grouped and yielded at every run.  This is required if
+                `max_step` is not configured, so as to prevent an infinite
+                step loop.
+
+        Yields:
+            (int, int) or (int, list): The tuple of ``(step counter,
+                number of steps)`` of each run, where the step counter is
+                the counter of the last step in this run, or the tuple of
+                ``(step counter, list of batch data)`` if `data_generator`
+                is specified.
+        """
+        steps_per_run = int(steps_per_run)
+        if steps_per_run < 1:
+            raise ValueError('`steps_per_run` must be at least 1.')
+        return self._iter_steps(data_generator, steps_per_run=steps_per_run)
+
+    def _iter_steps(self, data_generator, steps_per_run):
         def loop_condition():
             return self._max_step is None or self.step < self._max_step
 
@@ -701,22 +908,51 @@ class TrainLoop(DisposableContext):
                     data_flow = DataFlow.iterator_factory(iter_factory)
                 self._data_flow = data_flow
 
-            while loop_condition():
+            exhausted = False
+            while not exhausted and loop_condition():
+                # determine the number of steps to run
+                if steps_per_run is None:
+                    run_steps = 1
+                elif self._max_step is None:
+                    run_steps = steps_per_run
+                else:
+                    run_steps = min(steps_per_run, self._max_step - self.step)
+
                 # prepare for the step data
                 if self._data_flow is None:
-                    yield_obj = self.step + 1
                     step_data = None
                 else:
+                    step_data = []
+                    data_start_time = time.time()
                     try:
-                        step_data = self._data_flow.next_batch()
+                        while len(step_data) < run_steps:
+                            step_data.append(self._data_flow.next_batch())
                     except StopIteration:
-                        break
-                    yield_obj = self.step + 1, step_data
+                        # the data flow should not be iterated again,
+                        # otherwise a new epoch would be opened
+                        exhausted = True
+                        if not step_data:
+                            break
+                    finally:
+                        if self._profiler is not None:
+                            self._profiler.record(
+                                DATA_WAIT, time.time() - data_start_time)
+                    run_steps = len(step_data)
+                    if steps_per_run is None:
+                        step_data = step_data[0]
+
+                if step_data is not None:
+                    yield_obj = self.step + run_steps, step_data
+                elif steps_per_run is None:
+                    yield_obj = self.step + 1
+                else:
+                    yield_obj = self.step + run_steps, run_steps
 
                 # yield this step
-                self._states.step += 1
+                self._states.step += run_steps
                 self._within_step = True
                 self._step_data = step_data
+                self._steps_in_run = run_steps
                 self._step_start_time = time.time()
 
                 self.events.fire(EventKeys.BEFORE_STEP, self)
@@ -728,11 +964,14 @@ class TrainLoop(DisposableContext):
                 self.events.reverse_fire(EventKeys.AFTER_STEP, self)
 
                 self._commit_step_stop_time()
+                if self._checkpoint_saver is not None:
+                    self._report_checkpoints()
         finally:
             self._within_step = False
             self._step_start_time = None
             self._data_flow = None
             self._step_data = None
+            self._steps_in_run = 1
 
     def _require_context(self):
         self._require_entered()
@@ -778,37 +1017,47 @@ class TrainLoop(DisposableContext):
         if acc.has_value:
             self.collect_metrics(metrics={metric_name: acc.mean})
 
-    def _collect_metrics(self, metrics, event_key):
+    def _update_valid_metric(self, metrics, global_step, param_values):
+        v = metrics.get(self.valid_metric_name)
+        if v is not None:
+            if self.best_valid_metric is None or \
+                    (self._valid_metric_smaller_is_better and
+                     v < self.best_valid_metric) or \
+                    (not self._valid_metric_smaller_is_better and
+                     v > self.best_valid_metric):
+                # we've met a new best metric
+                self._states.best_valid_metric = v
+                self._is_best_valid_metric = True
+
+                # early-stopping save variables
+                if self._early_stopping_snapshot is not None:
+                    if param_values is None:
+                        self._early_stopping_snapshot.save(
+                            global_step=global_step)
+                    else:
+                        self._early_stopping_snapshot.save_values(
+                            param_values, global_step=global_step)
+            else:
+                self._is_best_valid_metric = False
+
+    def _collect_metrics(self, metrics, event_key, global_step=None,
+                         param_values=None, weight=1.):
         self._require_context()
+        if global_step is None:
+            global_step = self.step
 
         # update the metrics
-        self._epoch_metrics.collect_metrics(metrics, global_step=self.step)
+        self._epoch_metrics.collect_metrics(
+            metrics, global_step=global_step, weight=weight)
         if self._within_step:
-            self._step_metrics.collect_metrics(metrics, global_step=self.step)
+            self._step_metrics.collect_metrics(
+                metrics, global_step=global_step, weight=weight)
         self.events.fire(event_key, self, metrics)
 
         # update the validation metric
-        def update_valid_metric(d):
-            v = d.get(self.valid_metric_name)
-            if v is not None:
-                if self.best_valid_metric is None or \
-                        (self._valid_metric_smaller_is_better and
-                         v < self.best_valid_metric) or \
-                        (not self._valid_metric_smaller_is_better and
-                         v > self.best_valid_metric):
-                    # we've met a new best metric
-                    self._states.best_valid_metric = v
-                    self._is_best_valid_metric = True
-
-                    # early-stopping save variables
-                    if self._early_stopping_saver is not None:
-                        self._early_stopping_saver.save(global_step=self.step)
-                else:
-                    self._is_best_valid_metric = False
-
         if self.valid_metric_name:
             if metrics:
-                update_valid_metric(metrics)
+                self._update_valid_metric(metrics, global_step, param_values)
 
     def collect_metrics(self, metrics=None, **kwargs):
         """
@@ -836,6 +1085,74 @@ class TrainLoop(DisposableContext):
         metrics.update(kwargs)
         self._collect_metrics(metrics, EventKeys.METRICS_COLLECTED)
 
+    def collect_weighted_metrics(self, metrics, weight):
+        """
+        Add metric values, which are averaged over `weight` samples.
+
+        This method is the same as :meth:`collect_metrics`, except that the
+        metric values are weighted by `weight` when merged into the epoch
+        and step statistics.  It is used to deliver the metrics averaged over
+        several mini-batches, e.g., by :class:`~tfsnippet.trainer.Trainer`
+        and :class:`~tfsnippet.trainer.Evaluator` with streaming metrics,
+        such that these averages are merged as if the metrics of every
+        mini-batch were collected.
+
+        Args:
+            metrics (dict[str, float or np.ndarray]): Metric values as dict.
+            weight (float): The weight of the metric values, e.g., the number
+                of mini-batches or samples they are averaged over.
+        """
+        self._collect_metrics(dict(metrics), EventKeys.METRICS_COLLECTED,
+                              weight=weight)
+
+    def collect_evaluated_metrics(self, metrics, step, param_values=None):
+        """
+        Add metric values, computed on the parameters taken at `step`.
+
+        This method is used to deliver the results of evaluations running
+        in background, e.g., by :class:`~tfsnippet.trainer.AsyncEvaluator`,
+        which may finish several steps after the parameters were taken.
+        The metrics are written to summaries with `step` as the global step,
+        and if a new best validation metric is met, early-stopping saves
+        `param_values` instead of the current values of the parameters.
+
+        If there is no active epoch or step loop (e.g., the evaluation of
+        the last epoch finishes after the epoch loop), the metrics are
+        printed immediately.
+
+        Args:
+            metrics (dict[str, float or np.ndarray]): Metric values as dict.
+            step (int): The step counter when the parameters were taken.
+            param_values (dict[tf.Variable, np.ndarray]): The values of the
+                parameters taken at `step`, covering all the variables of
+                early-stopping.  If not specified, early-stopping saves the
+                current values of the parameters.
+        """
+        self._require_entered()
+        metrics = dict(metrics)
+        if self._within_step or self._within_epoch:
+            self._collect_metrics(
+                metrics, EventKeys.METRICS_COLLECTED, global_step=step,
+                param_values=param_values
+            )
+        else:
+            logger = MetricLogger(
+                summary_writer=self.summary_writer,
+                summary_metric_prefix=self._summary_metric_prefix,
+                summary_skip_pattern=self._summary_skip_pattern,
+                formatter=self._metric_formatter
+            )
+            logger.collect_metrics(metrics, global_step=step)
+            self.events.fire(EventKeys.METRICS_COLLECTED, self, metrics)
+            best_mark = ''
+            if self.valid_metric_name and metrics:
+                self._update_valid_metric(metrics, step, param_values)
+                if self._is_best_valid_metric:
+                    best_mark = ' (*)'
+                self._is_best_valid_metric = False
+            self.println('[Step {}] {}{}'.format(
+                step, logger.format_logs(), best_mark))
+
     def add_summary(self, summary):
         """
         Add a summary object, with ``self.step`` as `global_step`.
@@ -845,7 +1162,7 @@ class TrainLoop(DisposableContext):
                 or serialized summary.
         """
         self._require_entered()
-        self._summary_writer.add_summary(summary, global_step=self.step)
+        self.summary_writer.add_summary(summary, global_step=self.step)
         self.events.fire(EventKeys.SUMMARY_ADDED, self, summary)
 
     def get_eta(self):
@@ -923,6 +1240,9 @@ class TrainLoop(DisposableContext):
         immediately when this method is called, before printing the logs.
         """
         self._require_entered()
+        if self._within_step or self._within_epoch:
+            self.events.fire(EventKeys.BEFORE_PRINT_LOGS, self)
+
         metrics = None
         if self._within_step:
             self._commit_step_stop_time()
@@ -955,3 +1275,15 @@ class TrainLoop(DisposableContext):
                 EventKeys.TIME_METRIC_STATS_PRINTED, self, time_metric_stats)
 
         metrics.clear()
+
+        # report the profiling statistics
+        if self._profiler is not None and self._profiler.has_records:
+            stats = self._profiler.get_stats()
+            self._profiler.clear()
+            for line in self._profiler.format_stats(stats):
+                self.println('Profile: ' + line, with_tag=True)
+            if self._profile_json_file is not None:
+                self._profiler.dump_json(
+                    self._profile_json_file, stats, epoch=self.epoch,
+                    step=self.step
+                )
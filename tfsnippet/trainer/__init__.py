@@ -1,13 +1,20 @@
+from .async_evaluator import *
 from .base_trainer import *
+from .data_parallel import *
 from .dynamic_values import *
 from .evaluator import *
 from .feed_dict import *
+from .gradient_accumulator import *
 from .loss_trainer import *
+from .multi_step import *
+from .streaming_metrics import *
 from .trainer import *
 from .validator import *
 
 __all__ = [
-    'AnnealingScalar', 'BaseTrainer', 'DynamicValue', 'Evaluator',
-    'LossTrainer', 'Trainer', 'Validator', 'auto_batch_weight',
-    'merge_feed_dict', 'resolve_feed_dict',
+    'AnnealingScalar', 'AsyncEvaluator', 'BaseTrainer', 'DataParallel',
+    'DynamicValue', 'Evaluator', 'FeedDictPlan', 'GradientAccumulator',
+    'LossTrainer', 'StreamingMetrics', 'Trainer', 'Validator',
+    'auto_batch_weight', 'average_gradients', 'detect_gpus',
+    'merge_feed_dict', 'multi_step_train_op', 'resolve_feed_dict',
 ]
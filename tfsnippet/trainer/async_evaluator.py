@@ -0,0 +1,362 @@
+import time
+from logging import getLogger
+from threading import Thread
+
+import numpy as np
+import six
+import tensorflow as tf
+
+from tfsnippet.scaffold import EventKeys
+from tfsnippet.utils import get_default_session_or_error
+from .evaluator import Evaluator, auto_batch_weight
+from .feed_dict import FeedDictPlan
+
+if six.PY2:
+    from Queue import Queue, Empty
+else:
+    from queue import Queue, Empty
+
+__all__ = ['AsyncEvaluator']
+
+
+class _EvaluationClone(object):
+    """
+    A copy of the graph, where the evaluations run on the parameter
+    snapshots loaded by placeholders.
+    """
+
+    def __init__(self, graph, variables, metrics, inputs, clear_devices):
+        meta_graph = tf.train.export_meta_graph(graph=graph)
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            tf.train.import_meta_graph(meta_graph,
+                                       clear_devices=clear_devices)
+
+            clone_vars = {
+                v.name: v for v in
+                tf.global_variables() + tf.local_variables()
+            }
+            self.variables = list(variables)
+            self.placeholders = []
+            assign_ops = []
+            for v in self.variables:
+                if v.name not in clone_vars:  # pragma: no cover
+                    raise ValueError('Variable {!r} cannot be found in the '
+                                     'copy of the graph.'.format(v))
+                clone_var = clone_vars.pop(v.name)
+                ph = tf.placeholder(dtype=v.dtype.base_dtype,
+                                    shape=v.get_shape())
+                self.placeholders.append(ph)
+                assign_ops.append(tf.assign(clone_var, ph))
+            self.load_op = tf.group(*assign_ops)
+            self.init_op = tf.variables_initializer(
+                list(six.itervalues(clone_vars)))
+
+        self.metrics = [self.get_tensor(t) for t in metrics]
+        self.inputs = [self.get_tensor(t) for t in inputs]
+
+    def get_tensor(self, tensor):
+        return self.graph.get_tensor_by_name(getattr(tensor, 'name', tensor))
+
+
+class AsyncEvaluator(Evaluator):
+    """
+    Class to compute evaluation metrics in background.
+
+    :meth:`run` takes a snapshot of the parameters by one ``session.run``,
+    and returns immediately, while the metrics are computed on the snapshot
+    in a background thread, with a copy of the graph and a separated
+    session, such that the training can continue during the evaluation.
+    This is useful when the evaluation takes a long time, e.g., computing
+    the test NLL with many samples.
+
+    The metrics are delivered to the training loop by
+    :meth:`TrainLoop.collect_evaluated_metrics`, tagged with the step when
+    the snapshot was taken, after each step and epoch of the loop.  The
+    results are delivered in the order of :meth:`run`, and the
+    early-stopping saves the snapshot rather than the current parameters,
+    if a new best validation metric is met.  The results not delivered
+    after the epoch loop are delivered by :meth:`collect_results`, which
+    is called at the end of :meth:`BaseTrainer.run`.
+
+    The event schedule of an :class:`AsyncEvaluator` can be briefly
+    described as follows::
+
+        events.fire(EventKeys.BEFORE_EXECUTION, self)  # in `run()`
+
+        ...  # run the evaluation in background
+
+        # in `collect_results()`
+        events.reverse_fire(EventKeys.AFTER_EXECUTION, self)
+
+    Streaming metrics are not supported.  The fixed feed dict is resolved
+    at :meth:`run`, but the `data_flow` is iterated in the background
+    thread, thus it must not be used elsewhere during the evaluation.
+    """
+
+    def __init__(self, loop, metrics, inputs, data_flow, feed_dict=None,
+                 time_metric_name='eval_time',
+                 batch_weight_func=auto_batch_weight,
+                 variables=None, max_pending=1, clear_devices=False,
+                 session_config=None):
+        """
+        Construct a new :class:`AsyncEvaluator`.
+
+        Args:
+            loop (TrainLoop): The training loop object.
+            metrics (Tensor or dict[str, Tensor]): The metric tensors.
+            inputs (list[tf.Tensor]): The input placeholders.
+            data_flow (DataFlow): The evaluation data flow.
+            feed_dict (dict[tf.Tensor, any]): The fixed feed dict for
+                evaluation.  (default :obj:`None`)
+            time_metric_name (None or str): The metric name for collecting
+                the time usage of the background evaluation.  Specify
+                :obj:`None` to suppress the time usage metric.
+                (default "eval_time")
+            batch_weight_func ((\\*arrays) -> float or None): The function
+                to compute the metric weight of each mini-batch.
+            variables (list[tf.Variable]): The variables to take snapshot
+                of.  If not specified, use the model variables at the first
+                call to :meth:`run`, i.e., the trainable variables, the
+                variables in ``tf.GraphKeys.MODEL_VARIABLES``, and the
+                `param_vars` of `loop`.  The other variables (e.g., the
+                slot variables of the optimizer) are not copied at each
+                :meth:`run`, but kept at their initial values in the copy
+                of the graph.
+            max_pending (int): Maximum number of evaluations that have not
+                been delivered.  :meth:`run` waits for the earliest one
+                to be delivered if exceeded.  (default 1)
+            clear_devices (bool): Whether or not to clear the devices of
+                the copy of the graph?  (default :obj:`False`)
+            session_config (tf.ConfigProto): The config of the session
+                running the copy of the graph, e.g., to run the evaluation
+                on another device.
+        """
+        super(AsyncEvaluator, self).__init__(
+            loop=loop, metrics=metrics, inputs=inputs, data_flow=data_flow,
+            feed_dict=feed_dict, time_metric_name=time_metric_name,
+            batch_weight_func=batch_weight_func
+        )
+        max_pending = int(max_pending)
+        if max_pending < 1:
+            raise ValueError('`max_pending` must be at least 1.')
+        if variables is not None:
+            variables = list(variables)
+
+        self._variables = variables
+        self._max_pending = max_pending
+        self._clear_devices = clear_devices
+        self._session_config = session_config
+
+        # states of the background evaluation
+        self._clone = None  # type: _EvaluationClone
+        self._worker = None  # type: Thread
+        self._jobs = None  # type: Queue
+        self._results = None  # type: Queue
+        self._pending_count = 0
+
+        # deliver the results after each step and epoch
+        loop.events.on(EventKeys.AFTER_STEP, self._on_loop_event)
+        loop.events.on(EventKeys.AFTER_EPOCH, self._on_loop_event)
+
+    @property
+    def max_pending(self):
+        """Get the maximum number of evaluations not delivered."""
+        return self._max_pending
+
+    @property
+    def pending_count(self):
+        """Get the number of evaluations that have not been delivered."""
+        return self._pending_count
+
+    def _on_loop_event(self, loop):
+        self.collect_results()
+
+    def _evaluate(self, session, feed_dict):
+        clone = self._clone
+        metric_values = []
+        metric_weights = []
+
+        for batch_data in self.data_flow:
+            batch_feed_dict = dict(feed_dict)
+            batch_feed_dict.update(zip(clone.inputs, batch_data))
+            if self._batch_weight_func is not None:
+                batch_weight = self._batch_weight_func(*batch_data)
+            else:
+                batch_weight = 1.
+            metric_weights.append(batch_weight)
+            metric_values.append(np.asarray(
+                session.run(clone.metrics, feed_dict=batch_feed_dict)))
+
+        metrics_dict = {}
+        if metric_values:
+            metric_values = np.average(
+                np.stack(metric_values, axis=0),
+                axis=0,
+                weights=np.asarray(metric_weights),
+            )
+            metrics_dict = {
+                k: v for k, v in zip(self.metrics, metric_values)}
+        return metrics_dict
+
+    def _worker_func(self, jobs, results):
+        clone = self._clone
+        session = tf.Session(graph=clone.graph, config=self._session_config)
+        try:
+            session.run(clone.init_op)
+            while True:
+                job = jobs.get()
+                if job is None:
+                    break
+                step, param_values, feed_dict = job
+                try:
+                    start_time = time.time()
+                    session.run(clone.load_op, feed_dict={
+                        ph: param_values[v]
+                        for v, ph in zip(clone.variables, clone.placeholders)
+                    })
+                    metrics_dict = self._evaluate(session, feed_dict)
+                    if metrics_dict and self.time_metric_name is not None:
+                        metrics_dict[self.time_metric_name] = \
+                            time.time() - start_time
+                    results.put((step, metrics_dict, param_values, None))
+                except Exception as ex:
+                    getLogger(__name__).warning(
+                        'Background evaluation at step %s failed.', step,
+                        exc_info=True
+                    )
+                    results.put((step, None, None, ex))
+        finally:
+            session.close()
+
+    def _model_variables(self, graph):
+        param_vars = self.loop.param_vars
+        if isinstance(param_vars, dict):
+            param_vars = list(six.itervalues(param_vars))
+        variables = []
+        seen = set()
+        for v in (graph.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES) +
+                  graph.get_collection(tf.GraphKeys.MODEL_VARIABLES) +
+                  list(param_vars or ())):
+            if v not in seen:
+                seen.add(v)
+                variables.append(v)
+        return variables
+
+    def _start_worker(self):
+        if self._clone is None:
+            graph = tf.get_default_graph()
+            variables = self._variables
+            if variables is None:
+                variables = self._model_variables(graph)
+            self._clone = _EvaluationClone(
+                graph=graph,
+                variables=variables,
+                metrics=list(six.itervalues(self.metrics)),
+                inputs=self.inputs,
+                clear_devices=self._clear_devices
+            )
+        self._jobs = Queue()
+        self._results = Queue()
+        self._worker = Thread(target=self._worker_func,
+                              args=(self._jobs, self._results))
+        self._worker.daemon = True
+        self._worker.start()
+
+    def _next_result(self, wait):
+        # the worker may exit because of error at any time, thus never wait
+        # for it without checking whether or not it is still alive
+        while True:
+            try:
+                return self._results.get(timeout=.1 if wait else None,
+                                         block=wait)
+            except Empty:
+                if not wait:
+                    return None
+                if not self._worker.is_alive():
+                    raise RuntimeError('The background evaluation thread '
+                                       'has exited unexpectedly.')
+
+    def collect_results(self, wait=False, max_count=None):
+        """
+        Deliver the finished evaluations to the training loop.
+
+        Args:
+            wait (bool): Whether or not to wait for the pending evaluations
+                to finish?  (default :obj:`False`)
+            max_count (int): Deliver at most this number of evaluations.
+                If not specified, deliver all the finished ones.
+
+        Raises:
+            RuntimeError: If any of the delivered evaluations has failed.
+        """
+        count = 0
+        while self._pending_count > 0 and \
+                (max_count is None or count < max_count):
+            result = self._next_result(wait)
+            if result is None:
+                break
+            self._pending_count -= 1
+            count += 1
+
+            step, metrics_dict, param_values, error = result
+            if error is not None:
+                raise RuntimeError('Background evaluation at step {} failed: '
+                                   '{}'.format(step, error))
+            if metrics_dict:
+                self._last_metrics_dict = metrics_dict
+                self.loop.collect_evaluated_metrics(
+                    metrics_dict, step=step, param_values=param_values)
+            self.events.reverse_fire(EventKeys.AFTER_EXECUTION, self)
+
+    def run(self, feed_dict=None):
+        """
+        Start an evaluation in background.
+
+        Args:
+            feed_dict: The extra feed dict to be merged with the already
+                configured dict.  (default :obj:`None`)
+        """
+        session = get_default_session_or_error()
+
+        # wait for the earliest evaluation if too many are pending
+        if self._pending_count >= self._max_pending:
+            self.collect_results(
+                wait=True,
+                max_count=self._pending_count - self._max_pending + 1
+            )
+
+        self.events.fire(EventKeys.BEFORE_EXECUTION, self)
+        if self._worker is None:
+            self._start_worker()
+        clone = self._clone
+
+        # resolve the fixed feed dict, and take the snapshot of parameters
+        fixed_feed_dict = {
+            clone.get_tensor(k): v
+            for k, v in six.iteritems(
+                FeedDictPlan(self.feed_dict, feed_dict).resolve(
+                    session=session))
+        }
+        param_values = dict(zip(clone.variables,
+                                session.run(clone.variables)))
+
+        self._jobs.put((self.loop.step, param_values, fixed_feed_dict))
+        self._pending_count += 1
+
+    def close(self):
+        """
+        Stop the background thread.
+
+        The evaluations that have not been delivered are discarded.
+        The background thread will be restarted by the next :meth:`run`.
+        """
+        if self._worker is not None:
+            try:
+                self._jobs.put(None)
+                self._worker.join()
+            finally:
+                self._worker = None
+                self._jobs = None
+                self._results = None
+                self._pending_count = 0
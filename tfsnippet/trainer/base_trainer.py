@@ -1,8 +1,14 @@
+import heapq
+import time
+
+import six
+
 from tfsnippet.scaffold import TrainLoop, EventKeys
 from tfsnippet.utils import (ensure_variables_initialized,
                              get_default_session_or_error,
                              DocInherit, EventSource)
 
+from .async_evaluator import AsyncEvaluator
 from .evaluator import Evaluator
 
 __all__ = ['BaseTrainer']
@@ -16,20 +22,194 @@ def check_epochs_and_steps_arg(epochs=None, steps=None):
 
 
 class OnEveryFewCalls(object):
+    """A hook to run every `freq` epochs or steps."""
+
     def __init__(self, key, freq, callback):
         assert(callable(callback))
         self.key = key
         self.freq = freq
         self.callback = callback
+        self.next_due = None  # the next epoch or step counter to run
+
+    def due_after(self, counter):
+        """Get the first multiple of `freq` after `counter`."""
+        return (counter // self.freq + 1) * self.freq
+
+    def reschedule(self, counter):
+        """Set `next_due` to the first multiple of `freq` after `counter`."""
+        self.next_due = self.due_after(counter)
 
     def __call__(self, trainer):
-        if getattr(trainer.loop, self.key) % self.freq == 0:
+        """
+        Run `callback` if it is due at the current counter of `trainer`.
+
+        The hooks registered by :class:`BaseTrainer` are dispatched by
+        :class:`HookScheduler`, which does not call this method.  It is
+        kept for running a hook as a plain event handler, with the same
+        rule as the scheduler: the hook is due if the counter has passed
+        any multiple of `freq` in the last run.
+        """
+        counter = getattr(trainer.loop, self.key)
+        span = trainer._steps_in_run if self.key == 'step' else 1
+        if self.due_after(counter - span) <= counter:
             return self.callback()
 
     def __repr__(self):  # for `test_base_trainer.py`
         return '{}:{}:{}'.format(self.callback, self.key, self.freq)
 
 
+class _HookDispatcher(object):
+    """
+    The event handler to run a contiguous run of hooks, i.e., the hooks
+    registered without any other event handler registered in between.
+    """
+
+    # the time of each hook is reported by `HookScheduler.dispatch`
+    times_own_handlers = True
+
+    def __init__(self, scheduler, event_key):
+        self.scheduler = scheduler
+        self.event_key = event_key
+        self.hooks = []  # type: list[OnEveryFewCalls]
+        self.heap = None  # [(next_due, order, hook)]
+        self.last_counter = None  # the last dispatched counter
+
+    def add(self, hook):
+        self.hooks.append(hook)
+        self.heap = None  # rebuild the heap at next dispatch
+
+    def __call__(self, trainer):
+        self.scheduler.dispatch(self)
+
+
+class HookScheduler(object):
+    """
+    Dispatch the :class:`OnEveryFewCalls` hooks of a trainer.
+
+    The hooks registered consecutively to an event (without any other event
+    handler registered in between) share one handler registered to the
+    trainer's events, which runs nothing but a comparison unless the
+    earliest of these hooks is due.  Thus the hooks and other event handlers
+    still run in the order of registration.  The hooks of each handler are
+    kept in a min-heap ordered by the epoch or step counter they are next
+    due, and the due hooks are run in the order of registration.
+
+    The step counter might be advanced by more than one in a run, in which
+    case a hook is due if the counter has passed any multiple of its `freq`
+    in this run.  The hooks are rescheduled according to the counters if
+    the counters go backwards (e.g., when a new loop is used).
+    """
+
+    def __init__(self, trainer):
+        self._trainer = trainer
+        self._hooks = {}  # type: dict[str, list[OnEveryFewCalls]]
+        self._dispatchers = {}  # type: dict[str, list[_HookDispatcher]]
+
+    def add(self, event_key, hook):
+        """
+        Add a hook to run on event `event_key`.
+
+        Args:
+            event_key (str): The event key.
+            hook (OnEveryFewCalls): The hook.
+        """
+        self._hooks.setdefault(event_key, []).append(hook)
+        dispatchers = self._dispatchers.setdefault(event_key, [])
+        handlers = self._trainer.events.get_event_handlers(event_key)
+        if not dispatchers or not handlers or \
+                handlers[-1] is not dispatchers[-1]:
+            # another event handler has been registered after the last
+            # dispatcher, thus a new dispatcher is required to keep the
+            # order of registration
+            dispatchers.append(_HookDispatcher(self, event_key))
+            self._trainer.events.on(event_key, dispatchers[-1])
+        dispatchers[-1].add(hook)
+
+    def clear(self, event_key):
+        """
+        Remove all the hooks of event `event_key`.
+
+        The dispatchers of this event should have been removed from the
+        trainer's events by the caller.
+
+        Args:
+            event_key (str): The event key.
+        """
+        self._hooks.pop(event_key, None)
+        self._dispatchers.pop(event_key, None)
+
+    @staticmethod
+    def _build_heap(dispatcher, last_counter):
+        heap = []
+        for order, hook in enumerate(dispatcher.hooks):
+            hook.reschedule(last_counter)
+            heap.append((hook.next_due, order, hook))
+        heapq.heapify(heap)
+        dispatcher.heap = heap
+        return heap
+
+    def dispatch(self, dispatcher):
+        """
+        Run the due hooks of `dispatcher`.
+
+        Args:
+            dispatcher (_HookDispatcher): The dispatcher.
+        """
+        hooks = dispatcher.hooks
+        if not hooks:
+            return
+        key = hooks[0].key
+        counter = getattr(self._trainer.loop, key)
+        span = self._trainer._steps_in_run if key == 'step' else 1
+
+        heap = dispatcher.heap
+        last_counter = dispatcher.last_counter
+        if heap is None or last_counter is None or counter < last_counter:
+            heap = self._build_heap(dispatcher, counter - span)
+        dispatcher.last_counter = counter
+
+        if not heap or heap[0][0] > counter:
+            return
+
+        # pop the due hooks, and run them in the order of registration
+        due = []
+        while heap and heap[0][0] <= counter:
+            due.append(heapq.heappop(heap))
+        due.sort(key=lambda t: t[1])
+        handler_timer = self._trainer.events.handler_timer
+        try:
+            for _, order, hook in due:
+                if handler_timer is None:
+                    hook.callback()
+                else:
+                    start_time = time.time()
+                    try:
+                        hook.callback()
+                    finally:
+                        handler_timer(dispatcher.event_key, hook,
+                                      time.time() - start_time)
+        finally:
+            for _, order, hook in due:
+                hook.reschedule(counter)
+                heapq.heappush(heap, (hook.next_due, order, hook))
+
+    def get_schedule(self):
+        """
+        Get the schedule of the hooks.
+
+        Returns:
+            list[(str, OnEveryFewCalls)]: The event keys and the hooks,
+                in the order of registration for each event key.
+                The ``next_due`` attribute of each hook is the next epoch
+                or step counter it will run, or :obj:`None` if it has not
+                been scheduled, i.e., the event has not been fired since
+                the hook is registered.
+        """
+        return [(event_key, hook)
+                for event_key, hooks in six.iteritems(self._hooks)
+                for hook in hooks]
+
+
 @DocInherit
 class BaseTrainer(object):
     """
@@ -104,7 +284,12 @@ class BaseTrainer(object):
             EventKeys.STEP_LOGGING,
             EventKeys.AFTER_STEP,
         ])
+        if loop.profiler is not None:
+            self._events.set_handler_timer(loop.profiler.record_handler)
         self._is_fitting = False
+        self._steps_in_run = 1
+        self._hook_scheduler = HookScheduler(self)
+        self._async_evaluators = []  # type: list[AsyncEvaluator]
 
     @property
     def loop(self):
@@ -126,6 +311,29 @@ class BaseTrainer(object):
         """
         return self._events
 
+    @property
+    def hook_schedule(self):
+        """
+        Get the schedule of the hooks registered by the ``*_after_*()``
+        methods.
+
+        Returns:
+            list[(str, OnEveryFewCalls)]: The event keys and the hooks.
+                The hooks have attributes ``key`` ("epoch" or "step"),
+                ``freq``, ``callback`` and ``next_due`` (the next epoch or
+                step counter to run, or :obj:`None` if not scheduled yet).
+        """
+        return self._hook_scheduler.get_schedule()
+
+    def _add_hook(self, event_key, key, freq, callback):
+        self._hook_scheduler.add(
+            event_key, OnEveryFewCalls(key, freq, callback))
+
+    def _remove_hooks(self, *event_keys):
+        for event_key in event_keys:
+            self.events.clear_event_handlers(event_key)
+            self._hook_scheduler.clear(event_key)
+
     def run(self):
         """Run training loop."""
         if self._is_fitting:
@@ -147,6 +355,8 @@ class BaseTrainer(object):
 
                 # run steps of this epoch
                 for payload in self._iter_steps():
+                    self._steps_in_run = self.loop.steps_in_run
+
                     # trigger before step event
                     self.events.fire(EventKeys.BEFORE_STEP, self)
 
@@ -164,11 +374,18 @@ class BaseTrainer(object):
                 self.events.fire(EventKeys.EPOCH_ANNEALING, self)
                 self.events.fire(EventKeys.EPOCH_LOGGING, self)
                 self.events.reverse_fire(EventKeys.AFTER_EPOCH, self)
+                self._steps_in_run = 1
+
+            # deliver the background evaluations not finished in the loop
+            for evaluator in self._async_evaluators:
+                evaluator.collect_results(wait=True)
 
             # trigger the after execution event
             self.events.reverse_fire(EventKeys.AFTER_EXECUTION, self)
         finally:
             self._is_fitting = False
+            for evaluator in self._async_evaluators:
+                evaluator.close()
 
     def _iter_steps(self):
         """
@@ -203,10 +420,8 @@ class BaseTrainer(object):
         Args:
             freq (int): The frequency for this logging hook to run.
         """
-        self.events.on(
-            EventKeys.STEP_LOGGING,
-            OnEveryFewCalls('step', freq, self.loop.print_logs)
-        )
+        self._add_hook(EventKeys.STEP_LOGGING, 'step', freq,
+                       self.loop.print_logs)
 
     def log_after_epochs(self, freq):
         """
@@ -215,10 +430,8 @@ class BaseTrainer(object):
         Args:
             freq (int): The frequency for this logging hook to run.
         """
-        self.events.on(
-            EventKeys.EPOCH_LOGGING,
-            OnEveryFewCalls('epoch', freq, self.loop.print_logs)
-        )
+        self._add_hook(EventKeys.EPOCH_LOGGING, 'epoch', freq,
+                       self.loop.print_logs)
 
     def log_after(self, epochs=None, steps=None):
         """
@@ -245,8 +458,12 @@ class BaseTrainer(object):
         Returns:
             int: The number of removed hooks.
         """
-        self.events.clear_event_handlers(EventKeys.STEP_LOGGING)
-        self.events.clear_event_handlers(EventKeys.EPOCH_LOGGING)
+        self._remove_hooks(EventKeys.STEP_LOGGING, EventKeys.EPOCH_LOGGING)
+
+    def _add_async_evaluator(self, evaluator):
+        if isinstance(evaluator, AsyncEvaluator) and \
+                evaluator not in self._async_evaluators:
+            self._async_evaluators.append(evaluator)
 
     def evaluate_after_steps(self, evaluator, freq):
         """
@@ -258,10 +475,8 @@ class BaseTrainer(object):
             freq (int): The frequency for this evaluation hook to run.
         """
         callback = evaluator if callable(evaluator) else evaluator.run
-        self.events.on(
-            EventKeys.STEP_EVALUATION,
-            OnEveryFewCalls('step', freq, callback)
-        )
+        self._add_async_evaluator(evaluator)
+        self._add_hook(EventKeys.STEP_EVALUATION, 'step', freq, callback)
 
     def evaluate_after_epochs(self, evaluator, freq):
         """
@@ -273,10 +488,8 @@ class BaseTrainer(object):
             freq (int): The frequency for this evaluation hook to run.
         """
         callback = evaluator if callable(evaluator) else evaluator.run
-        self.events.on(
-            EventKeys.EPOCH_EVALUATION,
-            OnEveryFewCalls('epoch', freq, callback)
-        )
+        self._add_async_evaluator(evaluator)
+        self._add_hook(EventKeys.EPOCH_EVALUATION, 'epoch', freq, callback)
 
     def evaluate_after(self, evaluator, epochs=None, steps=None):
         """
@@ -305,8 +518,9 @@ class BaseTrainer(object):
         Returns:
             int: The number of removed hooks.
         """
-        self.events.clear_event_handlers(EventKeys.STEP_EVALUATION)
-        self.events.clear_event_handlers(EventKeys.EPOCH_EVALUATION)
+        self._remove_hooks(EventKeys.STEP_EVALUATION,
+                           EventKeys.EPOCH_EVALUATION)
+        del self._async_evaluators[:]
 
     # legacy names for evaluation
     validate_after_steps = evaluate_after_steps
@@ -324,10 +538,7 @@ class BaseTrainer(object):
             freq (int): The frequency for this annealing hook to run.
         """
         callback = value if callable(value) else value.anneal
-        self.events.on(
-            EventKeys.STEP_ANNEALING,
-            OnEveryFewCalls('step', freq, callback)
-        )
+        self._add_hook(EventKeys.STEP_ANNEALING, 'step', freq, callback)
 
     def anneal_after_epochs(self, value, freq):
         """
@@ -339,10 +550,7 @@ class BaseTrainer(object):
             freq (int): The frequency for this annealing hook to run.
         """
         callback = value if callable(value) else value.anneal
-        self.events.on(
-            EventKeys.EPOCH_ANNEALING,
-            OnEveryFewCalls('epoch', freq, callback)
-        )
+        self._add_hook(EventKeys.EPOCH_ANNEALING, 'epoch', freq, callback)
 
     def anneal_after(self, value, epochs=None, steps=None):
         """
@@ -371,5 +579,4 @@ class BaseTrainer(object):
         Returns:
             int: The number of removed hooks.
         """
-        self.events.clear_event_handlers(EventKeys.STEP_ANNEALING)
-        self.events.clear_event_handlers(EventKeys.EPOCH_ANNEALING)
+        self._remove_hooks(EventKeys.STEP_ANNEALING, EventKeys.EPOCH_ANNEALING)
@@ -0,0 +1,577 @@
+import multiprocessing as mp
+import traceback
+from contextlib import contextmanager
+
+import six
+import tensorflow as tf
+
+from tfsnippet.utils import (is_tensor_object,
+                             is_tensorflow_version_higher_or_equal)
+
+__all__ = ['detect_gpus', 'average_gradients', 'DataParallel']
+
+_detected_gpu_groups = None
+
+
+def detect_gpus():
+    """
+    Detect the GPU devices and their interconnection on current machine.
+
+    The result is cached, since the detection is done in a sub-process,
+    which is quite slow.
+
+    Returns:
+        list[list[str]]: List of GPU groups, each group is a list of
+            GPU device names.  The GPUs in one group are interconnected.
+    """
+    global _detected_gpu_groups
+    if _detected_gpu_groups is not None:
+        return _detected_gpu_groups
+
+    def worker(q):
+        # `device_lib` will not release the memory it took,
+        # so we run it in a sub-process.
+        try:
+            from tensorflow.python.client import device_lib
+
+            if is_tensorflow_version_higher_or_equal('1.8.0'):
+                config = tf.ConfigProto()
+                config.gpu_options.allow_growth = True
+                devices = list(device_lib.list_local_devices(config))
+            else:
+                devices = list(device_lib.list_local_devices())
+            gpus = [
+                (device.name, device)
+                for device in devices
+                if device.device_type == 'GPU'
+            ]
+            union_set = {i: i for i in range(len(gpus))}
+
+            for i, (name, device) in enumerate(gpus):
+                assert (device.name == '/device:GPU:{}'.format(i))
+                for link in device.locality.links.link:
+                    if link.device_id != i:
+                        union_set[i] = union_set[link.device_id]
+
+            for i in six.iterkeys(union_set):
+                while union_set[i] != union_set[union_set[i]]:
+                    union_set[i] = union_set[union_set[i]]
+
+            root_devices = sorted(set(union_set.values()))
+            gpu_groups = [[] for _ in range(len(root_devices))]
+            dev_to_group = {j: i for i, j in enumerate(root_devices)}
+            for i, (name, device) in enumerate(gpus):
+                gpu_groups[dev_to_group[union_set[i]]].append(name)
+
+            q.put((1, gpu_groups))
+        except Exception:
+            q.put((0, traceback.format_exc()))
+
+    q = mp.Queue()
+    p = mp.Process(target=worker, args=(q,))
+
+    try:
+        p.start()
+        result = q.get()
+        if result[0] == 1:
+            _detected_gpu_groups = result[1]
+            return _detected_gpu_groups
+        else:
+            raise RuntimeError(
+                'Failed to retrieve GPU information, the traceback of '
+                'sub-process is:\n  {}'.
+                format('\n  '.join(result[1].split('\n')))
+            )
+    finally:
+        p.terminate()
+        p.join()
+
+
+def _average_dense(grads, scale):
+    grad = tf.add_n(grads)
+    return grad * tf.cast(scale, dtype=grad.dtype.base_dtype)
+
+
+def _average_sparse(grads, scale):
+    # concatenate the slices instead of densifying them, the duplicated
+    # indices will be summed up by the optimizer
+    values = tf.concat([g.values for g in grads], axis=0)
+    indices = tf.concat([g.indices for g in grads], axis=0)
+    return tf.IndexedSlices(
+        values * tf.cast(scale, dtype=values.dtype.base_dtype),
+        indices,
+        grads[0].dense_shape
+    )
+
+
+def average_gradients(tower_grads, bucket_size=None):
+    """
+    Calculate the average gradient for each shared variable across all towers.
+    Note that this function provides a synchronization point across all towers.
+
+    The dense gradients of each variable are summed up by :func:`tf.add_n`
+    and then scaled by ``1/k``, which does not allocate a stacked copy of
+    the gradients from all the `k` towers.  The :class:`tf.IndexedSlices`
+    gradients (e.g., from embedding lookups) are averaged without being
+    densified, by concatenating their indices and values.
+
+    If `bucket_size` is specified, the small dense gradients of the same
+    dtype are flattened and packed into fused buffers of at most
+    `bucket_size` elements, which are averaged and then split back.  This
+    reduces the number of operations (and cross-device transfers) for
+    models with many small variables.
+
+    Args:
+        tower_grads: List of lists of (gradient, variable) tuples. The outer
+            list is over individual towers. The inner list is over the
+            gradient calculation for each variable.
+        bucket_size (int or None): The maximum number of elements of each
+            fused buffer.  If not specified, do not fuse the gradients.
+
+    Returns:
+       List of pairs of (gradient, variable) where the gradient has been
+       averaged across all towers.
+    """
+    if len(tower_grads) == 1:
+        return tower_grads[0]
+
+    scale = 1. / len(tower_grads)
+    var_grads = list(zip(*tower_grads))
+    average_grads = [None] * len(var_grads)
+    buckets = {}  # {dtype: [indices of the variables, number of elements]}
+
+    def average_bucket(indices):
+        if len(indices) == 1:
+            i = indices[0]
+            average_grads[i] = (
+                _average_dense([g for g, _ in var_grads[i]], scale),
+                var_grads[i][0][1]
+            )
+            return
+        shapes = [var_grads[i][0][0].get_shape() for i in indices]
+        flat_grads = [
+            tf.concat([tf.reshape(var_grads[i][t][0], [-1])
+                       for i in indices], axis=0)
+            for t in range(len(tower_grads))
+        ]
+        parts = tf.split(_average_dense(flat_grads, scale),
+                         [s.num_elements() for s in shapes])
+        for i, shape, part in zip(indices, shapes, parts):
+            average_grads[i] = (tf.reshape(part, shape), var_grads[i][0][1])
+
+    for i, grad_and_vars in enumerate(var_grads):
+        # Note that each grad_and_vars looks like the following:
+        #   ((grad0_gpu0, var0_gpu0), ... , (grad0_gpuN, var0_gpuN))
+        # The variables are redundant because they are shared across
+        # towers, so we just return the first tower's pointer.
+        v = grad_and_vars[0][1]
+        grads = [g for g, _ in grad_and_vars]
+        if all(g is None for g in grads):
+            average_grads[i] = (None, v)
+            continue
+        if any(g is None for g in grads):
+            raise ValueError('The gradients of variable {!r} are None in '
+                             'some of the towers.'.format(v))
+
+        if all(isinstance(g, tf.IndexedSlices) for g in grads):
+            average_grads[i] = (_average_sparse(grads, scale), v)
+            continue
+        grads = [tf.convert_to_tensor(g) for g in grads]
+
+        shape = grads[0].get_shape()
+        if bucket_size is None or not shape.is_fully_defined() or \
+                shape.num_elements() > bucket_size:
+            average_grads[i] = (_average_dense(grads, scale), v)
+        else:
+            var_grads[i] = tuple(zip(grads, [v] * len(grads)))
+            dtype = grads[0].dtype.base_dtype
+            bucket = buckets.get(dtype)
+            if bucket is not None and \
+                    bucket[1] + shape.num_elements() > bucket_size:
+                average_bucket(bucket[0])
+                bucket = None
+            if bucket is None:
+                bucket = buckets[dtype] = [[], 0]
+            bucket[0].append(i)
+            bucket[1] += shape.num_elements()
+
+    for dtype in sorted(buckets, key=lambda t: t.name):
+        average_bucket(buckets[dtype][0])
+    return average_grads
+
+
+def _device_type(device):
+    return tf.DeviceSpec.from_string(device).device_type
+
+
+class DataParallel(object):
+    """
+    Class to help build data-paralleled outputs and training operations,
+    by replicating the model into towers on a list of devices.
+
+    The devices can be GPUs, or multiple CPU devices (e.g., on a NUMA box
+    with many cores), in which case the session should be created with
+    :meth:`session_kwargs`, for example::
+
+        data_parallel = spt.DataParallel.cpu_towers(4)
+        grads, losses = [], []
+        for dev, pre_build, [dev_x] in data_parallel.data_parallel(
+                batch_size, [input_x]):
+            with tf.device(dev), data_parallel.maybe_name_scope(dev):
+                dev_loss = build_loss(dev_x)
+                if not pre_build:
+                    losses.append(dev_loss)
+                    grads.append(optimizer.compute_gradients(dev_loss))
+
+        [loss] = data_parallel.average([losses], batch_size)
+        train_op = data_parallel.apply_grads(
+            data_parallel.average_grads(grads), optimizer)
+
+        with spt.utils.create_session(
+                **data_parallel.session_kwargs()).as_default():
+            ...
+    """
+
+    def __init__(self, devices=None, main_device=None,
+                 disable_prebuild=False):
+        """
+        Construct a :class:`DataParallel`.
+
+        Args:
+            devices (Iterable[str]): The devices to build the towers on.
+                If not specified, use all the GPUs detected by
+                :func:`detect_gpus`, or the first CPU if there is no GPU.
+            main_device (str): The device for storing variables, and for
+                gathering losses / gradients.  If not specified, use the
+                only device if there is only one, the first GPU if all the
+                GPUs are interconnected, or the first CPU otherwise.
+            disable_prebuild: Whether or not to disable pre-build on
+                `main_device`?  Some operations (e.g., NCHW convolutional
+                kernels) may not be supported by CPUs for the time being,
+                thus the pre-building on CPUs might need to be disabled.
+        """
+        if devices is None:
+            gpu_groups = detect_gpus()
+            devices = sum(gpu_groups, [])
+            if main_device is None:
+                if not gpu_groups:
+                    main_device = '/device:CPU:0'
+                elif len(gpu_groups) != 1 and not disable_prebuild:
+                    main_device = '/device:CPU:0'
+                else:
+                    main_device = gpu_groups[0][0]
+            if not devices:
+                devices = [main_device]
+        else:
+            devices = list(devices)
+            if not devices:
+                raise ValueError('`devices` must not be empty.')
+            if main_device is None:
+                main_device = devices[0] if len(devices) == 1 \
+                    else '/device:CPU:0'
+
+        self._devices = tuple(devices)
+        self._main_device = main_device
+        self._disable_prebuild = disable_prebuild
+        self._gpu_devices = tuple(
+            d for d in devices if _device_type(d) == 'GPU')
+
+    @classmethod
+    def cpu_towers(cls, num_towers):
+        """
+        Construct a :class:`DataParallel` with towers on CPU devices.
+
+        Args:
+            num_towers (int): The number of CPU devices (towers).
+
+        Returns:
+            DataParallel: The data parallel object, with
+                ``/device:CPU:0``, ..., ``/device:CPU:<num_towers-1>`` as
+                the devices, and ``/device:CPU:0`` as the main device.
+        """
+        num_towers = int(num_towers)
+        if num_towers < 1:
+            raise ValueError('`num_towers` must be at least 1.')
+        return cls(devices=['/device:CPU:{}'.format(i)
+                            for i in range(num_towers)],
+                   main_device='/device:CPU:0')
+
+    @property
+    def disable_prebuild(self):
+        """Whether or not to disable pre-build on `main_device`?"""
+        return self._disable_prebuild
+
+    @property
+    def main_device(self):
+        """
+        Get the main device name.
+
+        Main device is the device for storing variables, and for gathering
+        losses / gradients during training.  It may not be necessary one
+        of the `work_devices`.  Do not run the model computation graph on the
+        `main_device`, otherwise the `channels_last` parameter for convolutional
+        layers might result in undesired behaviors.
+        """
+        return self._main_device
+
+    @property
+    def work_devices(self):
+        """
+        Get the names of the working devices.
+
+        The model computation graph should be run only on these devices.
+        Do not run them on the `main_device`, otherwise the `channels_last`
+        parameter for convolutional layers might result in undesired behaviors.
+        """
+        return self._devices
+
+    @property
+    def num_towers(self):
+        """Get the number of towers, i.e., the number of working devices."""
+        return len(self._devices)
+
+    @property
+    def gpu_devices(self):
+        """Get the names of GPU devices."""
+        return self._gpu_devices
+
+    def is_gpu_device(self, device):
+        """Check whether or not `device` is a GPU device."""
+        return device in self._gpu_devices
+
+    def channels_last(self, device):
+        """
+        Get the `channels_last` argument for `device`.
+
+        It will be :obj:`True` for non-GPU devices, :obj:`False` for GPUs.
+        Be careful if you want to build a model on both CPU and GPU devices,
+        with ``channels_last = data_parallel.channels_last(device)``.
+        The convolutional layers will work as desired, but the dense layers
+        after or before a convolutional layer will not work properly, unless
+        special treatment is taken.
+        """
+        return device not in self._gpu_devices
+
+    def session_kwargs(self, cpu_threads=None):
+        """
+        Get the named arguments for :func:`~tfsnippet.utils.create_session`,
+        to create the CPU devices of the towers.
+
+        If there are multiple CPU towers, the CPU threads are partitioned
+        among the towers, i.e., ``intra_op_parallelism_threads`` is set to
+        ``cpu_threads // num_cpu_towers``, while the towers run concurrently
+        with ``inter_op_parallelism_threads = num_cpu_towers``.  This avoids
+        over-subscribing the cores when all the towers are running.
+
+        Args:
+            cpu_threads (int): The total number of CPU threads.
+                If not specified, use the number of CPU cores.
+
+        Returns:
+            dict[str, any]: The named arguments for ``tf.ConfigProto``.
+        """
+        cpu_ids = [tf.DeviceSpec.from_string(d).device_index or 0
+                   for d in self._devices if _device_type(d) == 'CPU']
+        if not cpu_ids:
+            return {}
+        ret = {'device_count': {'CPU': max(cpu_ids) + 1}}
+        num_cpu_towers = len(cpu_ids)
+        if num_cpu_towers > 1:
+            if cpu_threads is None:
+                cpu_threads = mp.cpu_count()
+            ret['intra_op_parallelism_threads'] = \
+                max(1, int(cpu_threads) // num_cpu_towers)
+            ret['inter_op_parallelism_threads'] = num_cpu_towers
+        return ret
+
+    def _tower_slices(self, batch_size):
+        # split the batch into nearly equal slices, whose sizes differ by
+        # at most one, such that no tower is left with a padded or an
+        # empty slice if `batch_size >= k`
+        k = len(self._devices)
+        bounds = [(batch_size * i) // k for i in range(k + 1)]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def data_parallel(self, batch_size, inputs):
+        """
+        Iterate through all devices and build the data-paralleled model.
+
+        Args:
+            batch_size (int or tf.Tensor): The size of each mini-batch.
+            inputs (Iterable[tf.Tensor]): Input placeholders to be sliced
+                for data parallelism.  The input placeholders will be sliced
+                through the first dimension, into nearly equal slices.
+
+        Yields:
+            str, bool, tuple[tf.Tensor]: ``(dev, pre_build, inputs)``,
+                the device name, a flag indicating whether this is a
+                pre-building pass for creating variables on the main
+                device, and the tuple of sliced input placeholders.
+        """
+        inputs = list(inputs)
+
+        # quick path: only one device, do not slice
+        if len(self.work_devices) == 1:
+            yield self.work_devices[0], False, tuple(inputs)
+
+        # slow path: multiple devices
+        else:
+            # the towers are not on the main device, place variables on it
+            if self.main_device not in self.work_devices and \
+                    not self._disable_prebuild:
+                yield self.main_device, True, tuple(inputs)
+
+            # build the paralleled computation graph for each device
+            with tf.name_scope('data_parallel') as ns:
+                pass  # generate a name scope to place our data slicing ops
+
+            slices = self._tower_slices(batch_size)
+            for i, device in enumerate(self.work_devices):
+                low, high = slices[i]
+                with tf.name_scope(ns + 'tower_{}'.format(i)):
+                    dev_inputs = [inp[low: high] for inp in inputs]
+                yield device, False, tuple(dev_inputs)
+
+    @contextmanager
+    def maybe_name_scope(self, device):
+        """
+        Generate a name scope if `device` is not `main_device`.
+
+        Args:
+            device (str): The name of the device.
+
+        Yields
+            The generated name scope, or None.
+        """
+        if device == self.main_device:
+            yield
+        elif device not in self._devices:
+            with tf.name_scope('tower_main') as ns:
+                yield ns
+        else:
+            tower_id = self._devices.index(device)
+            with tf.name_scope('tower_{}'.format(tower_id)) as ns:
+                yield ns
+
+    def average_grads(self, grads, bucket_size=None):
+        """
+        Take the averaged gradients on the main device.
+
+        Args:
+            grads: List of lists of (gradients, variables) pairs.
+            bucket_size (int or None): The maximum number of elements of
+                each fused buffer.  See :func:`average_gradients`.
+
+        Returns:
+            List of pairs of (gradient, variable) where the gradient has been
+            averaged across all devices.
+        """
+        # quick path: only one device, just return the grads
+        if len(grads) == 1:
+            return grads[0]
+
+        # slow path: multiple devices
+        else:
+            with tf.device(self.main_device), tf.name_scope('average_grads'):
+                return average_gradients(grads, bucket_size=bucket_size)
+
+    def apply_grads(self, grads, optimizer, global_step=None,
+                    control_inputs=None):
+        """
+        Apply the gradients.
+
+        Args:
+            grads: List of (gradients, variables) pairs.
+            optimizer: The TensorFlow optimizer.
+            global_step: The optional global step counter.
+            control_inputs: Dependency operations before applying the gradients.
+
+        Returns:
+            The operation of applying gradients.
+        """
+        def mk_op():
+            return optimizer.apply_gradients(grads, global_step=global_step)
+
+        with tf.device(self.main_device), tf.name_scope('apply_grads'):
+            if control_inputs:
+                with tf.control_dependencies(control_inputs):
+                    return mk_op()
+            else:
+                return mk_op()
+
+    @staticmethod
+    def _check_tensors(tensors):
+        tensors = list(tensors)
+        if tensors:
+            length = len(tensors[0])
+            if length == 0:
+                raise ValueError('`tensors` must be list of non-empty Tensor '
+                                 'lists.')
+            for t in tensors[1:]:
+                if len(t) != length:
+                    raise ValueError('`tensors` must be list of Tensor lists '
+                                     'of the same length.')
+        return tensors
+
+    def average(self, tensors, batch_size=None):
+        """
+        Take the average of given tensors from different devices.
+
+        If `batch_size` is specified, the tensors will be averaged with respect
+        to the size of data fed to each device.
+
+        Args:
+            tensors (list[list[tf.Tensor]]): List of tensors from each device.
+            batch_size (None or int or tf.Tensor): The optional batch size.
+
+        Returns:
+            list[tf.Tensor]: The averaged tensors.
+        """
+        # check the arguments and try the fast path: only one tensor
+        tensors = self._check_tensors(tensors)
+        if not tensors:
+            return []
+        if len(tensors[0]) == 1:
+            return [t[0] for t in tensors]
+
+        # do the slow path: average all tensors
+        with tf.device(self.main_device), tf.name_scope('average_tensors'):
+            if batch_size is None:
+                k = len(tensors[0])
+                return [tf.add_n(list(t)) / float(k) for t in tensors]
+
+            if is_tensor_object(batch_size):
+                to_float = tf.to_float
+            else:
+                to_float = float
+
+            float_batch_size = to_float(batch_size)
+            weights = [to_float(high - low) / float_batch_size
+                       for low, high in self._tower_slices(batch_size)]
+            return [
+                tf.add_n([x * tf.cast(w, dtype=x.dtype.base_dtype)
+                          for x, w in zip(map(tf.convert_to_tensor, t),
+                                          weights)])
+                for t in tensors
+            ]
+
+    def concat(self, tensors):
+        """
+        Concat given tensors from different devices.
+
+        Args:
+            tensors (list[list[tf.Tensor]]): List of tensors from each device.
+
+        Returns:
+            list[tf.Tensor]: The concatenated tensors.
+        """
+        # check the arguments and try the fast path: only one tensor
+        tensors = self._check_tensors(tensors)
+        if not tensors:
+            return []
+        if len(tensors[0]) == 1:
+            return [t[0] for t in tensors]
+
+        # do the slow path: concat all tensors
+        with tf.device(self.main_device), tf.name_scope('concat_tensors'):
+            return [tf.concat(t, axis=0) for t in tensors]
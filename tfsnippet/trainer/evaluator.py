@@ -9,7 +9,8 @@ from tfsnippet.dataflows import DataFlow
 from tfsnippet.utils import get_default_session_or_error, EventSource
 from tfsnippet.scaffold import TrainLoop, EventKeys
 
-from .feed_dict import resolve_feed_dict, merge_feed_dict
+from .feed_dict import FeedDictPlan
+from .streaming_metrics import StreamingMetrics
 
 __all__ = ['auto_batch_weight', 'Evaluator']
 
@@ -51,7 +52,8 @@ class Evaluator(object):
 
     def __init__(self, loop, metrics, inputs, data_flow, feed_dict=None,
                  time_metric_name='eval_time',
-                 batch_weight_func=auto_batch_weight):
+                 batch_weight_func=auto_batch_weight,
+                 streaming_metrics=False):
         """
         Construct a new :class:`Evaluator`.
 
@@ -80,6 +82,11 @@ class Evaluator(object):
                 to compute the metric weight for each mini-batch.  If
                 :obj:`None`, will use 1. as the metric weight.
                 (default :func:`auto_batch_weight`)
+            streaming_metrics (bool): If :obj:`True`, accumulate the weighted
+                averages of `metrics` in the graph by :class:`StreamingMetrics`,
+                and fetch them only once after all the mini-batches have been
+                evaluated, instead of fetching the metrics of every
+                mini-batch.  (default :obj:`False`)
         """
         if not isinstance(metrics, (dict, OrderedDict)):
             metrics = {loop.valid_metric_name: metrics}
@@ -106,6 +113,17 @@ class Evaluator(object):
         self._batch_weight_func = batch_weight_func
         self._last_metrics_dict = {}  # store the metrics of last evaluation
 
+        # accumulate the metrics in the graph, if required
+        self._streaming_metrics = None  # type: StreamingMetrics
+        self._batch_weight_ph = None
+        if streaming_metrics:
+            self._batch_weight_ph = tf.placeholder_with_default(
+                np.asarray(1., dtype=np.float64), shape=(),
+                name='batch_weight'
+            )
+            self._streaming_metrics = StreamingMetrics(
+                self._metrics, weight=self._batch_weight_ph)
+
     @property
     def events(self):
         """
@@ -176,6 +194,17 @@ class Evaluator(object):
         """Get the function to compute the metric weight for each mini-batch."""
         return self._batch_weight_func
 
+    @property
+    def streaming_metrics(self):
+        """
+        Get the :class:`StreamingMetrics` accumulating `metrics`.
+
+        Returns:
+            StreamingMetrics or None: The :class:`StreamingMetrics`, or
+                :obj:`None` if the metrics are not accumulated in the graph.
+        """
+        return self._streaming_metrics
+
     @property
     def last_metrics_dict(self):
         """
@@ -187,6 +216,11 @@ class Evaluator(object):
         return self._last_metrics_dict
 
     def _run_batch(self, session, feed_dict):
+        if self._streaming_metrics is not None:
+            # the metrics are accumulated in the graph, not fetched
+            session.run(self._streaming_metrics.update_op,
+                        feed_dict=feed_dict)
+            return None
         return session.run(list(six.itervalues(self.metrics)),
                            feed_dict=feed_dict)
 
@@ -207,6 +241,7 @@ class Evaluator(object):
                 yield
 
         session = get_default_session_or_error()
+        feed_plan = FeedDictPlan(self.feed_dict, feed_dict)
         metric_tensors = list(six.itervalues(self.metrics))
         metric_names = list(six.iterkeys(self.metrics))
         metric_values = []
@@ -216,15 +251,14 @@ class Evaluator(object):
             # trigger before evaluation event
             self.events.fire(EventKeys.BEFORE_EXECUTION, self)
 
+            streaming = self._streaming_metrics
+            if streaming is not None:
+                streaming.reset(session)
+
             for batch_data in self.data_flow:
                 # prepare for the batch feed dict
-                feed_dict = resolve_feed_dict(
-                    merge_feed_dict(
-                        self.feed_dict,
-                        feed_dict,
-                        zip(self.inputs, batch_data)
-                    )
-                )
+                feed_dict = feed_plan.resolve(
+                    zip(self.inputs, batch_data), session=session)
 
                 # inspect the batch weight
                 if self._batch_weight_func is not None:
@@ -232,9 +266,13 @@ class Evaluator(object):
                 else:
                     batch_weight = 1.
                 metric_weights.append(batch_weight)
+                if streaming is not None:
+                    feed_dict[self._batch_weight_ph] = batch_weight
 
                 # run the mini-batch
                 batch_values = self._run_batch(session, feed_dict)
+                if batch_values is None:
+                    continue
                 for i, v in enumerate(batch_values):
                     if len(np.asarray(v).shape) != 0:  # pragma: no cover
                         raise ValueError(
@@ -246,17 +284,26 @@ class Evaluator(object):
                 metric_values.append(np.asarray(batch_values))
 
             # now merge all batch metrics and do logging
-            if metric_values:
+            if streaming is not None:
+                metrics_dict = dict(streaming.fetch(session))
+            elif metric_values:
                 metric_values = np.average(
                     np.stack(metric_values, axis=0),
                     axis=0,
                     weights=np.asarray(metric_weights),
                 )
                 assert(len(metric_names) == len(metric_values))
-                self._last_metrics_dict = metrics_dict = {
+                metrics_dict = {
                     k: v for k, v in zip(metric_names, metric_values)
                 }
-                self.loop.collect_metrics(metrics_dict)
+            else:
+                metrics_dict = {}
+            if metrics_dict:
+                # weight the averages by the total batch weight, as if the
+                # metrics of every mini-batch were collected
+                self._last_metrics_dict = metrics_dict
+                self.loop.collect_weighted_metrics(
+                    metrics_dict, np.sum(metric_weights))
 
             # trigger after evaluation event
             self.events.reverse_fire(EventKeys.AFTER_EXECUTION, self)
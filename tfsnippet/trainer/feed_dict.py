@@ -1,7 +1,8 @@
 from tfsnippet.scaffold import ScheduledVariable
+from tfsnippet.utils import get_default_session_or_error
 from .dynamic_values import DynamicValue
 
-__all__ = ['resolve_feed_dict', 'merge_feed_dict']
+__all__ = ['resolve_feed_dict', 'merge_feed_dict', 'FeedDictPlan']
 
 
 def resolve_feed_dict(feed_dict, inplace=False):
@@ -54,3 +55,112 @@ def merge_feed_dict(*feed_dicts):
         if feed_dict is not None:
             ret.update(feed_dict)
     return ret
+
+
+class FeedDictPlan(object):
+    """
+    A feed dict compiled for resolving repeatedly.
+
+    :func:`merge_feed_dict` and :func:`resolve_feed_dict` inspect every
+    value in the feed dict each time they are called.  This class instead
+    classifies the values of the merged feed dicts once, such that
+    :meth:`resolve` only needs to:
+
+    1.  copy the prebuilt dict of fixed values;
+    2.  call the :class:`DynamicValue` and callable objects;
+    3.  read the :class:`ScheduledVariable` values by one single
+        ``session.run`` on their tensors;
+    4.  fill in the batch arrays.
+
+    Since a placeholder can only be fed with a host-side value, the values
+    of :class:`ScheduledVariable` cannot be wired into the graph by the
+    plan, thus they still cost one ``session.run`` for each
+    :meth:`resolve` (shared by all such values).  This fetch is skipped
+    for the variables constructed with ``host_cache=True``, whose values
+    assigned by :meth:`ScheduledVariable.set` are fed from host memory.
+    To avoid the fetch entirely, use :attr:`ScheduledVariable.tensor` in
+    the graph instead of feeding a placeholder with the variable.
+
+    The plan does not track the changes of the source feed dicts after
+    it is constructed.
+    """
+
+    def __init__(self, *feed_dicts):
+        """
+        Construct a new :class:`FeedDictPlan`.
+
+        Args:
+            \**feed_dicts: List of feed dicts, merged by
+                :func:`merge_feed_dict`.
+        """
+        static_values = {}
+        dynamic_values = []  # [(key, () -> value)]
+        scheduled_keys = []
+        scheduled_vars = []
+        for k, v in merge_feed_dict(*feed_dicts).items():
+            if isinstance(v, ScheduledVariable):
+                scheduled_keys.append(k)
+                scheduled_vars.append(v)
+            elif isinstance(v, DynamicValue):
+                dynamic_values.append((k, v.get))
+            elif callable(v):
+                dynamic_values.append((k, v))
+            else:
+                static_values[k] = v
+
+        self._static_values = static_values
+        self._dynamic_values = dynamic_values
+        self._scheduled_keys = scheduled_keys
+        self._scheduled_vars = scheduled_vars
+
+    @property
+    def static_keys(self):
+        """Get the keys of the fixed values."""
+        return list(self._static_values)
+
+    @property
+    def dynamic_keys(self):
+        """Get the keys of the :class:`DynamicValue` and callable values."""
+        return [k for k, _ in self._dynamic_values]
+
+    @property
+    def scheduled_keys(self):
+        """Get the keys of the :class:`ScheduledVariable` values."""
+        return list(self._scheduled_keys)
+
+    def resolve(self, feeds=None, session=None):
+        """
+        Resolve the feed dict.
+
+        Args:
+            feeds: Dict or iterable of ``(key, value)`` pairs, which are
+                set into the resolved feed dict as-is, overriding the
+                values of the plan (e.g., the batch arrays).
+            session (tf.Session): The session to read the
+                :class:`ScheduledVariable` values, which are fetched by one
+                ``session.run`` unless all of them are kept in host memory
+                (see :class:`FeedDictPlan`).  If not specified, use the
+                default session.
+
+        Returns:
+            dict: The resolved feed dict.
+        """
+        ret = self._static_values.copy()
+        for k, get_value in self._dynamic_values:
+            ret[k] = get_value()
+        if self._scheduled_vars:
+            session = session or get_default_session_or_error()
+            missing_keys = []
+            missing_tensors = []
+            for k, v in zip(self._scheduled_keys, self._scheduled_vars):
+                value = v.get_cached(session)
+                if value is None:
+                    missing_keys.append(k)
+                    missing_tensors.append(v.tensor)
+                else:
+                    ret[k] = value
+            if missing_tensors:
+                ret.update(zip(missing_keys, session.run(missing_tensors)))
+        if feeds is not None:
+            ret.update(feeds)
+        return ret
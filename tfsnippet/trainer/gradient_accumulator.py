@@ -0,0 +1,178 @@
+import tensorflow as tf
+
+from tfsnippet.utils import get_default_session_or_error
+
+__all__ = ['GradientAccumulator']
+
+
+class GradientAccumulator(object):
+    """
+    Accumulate the gradients of micro-batches in the graph, and apply the
+    averaged gradients every few micro-batches.
+
+    This allows an effective batch size larger than fitting into the memory.
+    The gradients of each micro-batch are added to non-trainable local
+    variables (which are neither saved by checkpoints, nor initialized by
+    :func:`~tfsnippet.utils.ensure_variables_initialized`) by
+    :attr:`accumulate_op`, while :attr:`apply_op` accumulates the gradients
+    of the last micro-batch, applies the average of the accumulated
+    gradients by the optimizer, and resets the accumulators, all in one
+    ``session.run``.  For example::
+
+        optimizer = tf.train.AdamOptimizer(learning_rate)
+        accumulator = spt.GradientAccumulator(optimizer, loss)
+        trainer = spt.Trainer(loop, accumulator, [input_x], train_flow,
+                              metrics={'loss': loss}, accumulate_steps=4)
+
+    :meth:`reset` must be called before the first :attr:`accumulate_op`,
+    so as to initialize the local variables.  This is done by
+    :class:`Trainer` at the beginning of :meth:`Trainer.run`.
+    """
+
+    def __init__(self, optimizer, loss=None, grads_and_vars=None,
+                 var_list=None, global_step=None, name=None):
+        """
+        Construct a new :class:`GradientAccumulator`.
+
+        Args:
+            optimizer (tf.train.Optimizer): The optimizer.
+            loss (tf.Tensor): The training loss, whose gradients are
+                computed by ``optimizer.compute_gradients``.
+            grads_and_vars (list[(tf.Tensor, tf.Variable)]): The output of
+                ``optimizer.compute_gradients``.  Either `loss` or
+                `grads_and_vars` should be specified.
+            var_list (list[tf.Variable]): The variables to optimize, if
+                `loss` is specified.  If not specified, use all the
+                trainable variables.
+            global_step (tf.Variable): The global step variable, which is
+                increased by one at each :attr:`apply_op`.
+            name (str): Default name of the name scope.
+                If not specified, generate one according to the class name.
+        """
+        if (loss is None) == (grads_and_vars is None):
+            raise ValueError('Either `loss` or `grads_and_vars` should be '
+                             'specified, but not both.')
+        if loss is not None:
+            grads_and_vars = optimizer.compute_gradients(
+                loss, var_list=var_list)
+        grads_and_vars = [(g, v) for g, v in grads_and_vars if g is not None]
+        if not grads_and_vars:
+            raise ValueError('No gradient to accumulate.')
+
+        with tf.name_scope(name, default_name='GradientAccumulator'):
+            counter = tf.Variable(
+                0., name='counter', trainable=False, dtype=tf.float32,
+                collections=[tf.GraphKeys.LOCAL_VARIABLES]
+            )
+            accumulators = []
+            add_ops = []
+            for i, (g, v) in enumerate(grads_and_vars):
+                with tf.device(v.device):
+                    acc = tf.Variable(
+                        tf.zeros(v.get_shape(), dtype=v.dtype.base_dtype),
+                        name='accumulator_{}'.format(i), trainable=False,
+                        collections=[tf.GraphKeys.LOCAL_VARIABLES]
+                    )
+                accumulators.append(acc)
+                if isinstance(g, tf.IndexedSlices):
+                    add_ops.append(tf.scatter_add(acc, g.indices, g.values))
+                else:
+                    add_ops.append(tf.assign_add(acc, g))
+            accumulate_op = tf.group(tf.assign_add(counter, 1.), *add_ops)
+
+            # read the averaged gradients after the last micro-batch is
+            # accumulated, apply them, and then reset the accumulators
+            with tf.control_dependencies([accumulate_op]):
+                scale = 1. / tf.maximum(counter.read_value(), 1.)
+                averaged = [
+                    acc.read_value() * tf.cast(scale, acc.dtype.base_dtype)
+                    for acc in accumulators
+                ]
+            apply_gradients_op = optimizer.apply_gradients(
+                [(g, v) for g, (_, v) in zip(averaged, grads_and_vars)],
+                global_step=global_step
+            )
+            all_vars = [counter] + accumulators
+            with tf.control_dependencies([apply_gradients_op]):
+                apply_op = tf.group(
+                    *[tf.assign(v, tf.zeros_like(v)) for v in all_vars])
+            reset_op = tf.group(
+                *[tf.assign(v, tf.zeros_like(v)) for v in all_vars])
+
+        self._optimizer = optimizer
+        self._grads_and_vars = grads_and_vars
+        self._counter = counter
+        self._accumulators = accumulators
+        self._accumulate_op = accumulate_op
+        self._apply_op = apply_op
+        self._reset_op = reset_op
+
+    @property
+    def optimizer(self):
+        """Get the optimizer."""
+        return self._optimizer
+
+    @property
+    def grads_and_vars(self):
+        """
+        Get the gradients of each micro-batch and the variables.
+
+        Returns:
+            list[(tf.Tensor, tf.Variable)]: The gradients and the variables.
+        """
+        return list(self._grads_and_vars)
+
+    @property
+    def variables(self):
+        """
+        Get the local variables of the accumulated gradients.
+
+        Returns:
+            list[tf.Variable]: The counter of accumulated micro-batches,
+                followed by the accumulators of the gradients.
+        """
+        return [self._counter] + self._accumulators
+
+    @property
+    def accumulate_op(self):
+        """Get the operation to accumulate the gradients of a micro-batch."""
+        return self._accumulate_op
+
+    @property
+    def apply_op(self):
+        """
+        Get the operation to accumulate the gradients of the last
+        micro-batch, apply the averaged gradients, and reset the
+        accumulators.
+        """
+        return self._apply_op
+
+    @property
+    def reset_op(self):
+        """Get the operation to reset the accumulators."""
+        return self._reset_op
+
+    def reset(self, session=None):
+        """
+        Reset the accumulators, discarding the accumulated gradients.
+
+        Args:
+            session (tf.Session): The session to use.  If not specified,
+                use the default session.
+        """
+        session = session or get_default_session_or_error()
+        session.run(self._reset_op)
+
+    def get_accumulated_count(self, session=None):
+        """
+        Get the number of micro-batches accumulated since the last apply.
+
+        Args:
+            session (tf.Session): The session to use.  If not specified,
+                use the default session.
+
+        Returns:
+            int: The number of accumulated micro-batches.
+        """
+        session = session or get_default_session_or_error()
+        return int(session.run(self._counter))
@@ -0,0 +1,109 @@
+import tensorflow as tf
+
+__all__ = ['multi_step_train_op']
+
+
+def multi_step_train_op(step_fn, inputs=(), num_steps=None, metric_names=(),
+                        name=None):
+    """
+    Build an operation which runs multiple training steps in the graph.
+
+    The training steps are run sequentially by a :func:`tf.while_loop`, and
+    the metrics of these steps are averaged in the graph, such that a single
+    ``session.run`` is sufficient to run all these steps.  This can be used
+    along with ``Trainer(steps_per_run=k)``, so as to eliminate the per-step
+    Python and session overhead for small models.  For example::
+
+        input_x = tf.placeholder(tf.float32, [None, None, 784])  # stacked
+        optimizer = tf.train.AdamOptimizer()
+
+        @spt.global_reuse
+        def build_loss(x):
+            ...
+
+        # create the model variables and the optimizer slots in advance
+        _ = optimizer.minimize(build_loss(input_x[0]))
+
+        def train_step(x):
+            loss = build_loss(x)  # reuses the variables created above
+            return optimizer.minimize(loss), {'loss': loss}
+
+        train_op, metrics = spt.multi_step_train_op(
+            train_step, [input_x], metric_names=['loss'])
+        trainer = spt.Trainer(loop, train_op, [input_x], train_flow,
+                              metrics=metrics, steps_per_run=10)
+
+    All the variables used by `step_fn`, including the model variables and
+    the slot variables of the optimizer, must be created before building
+    this operation, since TensorFlow does not support creating variables
+    inside a :func:`tf.while_loop`.  A TensorFlow optimizer reuses its
+    existing slot variables, thus calling ``minimize`` or ``apply_gradients``
+    once outside the loop (as above) is sufficient.  The returned operation
+    of this extra call does not need to be run.
+
+    Args:
+        step_fn ((*tf.Tensor) -> tf.Operation or
+                (tf.Operation, dict[str, tf.Tensor])): The function to build
+            the operation of one training step, and optionally the metrics of
+            this step.  It will receive the slices of `inputs` at each step.
+        inputs (Iterable[tf.Tensor]): The stacked inputs, each with the
+            steps as its first axis.  (default ``()``)
+        num_steps (int or tf.Tensor): The number of steps to run.  If not
+            specified, use the length of the first axis of ``inputs[0]``.
+            It is required if `inputs` is empty, e.g., if `step_fn` obtains
+            its inputs from an in-graph input pipeline.
+        metric_names (Iterable[str]): The names of the metrics returned by
+            `step_fn`.  (default ``()``)
+        name (str): Default name of the name scope.
+            If not specified, generate one according to the method name.
+
+    Returns:
+        (tf.Operation, dict[str, tf.Tensor]): The training operation, and the
+            metrics averaged over the steps.
+    """
+    inputs = [tf.convert_to_tensor(i) for i in inputs]
+    metric_names = tuple(metric_names)
+
+    with tf.name_scope(name, default_name='multi_step_train_op',
+                       values=inputs):
+        if num_steps is None:
+            if not inputs:
+                raise ValueError('`num_steps` must be specified if `inputs` '
+                                 'is empty.')
+            num_steps = tf.shape(inputs[0])[0]
+        num_steps = tf.convert_to_tensor(num_steps, dtype=tf.int32)
+
+        def cond(i, *metric_sums):
+            return i < num_steps
+
+        def body(i, *metric_sums):
+            step_out = step_fn(*[x[i] for x in inputs])
+            if isinstance(step_out, tuple):
+                step_op, step_metrics = step_out
+            else:
+                step_op, step_metrics = step_out, {}
+            if sorted(step_metrics) != sorted(metric_names):
+                raise ValueError('The metrics returned by `step_fn` do not '
+                                 'match `metric_names`: {!r} vs {!r}.'.
+                                 format(sorted(step_metrics),
+                                        sorted(metric_names)))
+
+            with tf.control_dependencies([step_op]):
+                return [i + 1] + [
+                    s + tf.reduce_mean(tf.cast(step_metrics[n], tf.float32))
+                    for s, n in zip(metric_sums, metric_names)
+                ]
+
+        loop_vars = [tf.constant(0, dtype=tf.int32)] + \
+            [tf.constant(0., dtype=tf.float32) for _ in metric_names]
+        loop_out = tf.while_loop(cond, body, loop_vars, back_prop=False,
+                                 parallel_iterations=1)
+        if not metric_names:
+            loop_out = [loop_out]
+
+        denominator = tf.cast(tf.maximum(num_steps, 1), tf.float32)
+        metrics = {n: s / denominator
+                   for n, s in zip(metric_names, loop_out[1:])}
+        train_op = tf.group(*loop_out)
+
+    return train_op, metrics
@@ -0,0 +1,164 @@
+from collections import OrderedDict
+
+import numpy as np
+import six
+import tensorflow as tf
+
+from tfsnippet.utils import get_default_session_or_error
+
+__all__ = ['StreamingMetrics']
+
+
+class StreamingMetrics(object):
+    """
+    Accumulate the weighted running averages of metrics in the graph.
+
+    The weighted sums of the metrics, as well as the sum of the weights,
+    are kept in local variables (which are neither saved by checkpoints,
+    nor initialized by :func:`~tfsnippet.utils.ensure_variables_initialized`).
+    Running :attr:`update_op` along with the training or evaluation operation
+    accumulates the metrics without fetching them, while :meth:`fetch`
+    obtains the averages since the last reset.  This eliminates the
+    device-to-host transfer and the Python reductions of the metrics at
+    every step.  For example::
+
+        streaming = StreamingMetrics({'loss': loss})
+        streaming.reset()
+        for batch_x in data_flow:
+            session.run([train_op, streaming.update_op], feed_dict={...})
+        print(streaming.fetch())  # {'loss': ...}
+
+    :meth:`reset` must be called before the first :attr:`update_op`, so as
+    to initialize the local variables.
+    """
+
+    def __init__(self, metrics, weight=None, name=None):
+        """
+        Construct a new :class:`StreamingMetrics`.
+
+        Args:
+            metrics (dict[str, tf.Tensor]): The metrics to accumulate.
+                All the metrics must be 0-d tensors.
+            weight (tf.Tensor or float): The weight of the metrics at each
+                update.  (default 1.)
+            name (str): Default name of the name scope.
+                If not specified, generate one according to the class name.
+        """
+        metrics = OrderedDict([
+            (str(k), tf.convert_to_tensor(v))
+            for k, v in six.iteritems(metrics)
+        ])
+        for v in six.itervalues(metrics):
+            if v.get_shape().ndims is not None and v.get_shape().ndims != 0:
+                raise ValueError('Metric is not a scalar tensor: {!r}'.
+                                 format(v))
+
+        with tf.name_scope(name, default_name='StreamingMetrics',
+                           values=list(six.itervalues(metrics))):
+            if weight is None:
+                weight = tf.constant(1., dtype=tf.float64)
+            weight = tf.cast(weight, dtype=tf.float64)
+
+            def local_variable(var_name):
+                return tf.Variable(
+                    np.zeros([], dtype=np.float64), name=var_name,
+                    trainable=False, collections=[tf.GraphKeys.LOCAL_VARIABLES]
+                )
+
+            weight_sum = local_variable('weight_sum')
+            metric_sums = [local_variable('metric_sum')
+                           for _ in six.iterkeys(metrics)]
+            all_vars = [weight_sum] + metric_sums
+
+            self._update_op = tf.group(
+                tf.assign_add(weight_sum, weight),
+                *[tf.assign_add(s, weight * tf.cast(v, dtype=tf.float64))
+                  for s, v in zip(metric_sums, six.itervalues(metrics))]
+            )
+            self._reset_op = tf.group(
+                *[tf.assign(v, tf.zeros_like(v)) for v in all_vars])
+
+            # read and reset the sums in one session run.  `tf.identity`
+            # on a ref variable shares the buffer of the variable, which
+            # would be zeroed by the reset, so copy the sums by `tf.stack`
+            read_sums = tf.stack(all_vars)
+            with tf.control_dependencies([read_sums]):
+                fetch_and_reset_op = tf.group(
+                    *[tf.assign(v, tf.zeros_like(v)) for v in all_vars])
+
+        self._metrics = metrics
+        self._weight = weight
+        self._variables = all_vars
+        self._read_sums = read_sums
+        self._fetch_and_reset_op = fetch_and_reset_op
+
+    @property
+    def metrics(self):
+        """
+        Get the metrics to accumulate.
+
+        Returns:
+            OrderedDict[str, tf.Tensor]: The metrics to accumulate.
+        """
+        return self._metrics
+
+    @property
+    def variables(self):
+        """
+        Get the local variables of the accumulated sums.
+
+        Returns:
+            list[tf.Variable]: The sum of weights, followed by the weighted
+                sums of the metrics.
+        """
+        return list(self._variables)
+
+    @property
+    def update_op(self):
+        """Get the operation to accumulate the metrics."""
+        return self._update_op
+
+    @property
+    def reset_op(self):
+        """Get the operation to reset the accumulated sums."""
+        return self._reset_op
+
+    def reset(self, session=None):
+        """
+        Reset the accumulated sums.
+
+        Args:
+            session (tf.Session): The session to use.  If not specified,
+                use the default session.
+        """
+        session = session or get_default_session_or_error()
+        session.run(self._reset_op)
+
+    def fetch(self, session=None, reset=True):
+        """
+        Fetch the weighted averages of the metrics since the last reset.
+
+        Args:
+            session (tf.Session): The session to use.  If not specified,
+                use the default session.
+            reset (bool): Whether or not to reset the accumulated sums
+                after fetching them, in the same session run?
+                (default :obj:`True`)
+
+        Returns:
+            OrderedDict[str, float]: The averages of the metrics, or an empty
+                dict if nothing (or only zero weight) has been accumulated.
+        """
+        session = session or get_default_session_or_error()
+        if reset:
+            sums = session.run(
+                [self._read_sums, self._fetch_and_reset_op])[0]
+        else:
+            sums = session.run(self._read_sums)
+        weight_sum = sums[0]
+        if not weight_sum:
+            return OrderedDict()
+        return OrderedDict([
+            (k, s / weight_sum)
+            for k, s in zip(six.iterkeys(self._metrics), sums[1:])
+        ])
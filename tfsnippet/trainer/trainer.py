@@ -1,9 +1,18 @@
+import os
+
+import numpy as np
 import six
+import tensorflow as tf
+from tensorflow.python.client import timeline
 
-from tfsnippet.scaffold import TrainLoop
-from tfsnippet.utils import is_tensor_object
+from tfsnippet.scaffold import TrainLoop, EventKeys, AsyncSummaryWriter
+from tfsnippet.scaffold.profiler import FEED_DICT, SESSION_RUN, COLLECT_METRICS
+from tfsnippet.utils import (is_tensor_object, get_default_session_or_error,
+                             makedirs)
 from .base_trainer import BaseTrainer
-from .feed_dict import resolve_feed_dict, merge_feed_dict
+from .feed_dict import FeedDictPlan
+from .gradient_accumulator import GradientAccumulator
+from .streaming_metrics import StreamingMetrics
 
 
 __all__ = ['Trainer']
@@ -65,13 +74,17 @@ class Trainer(BaseTrainer):
     """
 
     def __init__(self, loop, train_op, inputs, data_flow, feed_dict=None,
-                 metrics=None, summaries=None, 
-                 ensure_variables_initialized=True):
+                 metrics=None, summaries=None,
+                 ensure_variables_initialized=True, steps_per_run=1,
+                 steps_input=None, streaming_metrics=False,
+                 accumulate_steps=1):
         """
 
         Args:
             loop (TrainLoop): The training loop object.
-            train_op (tf.Operation): The training operation.
+            train_op (tf.Operation or GradientAccumulator): The training
+                operation, or a :class:`GradientAccumulator` if
+                `accumulate_steps` is larger than 1.
             inputs (list[tf.Tensor]): The input placeholders.
                 The number of tensors, and the order of tensors, should
                 both match the arrays of each mini-batch data, provided
@@ -84,7 +97,9 @@ class Trainer(BaseTrainer):
 
                 Dynamic values can be specified, e.g., a callable function
                 or a :class:`ScheduledVariable`, which will be resolved
-                by :func:`resolve_feed_dict` at each step.
+                at each step.  The feed dict is compiled into a
+                :class:`FeedDictPlan` at the beginning of :meth:`run`,
+                thus it should not be modified during training.
             metrics (dict[str, tf.Tensor]): Metrics to be computed along with
                 `train_op`.  The keys are the names of metrics.
             summaries (tf.Tensor or Iterable[tf.Tensor]): A tensor or a list
@@ -93,12 +108,59 @@ class Trainer(BaseTrainer):
                 If ``loop.summary_writer`` is None, then no summary will be run.
             ensure_variables_initialized (bool): Whether or not to ensure
                 the variables are initialized in :meth:`run()`?
+            steps_per_run (int): If larger than 1, `train_op` is expected to
+                run multiple training steps at a time (e.g., built by
+                :func:`multi_step_train_op`), and at most this number of
+                mini-batches from `data_flow` are stacked along a new first
+                axis and fed to `inputs` in one ``session.run``.  The
+                mini-batches with different shapes (e.g., the last incomplete
+                mini-batch) are fed in separated ``session.run``.  The step
+                counter of `loop` is advanced by the number of mini-batches
+                of each run, while the metrics (which should be averaged
+                over the steps in the graph) are collected once per
+                ``session.run``.  (default 1)
+            steps_input (tf.Tensor): A scalar placeholder, fed with the number
+                of steps of each ``session.run`` if `steps_per_run` is larger
+                than 1.  This is required for running multiple steps without
+                `data_flow` (e.g., with an in-graph input pipeline).
+            streaming_metrics (bool): If :obj:`True`, accumulate the running
+                averages of `metrics` in the graph by :class:`StreamingMetrics`,
+                instead of fetching the metrics at every step.  The averages
+                are fetched and collected into `loop` only before the logs
+                are printed, and at the end of every epoch.
+                (default :obj:`False`)
+            accumulate_steps (int): If larger than 1, each training step
+                runs this number of mini-batches from `data_flow` (i.e.,
+                micro-batches), one ``session.run`` per micro-batch.  The
+                gradients of the micro-batches are accumulated and applied
+                by `train_op`, which must be a :class:`GradientAccumulator`,
+                and the metrics are averaged over the micro-batches.  The
+                step counter of `loop` counts the optimizer steps, and the
+                last step of an epoch might have fewer micro-batches.
+                (default 1)
         """
         if loop.max_epoch is None and loop.max_step is None:
             raise ValueError('At least one of `max_epoch`, `max_step` should '
                              'be configured for `loop`.')
         if summaries is not None and is_tensor_object(summaries):
             summaries = [summaries]
+        steps_per_run = int(steps_per_run)
+        if steps_per_run < 1:
+            raise ValueError('`steps_per_run` must be at least 1.')
+        if steps_per_run > 1 and data_flow is None and steps_input is None:
+            raise ValueError('`steps_input` is required for running multiple '
+                             'steps without `data_flow`.')
+        accumulate_steps = int(accumulate_steps)
+        if accumulate_steps < 1:
+            raise ValueError('`accumulate_steps` must be at least 1.')
+        if accumulate_steps > 1:
+            if steps_per_run > 1:
+                raise ValueError('`accumulate_steps` and `steps_per_run` '
+                                 'cannot be both larger than 1.')
+            if not isinstance(train_op, GradientAccumulator):
+                raise TypeError('`train_op` must be a GradientAccumulator if '
+                                '`accumulate_steps` is larger than 1: {!r}'.
+                                format(train_op))
         super(Trainer, self).__init__(
             loop=loop,
             ensure_variables_initialized=ensure_variables_initialized
@@ -111,6 +173,34 @@ class Trainer(BaseTrainer):
         self._train_op = train_op
         self._metrics = dict(metrics or ())
         self._summaries = list(summaries or ())
+        self._steps_per_run = steps_per_run
+        self._steps_input = steps_input
+        self._accumulate_steps = accumulate_steps
+
+        # discard the gradients accumulated by the previous runs
+        if isinstance(train_op, GradientAccumulator):
+            self.events.on(EventKeys.BEFORE_EXECUTION,
+                           lambda t: train_op.reset())
+
+        # accumulate the metrics in the graph, if required
+        self._streaming_metrics = None  # type: StreamingMetrics
+        self._streaming_runs = 0  # number of runs since the last fetch
+        if streaming_metrics and self._metrics:
+            self._streaming_metrics = StreamingMetrics(self._metrics)
+            self.events.on(EventKeys.BEFORE_EXECUTION,
+                           lambda t: self._streaming_metrics.reset())
+            self.events.on(EventKeys.AFTER_EPOCH,
+                           lambda t: self._collect_streaming_metrics())
+            loop.events.on(EventKeys.BEFORE_PRINT_LOGS,
+                           lambda l: self._collect_streaming_metrics())
+
+        # the feed dict compiled at the beginning of each `run()`
+        self._feed_plan = None  # type: FeedDictPlan
+
+        # states of tracing the training steps
+        self._trace_dir = None
+        self._trace_remaining = None  # number of remaining traces
+        self._trace_requested = False
 
     @property
     def inputs(self):
@@ -144,7 +234,7 @@ class Trainer(BaseTrainer):
 
     @property
     def train_op(self):
-        """Get the training operation."""
+        """Get the training operation (or the gradient accumulator)."""
         return self._train_op
 
     @property
@@ -157,35 +247,240 @@ class Trainer(BaseTrainer):
         """Get the summaries to be computed along with `train_op`."""
         return self._summaries
 
+    @property
+    def steps_per_run(self):
+        """Get the maximum number of training steps per ``session.run``."""
+        return self._steps_per_run
+
+    @property
+    def steps_input(self):
+        """Get the placeholder fed with the number of steps of each run."""
+        return self._steps_input
+
+    @property
+    def accumulate_steps(self):
+        """Get the number of micro-batches of each training step."""
+        return self._accumulate_steps
+
+    @property
+    def streaming_metrics(self):
+        """
+        Get the :class:`StreamingMetrics` accumulating `metrics`.
+
+        Returns:
+            StreamingMetrics or None: The :class:`StreamingMetrics`, or
+                :obj:`None` if the metrics are not accumulated in the graph.
+        """
+        return self._streaming_metrics
+
+    def trace_after(self, steps, count=None, trace_dir=None):
+        """
+        Trace the training step after every few steps.
+
+        The traced step is run with ``tf.RunOptions(trace_level=FULL_TRACE)``,
+        and the timeline is written as a Chrome trace JSON file, named
+        ``timeline_step_<step>.json``, which can be viewed via
+        ``chrome://tracing``.  The step stats are also added to
+        ``loop.summary_writer`` (if any), which can be viewed in the
+        "Graphs" tab of TensorBoard.  The steps not traced are not affected.
+
+        Args:
+            steps (int): Trace the training step after every this few steps.
+            count (int or None): If specified, trace at most this number of
+                steps.  (default :obj:`None`)
+            trace_dir (str or None): The directory where to write the
+                Chrome trace files.  If not specified, use the summary
+                directory of `loop`.
+
+        Raises:
+            ValueError: If `trace_dir` is not specified, and `loop` does not
+                have a summary directory or a summary writer.
+        """
+        if trace_dir is None and self.loop.summary_dir is None and \
+                self.loop.summary_writer is None:
+            raise ValueError('`trace_dir` is required if `loop` does not '
+                             'have a summary directory or a summary writer.')
+        if count is not None:
+            count = int(count)
+        self._trace_dir = trace_dir
+        self._trace_remaining = count
+        self._add_hook(EventKeys.BEFORE_STEP, 'step', steps,
+                       self._request_trace)
+
+    def _request_trace(self):
+        if self._trace_remaining is None or self._trace_remaining > 0:
+            self._trace_requested = True
+
+    def _run_traced(self, session, fetches, feed_dict):
+        self._trace_requested = False
+        if self._trace_remaining is not None:
+            self._trace_remaining -= 1
+
+        run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+        run_metadata = tf.RunMetadata()
+        session_out = session.run(fetches, feed_dict=feed_dict,
+                                  options=run_options,
+                                  run_metadata=run_metadata)
+
+        # add the step stats to the summary writer
+        step = self.loop.step
+        summary_writer = self.loop.summary_writer
+        if isinstance(summary_writer, AsyncSummaryWriter):
+            summary_writer = summary_writer.summary_writer
+        if summary_writer is not None:
+            summary_writer.add_run_metadata(
+                run_metadata, 'step_{}'.format(step), global_step=step)
+
+        # write the Chrome trace file
+        trace_dir = self._trace_dir or self.loop.summary_dir or \
+            summary_writer.get_logdir()
+        if not os.path.isdir(trace_dir):
+            makedirs(trace_dir, exist_ok=True)
+        trace_file = os.path.join(
+            trace_dir, 'timeline_step_{}.json'.format(step))
+        with open(trace_file, 'w') as f:
+            f.write(timeline.Timeline(run_metadata.step_stats).
+                    generate_chrome_trace_format())
+
+        return session_out
+
+    def _collect_streaming_metrics(self):
+        if self._is_fitting and self._streaming_runs > 0:
+            # weight the averages by the number of runs, as if the metrics
+            # of every run were collected
+            num_runs, self._streaming_runs = self._streaming_runs, 0
+            metrics = self._streaming_metrics.fetch(
+                get_default_session_or_error())
+            if metrics:
+                self.loop.collect_weighted_metrics(metrics, num_runs)
+
+    def _iter_micro_batches(self):
+        # group the mini-batches of the data flow into the steps
+        micro_batches = []
+        for batch_data in self.data_flow:
+            micro_batches.append(batch_data)
+            if len(micro_batches) == self._accumulate_steps:
+                yield micro_batches
+                micro_batches = []
+        if micro_batches:
+            yield micro_batches
+
     def _iter_steps(self):
+        if self._accumulate_steps > 1 and self.data_flow is not None:
+            return self.loop.iter_steps(self._iter_micro_batches())
+        if self._steps_per_run > 1:
+            return self.loop.iter_multi_steps(
+                self._steps_per_run, self.data_flow)
         return self.loop.iter_steps(self.data_flow)
 
     def _run_step(self, session, payload):
-        # prepare for the feed dict of this step
-        step, batch_data = payload
-        feed_dict = resolve_feed_dict(
-            merge_feed_dict(
-                self.feed_dict,
-                zip(self.inputs, batch_data)
-            )
-        )
+        if self._accumulate_steps > 1:
+            if self.data_flow is None:
+                feeds_list = [()] * self._accumulate_steps
+            else:
+                step, micro_batches = payload
+                feeds_list = [list(zip(self.inputs, batch_data))
+                              for batch_data in micro_batches]
+            self._run_accumulated(session, feeds_list)
+        elif self._steps_per_run == 1:
+            step, batch_data = payload
+            self._run_train_op(session, zip(self.inputs, batch_data))
+        elif self.data_flow is None:
+            step, num_steps = payload
+            self._run_train_op(session, [(self._steps_input, num_steps)])
+        else:
+            # stack the consecutive mini-batches with the same shapes
+            step, batches = payload
+            start = 0
+            while start < len(batches):
+                stop = start + 1
+                shapes = [np.shape(a) for a in batches[start]]
+                while stop < len(batches) and \
+                        [np.shape(a) for a in batches[stop]] == shapes:
+                    stop += 1
+                stacked = [np.stack(arrays, axis=0)
+                           for arrays in zip(*batches[start: stop])]
+                feeds = list(zip(self.inputs, stacked))
+                if self._steps_input is not None:
+                    feeds.append((self._steps_input, stop - start))
+                self._run_train_op(session, feeds)
+                start = stop
+
+    def run(self):
+        # compile the feed dict once, since it is not expected to be
+        # changed during training
+        self._feed_plan = None
+        try:
+            super(Trainer, self).run()
+        finally:
+            self._feed_plan = None
+
+    def _run_session(self, session, feeds, train_op, last_run=True):
+        # prepare for the feed dict of this run
+        with self.loop.profile(FEED_DICT):
+            if self._feed_plan is None:
+                self._feed_plan = FeedDictPlan(self.feed_dict)
+            feed_dict = self._feed_plan.resolve(feeds, session=session)
 
         # run the training operation if batch data is not null
-        metric_names = list(six.iterkeys(self.metrics))
+        if self._streaming_metrics is not None:
+            # the metrics are accumulated in the graph, not fetched
+            train_ops = [train_op, self._streaming_metrics.update_op]
+            metric_names = []
+        else:
+            train_ops = [train_op]
+            metric_names = list(six.iterkeys(self.metrics))
         metric_tensors = [self.metrics[k] for k in metric_names]
-        if self.loop.summary_writer is not None:
+        if self.loop.summary_writer is not None and last_run:
             summary_tensors = self._summaries
         else:
             summary_tensors = []
-        session_out = session.run(
-            [self._train_op] + metric_tensors + summary_tensors,
-            feed_dict=feed_dict
-        )
-        metric_values = session_out[1: len(session_out) - len(summary_tensors)]
+        with self.loop.profile(SESSION_RUN):
+            if self._trace_requested and last_run:
+                session_out = self._run_traced(
+                    session, train_ops + metric_tensors + summary_tensors,
+                    feed_dict
+                )
+            else:
+                session_out = session.run(
+                    train_ops + metric_tensors + summary_tensors,
+                    feed_dict=feed_dict
+                )
+        metric_values = session_out[
+            len(train_ops): len(session_out) - len(summary_tensors)]
         summaries = session_out[len(session_out) - len(summary_tensors):]
+        return dict(zip(metric_names, metric_values)), summaries
 
+    def _collect_run_outputs(self, metrics, summaries):
         # collect the metrics and the summaries
-        self.loop.collect_metrics(
-            {n: v for n, v in zip(metric_names, metric_values)})
-        for summary in summaries:
-            self.loop.add_summary(summary)
+        with self.loop.profile(COLLECT_METRICS):
+            if self._streaming_metrics is None:
+                self.loop.collect_metrics(metrics)
+            else:
+                self._streaming_runs += 1
+            for summary in summaries:
+                self.loop.add_summary(summary)
+
+    def _run_train_op(self, session, feeds):
+        metrics, summaries = self._run_session(session, feeds, self._train_op)
+        self._collect_run_outputs(metrics, summaries)
+
+    def _run_accumulated(self, session, feeds_list):
+        # accumulate the gradients of all micro-batches but the last one,
+        # which applies the accumulated gradients in the same run
+        accumulator = self._train_op
+        metric_values = {}
+        summaries = []
+        for i, feeds in enumerate(feeds_list):
+            last_run = i == len(feeds_list) - 1
+            train_op = (accumulator.apply_op if last_run
+                        else accumulator.accumulate_op)
+            metrics, summaries = self._run_session(
+                session, feeds, train_op, last_run=last_run)
+            for k, v in six.iteritems(metrics):
+                metric_values.setdefault(k, []).append(v)
+
+        # average the metrics over the micro-batches
+        metrics = {k: np.mean(v, axis=0)
+                   for k, v in six.iteritems(metric_values)}
+        self._collect_run_outputs(metrics, summaries)
@@ -39,8 +39,9 @@ __all__ = [
     'TensorArgValidator', 'TensorSpec', 'TensorWrapper', 'VarScopeObject',
     'VarScopeRandomState', 'ZipExtractor', 'add_histogram',
     'add_name_and_scope_arg_doc', 'add_name_arg_doc', 'add_summary',
-    'append_arg_to_doc', 'append_to_doc', 'assert_deps', 'camel_to_underscore',
-    'concat_shapes', 'create_session', 'default_summary_collector',
+    'append_arg_to_doc', 'append_to_doc', 'assert_deps',
+    'autotune_session_threads', 'camel_to_underscore', 'concat_shapes',
+    'create_session', 'default_summary_collector',
     'deprecated', 'deprecated_arg', 'ensure_variables_initialized',
     'generate_random_seed', 'get_batch_size', 'get_cache_root',
     'get_config_defaults', 'get_config_validator', 'get_default_scope_name',
@@ -1,6 +1,13 @@
+import os
+import shutil
 import sys
 import tarfile
+import threading
 import zipfile
+from multiprocessing.pool import ThreadPool
+
+import numpy as np
+import six
 
 try:
     import rarfile
@@ -8,6 +15,8 @@ try:
 except ImportError:  # pragma: no cover
     rarfile = None
 
+from .imported import makedirs
+
 __all__ = ['Extractor', 'TarExtractor', 'ZipExtractor', 'RarExtractor']
 
 
@@ -17,6 +26,13 @@ TAR_FILE_EXTENSIONS = ('.tar',
 if sys.version_info[:2] >= (3, 3):
     TAR_FILE_EXTENSIONS = TAR_FILE_EXTENSIONS + ('.tar.xz', '.txz')
 
+DEFAULT_COPY_BUFFER_SIZE = 1024 * 1024
+"""Default buffer size for copying the archive entries into files."""
+
+DEFAULT_ARRAYS_CAPACITY = 1024
+"""Initial number of records allocated by :meth:`Extractor.extract_arrays`,
+if the number of files in the archive is not known in advance."""
+
 
 def normalize_archive_entry_name(name):
     """
@@ -30,6 +46,19 @@ def normalize_archive_entry_name(name):
     return name.replace('\\', '/')
 
 
+def _copy_entry_to_file(file_obj, file_path, buffer_size):
+    """Copy the content of an archive entry into `file_path`."""
+    file_dir = os.path.split(file_path)[0]
+    if not os.path.isdir(file_dir):
+        makedirs(file_dir, exist_ok=True)
+    try:
+        with open(file_path, 'wb') as dst_obj:
+            shutil.copyfileobj(file_obj, dst_obj, buffer_size)
+    finally:
+        if hasattr(file_obj, 'close'):
+            file_obj.close()
+
+
 class Extractor(object):
     """
     The base class for all archive extractors.
@@ -85,6 +114,140 @@ class Extractor(object):
         """
         raise NotImplementedError()
 
+    def extract_all(self, path, buffer_size=DEFAULT_COPY_BUFFER_SIZE,
+                    num_workers=None):
+        """
+        Extract all files from the archive into the directory `path`.
+
+        Args:
+            path (str): The directory, where to place the extracted files.
+                It will be created if not exist.
+            buffer_size (int): Size of the buffer for copying each file.
+                (default 1MB)
+            num_workers (int or None): Number of threads for extracting
+                the files in parallel.  It is only supported by archives
+                whose entries can be accessed independently (e.g., ".zip"),
+                and will be ignored by others.  (default :obj:`None`)
+        """
+        if not os.path.isdir(path):
+            makedirs(path, exist_ok=True)
+        for name, file_obj in self.iter_extract():
+            _copy_entry_to_file(
+                file_obj, os.path.join(path, name), buffer_size)
+
+    def map_entries(self, func, num_workers=None):
+        """
+        Apply `func` on the content of each file in the archive.
+
+        Args:
+            func ((str, bytes) -> any): The function, which receives the
+                name and the content of each file, and returns the result.
+            num_workers (int or None): Number of threads for reading the
+                files and running `func` in parallel.  It is only supported
+                by archives whose entries can be accessed independently
+                (e.g., ".zip"), and will be ignored by others.
+                (default :obj:`None`)
+
+        Returns:
+            list: The results of `func`, in the order of archive entries.
+        """
+        return list(self._iter_map_entries(func, num_workers))
+
+    def _iter_map_entries(self, func, num_workers):
+        """Iterate through the results of :meth:`map_entries`."""
+        for name, file_obj in self.iter_extract():
+            try:
+                content = file_obj.read()
+            finally:
+                if hasattr(file_obj, 'close'):
+                    file_obj.close()
+            yield func(name, content)
+
+    def _count_entries(self):
+        """
+        Get the number of files in the archive, or :obj:`None` if it cannot
+        be counted without reading through the archive.
+        """
+        return None
+
+    def extract_arrays(self, decoder, num_workers=None):
+        """
+        Decode files in the archive into packed arrays.
+
+        This method is useful for archives of many small files, e.g.,
+        image folders, where each file can be decoded into a record of
+        arrays with identical shapes.  For example::
+
+            def decoder(name, content):
+                if name.endswith('.png'):
+                    return {'x': imageio.imread(content),
+                            'y': int(name.split('/')[-2])}
+
+            with Extractor.open('images.zip') as extractor:
+                arrays = extractor.extract_arrays(decoder, num_workers=4)
+
+        Args:
+            decoder ((str, bytes) -> dict[str, np.ndarray] or None): The
+                function to decode the name and content of each file into a
+                record of arrays.  It may return :obj:`None` to skip a file.
+            num_workers (int or None): Number of threads for reading and
+                decoding the files in parallel.  See :meth:`map_entries`.
+
+        Returns:
+            dict[str, np.ndarray]: The arrays packed from the decoded records.
+                The first axis of each array is the record axis.
+
+        Raises:
+            ValueError: If no file is decoded, or if the decoded records do
+                not have the same fields.
+        """
+        # The records are copied into pre-allocated buffers as soon as
+        # they are decoded, instead of being stacked at last, such that the
+        # decoded records and the packed arrays need not to be kept in
+        # memory at the same time.
+        capacity = self._count_entries() or DEFAULT_ARRAYS_CAPACITY
+        keys = buffers = None
+        size = 0
+
+        for record in self._iter_map_entries(decoder, num_workers):
+            if record is None:
+                continue
+            values = {k: np.asarray(v) for k, v in six.iteritems(record)}
+            if buffers is None:
+                keys = sorted(values)
+                buffers = {
+                    k: np.empty((capacity,) + values[k].shape,
+                                dtype=values[k].dtype)
+                    for k in keys
+                }
+            elif sorted(values) != keys:
+                raise ValueError('The decoded records do not have the same '
+                                 'fields: {!r} vs {!r}'.
+                                 format(keys, sorted(values)))
+
+            for k in keys:
+                buf, v = buffers[k], values[k]
+                if v.shape != buf.shape[1:]:
+                    raise ValueError('The decoded records do not have the '
+                                     'same shape for field {!r}: {!r} vs '
+                                     '{!r}'.format(k, buf.shape[1:], v.shape))
+                dtype = np.result_type(buf.dtype, v.dtype)
+                if dtype != buf.dtype:
+                    buf = buffers[k] = buf.astype(dtype)
+                if size >= len(buf):
+                    # grow the buffer in place (if possible)
+                    buf.resize((len(buf) * 2,) + buf.shape[1:],
+                               refcheck=False)
+                buf[size] = v
+            size += 1
+
+        if buffers is None:
+            raise ValueError('No file in the archive has been decoded.')
+        for buf in six.itervalues(buffers):
+            if size < len(buf):
+                buf.resize((size,) + buf.shape[1:], refcheck=False)
+        return buffers
+
     @staticmethod
     def open(file_path):
         """
@@ -133,17 +296,85 @@ class ZipExtractor(Extractor):
 
     def __init__(self, fpath):
         super(ZipExtractor, self).__init__(zipfile.ZipFile(fpath, 'r'))
+        self._fpath = fpath
+
+    def _file_entries(self):
+        # ignore directory entries
+        return [mi for mi in self._archive_file.infolist()
+                if mi.filename[-1] != '/']
+
+    def _count_entries(self):
+        return len(self._file_entries())
+
+    def _parallel_imap(self, func, entries, num_workers):
+        # Each worker thread opens its own handle of the zip file, such that
+        # the entries can be decompressed concurrently without contending
+        # for the file position of a shared handle.
+        local = threading.local()
+        handles = []
+        handles_lock = threading.Lock()
+
+        def get_handle():
+            handle = getattr(local, 'handle', None)
+            if handle is None:
+                handle = local.handle = zipfile.ZipFile(self._fpath, 'r')
+                with handles_lock:
+                    handles.append(handle)
+            return handle
+
+        def worker(mi):
+            return func(
+                normalize_archive_entry_name(mi.filename),
+                get_handle().open(mi)
+            )
+
+        pool = ThreadPool(num_workers)
+        try:
+            chunk_size = max(len(entries) // (num_workers * 4), 1)
+            for ret in pool.imap(worker, entries, chunksize=chunk_size):
+                yield ret
+        finally:
+            pool.terminate()
+            pool.join()
+            for handle in handles:
+                handle.close()
 
     def iter_extract(self):
-        for mi in self._archive_file.infolist():
-            # ignore directory entries
-            if mi.filename[-1] == '/':
-                continue
+        for mi in self._file_entries():
             yield (
                 normalize_archive_entry_name(mi.filename),
                 self._archive_file.open(mi)
             )
 
+    def extract_all(self, path, buffer_size=DEFAULT_COPY_BUFFER_SIZE,
+                    num_workers=None):
+        entries = self._file_entries()
+        if not num_workers or num_workers <= 1 or len(entries) <= 1:
+            return super(ZipExtractor, self).extract_all(
+                path, buffer_size=buffer_size)
+
+        if not os.path.isdir(path):
+            makedirs(path, exist_ok=True)
+
+        def copy_entry(name, file_obj):
+            _copy_entry_to_file(
+                file_obj, os.path.join(path, name), buffer_size)
+
+        for _ in self._parallel_imap(copy_entry, entries, num_workers):
+            pass
+
+    def _iter_map_entries(self, func, num_workers):
+        entries = self._file_entries()
+        if not num_workers or num_workers <= 1 or len(entries) <= 1:
+            return super(ZipExtractor, self)._iter_map_entries(func, None)
+
+        def read_entry(name, file_obj):
+            with file_obj:
+                content = file_obj.read()
+            return func(name, content)
+
+        return self._parallel_imap(read_entry, entries, num_workers)
+
 
 class RarExtractor(Extractor):
     """Extractor for ".rar" files."""
@@ -153,6 +384,10 @@ class RarExtractor(Extractor):
             raise RuntimeError('Required package not installed: rarfile.')
         super(RarExtractor, self).__init__(rarfile.RarFile(fpath, 'r'))
 
+    def _count_entries(self):
+        return len([mi for mi in self._archive_file.infolist()
+                    if not mi.isdir()])
+
     def iter_extract(self):
         for mi in self._archive_file.infolist():
             if mi.isdir():
@@ -2,6 +2,7 @@ import os
 import shutil
 from contextlib import contextmanager
 
+import numpy as np
 import requests
 import six
 import sys
@@ -13,9 +14,11 @@ from .imported import makedirs
 from .settings_ import settings
 
 if six.PY2:
+    from urllib import url2pathname
     from urlparse import urlparse
 else:
     from urllib.parse import urlparse
+    from urllib.request import url2pathname
 
 __all__ = [
     'get_cache_root', 'set_cache_root', 'CacheDir',
@@ -23,6 +26,19 @@ __all__ = [
 
 _cache_root = None
 
+CONTENT_STORE_DIR = '_content_store'
+"""Name of the content-addressed store directory under the cache root."""
+
+DECODED_ARRAYS_MARKER = '.decoded_arrays'
+"""Name of the marker file within a directory of decoded arrays."""
+
+
+def _normalize_hash(expected_hash):
+    """Normalize `expected_hash` as lowercase hex string."""
+    if expected_hash is not None:
+        expected_hash = str(expected_hash).lower()
+    return expected_hash
+
 
 @contextmanager
 def _maybe_tqdm(tqdm_enabled, **kwargs):
@@ -87,8 +103,89 @@ def guess_extract_dir_from_filename(filename):
     return extract_dir
 
 
+def _iter_uri_content(uri, timeout=None):
+    """
+    Open `uri` for reading its content.
+
+    Returns:
+        (int or None, Iterator[bytes]): The content length (if known), and
+            the iterator of the content chunks.
+    """
+    parsed_uri = urlparse(uri)
+    if parsed_uri.scheme == 'file':
+        source_path = url2pathname(parsed_uri.path)
+        if not os.path.isfile(source_path):
+            raise IOError('File not found: {}'.format(uri))
+
+        def iter_chunks():
+            with open(source_path, 'rb') as f:
+                chunk = f.read(8192)
+                while chunk:
+                    yield chunk
+                    chunk = f.read(8192)
+
+        return os.path.getsize(source_path), iter_chunks()
+
+    req = requests.get(uri, stream=True, timeout=timeout)
+    if req.status_code != 200:
+        raise IOError('HTTP Error {}: {}'.
+                      format(req.status_code, req.content))
+    cont_length = req.headers.get('Content-Length')
+    if cont_length is not None:
+        try:
+            cont_length = int(cont_length)
+        except ValueError:  # pragma: no cover
+            cont_length = None
+    return cont_length, req.iter_content(8192)
+
+
+def link_file(source, target):
+    """
+    Make `target` a hard link of `source`, falling back to a symbolic link,
+    or to a copy of `source`, if hard links are not supported.
+    """
+    parent_dir = os.path.split(target)[0]
+    if not os.path.isdir(parent_dir):
+        makedirs(parent_dir, exist_ok=True)
+    for make_link in (getattr(os, 'link', None), getattr(os, 'symlink', None)):
+        if make_link is not None:
+            try:
+                make_link(source, target)
+                return
+            except OSError:  # pragma: no cover
+                pass
+    shutil.copyfile(source, target)  # pragma: no cover
+
+
+def link_dir(source, target):
+    """
+    Make `target` a symbolic link of the directory `source`, falling back
+    to a copy of `source`, if symbolic links are not supported.
+    """
+    parent_dir = os.path.split(target)[0]
+    if not os.path.isdir(parent_dir):
+        makedirs(parent_dir, exist_ok=True)
+    if hasattr(os, 'symlink'):
+        try:
+            os.symlink(source, target)
+            return
+        except OSError:  # pragma: no cover
+            pass
+    shutil.copytree(source, target)  # pragma: no cover
+
+
 class CacheDir(object):
-    """Class to manipulate a cache directory."""
+    """
+    Class to manipulate a cache directory.
+
+    If ``settings.file_cache_content_addressed`` is :obj:`True`, the files
+    downloaded with `expected_hash`, as well as the directories extracted
+    from them, will be stored only once in a content-addressed store under
+    `cache_root` (keyed by the verified hash), and the named entries in a
+    :class:`CacheDir` will be links into this store.  This avoids storing,
+    downloading and extracting the same content repeatedly, for different
+    :class:`CacheDir` or different URIs.
+    """
 
     def __init__(self, name, cache_root=None):
         """
@@ -143,8 +240,40 @@ class CacheDir(object):
         with FileLock(lock_file):
             yield
 
+    def _content_path(self, hasher, expected_hash):
+        """
+        Get the path of the content `expected_hash` in the content-addressed
+        store, or :obj:`None` if the store should not be used.
+        """
+        if not settings.file_cache_content_addressed or \
+                hasher is None or expected_hash is None:
+            return None
+        hasher_name = getattr(hasher, 'name', None)
+        if not hasher_name:  # pragma: no cover
+            return None
+        return os.path.join(self._cache_root, CONTENT_STORE_DIR,
+                            hasher_name, expected_hash)
+
     def _download(self, uri, file_path, show_progress, progress_file,
-                  hasher=None, expected_hash=None):
+                  hasher=None, expected_hash=None, timeout=None):
+        content_path = self._content_path(hasher, expected_hash)
+        if content_path is not None and not os.path.isfile(file_path):
+            with self._lock_file(content_path):
+                self._download_file(
+                    uri, content_path, show_progress=show_progress,
+                    progress_file=progress_file, hasher=hasher,
+                    expected_hash=expected_hash, timeout=timeout
+                )
+            link_file(content_path, file_path)
+            return file_path
+        return self._download_file(
+            uri, file_path, show_progress=show_progress,
+            progress_file=progress_file, hasher=hasher,
+            expected_hash=expected_hash, timeout=timeout
+        )
+
+    def _download_file(self, uri, file_path, show_progress, progress_file,
+                       hasher=None, expected_hash=None, timeout=None):
         if os.path.isfile(file_path):
             if settings.file_cache_checksum and hasher is not None:
                 with open(file_path, 'rb') as f:
@@ -174,22 +303,14 @@ class CacheDir(object):
                                  unit='B', unit_scale=True, unit_divisor=1024,
                                  miniters=1, file=progress_file) as t, \
                         open(temp_file, 'wb') as f:
-                    req = requests.get(uri, stream=True)
-                    if req.status_code != 200:
-                        raise IOError('HTTP Error {}: {}'.
-                                      format(req.status_code, req.content))
+                    cont_length, chunks = _iter_uri_content(uri, timeout)
 
                     # detect the total length
-                    if t is not None:
-                        cont_length = req.headers.get('Content-Length')
-                        if cont_length is not None:
-                            try:
-                                t.total = int(cont_length)
-                            except ValueError:  # pragma: no cover
-                                pass
+                    if t is not None and cont_length is not None:
+                        t.total = cont_length
 
                     # do download the content
-                    for chunk in req.iter_content(8192):
+                    for chunk in chunks:
                         if chunk:
                             f.write(chunk)
                             if hasher is not None:
@@ -221,7 +342,8 @@ class CacheDir(object):
         return file_path
 
     def download(self, uri, filename=None, show_progress=None,
-                 progress_file=sys.stderr, hasher=None, expected_hash=None):
+                 progress_file=sys.stderr, hasher=None, expected_hash=None,
+                 timeout=None):
         """
         Download a file into this :class:`CacheDir`.
 
@@ -241,6 +363,9 @@ class CacheDir(object):
                 If specified, will compute the hash of downloaded content,
                 and validate against `expected_hash`.
             expected_hash (str): The expected hash of downloaded content.
+            timeout (float or (float, float)): The connect (and read)
+                timeout in seconds of the HTTP request.  (default
+                :obj:`None`, wait forever)
 
         Returns:
             str: The absolute path of the downloaded file.
@@ -250,6 +375,7 @@ class CacheDir(object):
         """
         # check the arguments
         show_progress = guess_show_progress_arg(progress_file, show_progress)
+        expected_hash = _normalize_hash(expected_hash)
 
         if filename is None:
             filename = guess_filename_from_uri(uri)
@@ -260,24 +386,49 @@ class CacheDir(object):
             return self._download(
                 uri, file_path, show_progress=show_progress,
                 progress_file=progress_file, hasher=hasher,
-                expected_hash=expected_hash
+                expected_hash=expected_hash, timeout=timeout
+            )
+
+    @staticmethod
+    def _check_extracted(extract_path, decoder):
+        """
+        Check whether or not the existing `extract_path` is extracted
+        with (or without) `decoder`, as is requested.
+        """
+        is_decoded = os.path.isfile(
+            os.path.join(extract_path, DECODED_ARRAYS_MARKER))
+        if is_decoded != (decoder is not None):
+            raise IOError(
+                'The existing directory {!r} is extracted {} `decoder`, '
+                'which does not match the request; use another '
+                '`extract_dir` instead.'.
+                format(extract_path, 'with' if is_decoded else 'without')
             )
+        return extract_path
 
     def _extract_file(self, archive_file, extract_path, show_progress,
-                      progress_file):
-        if not os.path.isdir(extract_path):
+                      progress_file, decoder=None, num_workers=None):
+        if os.path.isdir(extract_path):
+            self._check_extracted(extract_path, decoder)
+        else:
             temp_path = extract_path + '._extracting_'
             progress_file.write('Extracting {} ... '.format(archive_file))
             progress_file.flush()
             try:
                 with Extractor.open(archive_file) as extractor:
-                    for name, file_obj in extractor:
-                        file_path = os.path.join(temp_path, name)
-                        file_dir = os.path.split(file_path)[0]
-                        if not os.path.isdir(file_dir):
-                            makedirs(file_dir, exist_ok=True)
-                        with open(file_path, 'wb') as dst_obj:
-                            shutil.copyfileobj(file_obj, dst_obj)
+                    if decoder is not None:
+                        arrays = extractor.extract_arrays(
+                            decoder, num_workers=num_workers)
+                        makedirs(temp_path, exist_ok=True)
+                        for key, arr in six.iteritems(arrays):
+                            np.save(os.path.join(temp_path, key + '.npy'), arr)
+                        with open(os.path.join(temp_path,
+                                               DECODED_ARRAYS_MARKER),
+                                  'wb'):
+                            pass
+                    else:
+                        extractor.extract_all(
+                            temp_path, num_workers=num_workers)
             except BaseException:
                 progress_file.write('error\n')
                 progress_file.flush()
@@ -291,7 +442,7 @@ class CacheDir(object):
         return extract_path
 
     def extract_file(self, archive_file, extract_dir=None, show_progress=None,
-                     progress_file=sys.stderr):
+                     progress_file=sys.stderr, decoder=None, num_workers=None):
         """
         Extract an archive file into this :class:`CacheDir`.
 
@@ -307,12 +458,23 @@ class CacheDir(object):
                 if `progress_file.isatty()` is :obj:`True`.
             progress_file: The file object where to write the progress.
                 (default :obj:`sys.stderr`)
+            decoder ((str, bytes) -> dict[str, np.ndarray] or None): If
+                specified, decode the files in the archive into records of
+                arrays, and save the packed arrays as ``<field>.npy`` files
+                in the extracted directory, instead of extracting the files.
+                See :meth:`Extractor.extract_arrays`. (default :obj:`None`)
+            num_workers (int or None): Number of threads for extracting
+                the archive in parallel.  See :meth:`Extractor.extract_all`.
+                (default :obj:`None`)
 
         Returns:
             str: The absolute path of the extracted directory.
 
         Raises:
             ValueError: If `extract_dir` cannot be inferred.
+            IOError: If `extract_dir` already exists, but is extracted
+                with `decoder` while `decoder` is not specified, or vice
+                versa.
         """
         # check the arguments
         show_progress = guess_show_progress_arg(progress_file, show_progress)
@@ -327,12 +489,14 @@ class CacheDir(object):
         with self._lock_file(archive_file):
             return self._extract_file(
                 archive_file, extract_path, show_progress=show_progress,
-                progress_file=progress_file
+                progress_file=progress_file, decoder=decoder,
+                num_workers=num_workers
             )
 
     def download_and_extract(self, uri, filename=None, extract_dir=None,
                              show_progress=None, progress_file=sys.stderr,
-                             hasher=None, expected_hash=None):
+                             hasher=None, expected_hash=None, decoder=None,
+                             num_workers=None, timeout=None):
         """
         Download a file into this :class:`CacheDir`, and extract it.
 
@@ -356,15 +520,26 @@ class CacheDir(object):
                 If specified, will compute the hash of downloaded content,
                 and validate against `expected_hash`.
             expected_hash (str): The expected hash of downloaded content.
+            decoder ((str, bytes) -> dict[str, np.ndarray] or None): If
+                specified, save the decoded arrays as ``<field>.npy`` files
+                instead of extracting the files.  See :meth:`extract_file`.
+            num_workers (int or None): Number of threads for extracting
+                the archive in parallel.  See :meth:`extract_file`.
+            timeout (float or (float, float)): The timeout of the HTTP
+                request.  See :meth:`download`.
 
         Returns:
             str: The absolute path of the extracted directory.
 
         Raises:
             ValueError: If `filename` or `extract_dir` cannot be inferred.
+            IOError: If `extract_dir` already exists, but is extracted
+                with `decoder` while `decoder` is not specified, or vice
+                versa.
         """
         # check the arguments
         show_progress = guess_show_progress_arg(progress_file, show_progress)
+        expected_hash = _normalize_hash(expected_hash)
 
         if filename is None:
             filename = guess_filename_from_uri(uri)
@@ -376,15 +551,44 @@ class CacheDir(object):
 
         # download and extract the file
         with self._lock_file(file_path):
-            if not os.path.isdir(extract_path):
+            if os.path.isdir(extract_path):
+                return self._check_extracted(extract_path, decoder)
+
+            content_path = None
+            if decoder is None:
+                content_path = self._content_path(hasher, expected_hash)
+
+            if content_path is not None:
+                # extract into the content-addressed store, and link the
+                # extracted directory from there
+                content_extract_path = content_path + '._extracted_'
+                with self._lock_file(content_extract_path):
+                    if not os.path.isdir(content_extract_path):
+                        archive_file = self._download(
+                            uri, file_path, show_progress=show_progress,
+                            progress_file=progress_file, hasher=hasher,
+                            expected_hash=expected_hash, timeout=timeout
+                        )
+                        self._extract_file(
+                            archive_file, content_extract_path,
+                            show_progress=show_progress,
+                            progress_file=progress_file,
+                            num_workers=num_workers
+                        )
+                        # remove the link to the archive file, while the
+                        # archive file is kept in the store
+                        os.remove(file_path)
+                link_dir(content_extract_path, extract_path)
+            else:
                 archive_file = self._download(
                     uri, file_path, show_progress=show_progress,
                     progress_file=progress_file, hasher=hasher,
-                    expected_hash=expected_hash
+                    expected_hash=expected_hash, timeout=timeout
                 )
                 self._extract_file(
                     archive_file, extract_path, show_progress=show_progress,
-                    progress_file=progress_file
+                    progress_file=progress_file, decoder=decoder,
+                    num_workers=num_workers
                 )
                 # download the archive file if we successfully extracted it.
                 os.remove(file_path)
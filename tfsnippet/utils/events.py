@@ -1,3 +1,5 @@
+import time
+
 __all__ = ['EventSource']
 
 
@@ -46,6 +48,7 @@ class EventSource(object):
             allowed_event_keys = tuple(filter(str, allowed_event_keys))
         self._event_handlers_map = {}  # type: dict[str, list]
         self._allowed_event_keys = allowed_event_keys
+        self._handler_timer = None
 
     def on(self, event_key, handler):
         """
@@ -85,6 +88,18 @@ class EventSource(object):
             raise ValueError('`handler` is not a registered event handler of '
                              'event `{}`: {}'.format(event_key, handler))
 
+    def get_event_handlers(self, event_key):
+        """
+        Get the registered handlers of an event.
+
+        Args:
+            event_key (str): The event key.
+
+        Returns:
+            list: The event handlers, in the order of registration.
+        """
+        return list(self._event_handlers_map.get(str(event_key), ()))
+
     def _fire(self, event_key, args, kwargs, reverse=False):
         event_key = str(event_key)
         if self._allowed_event_keys is not None and \
@@ -92,8 +107,46 @@ class EventSource(object):
             raise KeyError('`event_key` is not allowed: {}'.format(event_key))
         event_handlers = self._event_handlers_map.get(event_key, None)
         if event_handlers:
+            handler_timer = self._handler_timer
             for h in (reversed(event_handlers) if reverse else event_handlers):
-                h(*args, **kwargs)
+                if handler_timer is None or \
+                        getattr(type(h), 'times_own_handlers', False):
+                    h(*args, **kwargs)
+                else:
+                    start_time = time.time()
+                    try:
+                        h(*args, **kwargs)
+                    finally:
+                        handler_timer(event_key, h, time.time() - start_time)
+
+    def set_handler_timer(self, timer):
+        """
+        Set the callback to receive the time spent in each event handler.
+
+        Args:
+            timer ((str, handler, float) -> None): The callback, which
+                receives the event key, the event handler, and the time
+                spent in this handler in seconds.  :obj:`None` to disable
+                timing the event handlers.
+
+        Notes:
+            A handler whose class has the attribute
+            ``times_own_handlers = True`` dispatches the event to other
+            handlers, and should report their time to :attr:`handler_timer`
+            by itself.
+        """
+        self._handler_timer = timer
+
+    @property
+    def handler_timer(self):
+        """
+        Get the callback to receive the time spent in each event handler.
+
+        Returns:
+            ((str, handler, float) -> None) or None: The callback, or
+                :obj:`None` if the event handlers are not timed.
+        """
+        return self._handler_timer
 
     def fire(self, event_key, *args, **kwargs):
         """
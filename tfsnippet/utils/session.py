@@ -1,8 +1,21 @@
+import codecs
+import hashlib
+import json
+import multiprocessing as mp
+import os
+import socket
+import time
+from contextlib import contextmanager
+
 import six
 import tensorflow as tf
 
+from .caching import get_cache_root
+from .imported import makedirs
+
 __all__ = [
     'create_session',
+    'autotune_session_threads',
     'get_default_session_or_error',
     'get_variables_as_dict',
     'get_uninitialized_variables',
@@ -11,13 +24,58 @@ __all__ = [
 ]
 
 
+def _parse_cpu_list(s):
+    """Parse a Linux CPU list string, e.g., "0-3,8-11"."""
+    ret = []
+    for piece in s.strip().split(','):
+        if piece:
+            if '-' in piece:
+                start, stop = piece.split('-', 1)
+                ret.extend(range(int(start), int(stop) + 1))
+            else:
+                ret.append(int(piece))
+    return ret
+
+
+def _numa_node_cpus(numa_node):
+    path = '/sys/devices/system/node/node{}/cpulist'.format(numa_node)
+    try:
+        with open(path, 'r') as f:
+            return _parse_cpu_list(f.read())
+    except (IOError, OSError, ValueError):
+        raise RuntimeError('Cannot determine the CPUs of NUMA node {}.'.
+                           format(numa_node))
+
+
+def _available_cpu_count():
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return mp.cpu_count()
+
+
 def create_session(lock_memory=True,
                    log_device_placement=False,
                    allow_soft_placement=True,
+                   cpu_threads=None,
+                   inter_op=None,
+                   numa_node=None,
+                   use_per_session_threads=None,
                    **kwargs):
     """
     A convenient method to create a TensorFlow session.
 
+    By default, TensorFlow sizes both the intra-op and the inter-op thread
+    pools by the number of CPU cores, which oversubscribes the CPUs when
+    several jobs or towers share the same machine.  The thread pools can be
+    limited by `cpu_threads` and `inter_op`, for example::
+
+        # two jobs sharing a 16-core machine, each on its own NUMA node
+        session = create_session(numa_node=0)  # cpu_threads = 8, inter_op = 2
+        session = create_session(numa_node=1)
+
+    See :func:`autotune_session_threads` for choosing the thread budgets by
+    benchmarking.
+
     Args:
         lock_memory (True or False or float):
 
@@ -34,11 +92,57 @@ def create_session(lock_memory=True,
             nodes.   (default :obj:`False`)
         allow_soft_placement (bool): Whether or not to allow soft placement?
             (default :obj:`True`)
+        cpu_threads (int): The number of threads of the intra-op thread pool.
+            If not specified, use the number of CPUs of `numa_node` if it
+            is specified, or the TensorFlow default otherwise.
+        inter_op (int): The number of threads of the inter-op thread pool.
+            If not specified, use ``min(2, cpu_threads)`` if `cpu_threads`
+            is determined, or the TensorFlow default otherwise.
+        numa_node (int): If specified, pin the current process to the CPUs
+            of this NUMA node (Linux only).  Note this affects the whole
+            process, not only the created session.
+        use_per_session_threads (bool): Whether or not to use thread pools
+            owned by this session, instead of the global thread pools shared
+            by all the sessions in the process?  (default :obj:`None`, use
+            the TensorFlow default)
         \\**kwargs: Other named parameters to be passed to `tf.ConfigProto`.
 
     Returns:
         tf.Session: The TensorFlow session.
     """
+    if (cpu_threads is not None or numa_node is not None) and \
+            'intra_op_parallelism_threads' in kwargs:
+        raise ValueError('`cpu_threads` and `numa_node` cannot be specified '
+                         'along with `intra_op_parallelism_threads`.')
+    if inter_op is not None and 'inter_op_parallelism_threads' in kwargs:
+        raise ValueError('`inter_op` cannot be specified along with '
+                         '`inter_op_parallelism_threads`.')
+
+    if numa_node is not None:
+        cpus = _numa_node_cpus(numa_node)
+        if not cpus or not hasattr(os, 'sched_setaffinity'):
+            raise RuntimeError('Cannot determine the CPUs of NUMA node {}.'.
+                               format(numa_node))
+        os.sched_setaffinity(0, cpus)
+        if cpu_threads is None:
+            cpu_threads = len(cpus)
+    if cpu_threads is not None:
+        cpu_threads = int(cpu_threads)
+        if cpu_threads < 1:
+            raise ValueError('`cpu_threads` must be at least 1: got {!r}.'.
+                             format(cpu_threads))
+        kwargs['intra_op_parallelism_threads'] = cpu_threads
+        if inter_op is None:
+            inter_op = min(2, cpu_threads)
+    if inter_op is not None:
+        inter_op = int(inter_op)
+        if inter_op < 1:
+            raise ValueError('`inter_op` must be at least 1: got {!r}.'.
+                             format(inter_op))
+        kwargs['inter_op_parallelism_threads'] = inter_op
+    if use_per_session_threads is not None:
+        kwargs['use_per_session_threads'] = bool(use_per_session_threads)
+
     config = tf.ConfigProto(log_device_placement=log_device_placement,
                             allow_soft_placement=allow_soft_placement,
                             **kwargs)
@@ -52,6 +156,143 @@ def create_session(lock_memory=True,
     return session
 
 
+def _host_signature(name=None):
+    """Get the signature of the current host, for caching tuned results."""
+    cpus = (sorted(os.sched_getaffinity(0))
+            if hasattr(os, 'sched_getaffinity') else mp.cpu_count())
+    key = json.dumps([socket.gethostname(), mp.cpu_count(), cpus,
+                      tf.__version__, name])
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _default_thread_candidates():
+    n = _available_cpu_count()
+    threads = []
+    t = 1
+    while t < n:
+        threads.append(t)
+        t *= 2
+    threads.append(n)
+    return [(t, i) for t in threads for i in sorted({1, min(2, t)})]
+
+
+def autotune_session_threads(step_fn, candidates=None, n_steps=10,
+                             warmup_steps=2, name=None, cache=True,
+                             cache_root=None):
+    """
+    Choose the thread budgets of sessions by benchmarking `step_fn`.
+
+    Each candidate ``(cpu_threads, inter_op)``, i.e., the sizes of the
+    intra-op and the inter-op thread pools, is benchmarked by creating a
+    session for the default graph via :func:`create_session` (with
+    `use_per_session_threads` enabled, such that each candidate gets its
+    own thread pools), initializing the variables, and timing `n_steps`
+    calls of ``step_fn(session)`` after `warmup_steps` calls.  For example::
+
+        train_op = ...
+
+        def step_fn(session):
+            session.run(train_op, feed_dict={input_x: x_batch})
+
+        session = create_session(**autotune_session_threads(step_fn))
+
+    The benchmark sessions own their copies of the variables, which are
+    discarded after benchmarking, thus running the training operation in
+    `step_fn` does not change the model.  In case `step_fn` runs on the
+    default session rather than the given one, the initialized global
+    variables of the default session (if any) are restored after
+    benchmarking.
+
+    The best candidate is cached under the cache root (see
+    :func:`~tfsnippet.utils.get_cache_root`), keyed by the signature of the
+    current host (host name, CPU affinity and TensorFlow version) and
+    `name`, such that the benchmark will only be run once on each host.
+
+    Args:
+        step_fn ((tf.Session) -> any): The function to run one step of the
+            workload.
+        candidates (Iterable[(int, int)]): The candidate ``(cpu_threads,
+            inter_op)`` pairs.  If not specified, use the powers of 2 up
+            to the number of available CPUs (plus the number itself) as
+            `cpu_threads`, each with `inter_op` being 1 and 2.
+        n_steps (int): The number of timed steps.
+        warmup_steps (int): The number of warm-up steps, not timed.
+        name (str): The name of the workload, as part of the cache key.
+            Workloads with different characteristics should use different
+            names.
+        cache (bool): Whether or not to read and write the cache?
+            (default :obj:`True`)
+        cache_root (str): The cache root directory.  If not specified,
+            use ``get_cache_root()``.
+
+    Returns:
+        dict[str, any]: The named arguments ``cpu_threads``, ``inter_op``
+            and ``use_per_session_threads`` for :func:`create_session`,
+            i.e., the full thread configuration of the chosen session.
+    """
+    cache_path = os.path.join(
+        cache_root or get_cache_root(), 'session_threads',
+        '{}.json'.format(_host_signature(name))
+    )
+    if cache and os.path.isfile(cache_path):
+        with codecs.open(cache_path, 'rb', 'utf-8') as f:
+            cached = json.load(f)
+        return {'cpu_threads': cached['cpu_threads'],
+                'inter_op': cached['inter_op'],
+                'use_per_session_threads':
+                    cached.get('use_per_session_threads', True)}
+
+    if candidates is None:
+        candidates = _default_thread_candidates()
+    candidates = [(int(t), int(i)) for t, i in candidates]
+    if not candidates:
+        raise ValueError('`candidates` must not be empty.')
+
+    # take a snapshot of the variables of the default session, in case
+    # `step_fn` runs on it rather than on the benchmark sessions
+    outer_session = tf.get_default_session()
+    snapshot = []
+    if outer_session is not None:
+        variables = tf.global_variables()
+        uninitialized = set(get_uninitialized_variables(variables))
+        variables = [v for v in variables if v not in uninitialized]
+        if variables:
+            snapshot = list(zip(variables, outer_session.run(variables)))
+
+    best = None
+    try:
+        for cpu_threads, inter_op in candidates:
+            session = create_session(
+                cpu_threads=cpu_threads, inter_op=inter_op,
+                use_per_session_threads=True
+            )
+            try:
+                with session.as_default():
+                    ensure_variables_initialized()
+                    for _ in range(warmup_steps):
+                        step_fn(session)
+                    start_time = time.time()
+                    for _ in range(n_steps):
+                        step_fn(session)
+                    seconds = (time.time() - start_time) / max(n_steps, 1)
+            finally:
+                session.close()
+            if best is None or seconds < best[0]:
+                best = (seconds, cpu_threads, inter_op)
+    finally:
+        for var, value in snapshot:
+            var.load(value, outer_session)
+
+    seconds, cpu_threads, inter_op = best
+    config = {'cpu_threads': cpu_threads, 'inter_op': inter_op,
+              'use_per_session_threads': True}
+    if cache:
+        makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with codecs.open(cache_path, 'wb', 'utf-8') as f:
+            f.write(json.dumps(dict(config, seconds_per_step=seconds)))
+    return config
+
+
 def get_default_session_or_error():
     """
     Get the default session.
@@ -104,10 +345,46 @@ def get_variables_as_dict(scope=None, collection=tf.GraphKeys.GLOBAL_VARIABLES):
     }
 
 
+def _get_variables_ops_cache(graph):
+    """
+    Get the cache of the operations built by
+    :func:`get_uninitialized_variables` and
+    :func:`ensure_variables_initialized` for `graph`.
+
+    The cache is attached to the graph object, such that it has the same
+    lifetime as the graph.
+    """
+    cache = getattr(graph, '_tfsnippet_variables_ops_cache', None)
+    if cache is None:
+        cache = {'is_initialized': {}, 'initializer': {}}
+        graph._tfsnippet_variables_ops_cache = cache
+    return cache
+
+
+@contextmanager
+def _cached_ops_scope(graph, name, default_name):
+    """
+    Open a scope for building the cached operations in `graph`.
+
+    The control dependencies, the control flow context, the device, the
+    colocation and the name scope of the caller are all cleared, since
+    the cached operations will be reused by later calls in other contexts.
+    """
+    with graph.as_default(), graph.control_dependencies(None), \
+            graph.device(None), \
+            graph.colocate_with(None, ignore_existing=True), \
+            graph.name_scope(None), \
+            tf.name_scope(name, default_name=default_name):
+        yield
+
+
 def get_uninitialized_variables(variables=None, name=None):
     """
     Get uninitialized variables as a list.
 
+    The operation to check the variables is built only once for each
+    (ordered) set of variables in a graph, and reused afterwards.
+
     Args:
         variables (list[tf.Variable]): Collect only uninitialized variables
             within this list. If not specified, will collect all uninitialized
@@ -122,10 +399,17 @@ def get_uninitialized_variables(variables=None, name=None):
         variables = tf.global_variables()
     else:
         variables = list(variables)
-    with tf.name_scope(name, default_name='get_uninitialized_variables'):
-        init_flag = sess.run(tf.stack(
-            [tf.is_variable_initialized(v) for v in variables]
-        ))
+    if not variables:
+        return []
+
+    graph = tf.get_default_graph()
+    cache = _get_variables_ops_cache(graph)['is_initialized']
+    key = tuple(variables)
+    if key not in cache:
+        with _cached_ops_scope(graph, name, 'get_uninitialized_variables'):
+            cache[key] = tf.stack(
+                [tf.is_variable_initialized(v) for v in variables])
+    init_flag = sess.run(cache[key])
     return [v for v, f in zip(variables, init_flag) if not f]
 
 
@@ -133,6 +417,11 @@ def ensure_variables_initialized(variables=None, name=None):
     """
     Ensure variables are initialized.
 
+    The operations to check and to initialize the variables are built only
+    once for each (ordered) set of variables in a graph, and reused
+    afterwards, thus calling this method repeatedly (e.g., at every
+    :meth:`~tfsnippet.trainer.BaseTrainer.run`) would not grow the graph.
+
     Args:
         variables (list[tf.Variable] or dict[str, tf.Variable]): Ensure only
             the variables within this collection to be initialized. If not
@@ -141,13 +430,20 @@ def ensure_variables_initialized(variables=None, name=None):
         name (str): TensorFlow name scope of the graph nodes. (default
             `ensure_variables_initialized`)
     """
-    with tf.name_scope(name, default_name='ensure_variables_initialized'):
-        if isinstance(variables, dict):
-            variables = list(six.itervalues(variables))
-        uninitialized = get_uninitialized_variables(variables)
-        if uninitialized:
-            sess = get_default_session_or_error()
-            sess.run(tf.variables_initializer(uninitialized))
+    if isinstance(variables, dict):
+        variables = list(six.itervalues(variables))
+    uninitialized = get_uninitialized_variables(
+        variables, name=name or 'ensure_variables_initialized')
+    if uninitialized:
+        sess = get_default_session_or_error()
+        graph = tf.get_default_graph()
+        cache = _get_variables_ops_cache(graph)['initializer']
+        key = tuple(uninitialized)
+        if key not in cache:
+            with _cached_ops_scope(graph, name,
+                                   'ensure_variables_initialized'):
+                cache[key] = tf.variables_initializer(uninitialized)
+        sess.run(cache[key])
 
 
 def get_variable_ddi(name,
@@ -24,6 +24,13 @@ class TFSnippetConfig(Config):
         bool, default=False,
         description='Whether or not to validate the checksum of cached files?'
     )
+    file_cache_content_addressed = ConfigField(
+        bool, default=False,
+        description='Whether or not to store the cached files downloaded with '
+                    'known hash (and the directories extracted from them) in '
+                    'a content-addressed store under the cache root, and to '
+                    'link the named cache entries into this store?'
+    )
 
 
 settings = TFSnippetConfig()
@@ -1,33 +1,158 @@
+import math
+
 import numpy as np
 
 __all__ = ['StatisticsCollector']
 
 
+class _TDigest(object):
+    """
+    A merging t-digest for estimating the quantiles of a stream of scalars.
+
+    The values are buffered, and merged into at most about `compression`
+    centroids when the buffer is full, according to the ``k_1`` scale
+    function of Dunning & Ertl, which keeps the centroids near the tails
+    small, thus the extreme quantiles accurate.
+    """
+
+    def __init__(self, compression=100):
+        self._compression = float(compression)
+        self._buffer_size = int(5 * compression)
+        self.reset()
+
+    def reset(self):
+        self._means = np.zeros([0], dtype=np.float64)
+        self._weights = np.zeros([0], dtype=np.float64)
+        self._buffer = []  # [(means, weights)]
+        self._buffer_count = 0
+        self._min = np.inf
+        self._max = -np.inf
+
+    def _k(self, q):
+        q = min(max(q, 0.), 1.)
+        return self._compression / (2. * math.pi) * math.asin(2. * q - 1.)
+
+    def _k_inv(self, k):
+        if k >= self._compression / 4.:
+            return 1.
+        return (math.sin(k * 2. * math.pi / self._compression) + 1.) / 2.
+
+    def add(self, values, weights):
+        values = np.asarray(values, dtype=np.float64).reshape([-1])
+        weights = np.asarray(weights, dtype=np.float64).reshape([-1])
+        mask = weights > 0
+        if not np.all(mask):
+            values, weights = values[mask], weights[mask]
+        if values.size:
+            self._min = min(self._min, np.min(values))
+            self._max = max(self._max, np.max(values))
+            self._buffer.append((values, weights))
+            self._buffer_count += values.size
+            if self._buffer_count >= self._buffer_size:
+                self._compress()
+
+    def merge(self, other):
+        other._compress()
+        if other._means.size:
+            self._min = min(self._min, other._min)
+            self._max = max(self._max, other._max)
+            self._buffer.append((other._means, other._weights))
+            self._buffer_count += other._means.size
+            self._compress()
+
+    def _compress(self):
+        if not self._buffer:
+            return
+        means = np.concatenate([self._means] + [m for m, _ in self._buffer])
+        weights = np.concatenate(
+            [self._weights] + [w for _, w in self._buffer])
+        self._buffer = []
+        self._buffer_count = 0
+
+        order = np.argsort(means, kind='mergesort')
+        means, weights = means[order], weights[order]
+        cum_q = np.cumsum(weights) / np.sum(weights)
+
+        # Each centroid greedily absorbs the following values as long as
+        # the cumulative weight is within the k-limit of the centroid.
+        # Since `cum_q` is sorted, the end of each centroid is found by
+        # binary search, thus the loop runs once per centroid instead of
+        # once per value.
+        starts = []
+        start, count = 0, len(means)
+        while start < count:
+            starts.append(start)
+            q_limit = self._k_inv(
+                self._k(cum_q[start - 1] if start > 0 else 0.) + 1.)
+            end = int(np.searchsorted(cum_q, q_limit, side='right'))
+            start = max(end, start + 1)
+
+        starts = np.asarray(starts, dtype=np.int64)
+        self._weights = np.add.reduceat(weights, starts)
+        self._means = np.add.reduceat(means * weights, starts) / self._weights
+
+    def quantile(self, q):
+        self._compress()
+        if not self._means.size:
+            return np.full(np.shape(q), np.nan)
+        # interpolate between the centers of the centroids, and the
+        # extreme values at both ends
+        centers = np.cumsum(self._weights) - self._weights / 2.
+        total = np.sum(self._weights)
+        positions = np.concatenate([[0.], centers, [total]])
+        values = np.concatenate([[self._min], self._means, [self._max]])
+        return np.interp(np.asarray(q) * total, positions, values)
+
+
 class StatisticsCollector(object):
     """
     Computing :math:`\\mathrm{E}[X]` and :math:`\\operatorname{Var}[X]` online.
+
+    The weighted mean and the weighted sum of squared deviations from the
+    mean are maintained in float64, and updated by the parallel algorithm
+    of Chan et al., which is numerically stable even if the mean is much
+    larger than the standard deviation.  Collectors of the same shape can
+    be combined by :meth:`merge`, e.g., the collectors filled by different
+    threads or processes.
+
+    If `quantiles` is :obj:`True`, the quantiles of the values are also
+    estimated by a t-digest, which can be obtained by :meth:`quantile`.
+    This is only supported for scalar values.
     """
 
-    def __init__(self, shape=()):
+    def __init__(self, shape=(), quantiles=False, compression=100):
         """
         Construct the :class:`StatisticsCollector`.
 
         Args:
             shape: Shape of the values. The statistics will be collected for
                 per element of the values. (default is ``()``).
+            quantiles (bool): Whether or not to estimate the quantiles of
+                the values? (default :obj:`False`)
+            compression (int): The compression parameter of the t-digest.
+                Larger value keeps more centroids, thus gives more accurate
+                quantiles.  (default 100)
+
+        Raises:
+            ValueError: If `quantiles` is :obj:`True` but `shape` is not
+                ``()``.
         """
+        shape = tuple(shape)
+        if quantiles and shape:
+            raise ValueError('`quantiles` is only supported for scalar '
+                             'values.')
         self._shape = shape
-        self._mean = np.zeros(shape=shape)      # E[X]
-        self._square = np.zeros(shape=shape)    # E[X^2]
-        self._counter = 0
-        self._weight_sum = 0.
+        self._digest = _TDigest(compression) if quantiles else None
+        self.reset()
 
     def reset(self):
         """Reset the collector to initial state."""
-        self._mean = np.zeros(shape=self._shape)
-        self._square = np.zeros(shape=self._shape)
+        self._mean = np.zeros(shape=self._shape, dtype=np.float64)  # E[X]
+        self._m2 = np.zeros(shape=self._shape, dtype=np.float64)  # W*Var[X]
         self._counter = 0
         self._weight_sum = 0.
+        if self._digest is not None:
+            self._digest.reset()
 
     @property
     def shape(self):
@@ -42,14 +167,16 @@ class StatisticsCollector(object):
     @property
     def square(self):
         """Get :math:`\\mathrm{E}[X^2]` of the values."""
-        return self._square
+        return self.var + self._mean ** 2
 
     @property
     def var(self):
         """
         Get the variance of the values, i.e., :math:`\\operatorname{Var}[X]`.
         """
-        return np.maximum(self._square - self._mean ** 2, 0.)
+        if self._weight_sum > 0:
+            return np.maximum(self._m2 / self._weight_sum, 0.)
+        return np.zeros_like(self._m2)
 
     @property
     def stddev(self):
@@ -73,19 +200,33 @@ class StatisticsCollector(object):
         """Get the counter of collected values."""
         return self._counter
 
+    def _update(self, weight_sum, mean, m2):
+        # merge the statistics of two sets by the algorithm of Chan et al.
+        new_weight_sum = self._weight_sum + weight_sum
+        delta = mean - self._mean
+        ratio = weight_sum / new_weight_sum
+        self._mean += delta * ratio
+        self._m2 += m2 + delta ** 2 * (self._weight_sum * ratio)
+        self._weight_sum = new_weight_sum
+
     def collect(self, values, weight=1.):
         """
         Update the statistics from values.
 
-        This method uses the following equation to update `mean` and `square`:
+        The mean and the sum of squared deviations of the batch are
+        computed in one vectorized pass, and then merged into the
+        statistics by:
 
         .. math::
-            \\frac{\\sum_{i=1}^n w_i f(x_i)}{\\sum_{j=1}^n w_j} =
-                \\frac{\\sum_{i=1}^m w_i f(x_i)}{\\sum_{j=1}^m w_j} +
-                \\frac{\\sum_{i=m+1}^n w_i}{\\sum_{j=1}^n w_j} \\Bigg(
-                    \\frac{\\sum_{i=m+1}^n w_i f(x_i)}{\\sum_{j=m+1}^n w_j} -
-                    \\frac{\\sum_{i=1}^m w_i f(x_i)}{\\sum_{j=1}^m w_j}
-                \\Bigg)
+            \\begin{aligned}
+                W &= W_a + W_b \\\\
+                \\delta &= \\bar{x}_b - \\bar{x}_a \\\\
+                \\bar{x} &= \\bar{x}_a + \\delta \\frac{W_b}{W} \\\\
+                M_2 &= M_{2,a} + M_{2,b} + \\delta^2 \\frac{W_a W_b}{W}
+            \\end{aligned}
+
+        where :math:`W` is the weight summation, and :math:`M_2` is the
+        weighted sum of squared deviations from the mean.
 
         Args:
             values: Values to be collected in batch, numpy array or scalar
@@ -100,7 +241,7 @@ class StatisticsCollector(object):
         values = np.asarray(values)
         if not values.size:
             return
-        weight = np.asarray(weight)
+        weight = np.asarray(weight, dtype=np.float64)
         if not weight.size:
             weight = np.asarray(1.)
 
@@ -114,22 +255,69 @@ class StatisticsCollector(object):
             batch_shape = values.shape[:-len(self._shape)]
         else:
             batch_shape = values.shape
+        batch_size = int(np.prod(batch_shape, dtype=np.int64))
+        reduce_axis = tuple(range(len(batch_shape)))
+
+        # the batch weights, as a view instead of a new array if possible
+        batch_weight = np.broadcast_to(weight, batch_shape)
+        batch_weight_sum = float(np.sum(batch_weight))
+        self._counter += batch_size
+        if batch_weight_sum <= 0:
+            return
+        if self._digest is not None:
+            self._digest.add(values, batch_weight)
+
+        if not reduce_axis:
+            self._update(batch_weight_sum, values, 0.)
+        else:
+            values_weight = np.reshape(
+                batch_weight, batch_shape + (1,) * len(self._shape))
+            batch_mean = np.sum(values_weight * values, axis=reduce_axis,
+                                dtype=np.float64) / batch_weight_sum
+            batch_m2 = np.sum(values_weight * (values - batch_mean) ** 2,
+                              axis=reduce_axis, dtype=np.float64)
+            self._update(batch_weight_sum, batch_mean, batch_m2)
+
+    def merge(self, other):
+        """
+        Merge the statistics of another collector into this collector.
+
+        Args:
+            other (StatisticsCollector): The other collector, whose shape
+                must be identical to this collector.  It is not modified.
+
+        Raises:
+            ValueError: If the shape of `other` is not identical to this
+                collector, or only one of the collectors estimates the
+                quantiles.
+        """
+        if other.shape != self._shape:
+            raise ValueError('Shape mismatch: {} vs {}'.
+                             format(other.shape, self._shape))
+        if (other._digest is None) != (self._digest is None):
+            raise ValueError('Cannot merge a collector estimating the '
+                             'quantiles with one not estimating them.')
+        self._counter += other._counter
+        if other._weight_sum > 0:
+            self._update(other._weight_sum, other._mean, other._m2)
+            if self._digest is not None:
+                self._digest.merge(other._digest)
+
+    def quantile(self, q):
+        """
+        Get the estimated quantiles of the values.
 
-        batch_weight = np.ones(shape=batch_shape, dtype=np.float) * weight
-        batch_weight = np.reshape(batch_weight,
-                                  batch_weight.shape + (1,) * len(self._shape))
-        batch_weight_sum = np.sum(batch_weight)
-        normed_batch_weight = batch_weight / batch_weight_sum
-
-        self._weight_sum += batch_weight_sum
-        discount = batch_weight_sum / self._weight_sum
-
-        def update_array(arr, update):
-            reduce_axis = tuple(range(len(batch_shape)))
-            update_reduced = normed_batch_weight * update
-            if reduce_axis:
-                update_reduced = np.sum(update_reduced, axis=reduce_axis)
-            arr += discount * (update_reduced - arr)
-        update_array(self._mean, values)
-        update_array(self._square, values ** 2)
-        self._counter += batch_weight.size
+        Args:
+            q (float or np.ndarray): The quantiles, within ``[0, 1]``.
+
+        Returns:
+            float or np.ndarray: The estimated quantiles, or NaN if no value
+                has been collected.
+
+        Raises:
+            RuntimeError: If `quantiles` is not enabled.
+        """
+        if self._digest is None:
+            raise RuntimeError('`quantiles` is not enabled for this '
+                               'collector.')
+        return self._digest.quantile(q)